@@ -0,0 +1,307 @@
+"""音频元数据提取基准测试 - 生成各种格式的合成音频文件，校验提取的时长并测量每秒处理的文件数
+
+合成文件只包含合法的帧头/容器头，音频数据为空白（解析不解码音频，结果与真实文件相同）；
+MP3 写出全部帧，其他格式的数据区用稀疏文件占位。
+先在当前进程中串行解析，再用进程池解析，最后通过 scan_backlog 走一遍补全历史数据的完整流程。
+
+用法: python scripts/bench_audio_metadata.py [--files 2000] [--workers 4] [--dir 真实音频目录]
+      指定 --dir 时只对该目录下的文件测速，不校验时长
+"""
+import argparse
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from _app import create_app
+from src.models.user import db, Music
+from src.services.audio_metadata import MetadataExtractor
+from src.services.audio_stream import audio_streamer
+from src.services.uploads import AUDIO_EXTENSIONS
+
+
+def _syncsafe(value):
+    return bytes([(value >> 21) & 0x7F, (value >> 14) & 0x7F, (value >> 7) & 0x7F, value & 0x7F])
+
+
+def _id3v2(title, artist, genre, padding=1024):
+    frames = b''
+    for frame_id, value in ((b'TIT2', title), (b'TPE1', artist), (b'TCON', genre)):
+        body = b'\x03' + value.encode('utf-8')
+        frames += frame_id + struct.pack('>I', len(body)) + b'\x00\x00' + body
+    frames += b'\x00' * padding
+    return b'ID3\x03\x00\x00' + _syncsafe(len(frames)) + frames
+
+
+def _id3v1(title):
+    return b'TAG' + title.encode('latin-1')[:30].ljust(30, b'\x00') + b'\x00' * 94 + bytes([13])
+
+
+def _mpeg_frames(f, count, header, length, rng, bitrates=None):
+    """写出 count 帧；bitrates 为 [(比特率索引, 帧长度)] 时随机混合（VBR）"""
+    for _ in range(count):
+        if bitrates:
+            index, length = rng.choice(bitrates)
+            f.write(bytes([header[0], header[1], (index << 4) | (header[2] & 0x0F), header[3]]))
+        else:
+            f.write(header)
+        f.write(bytes(length - 4))
+
+
+def make_mp3_cbr(path, seconds, rng):
+    frames = int(seconds * 44100 / 1152)
+    with open(path, 'wb') as f:
+        f.write(_id3v2('CBR 歌曲', 'ဘီတာ', '(13)'))
+        # MPEG-1 Layer III 128kbps 44.1kHz 联合立体声，无填充位时每帧 417 字节
+        _mpeg_frames(f, frames, b'\xff\xfb\x90\x44', 417, rng)
+        f.write(_id3v1('CBR song'))
+    return 'mp3', frames * 1152 / 44100, 'CBR 歌曲'
+
+
+def make_mp3_vbr(path, seconds, rng):
+    frames = int(seconds * 44100 / 1152)
+    delay, padding = 576, 1000
+    xing = bytearray(417)
+    xing[:4] = b'\xff\xfb\x90\x44'
+    xing[36:44] = b'Xing' + struct.pack('>I', 0x0F)
+    xing[44:52] = struct.pack('>II', frames, 0)
+    lame = 52 + 100 + 4
+    xing[lame:lame + 9] = b'LAME3.100'
+    xing[lame + 21:lame + 24] = bytes([delay >> 4, ((delay & 0x0F) << 4) | (padding >> 8), padding & 0xFF])
+    with open(path, 'wb') as f:
+        f.write(_id3v2('VBR 歌曲', 'Artist', 'Pop'))
+        f.write(xing)
+        # 128 / 192 / 256 kbps 混合
+        _mpeg_frames(f, frames, b'\xff\xfb\x90\x44', 417, rng, bitrates=[(9, 417), (11, 626), (13, 835)])
+    return 'mp3', (frames * 1152 - delay - padding) / 44100, 'VBR 歌曲'
+
+
+def make_mp3_mpeg2(path, seconds, rng):
+    frames = int(seconds * 22050 / 576)
+    with open(path, 'wb') as f:
+        # 无 ID3 标签：MPEG-2 Layer III 64kbps 22.05kHz 单声道，每帧 208 字节
+        _mpeg_frames(f, frames, b'\xff\xf3\x80\xc4', 208, rng)
+    return 'mp3', frames * 576 / 22050, None
+
+
+def make_wav(path, seconds, rng):
+    frames = int(seconds * 44100)
+    data_size = frames * 4
+    info = b'INFO'
+    for chunk_id, value in ((b'INAM', 'WAV 歌曲'), (b'IART', 'Artist')):
+        raw = value.encode('utf-8') + b'\x00'
+        raw += b'\x00' * (len(raw) & 1)
+        info += chunk_id + struct.pack('<I', len(raw)) + raw
+    fmt = struct.pack('<HHIIHH', 1, 2, 44100, 44100 * 4, 4, 16)
+    body = b'WAVE' + b'fmt ' + struct.pack('<I', len(fmt)) + fmt
+    body += b'LIST' + struct.pack('<I', len(info)) + info
+    body += b'data' + struct.pack('<I', data_size)
+    with open(path, 'wb') as f:
+        f.write(b'RIFF' + struct.pack('<I', len(body) + data_size) + body)
+        f.truncate(f.tell() + data_size)
+    return 'wav', frames / 44100, 'WAV 歌曲'
+
+
+def _vorbis_comment(vendor, **fields):
+    entries = [f'{key.upper()}={value}'.encode('utf-8') for key, value in fields.items()]
+    data = struct.pack('<I', len(vendor)) + vendor + struct.pack('<I', len(entries))
+    for entry in entries:
+        data += struct.pack('<I', len(entry)) + entry
+    return data
+
+
+def make_flac(path, seconds, rng):
+    samples = int(seconds * 44100)
+    packed = (44100 << 44) | (1 << 41) | (15 << 36) | samples
+    streaminfo = struct.pack('>HH', 4096, 4096) + b'\x00' * 6 + packed.to_bytes(8, 'big') + b'\x00' * 16
+    comment = _vorbis_comment(b'bench', title='FLAC 歌曲', artist='Artist', genre='Classical')
+    with open(path, 'wb') as f:
+        f.write(b'fLaC')
+        f.write(bytes([0]) + len(streaminfo).to_bytes(3, 'big') + streaminfo)
+        f.write(bytes([0x84]) + len(comment).to_bytes(3, 'big') + comment)
+        f.truncate(f.tell() + samples * 2)
+    return 'flac', samples / 44100, 'FLAC 歌曲'
+
+
+def _ogg_page(serial, sequence, granule, packet, header_type=0):
+    table = bytes([255] * (len(packet) // 255) + [len(packet) % 255])
+    return (b'OggS' + bytes([0, header_type]) + struct.pack('<qII', granule, serial, sequence) + b'\x00' * 4
+            + bytes([len(table)]) + table + packet)
+
+
+def make_ogg(path, seconds, rng, opus=False):
+    serial = rng.randrange(1 << 31)
+    if opus:
+        pre_skip = 312
+        ident = b'OpusHead' + struct.pack('<BBHIhB', 1, 2, pre_skip, 44100, 0, 0)
+        comment = b'OpusTags' + _vorbis_comment(b'bench', title='Opus 歌曲')
+        granule = int(seconds * 48000) + pre_skip
+        expected = (granule - pre_skip) / 48000
+    else:
+        ident = b'\x01vorbis' + struct.pack('<IBIiiiBB', 0, 2, 44100, 0, 128000, 0, 0xB8, 1)
+        comment = b'\x03vorbis' + _vorbis_comment(b'bench', title='Vorbis 歌曲') + b'\x01'
+        granule = int(seconds * 44100)
+        expected = granule / 44100
+    with open(path, 'wb') as f:
+        f.write(_ogg_page(serial, 0, 0, ident, header_type=2))
+        f.write(_ogg_page(serial, 1, 0, comment))
+        f.truncate(f.tell() + int(seconds * 16000))
+        f.seek(0, os.SEEK_END)
+        f.write(_ogg_page(serial, 2, granule, b'\x00' * 100, header_type=4))
+    return ('opus' if opus else 'ogg'), expected, ('Opus 歌曲' if opus else 'Vorbis 歌曲')
+
+
+def _atom(kind, payload):
+    return struct.pack('>I', 8 + len(payload)) + kind + payload
+
+
+def make_m4a(path, seconds, rng):
+    duration = int(seconds * 44100)
+    mdhd = _atom(b'mdhd', b'\x00' * 12 + struct.pack('>II', 44100, duration) + b'\x00' * 4)
+    hdlr = _atom(b'hdlr', b'\x00' * 8 + b'soun' + b'\x00' * 13)
+    entry = _atom(b'mp4a', b'\x00' * 6 + struct.pack('>H', 1) + b'\x00' * 8 + struct.pack('>HHHHI', 2, 16, 0, 0, 44100 << 16))
+    stsd = _atom(b'stsd', b'\x00' * 4 + struct.pack('>I', 1) + entry)
+    trak = _atom(b'trak', _atom(b'mdia', mdhd + hdlr + _atom(b'minf', _atom(b'stbl', stsd))))
+    title = _atom(b'\xa9nam', _atom(b'data', struct.pack('>II', 1, 0) + 'M4A 歌曲'.encode('utf-8')))
+    udta = _atom(b'udta', _atom(b'meta', b'\x00' * 4 + _atom(b'ilst', title)))
+    mdat_size = int(seconds * 16000)
+    with open(path, 'wb') as f:
+        f.write(_atom(b'ftyp', b'M4A \x00\x00\x00\x00'))
+        f.write(_atom(b'moov', trak + udta))
+        f.write(struct.pack('>I', 8 + mdat_size) + b'mdat')
+        f.truncate(f.tell() + mdat_size)
+    return 'mp4', duration / 44100, 'M4A 歌曲'
+
+
+def make_aac(path, seconds, rng):
+    frames = int(seconds * 44100 / 1024)
+    length = 7 + 364
+    # AAC LC 44.1kHz 立体声，每帧一个原始数据块
+    header = bytes([0xFF, 0xF1, (1 << 6) | (4 << 2), (2 << 6) | (length >> 11), (length >> 3) & 0xFF,
+                    ((length & 0x07) << 5) | 0x1F, 0xFC])
+    with open(path, 'wb') as f:
+        for _ in range(frames):
+            f.write(header + bytes(length - 7))
+    return 'aac', frames * 1024 / 44100, None
+
+
+# (生成函数, 扩展名, 权重)：曲库以 MP3 为主
+GENERATORS = (
+    (make_mp3_cbr, '.mp3', 40),
+    (make_mp3_vbr, '.mp3', 20),
+    (make_mp3_mpeg2, '.mp3', 5),
+    (make_flac, '.flac', 10),
+    (make_wav, '.wav', 5),
+    (make_ogg, '.ogg', 5),
+    (lambda path, seconds, rng: make_ogg(path, seconds, rng, opus=True), '.opus', 5),
+    (make_m4a, '.m4a', 5),
+    (make_aac, '.aac', 5),
+)
+
+
+def generate(directory, count, seed=1):
+    rng = random.Random(seed)
+    weights = [weight for _, _, weight in GENERATORS]
+    corpus = []
+    for index in range(count):
+        generator, extension, _ = rng.choices(GENERATORS, weights)[0]
+        path = os.path.join(directory, f'track{index:05d}{extension}')
+        seconds = rng.uniform(30, 300)
+        corpus.append((path,) + generator(path, seconds, rng))
+    return corpus
+
+
+def verify(corpus, results):
+    errors = {}
+    for (path, audio_format, expected, title), (metadata, error) in zip(corpus, results):
+        if error:
+            errors.setdefault(audio_format, []).append(f'{os.path.basename(path)}: {error}')
+            continue
+        if metadata['format'] != audio_format or abs(metadata['duration'] - expected) > 0.001:
+            errors.setdefault(audio_format, []).append(
+                f'{os.path.basename(path)}: {metadata["format"]} {metadata["duration"]} != {audio_format} {expected:.3f}'
+            )
+        elif title and metadata['tags'].get('title') != title:
+            errors.setdefault(audio_format, []).append(f'{os.path.basename(path)}: title {metadata["tags"]}')
+    return errors
+
+
+def timed(label, extractor, paths, total_bytes):
+    started = time.perf_counter()
+    results = extractor.extract_many(paths)
+    seconds = time.perf_counter() - started
+    print(f'{label:14s}: {len(paths) / seconds:8.1f} files/s  ({seconds:.2f} s, '
+          f'{total_bytes / 1024 / 1024 / seconds:.0f} MB/s of file size)')
+    return results
+
+
+def scan(directory, paths, workers):
+    """把文件登记为 Music 后走一遍 scan_backlog"""
+    app = create_app(os.path.join(directory, 'bench.db'))
+    with app.app_context():
+        audio_streamer.media_root = directory
+        db.session.add_all([
+            Music(title=os.path.basename(path), artist='未知艺术家', file_url='/media/' + os.path.basename(path))
+            for path in paths
+        ])
+        db.session.commit()
+        extractor = MetadataExtractor(workers=workers)
+        summary = extractor.scan_backlog()
+        extractor.shutdown()
+        print(f'scan_backlog  : {summary["files_per_second"]:8.1f} files/s  ({summary["duration_ms"] / 1000:.2f} s, '
+              f'updated={summary["updated"]}, failed={summary["failed"]}, skipped={summary["skipped"]})')
+        db.engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--dir', help='对已有的音频目录测速')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.dir:
+            paths = sorted(
+                os.path.join(root, name)
+                for root, _, names in os.walk(args.dir) for name in names
+                if name.lower().endswith(AUDIO_EXTENSIONS)
+            )
+            corpus = None
+        else:
+            started = time.perf_counter()
+            corpus = generate(tmp, args.files)
+            paths = [entry[0] for entry in corpus]
+            print(f'generated     : {len(paths)} files in {time.perf_counter() - started:.1f} s')
+        total_bytes = sum(os.path.getsize(path) for path in paths)
+        print(f'cpu count     : {os.cpu_count()}, workers: {args.workers}')
+
+        serial = MetadataExtractor(workers=0)
+        # 先完整读一遍，让两种方式都在页缓存命中的情况下比较
+        serial.extract_many(paths)
+        results = timed('serial', serial, paths, total_bytes)
+        pool = MetadataExtractor(workers=args.workers)
+        # 第一次调用创建工作进程，先预热
+        pool.extract_many(paths[:args.workers])
+        pooled = timed('process pool', pool, paths, total_bytes)
+        pool.shutdown()
+
+        if corpus is not None:
+            for label, values in (('serial', results), ('process pool', pooled)):
+                errors = verify(corpus, values)
+                print(f'verify {label:7s}: ' + ('all durations exact' if not errors else ''))
+                for audio_format, messages in errors.items():
+                    print(f'  {audio_format}: {len(messages)} errors, e.g. {messages[:3]}')
+            counts = {}
+            for _, audio_format, _, _ in corpus:
+                counts[audio_format] = counts.get(audio_format, 0) + 1
+            print(f'formats       : {counts}')
+            scan(tmp, paths, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""音乐目录缓存基准测试 - 对比 /api/music 列表页和详情页在有无缓存时的延迟和吞吐
+
+曲库与 bench_music_search.py 相同。请求按热度分布：70% 为详情页（歌曲按 Zipf 分布抽取），
+30% 为列表页（不筛选或按流派筛选，页码集中在前几页）；每 20 个请求落库一批播放次数，
+验证计数器更新不会淘汰缓存。最后测量 32 个线程同时请求同一个未缓存列表页时实际查询数据库的次数。
+
+用法: python scripts/bench_catalog_cache.py [--tracks 1000000] [--requests 20000] [--db 复用的数据库文件]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from _app import create_app
+from bench_music_search import GENRES, Zipf, generate
+from src.models.user import db, Music
+from src.routes.music import music_bp
+from src.services.catalog_cache import catalog_cache
+
+
+def make_requests(app, count, seed=4):
+    rng = random.Random(seed)
+    with app.app_context():
+        max_id = db.session.query(db.func.max(Music.id)).scalar()
+    tracks = Zipf(rng, rng.sample(range(1, max_id + 1), min(max_id, 200000)), offset=10)
+    genres = Zipf(rng, [None] + GENRES, offset=2)
+    pages = Zipf(rng, list(range(1, 21)))
+    requests = []
+    for _ in range(count):
+        if rng.random() < 0.7:
+            requests.append(('详情', f'/api/music/{tracks(1)[0]}', None))
+        else:
+            genre = genres(1)[0]
+            query = {'page': pages(1)[0], 'per_page': 20}
+            if genre:
+                query['genre'] = genre
+            requests.append(('列表', '/api/music', query))
+    plays = [{music_id: rng.randint(1, 5) for music_id in tracks(50)} for _ in range(count // 20)]
+    return requests, plays
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run(client, requests, plays):
+    timings = {'详情': [], '列表': []}
+    started = time.perf_counter()
+    for i, (kind, url, query) in enumerate(requests):
+        if i % 20 == 0 and plays:
+            catalog_cache.add_plays(plays[(i // 20) % len(plays)])
+        begin = time.perf_counter()
+        response = client.get(url, query_string=query)
+        timings[kind].append((time.perf_counter() - begin) * 1000)
+        assert response.status_code in (200, 404), response.status_code
+    return timings, time.perf_counter() - started
+
+
+def stampede(client, threads=32):
+    """同一个未缓存列表页被并发请求时，统计实际查询数据库的次数"""
+    catalog_cache.clear()
+    misses = catalog_cache.get_stats()['misses']
+    barrier = threading.Barrier(threads)
+
+    def request():
+        barrier.wait()
+        client.get('/api/music', query_string={'genre': GENRES[0], 'page': 3})
+
+    workers = [threading.Thread(target=request) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return catalog_cache.get_stats()['misses'] - misses
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tracks', type=int, default=1000000)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--db', help='已生成的数据库文件，存在时跳过生成')
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix='bench_catalog_cache_'), 'bench.db')
+    exists = os.path.exists(path)
+    app = create_app(path)
+    if not exists:
+        generate(app, args.tracks, with_index=False)
+    app.register_blueprint(music_bp, url_prefix='/api')
+    catalog_cache.init_app(app)
+    client = app.test_client()
+
+    requests, plays = make_requests(app, args.requests)
+    max_tracks, max_pages = catalog_cache.max_tracks, catalog_cache.max_pages
+
+    # 条数上限为 0 时每次请求都查询数据库，相当于不使用缓存
+    catalog_cache.max_tracks = catalog_cache.max_pages = 0
+    baseline, baseline_seconds = run(client, requests, [])
+
+    catalog_cache.max_tracks, catalog_cache.max_pages = max_tracks, max_pages
+    catalog_cache.clear()
+    catalog_cache.stats = dict.fromkeys(catalog_cache.stats, 0)
+    cached, cached_seconds = run(client, requests, plays)
+
+    print(f'{len(requests)} 次请求, 缓存统计: {catalog_cache.get_stats()}')
+    print(f'{"":<12}{"次数":>8}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"max ms":>10}')
+    for label, timings in (('无缓存', baseline), ('缓存', cached)):
+        for kind, values in timings.items():
+            print(f'{label + kind:<12}{len(values):>8}{percentile(values, 0.5):>10.2f}'
+                  f'{percentile(values, 0.95):>10.2f}{percentile(values, 0.99):>10.2f}{max(values):>10.2f}')
+    print(f'吞吐: 无缓存 {len(requests) / baseline_seconds:.0f} 次/秒, 缓存 {len(requests) / cached_seconds:.0f} 次/秒')
+
+    print(f'32 个并发请求同一未缓存列表页, 数据库查询 {stampede(client)} 次')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""数据库维护基准测试 - 对比整库 VACUUM 与分步增量回收期间并发写入的等待时间
+
+先删除最早的一部分系统日志制造空闲页，然后分别执行整库 VACUUM（同时完成 auto_vacuum=INCREMENTAL 的转换）
+和 MaintenanceEngine 的分步维护；维护期间另一个连接持续写入，记录每次写入的耗时。
+
+用法: python scripts/bench_db_maintenance.py [--db 已生成数据的库] [--scale 0.1] [--delete-ratio 0.3]
+      --db 指定的文件会先复制到临时目录，不会修改原文件
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from _app import create_app
+from seed_data import seed
+from src.models.user import db
+from src.services.db_maintenance import MaintenanceEngine
+
+
+class Writer(threading.Thread):
+    """独立连接上每 interval 秒写入一条日志，记录每次写入耗时"""
+
+    def __init__(self, db_path, interval=0.01):
+        super().__init__(daemon=True)
+        self.db_path = db_path
+        self.interval = interval
+        self.latencies = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        conn = sqlite3.connect(self.db_path, timeout=600, isolation_level=None)
+        while not self.stopped.is_set():
+            started = time.perf_counter()
+            conn.execute(
+                'INSERT INTO system_logs (action, details, created_at) VALUES (?, ?, ?)',
+                ('bench_write', 'maintenance benchmark', datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f'))
+            )
+            self.latencies.append((time.perf_counter() - started) * 1000)
+            time.sleep(self.interval)
+        conn.close()
+
+    def summary(self):
+        values = sorted(self.latencies)
+        if not values:
+            return 'no writes'
+        p99 = values[min(len(values) - 1, int(len(values) * 0.99))]
+        return f'writes={len(values)}, p99={p99:.1f} ms, max={values[-1]:.1f} ms'
+
+
+def delete_logs(db_path, ratio):
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    total = conn.execute('SELECT COUNT(*) FROM system_logs').fetchone()[0]
+    conn.execute('DELETE FROM system_logs WHERE id IN (SELECT id FROM system_logs ORDER BY id LIMIT ?)',
+                 (int(total * ratio),))
+    freelist = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    conn.close()
+    return freelist
+
+
+def sizes(state):
+    return f'db={state["database_bytes"]} wal={state["wal_bytes"]} freelist={state["freelist_pages"]}'
+
+
+def with_writer(db_path, fn):
+    writer = Writer(db_path)
+    writer.start()
+    time.sleep(0.2)
+    started = time.perf_counter()
+    result = fn()
+    elapsed = (time.perf_counter() - started) * 1000
+    writer.stopped.set()
+    writer.join()
+    return elapsed, writer, result
+
+
+def full_vacuum(db_path):
+    """与 MaintenanceEngine.convert_auto_vacuum 相同的整库 VACUUM"""
+    conn = sqlite3.connect(db_path, timeout=600, isolation_level=None)
+    conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    conn.execute('VACUUM')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+
+
+def bench(db_path, delete_ratio, max_block_ms):
+    app = create_app(db_path)
+    engine = MaintenanceEngine(max_block_ms=max_block_ms, max_duration=3600)
+    with app.app_context():
+        engine.init_app(app)
+
+        print(f'freed pages   : {delete_logs(db_path, delete_ratio)}')
+        before = engine.snapshot()
+        elapsed, writer, _ = with_writer(db_path, lambda: full_vacuum(db_path))
+        after = engine.snapshot()
+        print(f'full VACUUM   : {elapsed:10.1f} ms  ({writer.summary()})')
+        print(f'  before {sizes(before)}')
+        print(f'  after  {sizes(after)}')
+
+        print(f'freed pages   : {delete_logs(db_path, delete_ratio)}')
+        elapsed, writer, report = with_writer(db_path, engine.run)
+        steps = {op['operation']: op for op in report['operations']}
+        vacuum = steps.get('incremental_vacuum', {})
+        print(f'incremental   : {elapsed:10.1f} ms  ({writer.summary()})')
+        print(f'  before {sizes(report["before"])}')
+        print(f'  after  {sizes(report["after"])}')
+        print(f'  steps={vacuum.get("steps")}, step_ms={vacuum.get("step_ms")}, status={report["status"]}')
+        print(f'  checkpoint {steps.get("wal_checkpoint")}')
+        db.engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='已有数据的 SQLite 文件（会复制后使用）')
+    parser.add_argument('--scale', type=float, default=0.1)
+    parser.add_argument('--delete-ratio', type=float, default=0.3, help='每轮删除的日志比例')
+    parser.add_argument('--max-block-ms', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'maintenance.db')
+        if args.db:
+            shutil.copyfile(args.db, db_path)
+        else:
+            seed(db_path, args.scale)
+        bench(db_path, args.delete_ratio, args.max_block_ms)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""财务报表基准测试 - 对比逐条加载 ORM 对象与 SQL 分组聚合（冷/热缓存）
+
+用法: python scripts/bench_financial_report.py [--db 已生成数据的库] [--scale 1.0] [--days 90]
+      不指定 --db 时会在临时目录按 --scale 生成数据
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from _app import create_app
+from seed_data import seed
+from src.models.user import WalletTransaction, TransactionStatus
+from src.services.financial_report import FinancialReportService
+
+
+def legacy_report(start_date, end_date):
+    """原实现: 加载全部已完成交易后在 Python 中分类累加"""
+    transactions = WalletTransaction.query.filter(
+        WalletTransaction.created_at >= start_date,
+        WalletTransaction.created_at <= end_date + timedelta(days=1),
+        WalletTransaction.status == TransactionStatus.COMPLETED
+    ).all()
+    revenue_by_type = {}
+    expense_by_type = {}
+    for transaction in transactions:
+        amount = float(transaction.amount)
+        trans_type = transaction.transaction_type.value
+        if amount > 0:
+            revenue_by_type[trans_type] = revenue_by_type.get(trans_type, 0) + amount
+        else:
+            expense_by_type[trans_type] = expense_by_type.get(trans_type, 0) + abs(amount)
+    return sum(revenue_by_type.values()), len(transactions)
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - started) * 1000, result
+
+
+def bench(app, days):
+    end_date = datetime.utcnow().date()
+    start_date = end_date - timedelta(days=days - 1)
+    service = FinancialReportService()
+
+    with app.app_context():
+        elapsed, (revenue, count) = timed(lambda: legacy_report(start_date, end_date))
+        print(f'legacy        : {elapsed:10.1f} ms  (transactions={count}, revenue={revenue:.2f})')
+
+        for label in ('aggregate cold', 'aggregate warm'):
+            elapsed, report = timed(lambda: service.report(start_date, end_date, 'weekly'))
+            summary = report['summary']
+            print(f'{label:<14}: {elapsed:10.1f} ms  '
+                  f'(transactions={summary["transaction_count"]}, revenue={summary["total_revenue"]:.2f})')
+
+        print(f'cache         : {service.get_stats()}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='已有数据的 SQLite 文件')
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--days', type=int, default=90, help='报表覆盖的天数')
+    args = parser.parse_args()
+
+    if args.db:
+        bench(create_app(args.db), args.days)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'report.db')
+            seed(db_path, args.scale)
+            bench(create_app(db_path), args.days)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""音乐全文搜索基准测试 - 生成合成曲库（含缅文标题和艺术家），测量搜索延迟分位数
+
+查询从曲库中随机抽取：标题/艺术家/专辑中的一两个词，最后一个词随机截成前缀，
+部分查询加入一个拼写错误，另有单字母等宽泛查询。计时包括匹配、排序和加载 Music 对象。
+
+用法: python scripts/bench_music_search.py [--tracks 1000000] [--queries 5000] [--db 复用的数据库文件]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from _app import create_app
+from src.models.user import db, Music
+from src.services.music_search import MusicSearch, create_index, tokenize
+
+GENRES = ['Pop', 'Rock', 'Hip-Hop', 'R&B', 'Jazz', 'Classical', 'Electronic', 'Country', 'Folk', 'Traditional',
+          'Metal', 'Indie', 'Soul', 'Reggae', 'Blues', 'Latin', 'K-Pop', 'Gospel', 'Ambient', 'Soundtrack']
+COMMON_WORDS = ['love', 'you', 'me', 'my', 'the', 'night', 'heart', 'baby', 'time', 'life', 'dream', 'girl',
+                'remix', 'live', 'feat', 'song', 'world', 'day', 'rain', 'fire', 'home', 'sky', 'dance', 'blue']
+MYANMAR_CONSONANTS = 'ကခဂငစဆဇညတထဒနပဖဗဘမယရလဝသဟအ'
+MYANMAR_MEDIALS = ['', '', '', 'ျ', 'ြ', 'ွ']
+MYANMAR_VOWELS = ['', 'ာ', 'ိ', 'ီ', 'ု', 'ူ', 'ေ', 'ဲ', 'ော', 'ို']
+MYANMAR_FINALS = ['', '', 'င်', 'န်', 'မ်', 'က်', 'တ်', 'စ်', 'ပ်']
+
+
+def latin_vocabulary(rng, size):
+    syllables = [c + v for c in 'bcdfghjklmnprstvwyz' for v in 'aeiou'] + ['an', 'el', 'is', 'or', 'un']
+    words = set(COMMON_WORDS)
+    while len(words) < size:
+        words.add(''.join(rng.choice(syllables) for _ in range(rng.choice((1, 2, 2, 3, 3, 4)))))
+    # 常用词排在最前面，出现频率最高
+    rest = sorted(words - set(COMMON_WORDS))
+    rng.shuffle(rest)
+    return COMMON_WORDS + rest
+
+
+def myanmar_vocabulary(rng, size):
+    words = set()
+    while len(words) < size:
+        word = ''
+        for _ in range(rng.choice((1, 2, 2, 3))):
+            word += rng.choice(MYANMAR_CONSONANTS) + rng.choice(MYANMAR_MEDIALS) + rng.choice(MYANMAR_VOWELS)
+            word += rng.choice(MYANMAR_FINALS) if not word.endswith(('ေ', 'ော')) else ''
+        words.add(word)
+    words = sorted(words)
+    rng.shuffle(words)
+    return words
+
+
+class Zipf:
+    """按 1/(rank + offset) 概率抽取词表中的元素，offset 越大头部越平缓"""
+
+    def __init__(self, rng, words, offset=1):
+        self.rng = rng
+        self.words = words
+        weights = [1.0 / (rank + offset) for rank in range(len(words))]
+        self.cumulative = []
+        total = 0.0
+        for weight in weights:
+            total += weight
+            self.cumulative.append(total)
+
+    def __call__(self, count):
+        return self.rng.choices(self.words, cum_weights=self.cumulative, k=count)
+
+
+def generate(app, tracks, seed=1, with_index=True):
+    rng = random.Random(seed)
+    latin = Zipf(rng, latin_vocabulary(rng, 60000))
+    myanmar = Zipf(rng, myanmar_vocabulary(rng, 8000))
+    artists = [' '.join(w.capitalize() for w in latin(2)) for _ in range(40000)]
+    artists += [''.join(myanmar(rng.choice((2, 3)))) for _ in range(10000)]
+    rng.shuffle(artists)
+    # 最热门的艺术家约占曲库的 0.3%
+    artist = Zipf(rng, artists, offset=50)
+
+    def title(is_myanmar):
+        if is_myanmar:
+            return ''.join(myanmar(rng.choice((1, 2, 2, 3)))) if rng.random() < 0.6 else ' '.join(myanmar(2))
+        return ' '.join(w.capitalize() for w in latin(rng.choice((1, 2, 2, 3, 3, 4))))
+
+    started = time.perf_counter()
+    music = Music.__table__
+    with app.app_context():
+        with db.engine.begin() as conn:
+            batch = []
+            for i in range(tracks):
+                is_myanmar = rng.random() < 0.2
+                batch.append({
+                    'title': title(is_myanmar),
+                    'artist': artist(1)[0],
+                    'album': title(is_myanmar) if rng.random() < 0.7 else None,
+                    'genre': rng.choice(GENRES),
+                    'play_count': int(rng.paretovariate(1.1) * 10) - 10,
+                    'like_count': 0,
+                    'is_featured': False
+                })
+                if len(batch) == 10000:
+                    conn.execute(music.insert(), batch)
+                    batch = []
+            if batch:
+                conn.execute(music.insert(), batch)
+    print(f'生成 {tracks} 首音乐: {time.perf_counter() - started:.1f}s')
+    if not with_index:
+        return
+
+    started = time.perf_counter()
+    with app.app_context():
+        with db.engine.begin() as conn:
+            create_index(conn)
+    print(f'建立全文索引: {time.perf_counter() - started:.1f}s')
+
+
+def make_queries(app, count, seed=2):
+    rng = random.Random(seed)
+    with app.app_context():
+        max_id = db.session.query(db.func.max(Music.id)).scalar()
+        rows = []
+        while len(rows) < count:
+            ids = [rng.randint(1, max_id) for _ in range(count)]
+            rows += db.session.query(Music.title, Music.artist, Music.album).filter(Music.id.in_(ids)).all()
+
+    queries = []
+    for title, artist, album in rows[:count]:
+        roll = rng.random()
+        if roll < 0.05:
+            queries.append(('宽泛', rng.choice('abcdefghijklmnoprstw')))
+            continue
+        source = rng.choices([title, artist, album or title], weights=(6, 3, 1))[0]
+        words = [' '.join(tokens) if len(tokens) > 1 else tokens[0] for tokens in tokenize(source)]
+        start = rng.randrange(len(words))
+        picked = words[start:start + rng.choice((1, 2))]
+        last = picked[-1]
+        if ' ' not in last and len(last) > 3 and rng.random() < 0.5:
+            picked[-1] = last[:rng.randint(2, len(last) - 1)]
+        kind = '缅文' if any('က' <= ch <= '႟' for ch in source) else '拉丁'
+        if kind == '拉丁' and roll > 0.85:
+            candidates = [i for i, word in enumerate(picked) if len(word) >= 5 and word.isascii()]
+            if candidates:
+                i = rng.choice(candidates)
+                word = picked[i]
+                position = rng.randrange(1, len(word) - 1)
+                picked[i] = word[:position] + word[position + 1] + word[position] + word[position + 2:]
+                kind = '拼写错误'
+        # 缅文词按音节切分后用空格连接，查询时去掉空格还原为连续文字
+        queries.append((kind, ' '.join(word.replace(' ', '') if kind == '缅文' else word for word in picked)))
+    return queries
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tracks', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=5000)
+    parser.add_argument('--db', help='已生成的数据库文件，存在时跳过生成')
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix='bench_music_search_'), 'bench.db')
+    exists = os.path.exists(path)
+    app = create_app(path)
+    if not exists:
+        generate(app, args.tracks)
+    print(f'数据库大小: {os.path.getsize(path) / 1024 / 1024:.0f} MB ({path})')
+
+    search = MusicSearch()
+    queries = make_queries(app, args.queries)
+    with app.app_context():
+        started = time.perf_counter()
+        terms = search._vocabulary_snapshot().terms
+        print(f'加载纠错词表: {len(terms)} 个词, {(time.perf_counter() - started) * 1000:.0f}ms')
+        for _, query in queries[:200]:
+            search.search(query)
+
+        timings = defaultdict(list)
+        empty = 0
+        for kind, query in queries:
+            started = time.perf_counter()
+            result = search.search(query)
+            elapsed = (time.perf_counter() - started) * 1000
+            timings[kind].append(elapsed)
+            timings['全部'].append(elapsed)
+            empty += not result.items
+            db.session.remove()
+
+    print(f'{len(queries)} 次查询, 无结果 {empty} 次, 统计: {search.get_stats()}')
+    print(f'{"类型":<8}{"次数":>8}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"max ms":>10}')
+    for kind, values in sorted(timings.items(), key=lambda item: -len(item[1])):
+        print(f'{kind:<8}{len(values):>8}{percentile(values, 0.5):>10.2f}{percentile(values, 0.95):>10.2f}'
+              f'{percentile(values, 0.99):>10.2f}{max(values):>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""播放写入基准测试 - 对比逐条提交与写缓冲在并发客户端下的 plays/sec
+
+用法: python scripts/bench_play_ingest.py [--clients 16] [--plays 200] [--tracks 20]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from _app import create_app
+from src.models.user import db, User, Music, PlayHistory, SystemLog
+from src.services.audit import AuditLogWriter
+from src.services.play_ingest import PlayIngestBuffer
+
+
+def seed(app, clients, tracks):
+    with app.app_context():
+        for i in range(clients):
+            user = User(phone=f'09{i:09d}')
+            user.set_password('benchmark')
+            db.session.add(user)
+        for i in range(tracks):
+            db.session.add(Music(title=f'Track {i}', artist='Bench', play_count=0))
+        db.session.commit()
+        user_ids = [u.id for u in User.query.all()]
+        music_ids = [m.id for m in Music.query.all()]
+    return user_ids, music_ids
+
+
+def legacy_play(app, user_id, music_id):
+    """原实现: 每次播放两个事务"""
+    with app.app_context():
+        music = Music.query.get(music_id)
+        db.session.add(PlayHistory(user_id=user_id, music_id=music_id, play_duration=30))
+        music.play_count += 1
+        db.session.commit()
+        db.session.add(SystemLog(user_id=user_id, action='music_play', details=f'播放音乐: {music.title}'))
+        db.session.commit()
+
+
+def buffered_play(app, buffer, audit, user_id, music_id):
+    """写缓冲实现: 只读一次音乐行后入队"""
+    with app.app_context():
+        music = Music.query.get(music_id)
+        buffer.record(user_id, music_id, 30)
+        audit.log(user_id, 'music_play', f'播放音乐: {music.title}')
+        return music.play_count + buffer.pending_delta(music_id)
+
+
+def run_clients(clients, plays, user_ids, music_ids, play_fn):
+    errors = []
+
+    def worker(index):
+        user_id = user_ids[index % len(user_ids)]
+        for n in range(plays):
+            try:
+                play_fn(user_id, music_ids[(index + n) % len(music_ids)])
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - started, errors
+
+
+def verify(app, expected):
+    with app.app_context():
+        plays = PlayHistory.query.count()
+        logs = SystemLog.query.count()
+        total = db.session.query(db.func.sum(Music.play_count)).scalar() or 0
+    return plays == expected and logs == expected and total == expected, plays, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--plays', type=int, default=200)
+    parser.add_argument('--tracks', type=int, default=20)
+    args = parser.parse_args()
+    expected = args.clients * args.plays
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(os.path.join(tmp, 'legacy.db'))
+        user_ids, music_ids = seed(app, args.clients, args.tracks)
+        elapsed, errors = run_clients(
+            args.clients, args.plays, user_ids, music_ids,
+            lambda u, m: legacy_play(app, u, m)
+        )
+        ok, plays, total = verify(app, expected)
+        print(f'legacy   : {expected / elapsed:10.1f} plays/sec  '
+              f'({elapsed:.2f}s, errors={len(errors)}, rows={plays}, play_count={total}, consistent={ok})')
+
+        app = create_app(os.path.join(tmp, 'buffered.db'))
+        user_ids, music_ids = seed(app, args.clients, args.tracks)
+        buffer = PlayIngestBuffer(spool_path=os.path.join(tmp, 'spool.jsonl'))
+        buffer.init_app(app)
+        audit = AuditLogWriter(spill_path=os.path.join(tmp, 'audit_spill.jsonl'))
+        audit.init_app(app)
+        elapsed, errors = run_clients(
+            args.clients, args.plays, user_ids, music_ids,
+            lambda u, m: buffered_play(app, buffer, audit, u, m)
+        )
+        buffer.shutdown()
+        audit.shutdown()
+        ok, plays, total = verify(app, expected)
+        stats = buffer.get_stats()
+        print(f'buffered : {expected / elapsed:10.1f} plays/sec  '
+              f'({elapsed:.2f}s, errors={len(errors)}, rows={plays}, play_count={total}, consistent={ok}, '
+              f'flushes={stats["flush_count"]}, spooled={stats["spooled"]})')
+
+
+if __name__ == '__main__':
+    main()
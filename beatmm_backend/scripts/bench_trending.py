@@ -0,0 +1,113 @@
+"""热度榜单基准测试 - 重建耗时、增量更新吞吐，以及读取一页与 ORDER BY play_count 的延迟对比
+
+曲库与 bench_music_search.py 相同；另外按 Zipf 分布生成最近 30 天的播放历史（越近的播放越多）。
+读取对比按流派筛选的第 1 页和较深的一页：数据库按累计播放次数排序分页，榜单直接切片。
+
+用法: python scripts/bench_trending.py [--tracks 1000000] [--plays 2000000] [--reads 5000] [--db 复用的数据库文件]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from _app import create_app
+from bench_music_search import GENRES, Zipf, generate
+from src.models.user import db, Music, PlayHistory, User
+from src.services.trending import TrendingEngine, KINDS
+
+
+def generate_plays(app, plays, seed=5):
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    with app.app_context():
+        max_id = db.session.query(db.func.max(Music.id)).scalar()
+        user = User(phone='09000000000', first_name='Bench')
+        user.set_password('bench-password')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        tracks = Zipf(rng, rng.sample(range(1, max_id + 1), min(max_id, 100000)), offset=20)
+        now = datetime.utcnow()
+        history = PlayHistory.__table__
+        with db.engine.begin() as conn:
+            for start in range(0, plays, 10000):
+                conn.execute(history.insert(), [
+                    {
+                        'user_id': user_id,
+                        'music_id': music_id,
+                        # 指数分布的播放时间，平均 5 天前
+                        'played_at': now - timedelta(seconds=min(rng.expovariate(1 / (5 * 86400)), 30 * 86400)),
+                        'play_duration': 180
+                    }
+                    for music_id in tracks(min(10000, plays - start))
+                ])
+    print(f'生成 {plays} 条播放历史: {time.perf_counter() - started:.1f}s')
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tracks', type=int, default=1000000)
+    parser.add_argument('--plays', type=int, default=2000000)
+    parser.add_argument('--reads', type=int, default=5000)
+    parser.add_argument('--db', help='已生成的数据库文件，存在时跳过生成')
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix='bench_trending_'), 'bench.db')
+    exists = os.path.exists(path)
+    app = create_app(path)
+    if not exists:
+        generate(app, args.tracks, with_index=False)
+        generate_plays(app, args.plays)
+    print(f'数据库大小: {os.path.getsize(path) / 1024 / 1024:.0f} MB ({path})')
+
+    # 不调用 init_app，不启动后台线程
+    engine = TrendingEngine()
+    engine.app = app
+    print(f'重建榜单: {engine.build()}')
+
+    rng = random.Random(6)
+    with app.app_context():
+        max_id = db.session.query(db.func.max(Music.id)).scalar()
+    batches = [{rng.randint(1, max_id): rng.randint(1, 3) for _ in range(500)} for _ in range(20)]
+    started = time.perf_counter()
+    for deltas in batches:
+        engine.add_plays(deltas)
+    elapsed = time.perf_counter() - started
+    print(f'增量更新: {len(batches)} 批共 {sum(map(len, batches))} 首歌曲, '
+          f'{elapsed / len(batches) * 1000:.1f}ms/批（含读取歌曲流派）')
+
+    reads = [(rng.choice(GENRES), rng.choice((1, 1, 1, 25))) for _ in range(args.reads)]
+    timings = {}
+    with app.app_context():
+        for genre, page in reads:
+            started = time.perf_counter()
+            Music.query.filter(Music.genre == genre).order_by(
+                Music.play_count.desc(), Music.created_at.desc()
+            ).paginate(page=page, per_page=20, error_out=False)
+            timings.setdefault(f'all_time 第{page}页', []).append((time.perf_counter() - started) * 1000)
+            db.session.remove()
+
+            for kind in KINDS:
+                started = time.perf_counter()
+                engine.page(kind, genre, None, page=page, per_page=20)
+                timings.setdefault(f'{kind} 第{page}页', []).append((time.perf_counter() - started) * 1000)
+
+    print(f'{"读取":<18}{"次数":>8}{"p50 ms":>10}{"p99 ms":>10}{"max ms":>10}')
+    for label, values in timings.items():
+        print(f'{label:<18}{len(values):>8}{percentile(values, 0.5):>10.3f}{percentile(values, 0.99):>10.3f}'
+              f'{max(values):>10.3f}')
+    print(f'统计: {engine.get_stats()}')
+
+
+if __name__ == '__main__':
+    main()
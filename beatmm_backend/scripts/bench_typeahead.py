@@ -0,0 +1,104 @@
+"""输入建议基准测试 - 构建耗时、内存占用和单线程每秒查询数
+
+曲库与 bench_music_search.py 相同（含缅文标题和艺术家）。查询模拟逐字输入：从随机歌曲的标题、
+艺术家或专辑中取一个词首，依次输入 1 到 8 个字符，每个前缀都是一次查询。
+
+用法: python scripts/bench_typeahead.py [--tracks 1000000] [--queries 20000] [--db 复用的数据库文件]
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from _app import create_app
+from bench_music_search import generate
+from src.models.user import db, Music
+from src.services.typeahead import Typeahead, normalize
+
+
+def make_queries(app, count, seed=3):
+    rng = random.Random(seed)
+    with app.app_context():
+        max_id = db.session.query(db.func.max(Music.id)).scalar()
+        rows = db.session.query(Music.title, Music.artist, Music.album).filter(
+            Music.id.in_([rng.randint(1, max_id) for _ in range(count // 4)])
+        ).all()
+    queries = []
+    while len(queries) < count:
+        value = rng.choice(rng.choice(rows)) or rng.choice(rows)[0]
+        norm, starts = normalize(value)
+        start = rng.choice(starts)
+        for length in range(1, 9):
+            if start + length > len(norm):
+                break
+            queries.append(norm[start:start + length])
+    return queries[:count]
+
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tracks', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--db', help='已生成的数据库文件，存在时跳过生成')
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix='bench_typeahead_'), 'bench.db')
+    exists = os.path.exists(path)
+    app = create_app(path)
+    if not exists:
+        generate(app, args.tracks, with_index=False)
+    queries = make_queries(app, args.queries)
+
+    typeahead = Typeahead()
+    typeahead.app = app
+    before = rss_mb()
+    result = typeahead.build()
+    print(f'构建: {result}, 进程峰值内存 {before:.0f} MB -> {rss_mb():.0f} MB')
+    report = typeahead.memory_report()
+    print('内存占用 (MB): ' + ', '.join(f'{name} {size / 1024 / 1024:.1f}' for name, size in report.items()))
+
+    for _ in range(2):
+        timings = defaultdict(list)
+        started = time.perf_counter()
+        empty = 0
+        for query in queries:
+            begin = time.perf_counter()
+            empty += not typeahead.suggest(query, 10)
+            elapsed = (time.perf_counter() - begin) * 1000
+            timings['全部'].append(elapsed)
+            timings[f'{min(len(query), 4)}{"+" if len(query) >= 4 else ""} 字符'].append(elapsed)
+        total = time.perf_counter() - started
+    print(f'{len(queries)} 次查询, {len(queries) / total:.0f} 次/秒, 无结果 {empty} 次')
+    print(f'{"前缀长度":<10}{"次数":>8}{"p50 ms":>10}{"p99 ms":>10}{"max ms":>10}')
+    for name, values in sorted(timings.items()):
+        print(f'{name:<10}{len(values):>8}{percentile(values, 0.5):>10.3f}{percentile(values, 0.99):>10.3f}'
+              f'{max(values):>10.3f}')
+
+    # 增量更新：新增歌曲后立即可以搜到
+    sample = ' '.join(random.Random(4).choice(['neon', 'harbor', 'velvet']) for _ in range(2))
+    started = time.perf_counter()
+    with typeahead._lock:
+        first_id = len(typeahead._index.track_plays)
+        for i in range(1000):
+            typeahead._index.set_track(first_id + i, (f'{sample} {i}', 'Bench Artist', None), i)
+    print(f'增量写入 1000 首: {(time.perf_counter() - started) * 1000:.0f}ms, '
+          f'"{sample[:6]}" -> {[s["text"] for s in typeahead.suggest(sample[:6], 3)]}')
+
+
+if __name__ == '__main__':
+    main()
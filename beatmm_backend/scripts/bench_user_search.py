@@ -0,0 +1,125 @@
+"""管理后台用户搜索基准测试 - 对比四列 LIKE '%词%' 与 trigram 索引在不同用户规模下的延迟
+
+每次查询与 GET /api/admin/users?search= 相同：按 created_at 倒序取第一页并统计总数。
+搜索词从已有用户中抽取：名字片段、一两个字母的前缀、邮箱片段、带空格或国际前缀的手机号片段。
+
+用法: python scripts/bench_user_search.py [--users 100000 1000000] [--queries 300]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from _app import create_app
+from src.models.user import db, User
+from src.services.user_search import UserSearch, create_index
+
+FIRST_NAMES = ['Aung', 'Kyaw', 'Zaw', 'Min', 'Htet', 'Thant', 'Ye', 'Soe', 'Myo', 'Naing', 'Su', 'Hnin', 'Thiri',
+               'Ei', 'Phyu', 'Khin', 'May', 'Nandar', 'Wai', 'Yadanar', 'John', 'David', 'Linda', 'Emma']
+LAST_NAMES = ['Win', 'Oo', 'Htun', 'Naing', 'Lwin', 'Thu', 'Aye', 'Myint', 'Zin', 'Moe', 'Paing', 'Kyi',
+              'Smith', 'Brown', 'Nguyen', 'Tan']
+DOMAINS = ['gmail.com', 'yahoo.com', 'outlook.com', 'mpt.com.mm', 'example.com']
+
+
+def generate(path, users, seed=1):
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    conn = sqlite3.connect(path)
+    phones = rng.sample(range(10 ** 8, 10 ** 9), users)
+    rows = []
+    for i, number in enumerate(phones):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        email = f'{first.lower()}.{last.lower()}{i}@{rng.choice(DOMAINS)}' if rng.random() < 0.6 else None
+        created = (now - timedelta(seconds=rng.randint(0, 365 * 86400))).isoformat(' ')
+        rows.append((f'09{number}', email, 'x', first, last, 'USER', 0, 1, created, created, 0))
+    conn.executemany('INSERT INTO users (phone, email, password_hash, first_name, last_name, role, wallet_balance, '
+                     'is_active, created_at, updated_at, login_count) VALUES (?,?,?,?,?,?,?,?,?,?,?)', rows)
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+
+
+def make_queries(app, count, seed=2):
+    rng = random.Random(seed)
+    with app.app_context():
+        max_id = db.session.query(db.func.max(User.id)).scalar()
+        users = User.query.filter(User.id.in_([rng.randint(1, max_id) for _ in range(count)])).all()
+    queries = []
+    for user in users:
+        kind = rng.choice(['姓名', '姓名', '前缀', '邮箱', '手机号'])
+        if kind == '姓名':
+            query = f'{user.first_name} {user.last_name[:rng.randint(1, len(user.last_name))]}'
+        elif kind == '前缀':
+            query = user.first_name[:rng.randint(1, 2)]
+        elif kind == '邮箱' and user.email:
+            local = user.email.split('@')[0]
+            start = rng.randrange(len(local) - 3)
+            query = local[start:start + rng.randint(3, 8)]
+        else:
+            kind = '手机号'
+            digits = user.phone[rng.randint(2, 5):rng.randint(8, len(user.phone))]
+            query = rng.choice([digits, f'{digits[:3]} {digits[3:]}', f'+959 {user.phone[2:7]}'])
+        queries.append((kind, query))
+    return queries
+
+
+def run(app, queries, condition):
+    timings = defaultdict(list)
+    with app.app_context():
+        for kind, query in queries:
+            started = time.perf_counter()
+            User.query.filter(condition(query)).order_by(User.created_at.desc()).paginate(page=1, per_page=20,
+                                                                                         error_out=False)
+            elapsed = (time.perf_counter() - started) * 1000
+            timings[kind].append(elapsed)
+            timings['全部'].append(elapsed)
+            db.session.remove()
+    return timings
+
+
+def legacy_condition(search):
+    return db.or_(User.phone.contains(search), User.first_name.contains(search),
+                  User.last_name.contains(search), User.email.contains(search))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--queries', type=int, default=300)
+    args = parser.parse_args()
+
+    print(f'{"用户数":<10}{"实现":<10}{"类型":<8}{"次数":>6}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}')
+    for users in args.users:
+        path = os.path.join(tempfile.mkdtemp(prefix='bench_user_search_'), 'bench.db')
+        app = create_app(path)
+        generate(path, users)
+        with app.app_context():
+            with db.engine.begin() as conn:
+                started = time.perf_counter()
+                create_index(conn)
+        build = time.perf_counter() - started
+
+        queries = make_queries(app, args.queries)
+        search = UserSearch()
+        for name, condition in (('LIKE', legacy_condition), ('trigram', search.condition)):
+            timings = run(app, queries, condition)
+            for kind, values in sorted(timings.items(), key=lambda item: -len(item[1])):
+                print(f'{users:<10}{name:<10}{kind:<8}{len(values):>6}{percentile(values, 0.5):>10.2f}'
+                      f'{percentile(values, 0.95):>10.2f}{percentile(values, 0.99):>10.2f}')
+        print(f'{users:<10}建索引 {build:.1f}s, 数据库 {os.path.getsize(path) / 1024 / 1024:.0f} MB')
+
+
+if __name__ == '__main__':
+    main()
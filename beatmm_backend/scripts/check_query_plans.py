@@ -0,0 +1,156 @@
+"""查询计划回归检查 - 断言各路由的查询形状命中预期索引
+
+对与路由相同形状的查询执行 EXPLAIN QUERY PLAN，计划中必须出现预期的索引，
+且不能出现对该表的全表扫描。任一检查失败时以非零状态退出。
+
+用法: python scripts/check_query_plans.py [--db 已生成数据的库] [--scale 0.01]
+      不指定 --db 时会在临时目录按 --scale 生成数据后检查
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from _app import create_app
+from seed_data import seed
+from src.models.user import (db, User, UserRole, Music, PlayHistory, UserFavorite, Notification,
+                             WalletTransaction, TransactionStatus, SystemLog, BotTask)
+from src.services.pagination import _keyset_condition
+from src.services.user_search import user_search
+
+
+def query_shapes():
+    """(说明, 查询, 预期索引)"""
+    now = datetime.utcnow()
+    day_start = datetime(now.year, now.month, now.day)
+    day_end = day_start + timedelta(days=1)
+    order = (Music.play_count.desc(), Music.created_at.desc())
+
+    return [
+        ('音乐列表', Music.query.order_by(*order).limit(20),
+         'ix_music_play_count'),
+        ('音乐列表 genre', Music.query.filter(Music.genre == 'Pop').order_by(*order).limit(20),
+         'ix_music_genre_play_count'),
+        ('音乐列表 featured', Music.query.filter(Music.is_featured == True).order_by(*order).limit(20),
+         'ix_music_featured_play_count'),
+        ('音乐列表游标', Music.query.filter(
+            _keyset_condition([(Music.play_count, True), (Music.id, True)], [100, 5000])
+        ).order_by(Music.play_count.desc(), Music.id.desc()).limit(21),
+         'ix_music_play_count'),
+        ('播放历史', db.session.query(Music, PlayHistory).join(PlayHistory).filter(
+            PlayHistory.user_id == 42
+        ).order_by(PlayHistory.played_at.desc()).limit(20),
+         'ix_play_history_user_played_at'),
+        ('今日播放', PlayHistory.query.filter(
+            PlayHistory.played_at >= day_start, PlayHistory.played_at < day_end
+        ).with_entities(db.func.count()),
+         'ix_play_history_played_at'),
+        ('用户收藏', db.session.query(Music).join(UserFavorite).filter(
+            UserFavorite.user_id == 42
+        ).order_by(UserFavorite.created_at.desc()).limit(20),
+         'ix_user_favorites_user_created_at'),
+        ('管理员用户列表', User.query.order_by(User.created_at.desc()).limit(20),
+         'ix_users_created_at'),
+        ('管理员用户搜索', User.query.filter(user_search.condition('aung 0912')).order_by(
+            User.created_at.desc()
+        ).limit(20),
+         'user_search VIRTUAL TABLE'),
+        ('管理员人数', User.query.filter(
+            User.role.in_([UserRole.ADMIN, UserRole.SUPER_ADMIN])
+        ).with_entities(db.func.count()),
+         'ix_users_role'),
+        ('今日新增用户', User.query.filter(
+            User.created_at >= day_start, User.created_at < day_end
+        ).with_entities(db.func.count()),
+         'ix_users_created_at'),
+        ('今日登录用户', User.query.filter(
+            User.last_login >= day_start, User.last_login < day_end
+        ).with_entities(db.func.count()),
+         'ix_users_last_login'),
+        ('通知列表', Notification.query.order_by(Notification.created_at.desc()).limit(20),
+         'ix_notifications_created_at'),
+        ('过期通知', Notification.query.filter(
+            Notification.is_active == True, Notification.expires_at < now
+        ),
+         'ix_notifications_active_expires_at'),
+        ('用户交易', WalletTransaction.query.filter(
+            WalletTransaction.user_id == 42, WalletTransaction.status == TransactionStatus.COMPLETED
+        ),
+         'ix_wallet_transactions_user_status'),
+        ('失败交易清理', WalletTransaction.query.filter(
+            WalletTransaction.status == TransactionStatus.FAILED,
+            WalletTransaction.created_at < now - timedelta(days=7)
+        ),
+         'ix_wallet_transactions_report'),
+        ('交易时间范围', WalletTransaction.query.filter(
+            WalletTransaction.created_at >= now - timedelta(days=30), WalletTransaction.created_at < now
+        ),
+         'ix_wallet_transactions_'),
+        ('财务报表聚合', db.session.query(
+            db.func.date(WalletTransaction.created_at), WalletTransaction.transaction_type, db.func.count()
+        ).filter(
+            WalletTransaction.status == TransactionStatus.COMPLETED,
+            WalletTransaction.created_at >= now - timedelta(days=90), WalletTransaction.created_at < now
+        ).group_by(db.func.date(WalletTransaction.created_at), WalletTransaction.transaction_type),
+         'ix_wallet_transactions_report'),
+        ('到期定时任务', db.session.query(BotTask.id, BotTask.task_name, BotTask.next_run).filter(
+            BotTask.status == 'active', BotTask.next_run <= now
+        ).order_by(BotTask.next_run).limit(16),
+         'ix_bot_tasks_status_next_run'),
+        ('系统日志', SystemLog.query.order_by(SystemLog.created_at.desc()).limit(50),
+         'ix_system_logs_created_at'),
+        ('用户系统日志', SystemLog.query.filter(SystemLog.user_id == 42).order_by(
+            SystemLog.created_at.desc()
+        ).limit(50),
+         'ix_system_logs_user_created_at'),
+        ('旧日志清理', SystemLog.query.filter(SystemLog.created_at < now - timedelta(days=30)),
+         'ix_system_logs_created_at'),
+    ]
+
+
+def explain(query):
+    statement = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {statement}')).fetchall()
+    return [row[-1] for row in rows]
+
+
+def check(app):
+    failures = 0
+    with app.app_context():
+        for label, query, expected_index in query_shapes():
+            plan = explain(query)
+            uses_index = any(expected_index in step for step in plan)
+            full_scans = [step for step in plan if re.match(r'SCAN \w+$', step)]
+            ok = uses_index and not full_scans
+            failures += 0 if ok else 1
+            print(f'[{"OK" if ok else "FAIL"}] {label:<12} 预期 {expected_index}')
+            if not ok:
+                for step in plan:
+                    print(f'         {step}')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='已有数据的 SQLite 文件')
+    parser.add_argument('--scale', type=float, default=0.01)
+    args = parser.parse_args()
+
+    if args.db:
+        failures = check(create_app(args.db))
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'plans.db')
+            seed(db_path, args.scale)
+            failures = check(create_app(db_path))
+
+    print(f'{failures} 项失败' if failures else '全部查询计划符合预期')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,11 +7,34 @@ from flask import Flask, send_from_directory
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from src.models.user import db
+from src.models.migrations import run_migrations
 from src.routes.user import user_bp
 from src.routes.auth import auth_bp
 from src.routes.music import music_bp
 from src.routes.admin import admin_bp
 from src.routes.bot import bot_bp
+from src.routes.upload import upload_bp
+from src.services.audit import audit_log
+from src.services.play_ingest import play_ingest
+from src.services.principal import principal_cache
+from src.services.catalog_cache import catalog_cache
+from src.services.statistics import statistics
+from src.services.reconciliation import reconciliation_engine
+from src.services.financial_report import financial_reports
+from src.services.scheduler import scheduler
+from src.services.jobs import job_manager
+from src.services.cleanup import batch_cleaner
+from src.services.log_archive import log_archive
+from src.services.db_maintenance import db_maintenance
+from src.services.snapshots import snapshots
+from src.services.audio_stream import audio_streamer
+from src.services.uploads import uploads
+from src.services.audio_metadata import audio_metadata
+from src.services.waveforms import waveforms
+from src.services.music_search import music_search
+from src.services.user_search import user_search
+from src.services.typeahead import typeahead
+from src.services.trending import trending
 from datetime import timedelta
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
@@ -22,13 +45,163 @@ app.config['JWT_SECRET_KEY'] = 'beatmm-jwt-secret-key-2024'
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
 app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(days=30)
 
+# 权限身份缓存有效期（秒）
+app.config['PRINCIPAL_CACHE_TTL'] = 30
+
+# 管理后台统计计数器与数据库对账间隔（秒）
+app.config['STATISTICS_RECONCILE_INTERVAL'] = 300
+
+# 对账引擎配置（每个分区的用户数、并行线程数、注册初始余额、进度多少秒未更新视为已中断）
+app.config['RECONCILE_PARTITION_SIZE'] = 5000
+app.config['RECONCILE_WORKERS'] = 4
+app.config['RECONCILE_INITIAL_BALANCE'] = '1000.00'
+app.config['RECONCILE_STALE_AFTER'] = 600
+
+# 财务报表按天缓存已结束日期的最大天数
+app.config['FINANCIAL_REPORT_CACHE_DAYS'] = 3660
+
+# 定时任务调度器配置（每种任务类型在单个进程内的并发上限）
+app.config['BOT_SCHEDULER_ENABLED'] = True
+app.config['BOT_SCHEDULER_POLL_INTERVAL'] = 5.0
+app.config['BOT_SCHEDULER_MAX_WORKERS'] = 4
+app.config['BOT_SCHEDULER_LEASE_SECONDS'] = 300
+app.config['BOT_SCHEDULER_TYPE_LIMITS'] = {
+    'accounting': 1,
+    'maintenance': 1,
+    'data_cleanup': 1,
+    'report_generation': 2
+}
+
+# 异步任务配置（结果保留时间、心跳超时时间，单位秒）
+app.config['BOT_JOB_MAX_WORKERS'] = 2
+app.config['BOT_JOB_RESULT_TTL'] = 86400
+app.config['BOT_JOB_LEASE_SECONDS'] = 120
+
+# 过期数据清理配置（每批行数、批次间隔秒数、各表保留天数）
+app.config['CLEANUP_BATCH_SIZE'] = 1000
+app.config['CLEANUP_BATCH_PAUSE'] = 0.05
+app.config['CLEANUP_RETENTION_DAYS'] = {
+    'system_logs': 30,
+    'failed_transactions': 7
+}
+
+# 系统日志归档配置（过期日志转入压缩段文件；目录设为 None 则直接删除）
+app.config['LOG_ARCHIVE_DIR'] = os.path.join(os.path.dirname(__file__), 'database', 'log_archive')
+app.config['LOG_ARCHIVE_SEGMENT_ROWS'] = 10000
+
+# 数据库维护配置（单步最长阻塞毫秒数、每轮最长秒数、维护时间窗口 UTC、WAL 自动检查点页数）
+app.config['DB_BUSY_TIMEOUT_MS'] = 5000
+# 连接的 PRAGMA synchronous（如 'NORMAL'），None 保持 SQLite 默认
+app.config['DB_SYNCHRONOUS'] = None
+app.config['MAINTENANCE_MAX_BLOCK_MS'] = 200
+app.config['MAINTENANCE_STEP_PAUSE'] = 0.05
+app.config['MAINTENANCE_MAX_DURATION'] = 60.0
+app.config['MAINTENANCE_WINDOW'] = '02:00-05:00'
+app.config['MAINTENANCE_CHECKPOINT_PAGES'] = 1000
+
+# 数据库在线快照配置（保留份数、每步复制页数、步骤间隔秒数）
+app.config['SNAPSHOT_DIR'] = os.path.join(os.path.dirname(__file__), 'database', 'snapshots')
+app.config['SNAPSHOT_KEEP'] = 7
+app.config['SNAPSHOT_PAGES_PER_STEP'] = 1024
+app.config['SNAPSHOT_STEP_PAUSE'] = 0.01
+
+# 音频文件目录与流式播放配置（file_url 以 MEDIA_URL_PREFIX 开头或为相对路径时指向 MEDIA_ROOT 下的文件）
+app.config['MEDIA_ROOT'] = os.path.join(os.path.dirname(__file__), 'media')
+app.config['MEDIA_URL_PREFIX'] = '/media/'
+# 由前端服务器发送文件: None / 'x-sendfile'（Apache、lighttpd）/ 'x-accel-redirect'（nginx，需配置 internal location）
+app.config['STREAM_OFFLOAD'] = None
+app.config['STREAM_ACCEL_PREFIX'] = '/protected-media/'
+# 不超过该大小的音频映射到内存缓存，缓存总大小上限（字节）
+app.config['STREAM_MMAP_MAX_FILE'] = 8 * 1024 * 1024
+app.config['STREAM_MMAP_CACHE_BYTES'] = 256 * 1024 * 1024
+app.config['STREAM_MAX_AGE'] = 86400
+
+# 分块上传配置（临时文件与 MEDIA_ROOT 位于同一文件系统，完成后直接移动）
+app.config['UPLOAD_DIR'] = os.path.join(app.config['MEDIA_ROOT'], '.uploads')
+app.config['UPLOAD_CHUNK_SIZE'] = 4 * 1024 * 1024
+app.config['UPLOAD_MAX_FILE_SIZE'] = 200 * 1024 * 1024
+app.config['UPLOAD_SESSION_TTL'] = 86400
+
+# 音频元数据批量解析的工作进程数（0 表示在当前进程中解析）与补全历史数据时每批的文件数
+app.config['METADATA_WORKERS'] = min(4, os.cpu_count() or 1)
+app.config['METADATA_BATCH_SIZE'] = 200
+
+# 波形与响度预计算：每首歌的波形点数、短期响度曲线间隔（秒）、音量均衡目标响度、客户端缓存时间（秒）
+app.config['WAVEFORM_POINTS'] = 1000
+app.config['WAVEFORM_PROFILE_INTERVAL'] = 1.0
+app.config['WAVEFORM_TARGET_LUFS'] = -14.0
+app.config['WAVEFORM_MAX_AGE'] = 30 * 86400
+# 非 WAV 文件的外部解码命令，需输出 32 位浮点小端 PCM，例如
+# ['ffmpeg', '-v', 'error', '-i', '{path}', '-f', 'f32le', '-ac', '2', '-ar', '44100', '-']
+app.config['WAVEFORM_DECODER_COMMAND'] = None
+app.config['WAVEFORM_DECODER_SAMPLE_RATE'] = 44100
+app.config['WAVEFORM_DECODER_CHANNELS'] = 2
+
+# 音乐全文搜索：标题、艺术家、专辑、流派的 BM25 权重，播放次数加成（加成达到一半时的播放次数），
+# 匹配数超过候选上限时改为按播放次数排序，纠错的最短词长和词表刷新间隔（秒）
+app.config['MUSIC_SEARCH_WEIGHTS'] = (10.0, 6.0, 3.0, 1.0)
+app.config['MUSIC_SEARCH_POPULARITY_BOOST'] = 1.0
+app.config['MUSIC_SEARCH_POPULARITY_HALF'] = 1000
+app.config['MUSIC_SEARCH_CANDIDATE_LIMIT'] = 200
+app.config['MUSIC_SEARCH_TYPO_MIN_LENGTH'] = 4
+app.config['MUSIC_SEARCH_VOCABULARY_TTL'] = 600
+
+# 管理后台用户搜索：一次搜索最多使用的词数（手机号片段算一个词）
+app.config['USER_SEARCH_MAX_TERMS'] = 8
+
+# 输入建议：单次最多返回的条数，前缀匹配超过 SCAN_LIMIT 个词首时使用预先选出的候选，
+# 全量重建间隔（秒）和触发提前重建的新增建议数
+app.config['TYPEAHEAD_MAX_LIMIT'] = 20
+app.config['TYPEAHEAD_SCAN_LIMIT'] = 512
+app.config['TYPEAHEAD_REBUILD_INTERVAL'] = 3600
+app.config['TYPEAHEAD_DELTA_LIMIT'] = 20000
+
+# 音乐详情和列表页缓存：单曲和列表页的最大条数、有效期（秒）
+app.config['CATALOG_CACHE_MAX_TRACKS'] = 50000
+app.config['CATALOG_CACHE_MAX_PAGES'] = 5000
+app.config['CATALOG_CACHE_TRACK_TTL'] = 300
+app.config['CATALOG_CACHE_PAGE_TTL'] = 60
+
+# 热度榜单：各排序方式的半衰期（秒）、每个流派常驻内存的名次数、播放和收藏的权重、全量重建间隔（秒）
+app.config['TRENDING_HALF_LIVES'] = {'trending': 3 * 86400, 'hot': 6 * 3600}
+app.config['TRENDING_TOP_N'] = 1000
+app.config['TRENDING_PLAY_WEIGHT'] = 1.0
+app.config['TRENDING_LIKE_WEIGHT'] = 3.0
+app.config['TRENDING_REBUILD_INTERVAL'] = 3600
+
 # 数据库配置
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# 播放事件写缓冲配置
+app.config['PLAY_INGEST_BATCH_SIZE'] = 500
+app.config['PLAY_INGEST_FLUSH_INTERVAL'] = 1.0
+app.config['PLAY_INGEST_SPOOL_PATH'] = os.path.join(os.path.dirname(__file__), 'database', 'play_spool.jsonl')
+
+# 审计日志异步写入配置（溢出策略: block / drop_oldest / spill）
+app.config['AUDIT_LOG_QUEUE_SIZE'] = 10000
+app.config['AUDIT_LOG_BATCH_SIZE'] = 200
+app.config['AUDIT_LOG_FLUSH_INTERVAL'] = 0.5
+app.config['AUDIT_LOG_OVERFLOW_POLICY'] = 'spill'
+app.config['AUDIT_LOG_SPILL_PATH'] = os.path.join(os.path.dirname(__file__), 'database', 'audit_spill.jsonl')
+
 # 初始化扩展
 jwt = JWTManager(app)
-CORS(app, origins="*")  # 允许所有来源的跨域请求
+principal_cache.init_app(app)
+catalog_cache.init_app(app)
+statistics.init_app(app)
+reconciliation_engine.init_app(app)
+financial_reports.init_app(app)
+batch_cleaner.init_app(app)
+log_archive.init_app(app)
+snapshots.init_app(app)
+audio_streamer.init_app(app)
+uploads.init_app(app)
+audio_metadata.init_app(app)
+waveforms.init_app(app)
+music_search.init_app(app)
+user_search.init_app(app)
+CORS(app, origins="*", expose_headers=["Content-Range", "Accept-Ranges", "ETag", "Content-Length"])  # 允许所有来源的跨域请求
 
 # 注册蓝图
 app.register_blueprint(user_bp, url_prefix='/api')
@@ -36,15 +209,28 @@ app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(music_bp, url_prefix='/api')
 app.register_blueprint(admin_bp, url_prefix='/api/admin')
 app.register_blueprint(bot_bp, url_prefix='/api/bot')
+app.register_blueprint(upload_bp, url_prefix='/api')
 
 # 初始化数据库
 db.init_app(app)
 with app.app_context():
+    # 连接参数（WAL、忙等待）需在建表前生效
+    db_maintenance.init_app(app)
     db.create_all()
+    # 执行数据库结构迁移
+    run_migrations(db.engine)
     # 初始化示例音乐数据
     from src.routes.music import init_sample_music
     init_sample_music()
 
+# 启动后台写入器、定时任务调度器、异步任务线程池、输入建议索引和热度榜单构建线程
+audit_log.init_app(app)
+play_ingest.init_app(app)
+scheduler.init_app(app)
+job_manager.init_app(app)
+typeahead.init_app(app)
+trending.init_app(app)
+
 # JWT错误处理
 @jwt.expired_token_loader
 def expired_token_callback(jwt_header, jwt_payload):
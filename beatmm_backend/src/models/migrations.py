@@ -0,0 +1,166 @@
+"""数据库版本迁移
+
+db.create_all() 只会创建缺失的表，不会给已有的表补索引或新列，
+因此对已有数据库的结构变更在这里按版本号依次执行，并记录在
+schema_migrations 表中。每个迁移必须是幂等的。
+"""
+from collections import defaultdict
+from datetime import date, datetime
+
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+
+from src.models.user import db, DailyMetric, User, PlayHistory, WalletTransaction, TransactionStatus
+from src.services.music_search import create_index as create_music_search_index
+from src.services.user_search import create_index as create_user_search_index
+
+
+def _create_indexes(*names):
+    """按名称创建模型中声明的索引（已存在则跳过）"""
+    def apply(conn):
+        wanted = set(names)
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name in wanted:
+                    index.create(conn, checkfirst=True)
+                    wanted.discard(index.name)
+        if wanted:
+            raise RuntimeError(f'模型中未声明索引: {sorted(wanted)}')
+    return apply
+
+
+def _add_columns(table_name, *names):
+    """按模型中的列定义给已有的表补列（已存在则跳过）"""
+    def apply(conn):
+        table = db.metadata.tables[table_name]
+        existing = {column['name'] for column in inspect(conn).get_columns(table_name)}
+        for name in names:
+            if name not in existing:
+                column_type = table.c[name].type.compile(conn.dialect)
+                conn.exec_driver_sql(f'ALTER TABLE {table_name} ADD COLUMN {name} {column_type}')
+    return apply
+
+
+def backfill_daily_metrics(conn):
+    """根据明细表一次性回填 daily_metrics，之后由写路径增量维护"""
+    table = DailyMetric.__table__
+    table.create(conn, checkfirst=True)
+    conn.execute(table.delete())
+
+    totals = defaultdict(lambda: {
+        'new_users': 0, 'plays': 0, 'transaction_count': 0, 'revenue_amount': 0, 'expense_amount': 0
+    })
+
+    user_day = db.func.date(User.created_at)
+    for day, count in conn.execute(db.select(user_day, db.func.count()).group_by(user_day)):
+        if day is not None:
+            totals[str(day)]['new_users'] = count
+
+    play_day = db.func.date(PlayHistory.played_at)
+    for day, count in conn.execute(db.select(play_day, db.func.count()).group_by(play_day)):
+        if day is not None:
+            totals[str(day)]['plays'] = count
+
+    tx_day = db.func.date(WalletTransaction.created_at)
+    amount = WalletTransaction.amount
+    query = db.select(
+        tx_day,
+        db.func.count(),
+        db.func.sum(db.case((amount > 0, amount), else_=0)),
+        db.func.sum(db.case((amount < 0, -amount), else_=0))
+    ).where(WalletTransaction.status == TransactionStatus.COMPLETED).group_by(tx_day)
+    for day, count, revenue, expense in conn.execute(query):
+        if day is not None:
+            totals[str(day)].update(transaction_count=count, revenue_amount=revenue or 0, expense_amount=expense or 0)
+
+    if totals:
+        conn.execute(table.insert(), [
+            dict(values, day=date.fromisoformat(day)) for day, values in totals.items()
+        ])
+
+
+def _replace_report_index(conn):
+    """用覆盖索引替换 (status, created_at) 索引，前者是后者的超集"""
+    _create_indexes('ix_wallet_transactions_report')(conn)
+    conn.exec_driver_sql('DROP INDEX IF EXISTS ix_wallet_transactions_status_created_at')
+
+
+def _widen_played_at_index(conn):
+    """ix_play_history_played_at 加上 music_id 列，旧索引同名，先删除再按模型重建"""
+    conn.exec_driver_sql('DROP INDEX IF EXISTS ix_play_history_played_at')
+    _create_indexes('ix_play_history_played_at')(conn)
+
+
+def _add_principal_changed_at(conn):
+    _add_columns('users', 'principal_changed_at')(conn)
+    _create_indexes('ix_users_principal_changed_at')(conn)
+
+
+# (版本号, 说明, 执行函数)
+MIGRATIONS = [
+    (1, '热点查询索引', _create_indexes(
+        'ix_users_created_at',
+        'ix_users_role',
+        'ix_users_last_login',
+        'ix_users_updated_at',
+        'ix_music_play_count',
+        'ix_music_genre_play_count',
+        'ix_music_featured_play_count',
+        'ix_play_history_user_played_at',
+        'ix_play_history_played_at',
+        'ix_play_history_music_id',
+        'ix_user_favorites_user_created_at',
+        'ix_notifications_active_expires_at',
+        'ix_notifications_created_at',
+        'ix_wallet_transactions_user_status',
+        'ix_wallet_transactions_created_at',
+        'ix_system_logs_created_at',
+        'ix_system_logs_user_created_at',
+    )),
+    (2, '回填每日汇总表 daily_metrics', backfill_daily_metrics),
+    (3, '财务报表覆盖索引', _replace_report_index),
+    (4, '定时任务轮询索引', _create_indexes('ix_bot_tasks_status_next_run')),
+    (5, '音乐比特率列', _add_columns('music', 'bitrate')),
+    (6, '音乐全文搜索索引 music_fts', create_music_search_index),
+    (7, '管理后台用户搜索索引 user_search', create_user_search_index),
+    (8, '播放历史时间范围覆盖索引', _widen_played_at_index),
+    (9, '用户角色/状态变更时间列', _add_principal_changed_at),
+]
+
+
+schema_migrations = db.Table(
+    'schema_migrations',
+    db.Column('version', db.Integer, primary_key=True),
+    db.Column('description', db.String(200)),
+    db.Column('applied_at', db.DateTime)
+)
+
+
+def current_version(conn):
+    schema_migrations.create(conn, checkfirst=True)
+    return conn.execute(db.select(db.func.max(schema_migrations.c.version))).scalar() or 0
+
+
+def run_migrations(engine):
+    """执行所有未应用的迁移，返回已应用的版本号列表"""
+    applied = []
+    with engine.begin() as conn:
+        version = current_version(conn)
+
+    for number, description, apply in MIGRATIONS:
+        if number <= version:
+            continue
+        try:
+            with engine.begin() as conn:
+                apply(conn)
+                conn.execute(schema_migrations.insert().values(
+                    version=number,
+                    description=description,
+                    applied_at=datetime.utcnow()
+                ))
+        except IntegrityError:
+            # 其他进程已完成同一迁移
+            continue
+        applied.append(number)
+
+    return applied
@@ -46,6 +46,16 @@ class User(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     last_login = db.Column(db.DateTime, nullable=True)
     login_count = db.Column(db.Integer, default=0)
+    # 角色或启用状态最近一次变更的时间，早于该时间签发的令牌中的角色声明不再可信
+    principal_changed_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_users_created_at', 'created_at', 'id'),
+        db.Index('ix_users_role', 'role'),
+        db.Index('ix_users_last_login', 'last_login'),
+        db.Index('ix_users_updated_at', 'updated_at'),
+        db.Index('ix_users_principal_changed_at', 'principal_changed_at'),
+    )
     
     # 关系
     play_history = db.relationship('PlayHistory', backref='user', lazy=True)
@@ -89,6 +99,7 @@ class Music(db.Model):
     artist = db.Column(db.String(200), nullable=False)
     album = db.Column(db.String(200), nullable=True)
     duration = db.Column(db.Integer, nullable=True)  # 秒数
+    bitrate = db.Column(db.Integer, nullable=True)  # 平均比特率 kbps，由上传后的元数据提取填写
     file_url = db.Column(db.String(500), nullable=True)
     cover_url = db.Column(db.String(500), nullable=True)
     genre = db.Column(db.String(100), nullable=True)
@@ -99,6 +110,12 @@ class Music(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_music_play_count', 'play_count', 'id'),
+        db.Index('ix_music_genre_play_count', 'genre', 'play_count', 'id'),
+        db.Index('ix_music_featured_play_count', 'is_featured', 'play_count', 'id'),
+    )
+    
     # 关系
     play_history = db.relationship('PlayHistory', backref='music', lazy=True)
     favorites = db.relationship('UserFavorite', backref='music', lazy=True)
@@ -110,6 +127,7 @@ class Music(db.Model):
             'artist': self.artist,
             'album': self.album,
             'duration': self.duration,
+            'bitrate': self.bitrate,
             'file_url': self.file_url,
             'cover_url': self.cover_url,
             'genre': self.genre,
@@ -127,6 +145,13 @@ class PlayHistory(db.Model):
     music_id = db.Column(db.Integer, db.ForeignKey('music.id'), nullable=False)
     played_at = db.Column(db.DateTime, default=datetime.utcnow)
     play_duration = db.Column(db.Integer, nullable=True)  # 实际播放时长(秒)
+    
+    __table_args__ = (
+        db.Index('ix_play_history_user_played_at', 'user_id', 'played_at', 'id'),
+        # 带 music_id 的覆盖索引，热度榜单重建按时间范围读取播放时不回表
+        db.Index('ix_play_history_played_at', 'played_at', 'music_id'),
+        db.Index('ix_play_history_music_id', 'music_id'),
+    )
 
 class UserFavorite(db.Model):
     __tablename__ = 'user_favorites'
@@ -136,7 +161,10 @@ class UserFavorite(db.Model):
     music_id = db.Column(db.Integer, db.ForeignKey('music.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.UniqueConstraint('user_id', 'music_id'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'music_id'),
+        db.Index('ix_user_favorites_user_created_at', 'user_id', 'created_at', 'id'),
+    )
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
@@ -153,6 +181,11 @@ class Notification(db.Model):
     expires_at = db.Column(db.DateTime, nullable=True)
     is_active = db.Column(db.Boolean, default=True)
     
+    __table_args__ = (
+        db.Index('ix_notifications_active_expires_at', 'is_active', 'expires_at'),
+        db.Index('ix_notifications_created_at', 'created_at', 'id'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -191,6 +224,13 @@ class WalletTransaction(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     processed_at = db.Column(db.DateTime, nullable=True)
     
+    __table_args__ = (
+        db.Index('ix_wallet_transactions_user_status', 'user_id', 'status'),
+        db.Index('ix_wallet_transactions_created_at', 'created_at'),
+        # 按状态+时间过滤（失败交易清理、财务报表聚合），覆盖类型和金额，按天分组时无需回表
+        db.Index('ix_wallet_transactions_report', 'status', 'created_at', 'transaction_type', 'amount'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -214,6 +254,32 @@ class SystemLog(db.Model):
     ip_address = db.Column(db.String(45), nullable=True)
     user_agent = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_system_logs_created_at', 'created_at', 'id'),
+        db.Index('ix_system_logs_user_created_at', 'user_id', 'created_at'),
+    )
+
+class DailyMetric(db.Model):
+    __tablename__ = 'daily_metrics'
+    
+    # 按天汇总的指标，由写路径增量维护，避免统计时扫描明细表
+    day = db.Column(db.Date, primary_key=True)
+    new_users = db.Column(db.Integer, default=0, nullable=False)
+    plays = db.Column(db.Integer, default=0, nullable=False)
+    transaction_count = db.Column(db.Integer, default=0, nullable=False)  # 已完成交易数
+    revenue_amount = db.Column(db.Numeric(14, 2), default=0, nullable=False)  # 已完成交易的收入合计
+    expense_amount = db.Column(db.Numeric(14, 2), default=0, nullable=False)  # 已完成交易的支出合计
+    
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat(),
+            'new_users': self.new_users,
+            'plays': self.plays,
+            'transaction_count': self.transaction_count,
+            'revenue_amount': float(self.revenue_amount or 0),
+            'expense_amount': float(self.expense_amount or 0)
+        }
 
 class BotTask(db.Model):
     __tablename__ = 'bot_tasks'
@@ -226,14 +292,19 @@ class BotTask(db.Model):
     schedule_time = db.Column(db.Time, nullable=True)
     last_run = db.Column(db.DateTime, nullable=True)
     next_run = db.Column(db.DateTime, nullable=True)
-    status = db.Column(db.String(20), default='active')  # 'active', 'paused', 'completed', 'failed'
+    status = db.Column(db.String(20), default='active')  # 'active', 'running', 'paused', 'completed', 'failed'
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # 执行中兼作心跳时间
     
     # 关系
     execution_logs = db.relationship('BotExecutionLog', backref='task', lazy=True)
     
+    __table_args__ = (
+        # 调度器轮询到期任务
+        db.Index('ix_bot_tasks_status_next_run', 'status', 'next_run'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -241,6 +312,7 @@ class BotTask(db.Model):
             'task_name': self.task_name,
             'description': self.description,
             'schedule_type': self.schedule_type,
+            'schedule_time': self.schedule_time.strftime('%H:%M') if self.schedule_time else None,
             'status': self.status,
             'last_run': self.last_run.isoformat() if self.last_run else None,
             'next_run': self.next_run.isoformat() if self.next_run else None,
@@ -253,7 +325,7 @@ class BotExecutionLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     task_id = db.Column(db.Integer, db.ForeignKey('bot_tasks.id'), nullable=False)
     execution_time = db.Column(db.DateTime, default=datetime.utcnow)
-    status = db.Column(db.String(20), nullable=False)  # 'success', 'failed', 'partial'
+    status = db.Column(db.String(20), nullable=False)  # 'running', 'success', 'failed', 'partial'
     result_summary = db.Column(db.Text, nullable=True)
     error_message = db.Column(db.Text, nullable=True)
     execution_duration = db.Column(db.Integer, nullable=True)  # 执行时长(秒)
@@ -268,3 +340,128 @@ class BotExecutionLog(db.Model):
             'execution_duration': self.execution_duration
         }
 
+
+class BotJob(db.Model):
+    """管理员触发的异步任务，结果以压缩 JSON 保存并在过期后清除"""
+    __tablename__ = 'bot_jobs'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False)  # 'reconcile', 'cleanup', 'optimize', 'user_statistics'
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running', 'succeeded', 'failed', 'interrupted'
+    params = db.Column(db.Text, nullable=True)
+    progress_current = db.Column(db.Integer, default=0)
+    progress_total = db.Column(db.Integer, nullable=True)
+    partial_result = db.Column(db.LargeBinary, nullable=True)  # zlib 压缩的 JSON
+    result = db.Column(db.LargeBinary, nullable=True)  # zlib 压缩的 JSON
+    error_message = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, default=0)
+    worker_id = db.Column(db.String(100), nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_bot_jobs_status_heartbeat', 'status', 'heartbeat_at'),
+        db.Index('ix_bot_jobs_expires_at', 'expires_at'),
+    )
+
+
+class MediaBlob(db.Model):
+    """按内容哈希去重后的媒体文件，多首音乐可以共用同一个文件"""
+    __tablename__ = 'media_blobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    storage_path = db.Column(db.String(500), nullable=False)  # 相对 MEDIA_ROOT 的路径
+    mime_type = db.Column(db.String(100), nullable=True)
+    ref_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'sha256': self.sha256,
+            'size': self.size,
+            'mime_type': self.mime_type,
+            'ref_count': self.ref_count,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class UploadSession(db.Model):
+    """分块上传会话，分块直接写入预分配的临时文件对应偏移处"""
+    __tablename__ = 'upload_sessions'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    mime_type = db.Column(db.String(100), nullable=True)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    expected_sha256 = db.Column(db.String(64), nullable=True)
+    details = db.Column(db.Text, nullable=True)  # 音乐信息 JSON（title、artist、album、genre）
+    status = db.Column(db.String(20), nullable=False, default='uploading')  # 'uploading', 'completing', 'completed', 'failed'
+    error_message = db.Column(db.Text, nullable=True)
+    music_id = db.Column(db.Integer, db.ForeignKey('music.id'), nullable=True)
+    blob_id = db.Column(db.Integer, db.ForeignKey('media_blobs.id'), nullable=True)
+    job_id = db.Column(db.String(32), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_upload_sessions_status_expires', 'status', 'expires_at'),
+    )
+    
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.total_size // self.chunk_size))
+    
+    def chunk_length(self, index):
+        return min(self.chunk_size, self.total_size - index * self.chunk_size)
+
+
+class UploadChunk(db.Model):
+    """已接收并校验通过的分块"""
+    __tablename__ = 'upload_chunks'
+    
+    session_id = db.Column(db.String(32), db.ForeignKey('upload_sessions.id'), primary_key=True)
+    chunk_index = db.Column(db.Integer, primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class MusicWaveform(db.Model):
+    """预先计算的波形峰值和响度曲线，data 为紧凑二进制格式（见 services/waveforms.py）"""
+    __tablename__ = 'music_waveforms'
+    
+    music_id = db.Column(db.Integer, db.ForeignKey('music.id'), primary_key=True)
+    etag = db.Column(db.String(64), nullable=False)
+    source = db.Column(db.String(100), nullable=True)  # 源文件 "大小-修改时间"，变化后需要重新计算
+    sample_rate = db.Column(db.Integer, nullable=False)
+    channels = db.Column(db.Integer, nullable=False)
+    duration_ms = db.Column(db.Integer, nullable=False)
+    points = db.Column(db.Integer, nullable=False)
+    integrated_lufs = db.Column(db.Float, nullable=True)  # 全程静音时为空
+    loudness_range = db.Column(db.Float, nullable=True)
+    sample_peak_db = db.Column(db.Float, nullable=True)
+    data = db.deferred(db.Column(db.LargeBinary, nullable=False))
+    analyzed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'music_id': self.music_id,
+            'sample_rate': self.sample_rate,
+            'channels': self.channels,
+            'duration_ms': self.duration_ms,
+            'points': self.points,
+            'integrated_lufs': self.integrated_lufs,
+            'loudness_range': self.loudness_range,
+            'sample_peak_db': self.sample_peak_db,
+            'analyzed_at': self.analyzed_at.isoformat() if self.analyzed_at else None
+        }
@@ -1,6 +1,13 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, make_response
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from src.models.user import db, User, UserRole, Notification, NotificationType, WalletTransaction, TransactionType, TransactionStatus, SystemLog
+from src.services.principal import load_current_principal, principal_cache
+from src.services.audit import log_action
+from src.services.daily_metrics import bump_daily_metrics, transaction_deltas, get_daily_metrics
+from src.services.statistics import statistics
+from src.services.pagination import cursor_paginate, wants_total, decode_cursor, encode_cursor, CursorPage, InvalidCursor
+from src.services.log_archive import log_archive
+from src.services.user_search import user_search
 from datetime import datetime, timedelta
 from functools import wraps
 
@@ -11,10 +18,9 @@ def super_admin_required(f):
     @wraps(f)
     @jwt_required()
     def decorated_function(*args, **kwargs):
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        principal = load_current_principal()
         
-        if not user or not user.is_super_admin():
+        if not principal or not principal.is_super_admin():
             return jsonify({'error': '需要超级管理员权限'}), 403
         
         return f(*args, **kwargs)
@@ -25,26 +31,14 @@ def admin_required(f):
     @wraps(f)
     @jwt_required()
     def decorated_function(*args, **kwargs):
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        principal = load_current_principal()
         
-        if not user or not user.is_admin():
+        if not principal or not principal.is_admin():
             return jsonify({'error': '需要管理员权限'}), 403
         
         return f(*args, **kwargs)
     return decorated_function
 
-def log_admin_action(user_id, action, details=None, ip_address=None):
-    """记录管理员操作日志"""
-    log = SystemLog(
-        user_id=user_id,
-        action=f'admin_{action}',
-        details=details,
-        ip_address=ip_address
-    )
-    db.session.add(log)
-    db.session.commit()
-
 # ==================== 用户管理 ====================
 
 @admin_bp.route('/users', methods=['GET'])
@@ -55,7 +49,7 @@ def get_users():
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
         role_filter = request.args.get('role')
-        search = request.args.get('search')
+        search = (request.args.get('search') or '').strip()
         
         query = User.query
         
@@ -63,14 +57,24 @@ def get_users():
             query = query.filter(User.role == UserRole(role_filter))
         
         if search:
-            query = query.filter(
-                db.or_(
-                    User.phone.contains(search),
-                    User.first_name.contains(search),
-                    User.last_name.contains(search),
-                    User.email.contains(search)
-                )
+            # 手机号、姓名、邮箱的全文索引查找，不再对 users 表做前后通配的 LIKE 扫描
+            query = query.filter(user_search.condition(search))
+        
+        # 游标分页模式
+        cursor = request.args.get('cursor')
+        if cursor is not None:
+            cursor_page = cursor_paginate(
+                query,
+                [(User.created_at, True), (User.id, True)],
+                key=lambda user: (user.created_at, user.id),
+                cursor=cursor,
+                per_page=per_page,
+                with_total=wants_total(request.args)
             )
+            return jsonify({
+                'users': [user.to_dict() for user in cursor_page.items],
+                'pagination': cursor_page.to_dict()
+            }), 200
         
         query = query.order_by(User.created_at.desc())
         
@@ -94,6 +98,8 @@ def get_users():
             }
         }), 200
         
+    except InvalidCursor:
+        return jsonify({'error': '无效的分页游标'}), 400
     except Exception as e:
         return jsonify({'error': '获取用户列表失败'}), 500
 
@@ -151,14 +157,17 @@ def update_user_role(user_id):
         
         old_role = user.role.value
         user.role = UserRole(new_role)
-        user.updated_at = datetime.utcnow()
+        user.updated_at = user.principal_changed_at = datetime.utcnow()
         
         db.session.commit()
+        principal_cache.invalidate(user.id)
+        was_admin = old_role in ('admin', 'super_admin')
+        statistics.adjust(admin_users=int(user.is_admin()) - int(was_admin))
         
         # 记录操作日志
-        log_admin_action(
+        log_action(
             current_user_id,
-            'update_user_role',
+            'admin_update_user_role',
             f'用户 {user.phone} 角色从 {old_role} 更改为 {new_role}',
             request.remote_addr
         )
@@ -192,18 +201,21 @@ def update_user_status(user_id):
         if is_active is None:
             return jsonify({'error': '缺少is_active参数'}), 400
         
+        was_active = bool(user.is_active)
         old_status = '启用' if user.is_active else '禁用'
         user.is_active = is_active
-        user.updated_at = datetime.utcnow()
+        user.updated_at = user.principal_changed_at = datetime.utcnow()
         
         db.session.commit()
+        principal_cache.invalidate(user.id)
+        statistics.adjust(active_users=int(bool(is_active)) - int(was_active))
         
         new_status = '启用' if is_active else '禁用'
         
         # 记录操作日志
-        log_admin_action(
+        log_action(
             current_user_id,
-            'update_user_status',
+            'admin_update_user_status',
             f'用户 {user.phone} 状态从 {old_status} 更改为 {new_status}',
             request.remote_addr
         )
@@ -267,12 +279,18 @@ def adjust_user_wallet(user_id):
         )
         
         db.session.add(transaction)
+        bump_daily_metrics(
+            db.session,
+            transaction.processed_at.date(),
+            **transaction_deltas(amount, TransactionStatus.COMPLETED)
+        )
         db.session.commit()
+        statistics.adjust(total_balance=amount)
         
         # 记录操作日志
-        log_admin_action(
+        log_action(
             current_user_id,
-            'adjust_wallet',
+            'admin_adjust_wallet',
             f'调整用户 {user.phone} 钱包余额 {amount} MMK，原余额: {old_balance}，新余额: {new_balance}',
             request.remote_addr
         )
@@ -343,12 +361,13 @@ def create_notification():
         
         db.session.add(notification)
         db.session.commit()
+        statistics.adjust(active_notifications=1)
         
         # 记录操作日志
         target_desc = f'用户 {target_user_id}' if target_user_id else f'角色 {target_role}'
-        log_admin_action(
+        log_action(
             current_user_id,
-            'create_notification',
+            'admin_create_notification',
             f'发布通知: {title}，目标: {target_desc}',
             request.remote_addr
         )
@@ -380,6 +399,22 @@ def get_notifications():
         if target_role:
             query = query.filter(Notification.target_role == target_role)
         
+        # 游标分页模式
+        cursor = request.args.get('cursor')
+        if cursor is not None:
+            cursor_page = cursor_paginate(
+                query,
+                [(Notification.created_at, True), (Notification.id, True)],
+                key=lambda notification: (notification.created_at, notification.id),
+                cursor=cursor,
+                per_page=per_page,
+                with_total=wants_total(request.args)
+            )
+            return jsonify({
+                'notifications': [notification.to_dict() for notification in cursor_page.items],
+                'pagination': cursor_page.to_dict()
+            }), 200
+        
         query = query.order_by(Notification.created_at.desc())
         
         pagination = query.paginate(
@@ -402,6 +437,8 @@ def get_notifications():
             }
         }), 200
         
+    except InvalidCursor:
+        return jsonify({'error': '无效的分页游标'}), 400
     except Exception as e:
         return jsonify({'error': '获取通知列表失败'}), 500
 
@@ -417,13 +454,15 @@ def delete_notification(notification_id):
             return jsonify({'error': '通知不存在'}), 404
         
         title = notification.title
+        was_active = bool(notification.is_active)
         db.session.delete(notification)
         db.session.commit()
+        statistics.adjust(active_notifications=-int(was_active))
         
         # 记录操作日志
-        log_admin_action(
+        log_action(
             current_user_id,
-            'delete_notification',
+            'admin_delete_notification',
             f'删除通知: {title}',
             request.remote_addr
         )
@@ -439,69 +478,108 @@ def delete_notification(notification_id):
 @admin_bp.route('/statistics', methods=['GET'])
 @admin_required
 def get_system_statistics():
-    """获取系统统计信息"""
+    """获取系统统计信息（内存计数器，支持 ETag 条件请求）"""
     try:
-        # 用户统计
-        total_users = User.query.count()
-        active_users = User.query.filter_by(is_active=True).count()
-        admin_users = User.query.filter(User.role.in_([UserRole.ADMIN, UserRole.SUPER_ADMIN])).count()
-        
-        # 今日新增用户
-        today = datetime.utcnow().date()
-        today_users = User.query.filter(
-            db.func.date(User.created_at) == today
-        ).count()
-        
-        # 钱包统计
-        total_balance = db.session.query(db.func.sum(User.wallet_balance)).scalar() or 0
-        
-        # 音乐统计
-        from src.models.user import Music, PlayHistory
-        total_music = Music.query.count()
-        total_plays = PlayHistory.query.count()
+        counters, version = statistics.snapshot()
         
-        # 今日播放次数
-        today_plays = PlayHistory.query.filter(
-            db.func.date(PlayHistory.played_at) == today
-        ).count()
-        
-        # 通知统计
-        active_notifications = Notification.query.filter_by(is_active=True).count()
-        
-        return jsonify({
+        response = make_response(jsonify({
             'users': {
-                'total': total_users,
-                'active': active_users,
-                'admins': admin_users,
-                'today_new': today_users
+                'total': counters['total_users'],
+                'active': counters['active_users'],
+                'admins': counters['admin_users'],
+                'today_new': counters['today_new_users']
             },
             'wallet': {
-                'total_balance': float(total_balance)
+                'total_balance': float(counters['total_balance'])
             },
             'music': {
-                'total_songs': total_music,
-                'total_plays': total_plays,
-                'today_plays': today_plays
+                'total_songs': counters['total_music'],
+                'total_plays': counters['total_plays'],
+                'today_plays': counters['today_plays']
             },
             'notifications': {
-                'active': active_notifications
+                'active': counters['active_notifications']
             }
-        }), 200
+        }), 200)
+        
+        # 计数器未变化时轮询请求直接返回 304
+        response.set_etag(f'stats-{version}')
+        response.headers['Cache-Control'] = 'private, max-age=5, must-revalidate'
+        return response.make_conditional(request)
         
     except Exception as e:
         return jsonify({'error': '获取统计信息失败'}), 500
 
+@admin_bp.route('/statistics/daily', methods=['GET'])
+@admin_required
+def get_daily_statistics():
+    """获取按天汇总的统计数据"""
+    try:
+        end_date_str = request.args.get('end_date')
+        start_date_str = request.args.get('start_date')
+        
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date() if end_date_str else datetime.utcnow().date()
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date() if start_date_str else end_date - timedelta(days=29)
+        
+        if start_date > end_date:
+            return jsonify({'error': '开始日期不能晚于结束日期'}), 400
+        if (end_date - start_date).days > 366:
+            return jsonify({'error': '日期范围不能超过一年'}), 400
+        
+        return jsonify({
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'days': get_daily_metrics(start_date, end_date)
+        }), 200
+        
+    except ValueError:
+        return jsonify({'error': '无效的日期格式'}), 400
+    except Exception as e:
+        return jsonify({'error': '获取每日统计失败'}), 500
+
 # ==================== 系统日志 ====================
 
+def _serialize_logs(items):
+    """序列化日志条目，并一次性加载关联用户信息"""
+    user_ids = {log.user_id for log in items if log.user_id}
+    users = {user.id: user for user in User.query.filter(User.id.in_(user_ids)).all()} if user_ids else {}
+    
+    logs = []
+    for log in items:
+        log_data = {
+            'id': log.id,
+            'user_id': log.user_id,
+            'action': log.action,
+            'resource': log.resource,
+            'resource_id': log.resource_id,
+            'details': log.details,
+            'ip_address': log.ip_address,
+            'created_at': log.created_at.isoformat() if log.created_at else None,
+            'archived': getattr(log, 'archived', False)
+        }
+        
+        # 添加用户信息
+        user = users.get(log.user_id)
+        if user:
+            log_data['user'] = {
+                'phone': user.phone,
+                'first_name': user.first_name,
+                'role': user.role.value
+            }
+        
+        logs.append(log_data)
+    return logs
+
 @admin_bp.route('/logs', methods=['GET'])
 @super_admin_required
 def get_system_logs():
-    """获取系统日志（仅超级管理员）"""
+    """获取系统日志（仅超级管理员），结果包含在线表和已归档的日志"""
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 50, type=int)
         action_filter = request.args.get('action')
         user_id_filter = request.args.get('user_id', type=int)
+        include_archive = log_archive.enabled and request.args.get('archive', '1').lower() not in ('0', 'false')
         
         query = SystemLog.query
         
@@ -511,6 +589,51 @@ def get_system_logs():
         if user_id_filter:
             query = query.filter(SystemLog.user_id == user_id_filter)
         
+        # 游标分页模式
+        cursor = request.args.get('cursor')
+        if cursor is not None:
+            with_total = wants_total(request.args)
+            cursor_page = cursor_paginate(
+                query,
+                [(SystemLog.created_at, True), (SystemLog.id, True)],
+                key=lambda log: (log.created_at, log.id),
+                cursor=cursor,
+                per_page=per_page,
+                with_total=with_total
+            )
+            
+            if include_archive:
+                # 与归档中排在游标之后的日志合并
+                before = tuple(decode_cursor(cursor, 2)) if cursor else None
+                archived = log_archive.query(
+                    user_id=user_id_filter,
+                    action=action_filter,
+                    before=before,
+                    limit=cursor_page.per_page + 1
+                )
+                hot_ids = {log.id for log in cursor_page.items}
+                merged = sorted(
+                    cursor_page.items + [log for log in archived if log.id not in hot_ids],
+                    key=lambda log: (log.created_at, log.id),
+                    reverse=True
+                )
+                has_next = cursor_page.has_next or len(merged) > cursor_page.per_page
+                items = merged[:cursor_page.per_page]
+                total = None
+                if with_total:
+                    total = cursor_page.total + log_archive.count(user_id_filter, action_filter)
+                cursor_page = CursorPage(
+                    items,
+                    cursor_page.per_page,
+                    encode_cursor((items[-1].created_at, items[-1].id)) if has_next and items else None,
+                    total
+                )
+            
+            return jsonify({
+                'logs': _serialize_logs(cursor_page.items),
+                'pagination': cursor_page.to_dict()
+            }), 200
+        
         query = query.order_by(SystemLog.created_at.desc())
         
         pagination = query.paginate(
@@ -518,44 +641,38 @@ def get_system_logs():
             per_page=per_page,
             error_out=False
         )
+        items = list(pagination.items)
+        total = pagination.total
+        
+        if include_archive:
+            # 在线日志之后接着是归档日志，归档部分的偏移量按索引跳过整段
+            total += log_archive.count(user_id_filter, action_filter)
+            offset = (page - 1) * per_page
+            if len(items) < per_page and offset + len(items) >= pagination.total:
+                items += log_archive.query(
+                    user_id=user_id_filter,
+                    action=action_filter,
+                    offset=max(0, offset - pagination.total),
+                    limit=per_page - len(items)
+                )
         
-        logs = []
-        for log in pagination.items:
-            log_data = {
-                'id': log.id,
-                'user_id': log.user_id,
-                'action': log.action,
-                'resource': log.resource,
-                'resource_id': log.resource_id,
-                'details': log.details,
-                'ip_address': log.ip_address,
-                'created_at': log.created_at.isoformat() if log.created_at else None
-            }
-            
-            # 添加用户信息
-            if log.user_id:
-                user = User.query.get(log.user_id)
-                if user:
-                    log_data['user'] = {
-                        'phone': user.phone,
-                        'first_name': user.first_name,
-                        'role': user.role.value
-                    }
-            
-            logs.append(log_data)
+        logs = _serialize_logs(items)
+        pages = (total + per_page - 1) // per_page if per_page else 0
         
         return jsonify({
             'logs': logs,
             'pagination': {
                 'page': page,
                 'per_page': per_page,
-                'total': pagination.total,
-                'pages': pagination.pages,
-                'has_next': pagination.has_next,
-                'has_prev': pagination.has_prev
+                'total': total,
+                'pages': pages,
+                'has_next': page < pages,
+                'has_prev': page > 1
             }
         }), 200
         
+    except InvalidCursor:
+        return jsonify({'error': '无效的分页游标'}), 400
     except Exception as e:
         return jsonify({'error': '获取系统日志失败'}), 500
 
@@ -1,6 +1,10 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity, get_jwt
-from src.models.user import db, User, UserRole, SystemLog
+from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
+from src.models.user import db, User, UserRole
+from src.services.audit import log_action
+from src.services.principal import principal_claims
+from src.services.daily_metrics import bump_daily_metrics
+from src.services.statistics import statistics
 from datetime import datetime, timedelta
 import re
 
@@ -17,17 +21,6 @@ def validate_password(password):
         return False, "密码至少需要6位字符"
     return True, ""
 
-def log_action(user_id, action, details=None, ip_address=None):
-    """记录系统日志"""
-    log = SystemLog(
-        user_id=user_id,
-        action=action,
-        details=details,
-        ip_address=ip_address
-    )
-    db.session.add(log)
-    db.session.commit()
-
 @auth_bp.route('/register', methods=['POST'])
 def register():
     try:
@@ -71,7 +64,9 @@ def register():
         user.set_password(password)
         
         db.session.add(user)
+        bump_daily_metrics(db.session, datetime.utcnow().date(), new_users=1)
         db.session.commit()
+        statistics.adjust(total_users=1, active_users=1, today_new_users=1, total_balance=user.wallet_balance)
         
         # 记录注册日志
         log_action(user.id, 'user_register', f'新用户注册: {phone}', request.remote_addr)
@@ -79,6 +74,7 @@ def register():
         # 创建访问令牌
         access_token = create_access_token(
             identity=user.id,
+            additional_claims=principal_claims(user),
             expires_delta=timedelta(hours=24)
         )
         refresh_token = create_refresh_token(
@@ -128,6 +124,7 @@ def login():
         # 创建访问令牌
         access_token = create_access_token(
             identity=user.id,
+            additional_claims=principal_claims(user),
             expires_delta=timedelta(hours=24)
         )
         refresh_token = create_refresh_token(
@@ -198,7 +195,9 @@ def super_admin_register():
         user.set_password(password)
         
         db.session.add(user)
+        bump_daily_metrics(db.session, datetime.utcnow().date(), new_users=1)
         db.session.commit()
+        statistics.adjust(total_users=1, active_users=1, admin_users=1, today_new_users=1, total_balance=user.wallet_balance)
         
         # 记录超级管理员注册日志
         log_action(user.id, 'super_admin_register', f'超级管理员注册: {phone}', request.remote_addr)
@@ -206,6 +205,7 @@ def super_admin_register():
         # 创建访问令牌
         access_token = create_access_token(
             identity=user.id,
+            additional_claims=principal_claims(user),
             expires_delta=timedelta(hours=24)
         )
         refresh_token = create_refresh_token(
@@ -237,6 +237,7 @@ def refresh():
         # 创建新的访问令牌
         access_token = create_access_token(
             identity=user.id,
+            additional_claims=principal_claims(user),
             expires_delta=timedelta(hours=24)
         )
         
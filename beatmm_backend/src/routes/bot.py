@@ -1,12 +1,31 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from src.models.user import db, User, UserRole, WalletTransaction, TransactionType, TransactionStatus, SystemLog, Music, PlayHistory, Notification
-from datetime import datetime, timedelta
+from flask import Blueprint, request, jsonify, g
+from flask_jwt_extended import jwt_required
+from src.models.user import db, User, WalletTransaction, TransactionType, TransactionStatus, Music, PlayHistory, UserFavorite, DailyMetric, BotTask, BotExecutionLog
+from src.services.principal import load_current_principal
+from src.services.audit import audit_log
+from src.services.play_ingest import play_ingest
+from src.services.daily_metrics import day_range, get_day_metric
+from src.services.statistics import statistics
+from src.services.financial_report import financial_reports
+from src.services.money import from_cents
+from src.services.pagination import cursor_paginate, InvalidCursor
+from src.services.reconciliation import reconciliation_engine
+from src.services.scheduler import scheduler, first_run, SCHEDULE_TYPES
+from src.services.jobs import job_manager
+from src.services.cleanup import batch_cleaner
+from src.services.log_archive import log_archive
+from src.services.db_maintenance import db_maintenance
+from src.services.snapshots import snapshots
+from src.services.uploads import uploads
+from src.services.audio_metadata import audio_metadata
+from src.services.waveforms import waveforms
+from src.services.music_search import music_search
+from src.services.user_search import user_search
+from src.services.typeahead import typeahead
+from src.services.catalog_cache import catalog_cache
+from src.services.trending import trending
+from datetime import datetime, timedelta, timezone
 from functools import wraps
-import threading
-import time
-import json
-from decimal import Decimal
 
 bot_bp = Blueprint('bot', __name__)
 
@@ -15,10 +34,9 @@ def super_admin_required(f):
     @wraps(f)
     @jwt_required()
     def decorated_function(*args, **kwargs):
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        principal = load_current_principal()
         
-        if not user or not user.is_super_admin():
+        if not principal or not principal.is_super_admin():
             return jsonify({'error': '需要超级管理员权限'}), 403
         
         return f(*args, **kwargs)
@@ -32,135 +50,220 @@ class AccountingBot:
         self.version = "1.0.0"
         self.last_run = None
         
-    def calculate_daily_revenue(self, date=None):
-        """计算每日收入"""
+    # 计入每日收入的交易类型
+    REVENUE_TYPES = (TransactionType.PURCHASE, TransactionType.REWARD)
+    
+    def calculate_daily_revenue(self, date=None, include_transactions=False, cursor=None, per_page=50):
+        """计算每日收入，交易明细按需分页返回"""
         if date is None:
             date = datetime.utcnow().date()
         
-        # 计算当日所有收入交易
-        revenue_transactions = WalletTransaction.query.filter(
-            db.func.date(WalletTransaction.created_at) == date,
-            WalletTransaction.transaction_type.in_([
-                TransactionType.PURCHASE,
-                TransactionType.SUBSCRIPTION,
-                TransactionType.REWARD
-            ]),
+        # 当日汇总来自按类型分组的聚合（已结束的日期命中缓存）
+        breakdown = financial_reports.daily_breakdown(date, date)[date]
+        revenue_types = {t.value for t in self.REVENUE_TYPES}
+        total_revenue = 0
+        transaction_count = 0
+        for (transaction_type, kind), (count, cents) in breakdown.items():
+            if transaction_type in revenue_types:
+                transaction_count += count
+                if kind == 'revenue':
+                    total_revenue += cents
+        
+        result = {
+            'date': date.isoformat(),
+            'total_revenue': float(from_cents(total_revenue)),
+            'transaction_count': transaction_count
+        }
+        
+        if include_transactions:
+            day_start, day_end = day_range(date)
+            query = WalletTransaction.query.filter(
+                WalletTransaction.created_at >= day_start,
+                WalletTransaction.created_at < day_end,
+                WalletTransaction.transaction_type.in_(self.REVENUE_TYPES),
+                WalletTransaction.status == TransactionStatus.COMPLETED
+            )
+            page = cursor_paginate(
+                query,
+                [(WalletTransaction.created_at, True), (WalletTransaction.id, True)],
+                key=lambda t: (t.created_at, t.id),
+                cursor=cursor,
+                per_page=per_page
+            )
+            result['transactions'] = [t.to_dict() for t in page.items]
+            result['pagination'] = page.to_dict()
+        
+        return result
+    
+    # 用户价值等级: (代码, 名称, 最低消费)
+    VALUE_TIERS = [
+        ('diamond', '钻石用户', 10000),
+        ('gold', '黄金用户', 5000),
+        ('silver', '白银用户', 1000),
+        ('normal', '普通用户', 0)
+    ]
+    USER_STATISTICS_SORTS = ('activity_score', 'total_spent', 'total_earned', 'play_count', 'user_id')
+    USER_STATISTICS_MAX_PER_PAGE = 1000
+    
+    def _user_statistics_query(self):
+        """每个度量一个 GROUP BY 子查询，LEFT JOIN 到用户表，全部在数据库内计算"""
+        amount = WalletTransaction.amount
+        transactions = db.session.query(
+            WalletTransaction.user_id.label('user_id'),
+            db.func.sum(db.case((amount < 0, -amount), else_=0)).label('total_spent'),
+            db.func.sum(db.case((amount > 0, amount), else_=0)).label('total_earned')
+        ).filter(
             WalletTransaction.status == TransactionStatus.COMPLETED
-        ).all()
+        ).group_by(WalletTransaction.user_id).subquery()
+        
+        plays = db.session.query(
+            PlayHistory.user_id.label('user_id'),
+            db.func.count().label('play_count')
+        ).group_by(PlayHistory.user_id).subquery()
+        
+        favorites = db.session.query(
+            UserFavorite.user_id.label('user_id'),
+            db.func.count().label('favorite_count')
+        ).group_by(UserFavorite.user_id).subquery()
+        
+        total_spent = db.func.coalesce(transactions.c.total_spent, 0)
+        total_earned = db.func.coalesce(transactions.c.total_earned, 0)
+        play_count = db.func.coalesce(plays.c.play_count, 0)
+        favorite_count = db.func.coalesce(favorites.c.favorite_count, 0)
         
-        total_revenue = sum(float(t.amount) for t in revenue_transactions if t.amount > 0)
-        transaction_count = len(revenue_transactions)
+        # 活跃度分数 (0-100)
+        raw_score = (play_count * 2 + favorite_count * 5 + db.func.coalesce(User.login_count, 0)) / 10.0
+        activity_score = db.case((raw_score > 100, 100.0), else_=raw_score)
         
+        value_tier = db.case(
+            *[(total_spent >= minimum, code) for code, _, minimum in self.VALUE_TIERS[:-1]],
+            else_=self.VALUE_TIERS[-1][0]
+        )
+        
+        columns = {
+            'total_spent': total_spent,
+            'total_earned': total_earned,
+            'play_count': play_count,
+            'favorite_count': favorite_count,
+            'activity_score': activity_score,
+            'value_tier': value_tier
+        }
+        query = db.session.query(
+            User.id, User.phone, User.first_name, User.last_name, User.role, User.wallet_balance,
+            User.login_count, User.created_at, User.last_login,
+            *[expression.label(name) for name, expression in columns.items()]
+        ).outerjoin(
+            transactions, transactions.c.user_id == User.id
+        ).outerjoin(
+            plays, plays.c.user_id == User.id
+        ).outerjoin(
+            favorites, favorites.c.user_id == User.id
+        )
+        return query, columns
+    
+    def _user_statistics_row(self, row):
+        total_spent = float(row.total_spent or 0)
+        total_earned = float(row.total_earned or 0)
+        tier_names = {code: name for code, name, _ in self.VALUE_TIERS}
         return {
-            'date': date.isoformat(),
-            'total_revenue': total_revenue,
-            'transaction_count': transaction_count,
-            'transactions': [t.to_dict() for t in revenue_transactions]
+            'user_id': row.id,
+            'phone': row.phone,
+            'name': f"{row.first_name} {row.last_name}",
+            'role': row.role.value,
+            'wallet_balance': float(row.wallet_balance or 0),
+            'total_spent': total_spent,
+            'total_earned': total_earned,
+            'net_balance': total_earned - total_spent,
+            'play_count': row.play_count,
+            'favorite_count': row.favorite_count,
+            'login_count': row.login_count,
+            'activity_score': round(float(row.activity_score), 2),
+            'value_tier': tier_names[row.value_tier],
+            'member_since': row.created_at.isoformat() if row.created_at else None,
+            'last_login': row.last_login.isoformat() if row.last_login else None
         }
     
-    def calculate_user_statistics(self, user_id=None):
-        """计算用户统计信息"""
+    def validate_user_statistics_args(self, tier=None, sort_by='activity_score'):
+        """检查等级和排序参数，无效时抛出 ValueError"""
+        if sort_by not in self.USER_STATISTICS_SORTS:
+            raise ValueError(f'无效的排序字段: {sort_by}')
+        if tier and tier not in [code for code, _, _ in self.VALUE_TIERS]:
+            raise ValueError(f'无效的用户等级: {tier}')
+    
+    def iter_user_statistics(self, user_id=None, tier=None, sort_by='activity_score', descending=True,
+                             offset=0, limit=None, chunk_size=1000):
+        """逐块流式产出用户统计，内存占用与用户总数无关"""
+        self.validate_user_statistics_args(tier, sort_by)
+        
+        query, columns = self._user_statistics_query()
+        
         if user_id:
-            users = [User.query.get(user_id)]
-        else:
-            users = User.query.all()
+            query = query.filter(User.id == user_id)
+        if tier:
+            query = query.filter(columns['value_tier'] == tier)
         
-        statistics = []
+        sort_column = User.id if sort_by == 'user_id' else columns[sort_by]
+        query = query.order_by(
+            sort_column.desc() if descending else sort_column.asc(),
+            User.id.desc() if descending else User.id.asc()
+        )
+        if offset:
+            query = query.offset(offset)
+        if limit is not None:
+            query = query.limit(limit)
         
-        for user in users:
-            if not user:
-                continue
-                
-            # 计算用户数据
-            total_spent = sum(
-                float(abs(t.amount)) for t in user.wallet_transactions 
-                if t.amount < 0 and t.status == TransactionStatus.COMPLETED
-            )
-            
-            total_earned = sum(
-                float(t.amount) for t in user.wallet_transactions 
-                if t.amount > 0 and t.status == TransactionStatus.COMPLETED
-            )
-            
-            play_count = len(user.play_history)
-            favorite_count = len(user.favorites)
-            
-            # 计算活跃度分数 (0-100)
-            activity_score = min(100, (play_count * 2 + favorite_count * 5 + user.login_count) / 10)
-            
-            # 计算用户价值等级
-            if total_spent >= 10000:
-                value_tier = "钻石用户"
-            elif total_spent >= 5000:
-                value_tier = "黄金用户"
-            elif total_spent >= 1000:
-                value_tier = "白银用户"
-            else:
-                value_tier = "普通用户"
-            
-            user_stats = {
-                'user_id': user.id,
-                'phone': user.phone,
-                'name': f"{user.first_name} {user.last_name}",
-                'role': user.role.value,
-                'wallet_balance': float(user.wallet_balance),
-                'total_spent': total_spent,
-                'total_earned': total_earned,
-                'net_balance': total_earned - total_spent,
-                'play_count': play_count,
-                'favorite_count': favorite_count,
-                'login_count': user.login_count,
-                'activity_score': round(activity_score, 2),
-                'value_tier': value_tier,
-                'member_since': user.created_at.isoformat() if user.created_at else None,
-                'last_login': user.last_login.isoformat() if user.last_login else None
-            }
-            
-            statistics.append(user_stats)
+        for row in query.yield_per(chunk_size):
+            yield self._user_statistics_row(row)
+    
+    def calculate_user_statistics(self, user_id=None, tier=None, sort_by='activity_score', descending=True,
+                                  page=1, per_page=100, progress_callback=None):
+        """计算用户统计信息（分页），返回 (当前页统计, 是否有下一页)
+
+        progress_callback(已读取行数, 本页最多行数) 每读取一行调用一次
+        """
+        page = max(page, 1)
+        per_page = max(1, min(per_page, self.USER_STATISTICS_MAX_PER_PAGE))
+        
+        statistics = []
+        for row in self.iter_user_statistics(
+            user_id=user_id,
+            tier=tier,
+            sort_by=sort_by,
+            descending=descending,
+            offset=(page - 1) * per_page,
+            limit=per_page + 1
+        ):
+            statistics.append(row)
+            if progress_callback:
+                progress_callback(len(statistics), per_page + 1)
         
-        return statistics
+        return statistics[:per_page], len(statistics) > per_page
     
-    def generate_financial_report(self, start_date=None, end_date=None):
-        """生成财务报告"""
+    def generate_financial_report(self, start_date=None, end_date=None, granularity=None):
+        """生成财务报告，granularity 为 daily/weekly/monthly 时按周期分桶"""
         if end_date is None:
             end_date = datetime.utcnow().date()
         if start_date is None:
             start_date = end_date - timedelta(days=30)  # 默认30天
+        if start_date > end_date:
+            raise ValueError('开始日期不能晚于结束日期')
         
-        # 查询期间内的所有交易
-        transactions = WalletTransaction.query.filter(
-            WalletTransaction.created_at >= start_date,
-            WalletTransaction.created_at <= end_date + timedelta(days=1),
-            WalletTransaction.status == TransactionStatus.COMPLETED
-        ).all()
-        
-        # 分类统计
-        revenue_by_type = {}
-        expense_by_type = {}
+        # 收支按交易类型和正负在数据库中聚合
+        aggregated = financial_reports.report(start_date, end_date, granularity)
+        summary = aggregated['summary']
         
-        for transaction in transactions:
-            amount = float(transaction.amount)
-            trans_type = transaction.transaction_type.value
-            
-            if amount > 0:  # 收入
-                revenue_by_type[trans_type] = revenue_by_type.get(trans_type, 0) + amount
-            else:  # 支出
-                expense_by_type[trans_type] = expense_by_type.get(trans_type, 0) + abs(amount)
-        
-        total_revenue = sum(revenue_by_type.values())
-        total_expense = sum(expense_by_type.values())
-        net_profit = total_revenue - total_expense
-        
-        # 用户增长统计
-        new_users = User.query.filter(
-            User.created_at >= start_date,
-            User.created_at <= end_date + timedelta(days=1)
-        ).count()
+        # 用户增长统计（每日汇总表）
+        new_users = db.session.query(db.func.sum(DailyMetric.new_users)).filter(
+            DailyMetric.day >= start_date,
+            DailyMetric.day <= end_date
+        ).scalar() or 0
         
         # 活跃用户统计
+        period_start, _ = day_range(start_date)
+        _, period_end = day_range(end_date)
         active_users = User.query.filter(
-            User.last_login >= start_date,
-            User.last_login <= end_date + timedelta(days=1)
+            User.last_login >= period_start,
+            User.last_login < period_end
         ).count()
         
         report = {
@@ -170,57 +273,41 @@ class AccountingBot:
                 'days': (end_date - start_date).days + 1
             },
             'financial_summary': {
-                'total_revenue': total_revenue,
-                'total_expense': total_expense,
-                'net_profit': net_profit,
-                'profit_margin': round((net_profit / total_revenue * 100) if total_revenue > 0 else 0, 2)
+                'total_revenue': summary['total_revenue'],
+                'total_expense': summary['total_expense'],
+                'net_profit': summary['net_profit'],
+                'profit_margin': summary['profit_margin']
             },
-            'revenue_breakdown': revenue_by_type,
-            'expense_breakdown': expense_by_type,
+            'revenue_breakdown': summary['revenue_breakdown'],
+            'expense_breakdown': summary['expense_breakdown'],
             'user_metrics': {
-                'new_users': new_users,
+                'new_users': int(new_users),
                 'active_users': active_users,
                 'total_users': User.query.count()
             },
-            'transaction_count': len(transactions),
+            'transaction_count': summary['transaction_count'],
             'generated_at': datetime.utcnow().isoformat(),
             'generated_by': self.name
         }
         
+        if granularity:
+            report['granularity'] = granularity
+            report['buckets'] = aggregated['buckets']
+        
         return report
     
-    def auto_reconcile_accounts(self):
-        """自动对账功能"""
-        # 检查所有用户的钱包余额是否与交易记录一致
-        inconsistencies = []
-        
-        users = User.query.all()
-        for user in users:
-            # 计算基于交易记录的余额
-            calculated_balance = 1000.0  # 初始余额
-            
-            for transaction in user.wallet_transactions:
-                if transaction.status == TransactionStatus.COMPLETED:
-                    calculated_balance += float(transaction.amount)
-            
-            current_balance = float(user.wallet_balance)
-            
-            # 检查是否有差异
-            if abs(calculated_balance - current_balance) > 0.01:  # 允许0.01的浮点误差
-                inconsistencies.append({
-                    'user_id': user.id,
-                    'phone': user.phone,
-                    'current_balance': current_balance,
-                    'calculated_balance': calculated_balance,
-                    'difference': calculated_balance - current_balance
-                })
-        
-        return {
-            'reconciliation_date': datetime.utcnow().isoformat(),
-            'total_users_checked': len(users),
-            'inconsistencies_found': len(inconsistencies),
-            'inconsistencies': inconsistencies
-        }
+    def auto_reconcile_accounts(self, created_by, incremental=False, resume=True, progress_callback=None,
+                                owner=None):
+        """自动对账功能 - 由对账引擎按用户分区并行执行，金额使用精确 Decimal 计算"""
+        result = reconciliation_engine.run(
+            created_by,
+            incremental=incremental,
+            resume=resume,
+            progress_callback=progress_callback,
+            owner=owner
+        )
+        self.last_run = datetime.utcnow()
+        return result
 
 class MaintenanceBot:
     """平台维护机器人 - 系统监控、自动清理、性能优化"""
@@ -287,113 +374,104 @@ class MaintenanceBot:
             }
             health_status['overall_status'] = 'unhealthy'
         
-        # 存储空间检查（模拟）
-        health_status['checks']['storage'] = {
-            'status': 'healthy',
-            'disk_usage': '45%',
-            'available_space': '2.1GB'
+        # 后台写入队列检查
+        audit_stats = audit_log.get_stats()
+        health_status['checks']['write_buffers'] = {
+            'status': 'warning' if audit_stats['dropped'] or audit_stats['write_errors'] else 'healthy',
+            'audit_log': audit_stats,
+            'play_ingest': play_ingest.get_stats()
         }
         
+        # 数据库文件和空闲页检查
+        try:
+            storage = db_maintenance.snapshot()
+            free_ratio = storage['freelist_pages'] / storage['page_count'] if storage['page_count'] else 0
+            health_status['checks']['storage'] = dict(
+                storage,
+                status='warning' if free_ratio > 0.25 else 'healthy',
+                freelist_ratio=round(free_ratio, 4),
+                last_maintenance=db_maintenance.last_report and {
+                    'timestamp': db_maintenance.last_report['timestamp'],
+                    'status': db_maintenance.last_report['status']
+                }
+            )
+        except Exception as e:
+            health_status['checks']['storage'] = {
+                'status': 'error',
+                'message': f'存储检查失败: {str(e)}'
+            }
+        
         return health_status
     
-    def cleanup_expired_data(self):
-        """清理过期数据"""
+    def cleanup_expired_data(self, progress_callback=None):
+        """清理过期数据 - 分批执行，每批一个短事务"""
+        now = datetime.utcnow()
         cleanup_results = {
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': now.isoformat(),
+            'retention_days': dict(batch_cleaner.retention_days),
             'operations': []
         }
         
-        try:
-            # 清理过期通知
-            expired_notifications = Notification.query.filter(
-                Notification.expires_at < datetime.utcnow(),
-                Notification.is_active == True
-            ).all()
-            
-            for notification in expired_notifications:
-                notification.is_active = False
-            
-            cleanup_results['operations'].append({
-                'operation': 'expire_notifications',
-                'count': len(expired_notifications),
-                'status': 'success'
-            })
-            
-            # 清理旧的系统日志（保留30天）
-            cutoff_date = datetime.utcnow() - timedelta(days=30)
-            old_logs = SystemLog.query.filter(SystemLog.created_at < cutoff_date).all()
-            
-            for log in old_logs:
-                db.session.delete(log)
-            
-            cleanup_results['operations'].append({
-                'operation': 'cleanup_old_logs',
-                'count': len(old_logs),
-                'status': 'success'
-            })
-            
-            # 清理失败的交易记录（7天前的）
-            failed_cutoff = datetime.utcnow() - timedelta(days=7)
-            failed_transactions = WalletTransaction.query.filter(
-                WalletTransaction.status == TransactionStatus.FAILED,
-                WalletTransaction.created_at < failed_cutoff
-            ).all()
-            
-            for transaction in failed_transactions:
-                db.session.delete(transaction)
-            
-            cleanup_results['operations'].append({
-                'operation': 'cleanup_failed_transactions',
-                'count': len(failed_transactions),
-                'status': 'success'
-            })
-            
-            db.session.commit()
-            
-        except Exception as e:
-            db.session.rollback()
-            cleanup_results['operations'].append({
-                'operation': 'cleanup_error',
-                'error': str(e),
-                'status': 'failed'
-            })
+        # (操作, 分批执行函数, 每批完成后的回调, 每批行数)
+        operations = [
+            # 过期通知置为失效，计数器按批次同步
+            ('expire_notifications', batch_cleaner.expire_notifications(now),
+             lambda count: statistics.adjust(active_notifications=-count), None),
+            # 失败的交易记录
+            ('cleanup_failed_transactions', batch_cleaner.delete_failed_transactions(now), None, None),
+            # 过期的上传会话及其临时文件
+            ('expire_upload_sessions', uploads.expire_sessions(now), None, None)
+        ]
+        # 旧的系统日志：启用归档时转入压缩段文件，否则直接删除
+        if log_archive.enabled:
+            operations.insert(1, ('archive_old_logs', log_archive.archive_batch(batch_cleaner.log_cutoff(now)),
+                                  None, log_archive.segment_rows))
+        else:
+            operations.insert(1, ('cleanup_old_logs', batch_cleaner.delete_old_logs(now), None, None))
         
+        for operation, execute_batch, on_batch, batch_size in operations:
+            try:
+                cleanup_results['operations'].append(batch_cleaner.run_batches(
+                    operation,
+                    execute_batch,
+                    on_batch=on_batch,
+                    progress_callback=progress_callback,
+                    batch_size=batch_size
+                ))
+            except Exception as e:
+                cleanup_results['operations'].append({
+                    'operation': operation,
+                    'error': str(e),
+                    'status': 'failed'
+                })
+        
+        self.last_run = datetime.utcnow()
         return cleanup_results
     
-    def optimize_database(self):
-        """数据库优化"""
-        optimization_results = {
-            'timestamp': datetime.utcnow().isoformat(),
-            'operations': []
-        }
-        
+    def optimize_database(self, scheduled=False, convert=False):
+        """数据库优化 - 增量回收空闲页、更新统计信息、WAL 检查点，单步阻塞时间有上限"""
         try:
-            # SQLite VACUUM 操作（清理和压缩数据库）
-            db.session.execute(db.text('VACUUM'))
-            optimization_results['operations'].append({
-                'operation': 'vacuum_database',
-                'status': 'success',
-                'message': '数据库已压缩和优化'
-            })
-            
-            # 分析表统计信息
-            db.session.execute(db.text('ANALYZE'))
-            optimization_results['operations'].append({
-                'operation': 'analyze_tables',
-                'status': 'success',
-                'message': '表统计信息已更新'
-            })
-            
-            db.session.commit()
-            
+            return db_maintenance.run(scheduled=scheduled, convert=convert)
         except Exception as e:
-            optimization_results['operations'].append({
-                'operation': 'optimization_error',
-                'error': str(e),
-                'status': 'failed'
-            })
-        
-        return optimization_results
+            return {
+                'timestamp': datetime.utcnow().isoformat(),
+                'status': 'failed',
+                'operations': [{
+                    'operation': 'optimization_error',
+                    'error': str(e),
+                    'status': 'failed'
+                }]
+            }
+    
+    def create_snapshot(self, progress_callback=None):
+        """在线创建数据库快照（分步复制，不停止服务）"""
+        manifest = snapshots.create(progress_callback=progress_callback)
+        self.last_run = datetime.utcnow()
+        return manifest
+    
+    def verify_snapshot(self, name=None, progress_callback=None):
+        """把快照恢复到临时文件并校验，默认校验最新的快照"""
+        return snapshots.verify(name, progress_callback=progress_callback)
     
     def generate_performance_report(self):
         """生成性能报告"""
@@ -428,13 +506,13 @@ class MaintenanceBot:
             
             # 用户活动指标
             today = datetime.utcnow().date()
+            day_start, day_end = day_range(today)
             today_logins = User.query.filter(
-                db.func.date(User.last_login) == today
+                User.last_login >= day_start,
+                User.last_login < day_end
             ).count()
             
-            today_plays = PlayHistory.query.filter(
-                db.func.date(PlayHistory.played_at) == today
-            ).count()
+            today_plays = get_day_metric(today, 'plays')
             
             report['user_activity_metrics'] = {
                 'daily_active_users': today_logins,
@@ -452,6 +530,153 @@ class MaintenanceBot:
 accounting_bot = AccountingBot()
 maintenance_bot = MaintenanceBot()
 
+# ==================== 定时任务处理函数 ====================
+# BotTask.task_name 对应以下注册的名称，由调度器在后台线程中执行
+
+@scheduler.task('auto_reconcile_accounts', 'accounting')
+def run_full_reconcile(task, execution_log):
+    return reconciliation_engine.run(task.created_by, task=task, execution_log=execution_log)
+
+@scheduler.task('incremental_reconcile_accounts', 'accounting')
+def run_incremental_reconcile(task, execution_log):
+    return reconciliation_engine.run(task.created_by, incremental=True, task=task, execution_log=execution_log)
+
+@scheduler.task('calculate_daily_revenue', 'accounting')
+def run_daily_revenue(task, execution_log):
+    # 统计前一天（已结束）的收入
+    return accounting_bot.calculate_daily_revenue(datetime.utcnow().date() - timedelta(days=1))
+
+@scheduler.task('generate_financial_report', 'report_generation')
+def run_financial_report(task, execution_log):
+    return accounting_bot.generate_financial_report()
+
+@scheduler.task('generate_performance_report', 'report_generation')
+def run_performance_report(task, execution_log):
+    return maintenance_bot.generate_performance_report()
+
+@scheduler.task('system_health_check', 'maintenance')
+def run_health_check(task, execution_log):
+    return maintenance_bot.system_health_check()
+
+@scheduler.task('optimize_database', 'maintenance')
+def run_optimize_database(task, execution_log):
+    # 定时执行只在维护窗口内进行
+    return maintenance_bot.optimize_database(scheduled=True)
+
+@scheduler.task('create_database_snapshot', 'maintenance')
+def run_create_snapshot(task, execution_log):
+    return maintenance_bot.create_snapshot()
+
+@scheduler.task('verify_database_snapshot', 'maintenance')
+def run_verify_snapshot(task, execution_log):
+    return maintenance_bot.verify_snapshot()
+
+@scheduler.task('cleanup_expired_data', 'data_cleanup')
+def run_cleanup(task, execution_log):
+    return maintenance_bot.cleanup_expired_data()
+
+# ==================== 异步任务处理函数 ====================
+# 耗时操作由接口提交为异步任务，立即返回任务ID
+
+@job_manager.job('reconcile', resumable=True)
+def reconcile_job(context, mode='full', resume=True):
+    # 对账引擎自带分区断点，重新执行会从已完成的分区继续
+    return accounting_bot.auto_reconcile_accounts(
+        context.created_by,
+        incremental=mode == 'incremental',
+        resume=resume,
+        progress_callback=lambda done, total: context.progress(done, total),
+        owner=f'job:{context.job_id}'
+    )
+
+@job_manager.job('cleanup', resumable=True)
+def cleanup_job(context):
+    processed = {}
+    
+    def report(operation, count):
+        processed[operation] = count
+        context.progress(sum(processed.values()), partial={'processed': processed})
+    
+    return maintenance_bot.cleanup_expired_data(progress_callback=report)
+
+@job_manager.job('optimize')
+def optimize_job(context, convert=False):
+    return maintenance_bot.optimize_database(convert=convert)
+
+@job_manager.job('snapshot')
+def snapshot_job(context):
+    return maintenance_bot.create_snapshot(
+        progress_callback=lambda phase, done, total: context.progress(done, total, partial={'phase': phase})
+    )
+
+@job_manager.job('verify_snapshot', resumable=True)
+def verify_snapshot_job(context, name=None):
+    return maintenance_bot.verify_snapshot(
+        name,
+        progress_callback=lambda phase, done, total: context.progress(done, total, partial={'phase': phase}, force=True)
+    )
+
+@job_manager.job('music_metadata', resumable=True)
+def music_metadata_job(context, limit=None):
+    # 已提取的音乐 bitrate 不再为空，重新执行时自然跳过
+    return audio_metadata.scan_backlog(
+        limit=limit,
+        progress_callback=lambda done, total, last_id: context.progress(done, total, partial={'last_id': last_id})
+    )
+
+@job_manager.job('waveforms', resumable=True)
+def waveforms_job(context, limit=None):
+    # 已生成的波形不会重复计算，重新执行时从剩余的音乐继续
+    return waveforms.analyze_backlog(limit=limit, progress_callback=lambda done, total: context.progress(done, total))
+
+@job_manager.job('music_search_rebuild')
+def music_search_rebuild_job(context):
+    return music_search.rebuild()
+
+@job_manager.job('user_search_rebuild')
+def user_search_rebuild_job(context):
+    return user_search.rebuild()
+
+@job_manager.job('trending_rebuild')
+def trending_rebuild_job(context):
+    return trending.build()
+
+@job_manager.job('user_statistics', resumable=True)
+def user_statistics_job(context, user_id=None, tier=None, sort_by='activity_score', descending=True,
+                        page=1, per_page=100):
+    # 页码和每页条数由 calculate_user_statistics 限制在有效范围内
+    rows, has_next = accounting_bot.calculate_user_statistics(
+        user_id=user_id,
+        tier=tier,
+        sort_by=sort_by,
+        descending=descending,
+        page=page,
+        per_page=per_page,
+        progress_callback=context.progress
+    )
+    
+    return {
+        'statistics': rows,
+        'pagination': {
+            'page': max(page, 1),
+            'per_page': max(1, min(per_page, accounting_bot.USER_STATISTICS_MAX_PER_PAGE)),
+            'has_next': has_next,
+            'has_prev': page > 1
+        }
+    }
+
+def _job_accepted(job_id):
+    """202 响应，附带任务状态查询地址"""
+    status_url = f'{request.script_root}/api/bot/jobs/{job_id}'
+    response = jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': status_url
+    })
+    response.status_code = 202
+    response.headers['Location'] = status_url
+    return response
+
 # ==================== 算账机器人API ====================
 
 @bot_bp.route('/accounting/daily-revenue', methods=['GET'])
@@ -462,22 +687,48 @@ def get_daily_revenue():
         date_str = request.args.get('date')
         date = datetime.strptime(date_str, '%Y-%m-%d').date() if date_str else None
         
-        result = accounting_bot.calculate_daily_revenue(date)
+        result = accounting_bot.calculate_daily_revenue(
+            date,
+            include_transactions=request.args.get('include_transactions', '').lower() in ('1', 'true'),
+            cursor=request.args.get('cursor'),
+            per_page=request.args.get('per_page', 50, type=int)
+        )
         return jsonify(result), 200
         
+    except InvalidCursor:
+        return jsonify({'error': '无效的分页游标'}), 400
     except Exception as e:
         return jsonify({'error': f'获取每日收入失败: {str(e)}'}), 500
 
 @bot_bp.route('/accounting/user-statistics', methods=['GET'])
 @super_admin_required
 def get_user_statistics():
-    """获取用户统计信息"""
+    """获取用户统计信息（异步任务，通过 /jobs/<job_id> 查询结果）"""
     try:
-        user_id = request.args.get('user_id', type=int)
+        tier = request.args.get('tier')
+        sort_by = request.args.get('sort', 'activity_score')
+        accounting_bot.validate_user_statistics_args(tier, sort_by)
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 100, type=int)
+        if page < 1:
+            return jsonify({'error': 'page 必须大于等于 1'}), 400
+        if not 1 <= per_page <= accounting_bot.USER_STATISTICS_MAX_PER_PAGE:
+            return jsonify({'error': f'per_page 必须在 1 到 {accounting_bot.USER_STATISTICS_MAX_PER_PAGE} 之间'}), 400
         
-        result = accounting_bot.calculate_user_statistics(user_id)
-        return jsonify({'statistics': result}), 200
+        job_id = job_manager.submit(
+            'user_statistics',
+            g.current_principal.id,
+            user_id=request.args.get('user_id', type=int),
+            tier=tier,
+            sort_by=sort_by,
+            descending=request.args.get('order', 'desc') != 'asc',
+            page=page,
+            per_page=per_page
+        )
+        return _job_accepted(job_id)
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'获取用户统计失败: {str(e)}'}), 500
 
@@ -492,9 +743,13 @@ def get_financial_report():
         start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date() if start_date_str else None
         end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date() if end_date_str else None
         
-        result = accounting_bot.generate_financial_report(start_date, end_date)
+        granularity = request.args.get('granularity')
+        
+        result = accounting_bot.generate_financial_report(start_date, end_date, granularity)
         return jsonify(result), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'生成财务报告失败: {str(e)}'}), 500
 
@@ -503,8 +758,14 @@ def get_financial_report():
 def reconcile_accounts():
     """执行自动对账"""
     try:
-        result = accounting_bot.auto_reconcile_accounts()
-        return jsonify(result), 200
+        data = request.get_json(silent=True) or {}
+        mode = data.get('mode', request.args.get('mode', 'full'))
+        if mode not in ('full', 'incremental'):
+            return jsonify({'error': '对账模式只能是 full 或 incremental'}), 400
+        resume = str(data.get('resume', request.args.get('resume', 'true'))).lower() not in ('0', 'false', 'no')
+
+        job_id = job_manager.submit('reconcile', g.current_principal.id, mode=mode, resume=resume)
+        return _job_accepted(job_id)
         
     except Exception as e:
         return jsonify({'error': f'自动对账失败: {str(e)}'}), 500
@@ -527,8 +788,8 @@ def system_health_check():
 def cleanup_system():
     """执行系统清理"""
     try:
-        result = maintenance_bot.cleanup_expired_data()
-        return jsonify(result), 200
+        job_id = job_manager.submit('cleanup', g.current_principal.id)
+        return _job_accepted(job_id)
         
     except Exception as e:
         return jsonify({'error': f'系统清理失败: {str(e)}'}), 500
@@ -536,14 +797,87 @@ def cleanup_system():
 @bot_bp.route('/maintenance/optimize', methods=['POST'])
 @super_admin_required
 def optimize_system():
-    """执行系统优化"""
+    """执行系统优化（convert_auto_vacuum=true 时执行一次整库 VACUUM 切换到增量回收）"""
     try:
-        result = maintenance_bot.optimize_database()
-        return jsonify(result), 200
+        data = request.get_json(silent=True) or {}
+        job_id = job_manager.submit('optimize', g.current_principal.id,
+                                    convert=bool(data.get('convert_auto_vacuum')))
+        return _job_accepted(job_id)
         
     except Exception as e:
         return jsonify({'error': f'系统优化失败: {str(e)}'}), 500
 
+@bot_bp.route('/maintenance/snapshots', methods=['GET'])
+@super_admin_required
+def list_snapshots():
+    """数据库快照列表"""
+    try:
+        return jsonify({
+            'snapshots': snapshots.list(),
+            'stats': snapshots.get_stats()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'获取快照列表失败: {str(e)}'}), 500
+
+@bot_bp.route('/maintenance/snapshots', methods=['POST'])
+@super_admin_required
+def create_snapshot():
+    """创建数据库快照"""
+    try:
+        if not snapshots.enabled:
+            return jsonify({'error': '未配置快照目录'}), 400
+        job_id = job_manager.submit('snapshot', g.current_principal.id)
+        return _job_accepted(job_id)
+        
+    except Exception as e:
+        return jsonify({'error': f'创建快照失败: {str(e)}'}), 500
+
+@bot_bp.route('/maintenance/snapshots/<name>/verify', methods=['POST'])
+@super_admin_required
+def verify_snapshot(name):
+    """恢复校验数据库快照"""
+    try:
+        if snapshots.get(name) is None:
+            return jsonify({'error': '快照不存在'}), 404
+        job_id = job_manager.submit('verify_snapshot', g.current_principal.id, name=name)
+        return _job_accepted(job_id)
+        
+    except Exception as e:
+        return jsonify({'error': f'快照校验失败: {str(e)}'}), 500
+
+@bot_bp.route('/maintenance/music-metadata', methods=['POST'])
+@super_admin_required
+def extract_music_metadata():
+    """为尚未提取元数据的音乐补全时长、比特率和标签"""
+    try:
+        data = request.get_json(silent=True) or {}
+        limit = data.get('limit')
+        if limit is not None and (not isinstance(limit, int) or limit < 1):
+            return jsonify({'error': 'limit 必须是正整数'}), 400
+        job_id = job_manager.submit('music_metadata', g.current_principal.id, limit=limit)
+        return _job_accepted(job_id)
+        
+    except Exception as e:
+        return jsonify({'error': f'提取音乐元数据失败: {str(e)}'}), 500
+
+@bot_bp.route('/maintenance/waveforms', methods=['POST'])
+@super_admin_required
+def generate_waveforms():
+    """为还没有波形的音乐计算波形峰值和响度"""
+    try:
+        if not waveforms.available:
+            return jsonify({'error': '计算波形需要安装 numpy'}), 400
+        data = request.get_json(silent=True) or {}
+        limit = data.get('limit')
+        if limit is not None and (not isinstance(limit, int) or limit < 1):
+            return jsonify({'error': 'limit 必须是正整数'}), 400
+        job_id = job_manager.submit('waveforms', g.current_principal.id, limit=limit)
+        return _job_accepted(job_id)
+        
+    except Exception as e:
+        return jsonify({'error': f'生成波形失败: {str(e)}'}), 500
+
 @bot_bp.route('/maintenance/performance-report', methods=['GET'])
 @super_admin_required
 def get_performance_report():
@@ -555,6 +889,180 @@ def get_performance_report():
     except Exception as e:
         return jsonify({'error': f'获取性能报告失败: {str(e)}'}), 500
 
+# ==================== 定时任务API ====================
+
+@bot_bp.route('/tasks', methods=['GET'])
+@super_admin_required
+def get_bot_tasks():
+    """获取定时任务列表"""
+    try:
+        status = request.args.get('status')
+        query = BotTask.query
+        if status:
+            query = query.filter(BotTask.status == status)
+        tasks = query.order_by(BotTask.next_run.is_(None), BotTask.next_run, BotTask.id).all()
+        
+        return jsonify({
+            'tasks': [task.to_dict() for task in tasks],
+            'registered_tasks': scheduler.registered_tasks(),
+            'scheduler': scheduler.get_stats()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'获取定时任务失败: {str(e)}'}), 500
+
+@bot_bp.route('/tasks', methods=['POST'])
+@super_admin_required
+def create_bot_task():
+    """创建定时任务"""
+    try:
+        data = request.get_json() or {}
+        task_name = data.get('task_name')
+        task_type = scheduler.task_type_of(task_name)
+        if task_type is None:
+            return jsonify({'error': f'未知的任务: {task_name}'}), 400
+        
+        schedule_type = data.get('schedule_type', 'once')
+        if schedule_type not in SCHEDULE_TYPES:
+            return jsonify({'error': f'调度类型只能是 {", ".join(SCHEDULE_TYPES)}'}), 400
+        
+        schedule_time = None
+        if data.get('schedule_time'):
+            schedule_time = datetime.strptime(data['schedule_time'], '%H:%M').time()
+        elif task_name == 'optimize_database' and schedule_type != 'once':
+            # 数据库维护默认在维护窗口开始时执行
+            schedule_time = db_maintenance.window_start
+        
+        if data.get('next_run'):
+            next_run = datetime.fromisoformat(data['next_run'])
+            # 带时区的时间换算成 UTC，调度器按不带时区的 UTC 时间比较
+            if next_run.tzinfo is not None:
+                next_run = next_run.astimezone(timezone.utc).replace(tzinfo=None)
+        else:
+            next_run = first_run(schedule_type, schedule_time)
+        
+        task = BotTask(
+            task_type=task_type,
+            task_name=task_name,
+            description=data.get('description'),
+            schedule_type=schedule_type,
+            schedule_time=schedule_time,
+            next_run=next_run,
+            status='active',
+            created_by=g.current_principal.id
+        )
+        db.session.add(task)
+        db.session.commit()
+        
+        if next_run <= datetime.utcnow():
+            scheduler.wakeup()
+        
+        return jsonify({
+            'message': '定时任务已创建',
+            'task': task.to_dict()
+        }), 201
+        
+    except ValueError as e:
+        return jsonify({'error': f'时间格式错误: {str(e)}'}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'创建定时任务失败: {str(e)}'}), 500
+
+@bot_bp.route('/tasks/<int:task_id>/status', methods=['PUT'])
+@super_admin_required
+def update_bot_task_status(task_id):
+    """暂停或恢复定时任务"""
+    try:
+        data = request.get_json() or {}
+        status = data.get('status')
+        if status not in ('active', 'paused'):
+            return jsonify({'error': '状态只能是 active 或 paused'}), 400
+        
+        task = BotTask.query.get_or_404(task_id)
+        if task.status == 'running':
+            return jsonify({'error': '任务正在执行，请稍后再试'}), 409
+        
+        task.status = status
+        if status == 'active' and task.next_run is None:
+            task.next_run = first_run(task.schedule_type, task.schedule_time)
+        db.session.commit()
+        
+        return jsonify({
+            'message': '任务状态已更新',
+            'task': task.to_dict()
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'更新任务状态失败: {str(e)}'}), 500
+
+@bot_bp.route('/tasks/<int:task_id>/logs', methods=['GET'])
+@super_admin_required
+def get_bot_task_logs(task_id):
+    """获取任务执行记录"""
+    try:
+        task = BotTask.query.get_or_404(task_id)
+        limit = min(request.args.get('limit', 20, type=int), 100)
+        logs = BotExecutionLog.query.filter_by(task_id=task.id).order_by(
+            BotExecutionLog.id.desc()
+        ).limit(limit).all()
+        
+        return jsonify({
+            'task': task.to_dict(),
+            'logs': [log.to_dict() for log in logs]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'获取执行记录失败: {str(e)}'}), 500
+
+# ==================== 异步任务API ====================
+
+@bot_bp.route('/jobs/<job_id>', methods=['GET'])
+@super_admin_required
+def get_job_status(job_id):
+    """查询异步任务的状态、进度和结果"""
+    try:
+        job = job_manager.get(job_id)
+        if job is None:
+            return jsonify({'error': '任务不存在或结果已过期'}), 404
+        return jsonify(job), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'获取任务状态失败: {str(e)}'}), 500
+
+@bot_bp.route('/maintenance/music-search', methods=['POST'])
+@super_admin_required
+def rebuild_music_search():
+    """按 music 表全量重建全文搜索索引（绕过 ORM 批量修改音乐信息后使用）"""
+    try:
+        job_id = job_manager.submit('music_search_rebuild', g.current_principal.id)
+        return _job_accepted(job_id)
+        
+    except Exception as e:
+        return jsonify({'error': f'重建搜索索引失败: {str(e)}'}), 500
+
+@bot_bp.route('/maintenance/user-search', methods=['POST'])
+@super_admin_required
+def rebuild_user_search():
+    """按 users 表全量重建管理后台用户搜索索引（绕过 ORM 批量导入或修改用户后使用）"""
+    try:
+        job_id = job_manager.submit('user_search_rebuild', g.current_principal.id)
+        return _job_accepted(job_id)
+        
+    except Exception as e:
+        return jsonify({'error': f'重建用户搜索索引失败: {str(e)}'}), 500
+
+@bot_bp.route('/maintenance/trending', methods=['POST'])
+@super_admin_required
+def rebuild_trending():
+    """按播放历史和收藏记录重建热度榜单（绕过 ORM 批量导入播放或收藏后使用）"""
+    try:
+        job_id = job_manager.submit('trending_rebuild', g.current_principal.id)
+        return _job_accepted(job_id)
+        
+    except Exception as e:
+        return jsonify({'error': f'重建热度榜单失败: {str(e)}'}), 500
+
 # ==================== 机器人状态API ====================
 
 @bot_bp.route('/status', methods=['GET'])
@@ -575,6 +1083,16 @@ def get_bot_status():
                 'status': 'active',
                 'last_run': maintenance_bot.last_run
             },
+            'scheduler': scheduler.get_stats(),
+            'jobs': job_manager.get_stats(),
+            'snapshots': snapshots.get_stats(),
+            'audio_metadata': audio_metadata.get_stats(),
+            'waveforms': waveforms.get_stats(),
+            'music_search': music_search.get_stats(),
+            'user_search': user_search.get_stats(),
+            'typeahead': dict(typeahead.get_stats(), memory=typeahead.memory_report()),
+            'catalog_cache': catalog_cache.get_stats(),
+            'trending': trending.get_stats(),
             'system_time': datetime.utcnow().isoformat()
         }
         
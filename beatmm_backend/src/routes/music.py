@@ -1,77 +1,234 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from src.models.user import db, User, Music, PlayHistory, UserFavorite, SystemLog
-from datetime import datetime
+from src.models.user import db, Music, PlayHistory, UserFavorite
+from src.services.audit import log_action
+from src.services.pagination import cursor_paginate, wants_total, InvalidCursor, MAX_CURSOR_PAGE_SIZE
+from src.services.play_ingest import play_ingest, MAX_PLAY_DURATION
+from src.services.statistics import statistics
+from src.services.audio_stream import audio_streamer
+from src.services.waveforms import waveforms
+from src.services.music_search import music_search, SearchError
+from src.services.typeahead import typeahead
+from src.services.catalog_cache import catalog_cache
+from src.services.trending import trending, SORTS
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
 
 music_bp = Blueprint('music', __name__)
 
-def log_action(user_id, action, details=None, ip_address=None):
-    """记录系统日志"""
-    log = SystemLog(
-        user_id=user_id,
-        action=action,
-        details=details,
-        ip_address=ip_address
-    )
-    db.session.add(log)
-    db.session.commit()
-
 @music_bp.route('/music', methods=['GET'])
 def get_music_list():
-    """获取音乐列表"""
+    """获取音乐列表，sort=all_time（默认）按累计播放次数排序，trending/hot 按时间衰减的热度排序（只包含热度榜前 N 首）"""
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
         genre = request.args.get('genre')
         featured = request.args.get('featured', type=bool)
+        sort = request.args.get('sort', 'all_time')
+        if sort not in SORTS:
+            return jsonify({'error': 'sort 必须是 ' + '、'.join(SORTS) + ' 之一'}), 400
+        
+        cursor = request.args.get('cursor')
+        
+        # 热度排序直接切片内存中的榜单，榜单建立之前按累计播放次数排序
+        if sort != 'all_time':
+            if cursor is not None:
+                ranked = trending.after(sort, genre, featured, cursor=cursor, per_page=per_page)
+                if ranked is not None:
+                    ids, next_cursor, total = ranked
+                    pagination = {
+                        'per_page': max(1, min(per_page, MAX_CURSOR_PAGE_SIZE)),
+                        'next_cursor': next_cursor,
+                        'has_next': next_cursor is not None
+                    }
+                    if wants_total(request.args):
+                        pagination['total'] = total
+                    return jsonify({
+                        'music': catalog_cache.tracks(ids),
+                        'pagination': pagination
+                    }), 200
+            else:
+                ranked = trending.page(sort, genre, featured, page=page, per_page=per_page)
+                if ranked is not None:
+                    ids, total = ranked
+                    per_page = max(1, min(per_page, MAX_CURSOR_PAGE_SIZE))
+                    page = max(page, 1)
+                    return jsonify({
+                        'music': catalog_cache.tracks(ids),
+                        'pagination': {
+                            'page': page,
+                            'per_page': per_page,
+                            'total': total,
+                            'pages': -(-total // per_page),
+                            'has_next': page * per_page < total,
+                            'has_prev': page > 1
+                        }
+                    }), 200
+        
+        # 列表页按查询参数缓存，播放次数和收藏数从计数器叠加
+        if cursor is not None:
+            with_total = wants_total(request.args)
+            key = ('cursor', genre, featured, cursor, per_page, with_total)
+        else:
+            key = ('page', genre, featured, page, per_page)
+        
+        def load():
+            query = Music.query
+            
+            if genre:
+                query = query.filter(Music.genre == genre)
+            
+            if featured is not None:
+                query = query.filter(Music.is_featured == featured)
+            
+            # 游标分页模式
+            if cursor is not None:
+                cursor_page = cursor_paginate(
+                    query,
+                    [(Music.play_count, True), (Music.id, True)],
+                    key=lambda music: (music.play_count, music.id),
+                    cursor=cursor,
+                    per_page=per_page,
+                    with_total=with_total
+                )
+                return cursor_page.items, cursor_page.to_dict()
+            
+            # 按播放次数排序
+            query = query.order_by(Music.play_count.desc(), Music.created_at.desc())
+            
+            pagination = query.paginate(
+                page=page, 
+                per_page=per_page, 
+                error_out=False
+            )
+            
+            return pagination.items, {
+                'page': page,
+                'per_page': per_page,
+                'total': pagination.total,
+                'pages': pagination.pages,
+                'has_next': pagination.has_next,
+                'has_prev': pagination.has_prev
+            }
         
-        query = Music.query
-        
-        if genre:
-            query = query.filter(Music.genre == genre)
-        
-        if featured is not None:
-            query = query.filter(Music.is_featured == featured)
+        music_list, pagination = catalog_cache.page(key, genre or None, load)
         
-        # 按播放次数排序
-        query = query.order_by(Music.play_count.desc(), Music.created_at.desc())
+        return jsonify({
+            'music': music_list,
+            'pagination': pagination
+        }), 200
         
-        pagination = query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
-        )
+    except InvalidCursor:
+        return jsonify({'error': '无效的分页游标'}), 400
+    except Exception as e:
+        return jsonify({'error': '获取音乐列表失败'}), 500
+
+@music_bp.route('/music/search', methods=['GET'])
+def search_music():
+    """全文搜索音乐标题、艺术家、专辑和流派，最后一个词按前缀匹配，无结果时自动纠错"""
+    try:
+        query = request.args.get('q', '')
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 20, type=int)
+        genre = request.args.get('genre')
+        if not 1 <= per_page <= 100:
+            return jsonify({'error': 'per_page 必须在 1 到 100 之间'}), 400
         
-        music_list = [music.to_dict() for music in pagination.items]
+        result = music_search.search(query, genre=genre, page=page, per_page=per_page)
         
         return jsonify({
-            'music': music_list,
+            'music': [music.to_dict() for music in result.items],
+            'query': query,
+            'corrected_query': result.corrected_query,
             'pagination': {
-                'page': page,
+                'page': result.page,
                 'per_page': per_page,
-                'total': pagination.total,
-                'pages': pagination.pages,
-                'has_next': pagination.has_next,
-                'has_prev': pagination.has_prev
+                # 匹配数过多时不计算总数
+                'total': result.total,
+                'pages': -(-result.total // per_page) if result.total is not None else None,
+                'has_next': result.has_next,
+                'has_prev': result.page > 1
             }
         }), 200
         
+    except SearchError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        return jsonify({'error': '获取音乐列表失败'}), 500
+        return jsonify({'error': '搜索音乐失败'}), 500
+
+@music_bp.route('/music/suggest', methods=['GET'])
+def suggest_music():
+    """输入即搜：按前缀返回标题、艺术家、专辑建议，按播放次数排序（内存索引，不查询数据库）"""
+    try:
+        query = request.args.get('q', '')
+        limit = request.args.get('limit', 10, type=int)
+        if not 1 <= limit <= typeahead.max_limit:
+            return jsonify({'error': f'limit 必须在 1 到 {typeahead.max_limit} 之间'}), 400
+        
+        return jsonify({
+            'suggestions': typeahead.suggest(query, limit),
+            'query': query
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': '获取搜索建议失败'}), 500
 
 @music_bp.route('/music/<int:music_id>', methods=['GET'])
 def get_music_detail(music_id):
     """获取音乐详情"""
     try:
-        music = Music.query.get(music_id)
+        music = catalog_cache.track(music_id)
         if not music:
             return jsonify({'error': '音乐不存在'}), 404
         
-        return jsonify({'music': music.to_dict()}), 200
+        return jsonify({'music': music}), 200
         
     except Exception as e:
         return jsonify({'error': '获取音乐详情失败'}), 500
 
+@music_bp.route('/music/<int:music_id>/stream', methods=['GET'])
+def stream_music(music_id):
+    """音频流式播放，支持 Range 断点和拖动"""
+    try:
+        music = db.session.get(Music, music_id)
+        if not music:
+            return jsonify({'error': '音乐不存在'}), 404
+        
+        response = audio_streamer.stream(request.environ, music.file_url)
+        if response is None:
+            return jsonify({'error': '音频文件不存在'}), 404
+        return response
+        
+    except RequestedRangeNotSatisfiable as e:
+        return e
+    except Exception as e:
+        return jsonify({'error': '音频播放失败'}), 500
+
+@music_bp.route('/music/<int:music_id>/waveform', methods=['GET'])
+def get_music_waveform(music_id):
+    """预计算的波形峰值和响度曲线；format=binary 时返回紧凑二进制格式"""
+    try:
+        etag = waveforms.etag(music_id)
+        if etag is None:
+            return jsonify({'error': '波形尚未生成'}), 404
+        
+        binary = request.args.get('format') == 'binary'
+        # 两种表示使用不同的 ETag；命中时不读取波形数据
+        etag = f'{etag}-{"bin" if binary else "json"}'
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        elif binary:
+            response = Response(waveforms.raw(music_id), mimetype='application/octet-stream')
+        else:
+            response = jsonify(waveforms.render(music_id))
+        
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = waveforms.max_age
+        return response
+        
+    except Exception as e:
+        return jsonify({'error': '获取波形失败'}), 500
+
 @music_bp.route('/music/<int:music_id>/play', methods=['POST'])
 @jwt_required()
 def record_play(music_id):
@@ -84,26 +241,22 @@ def record_play(music_id):
             return jsonify({'error': '音乐不存在'}), 404
         
         data = request.get_json() or {}
-        play_duration = data.get('play_duration', 0)
+        try:
+            play_duration = int(data.get('play_duration') or 0)
+        except (TypeError, ValueError, OverflowError):
+            play_duration = -1
+        if not 0 <= play_duration <= MAX_PLAY_DURATION:
+            return jsonify({'error': f'play_duration 必须是 0 到 {MAX_PLAY_DURATION} 之间的整数'}), 400
         
-        # 记录播放历史
-        play_record = PlayHistory(
-            user_id=current_user_id,
-            music_id=music_id,
-            play_duration=play_duration
-        )
-        db.session.add(play_record)
-        
-        # 更新播放次数
-        music.play_count += 1
-        db.session.commit()
+        # 播放历史和播放次数由写缓冲批量落库
+        play_ingest.record(current_user_id, music_id, play_duration)
         
         # 记录日志
         log_action(current_user_id, 'music_play', f'播放音乐: {music.title}', request.remote_addr)
         
         return jsonify({
             'message': '播放记录成功',
-            'play_count': music.play_count
+            'play_count': music.play_count + play_ingest.pending_delta(music_id)
         }), 200
         
     except Exception as e:
@@ -208,6 +361,22 @@ def get_user_favorites():
             UserFavorite.user_id == current_user_id
         ).order_by(UserFavorite.created_at.desc())
         
+        # 游标分页模式
+        cursor = request.args.get('cursor')
+        if cursor is not None:
+            cursor_page = cursor_paginate(
+                query.add_columns(UserFavorite.created_at, UserFavorite.id),
+                [(UserFavorite.created_at, True), (UserFavorite.id, True)],
+                key=lambda row: (row[1], row[2]),
+                cursor=cursor,
+                per_page=per_page,
+                with_total=wants_total(request.args)
+            )
+            return jsonify({
+                'music': [row[0].to_dict() for row in cursor_page.items],
+                'pagination': cursor_page.to_dict()
+            }), 200
+        
         pagination = query.paginate(
             page=page,
             per_page=per_page,
@@ -228,9 +397,18 @@ def get_user_favorites():
             }
         }), 200
         
+    except InvalidCursor:
+        return jsonify({'error': '无效的分页游标'}), 400
     except Exception as e:
         return jsonify({'error': '获取收藏列表失败'}), 500
 
+def _history_item(music, play_record):
+    """播放历史条目"""
+    music_data = music.to_dict()
+    music_data['played_at'] = play_record.played_at.isoformat()
+    music_data['play_duration'] = play_record.play_duration
+    return music_data
+
 @music_bp.route('/user/history', methods=['GET'])
 @jwt_required()
 def get_play_history():
@@ -245,6 +423,22 @@ def get_play_history():
             PlayHistory.user_id == current_user_id
         ).order_by(PlayHistory.played_at.desc())
         
+        # 游标分页模式
+        cursor = request.args.get('cursor')
+        if cursor is not None:
+            cursor_page = cursor_paginate(
+                query,
+                [(PlayHistory.played_at, True), (PlayHistory.id, True)],
+                key=lambda row: (row[1].played_at, row[1].id),
+                cursor=cursor,
+                per_page=per_page,
+                with_total=wants_total(request.args)
+            )
+            return jsonify({
+                'history': [_history_item(music, play_record) for music, play_record in cursor_page.items],
+                'pagination': cursor_page.to_dict()
+            }), 200
+        
         pagination = query.paginate(
             page=page,
             per_page=per_page,
@@ -253,10 +447,7 @@ def get_play_history():
         
         history_list = []
         for music, play_record in pagination.items:
-            music_data = music.to_dict()
-            music_data['played_at'] = play_record.played_at.isoformat()
-            music_data['play_duration'] = play_record.play_duration
-            history_list.append(music_data)
+            history_list.append(_history_item(music, play_record))
         
         return jsonify({
             'history': history_list,
@@ -270,6 +461,8 @@ def get_play_history():
             }
         }), 200
         
+    except InvalidCursor:
+        return jsonify({'error': '无效的分页游标'}), 400
     except Exception as e:
         return jsonify({'error': '获取播放历史失败'}), 500
 
@@ -326,4 +519,5 @@ def init_sample_music():
             db.session.add(music)
     
     db.session.commit()
+    statistics.invalidate()
 
@@ -0,0 +1,172 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from src.models.user import db, Music, MediaBlob, UploadSession
+from src.services.audit import log_action
+from src.services.jobs import job_manager
+from src.services.statistics import statistics
+from src.services.uploads import uploads, UploadError
+from src.services.audio_metadata import audio_metadata
+from src.services.waveforms import waveforms, WaveformError
+import json
+import os
+
+upload_bp = Blueprint('upload', __name__)
+
+def _own_session(upload_id):
+    """当前用户的上传会话，不存在或不属于当前用户时返回 None"""
+    session = db.session.get(UploadSession, upload_id)
+    if session is None or str(session.user_id) != str(get_jwt_identity()):
+        return None
+    return session
+
+@upload_bp.route('/uploads', methods=['POST'])
+@jwt_required()
+def create_upload():
+    """创建分块上传会话"""
+    try:
+        data = request.get_json() or {}
+        session = uploads.create_session(
+            get_jwt_identity(),
+            data.get('filename'),
+            data.get('size'),
+            mime_type=data.get('mime_type'),
+            sha256=data.get('sha256'),
+            chunk_size=data.get('chunk_size'),
+            details={key: data.get(key) for key in ('title', 'artist', 'album', 'genre') if data.get(key)}
+        )
+        return jsonify(uploads.describe(session)), 201
+        
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': '创建上传失败'}), 500
+
+@upload_bp.route('/uploads/<upload_id>', methods=['GET'])
+@jwt_required()
+def get_upload(upload_id):
+    """查询上传进度，断点续传时据此补传缺失的分块"""
+    try:
+        session = _own_session(upload_id)
+        if session is None:
+            return jsonify({'error': '上传会话不存在'}), 404
+        return jsonify(uploads.describe(session)), 200
+        
+    except Exception as e:
+        return jsonify({'error': '获取上传状态失败'}), 500
+
+@upload_bp.route('/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@jwt_required()
+def upload_chunk(upload_id, index):
+    """上传一个分块，请求体为分块原始数据，X-Chunk-SHA256 头可选"""
+    try:
+        session = _own_session(upload_id)
+        if session is None:
+            return jsonify({'error': '上传会话不存在'}), 404
+        
+        checksum = uploads.write_chunk(
+            session,
+            index,
+            request.stream,
+            request.content_length,
+            expected_sha256=request.headers.get('X-Chunk-SHA256')
+        )
+        return jsonify({'chunk': index, 'sha256': checksum}), 200
+        
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': '分块上传失败'}), 500
+
+@upload_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@jwt_required()
+def complete_upload(upload_id):
+    """全部分块上传后合并校验，创建音乐并提交后台处理任务"""
+    try:
+        current_user_id = get_jwt_identity()
+        session = _own_session(upload_id)
+        if session is None:
+            return jsonify({'error': '上传会话不存在'}), 404
+        
+        music, blob = uploads.complete(session)
+        statistics.adjust(total_music=1)
+        
+        # 上传时填写的字段不被文件标签覆盖
+        details = json.loads(session.details or '{}')
+        keep = [field for field in ('title', 'artist', 'album', 'genre') if details.get(field)]
+        session.job_id = job_manager.submit('process_upload', int(current_user_id), music_id=music.id, blob_id=blob.id,
+                                            keep=keep)
+        db.session.commit()
+        
+        log_action(current_user_id, 'music_upload', f'上传音乐: {music.title}', request.remote_addr)
+        
+        return jsonify({
+            'message': '上传成功',
+            'music': music.to_dict(),
+            'blob': blob.to_dict(),
+            'deduplicated': blob.ref_count > 1,
+            'job_id': session.job_id,
+            'status_url': f'/api/bot/jobs/{session.job_id}'
+        }), 201
+        
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': '完成上传失败'}), 500
+
+@upload_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@jwt_required()
+def abort_upload(upload_id):
+    """取消上传并删除已接收的数据"""
+    try:
+        session = _own_session(upload_id)
+        if session is None:
+            return jsonify({'error': '上传会话不存在'}), 404
+        uploads.abort(session)
+        return jsonify({'message': '上传已取消'}), 200
+        
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': '取消上传失败'}), 500
+
+# ==================== 上传后台处理 ====================
+
+@job_manager.job('process_upload', resumable=True)
+def process_upload_job(context, music_id, blob_id, keep=()):
+    """识别上传文件的实际格式，提取时长、比特率和标签写入音乐信息，并生成波形"""
+    blob = db.session.get(MediaBlob, blob_id)
+    music = db.session.get(Music, music_id)
+    if blob is None or music is None:
+        raise ValueError('上传的音乐或文件已被删除')
+    
+    path = uploads.blob_path(blob)
+    metadata = audio_metadata.extract(path)
+    if metadata['mime_type'] != blob.mime_type:
+        blob.mime_type = metadata['mime_type']
+    # 标题和艺术家未填写时是由文件名生成的默认值，改用文件标签
+    audio_metadata.apply(music, metadata, overwrite=[field for field in ('title', 'artist') if field not in keep])
+    
+    # 有对应的解码器时同时生成波形，失败不影响上传处理
+    waveform = None
+    if waveforms.available and waveforms.can_decode(metadata['format']):
+        try:
+            waveform = waveforms.analyze(music, path).to_dict()
+        except WaveformError as e:
+            waveform = {'error': str(e)}
+    db.session.commit()
+    
+    return {
+        'music_id': music_id,
+        'blob_id': blob_id,
+        'format': metadata['format'],
+        'mime_type': metadata['mime_type'],
+        'duration': metadata['duration'],
+        'bitrate': metadata['bitrate'],
+        'tags': metadata['tags'],
+        'waveform': waveform,
+        'size': os.path.getsize(path)
+    }
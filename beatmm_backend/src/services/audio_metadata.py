@@ -0,0 +1,222 @@
+import atexit
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import safe_join
+
+from src.models.user import db, Music
+from src.services.audio_probe import MetadataError, probe, probe_safe
+from src.services.audio_stream import audio_streamer
+
+
+# 包含 src 包的目录，解析进程以 python -m src.services.audio_probe 启动
+_PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class _ProbeProcess:
+    """一个解析工作进程，逐个发送文件路径并读取结果"""
+
+    def __init__(self):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, (_PACKAGE_ROOT, env.get('PYTHONPATH'))))
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'src.services.audio_probe'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=env,
+            text=True,
+            encoding='utf-8'
+        )
+
+    def probe(self, path):
+        self.process.stdin.write(json.dumps(os.path.abspath(path)) + '\n')
+        self.process.stdin.flush()
+        line = self.process.stdout.readline()
+        if not line:
+            raise BrokenPipeError('解析进程已退出')
+        metadata, error = json.loads(line)
+        return metadata, error
+
+    def close(self):
+        self.process.kill()
+        self.process.wait()
+
+
+class MetadataExtractor:
+    """音频元数据提取 - 只读帧头和容器头计算精确时长与比特率，并读取标签
+
+    MP3 优先使用 Xing/Info（扣除 LAME 记录的编码延迟和填充）或 VBRI 头中的总帧数，
+    没有时逐帧读取帧头累加采样数；WAV/FLAC/Ogg/MP4 使用容器头记录的采样数。
+    文件通过 mmap 读取，只访问用到的页面。
+
+    单个文件（上传处理）在当前进程中解析。纯 Python 解析受 GIL 限制，批量补全时
+    在 workers 个独立的解析进程中执行：进程以 python -m src.services.audio_probe 启动，
+    只导入标准库，不复制（fork）正在运行多个后台线程的应用进程，也不重新执行 main 模块；
+    workers 为 0 时在当前进程中解析。
+    """
+
+    def __init__(self, workers=None, batch_size=200):
+        self.workers = workers
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._processes = []
+        self._counters = {'files': 0, 'failed': 0, 'seconds': 0.0}
+
+    def init_app(self, app):
+        self.workers = app.config.get('METADATA_WORKERS', self.workers)
+        self.batch_size = app.config.get('METADATA_BATCH_SIZE', self.batch_size)
+        app.extensions['audio_metadata'] = self
+        atexit.register(self.shutdown)
+
+    def _pool(self):
+        with self._lock:
+            if not self._processes:
+                self._processes = [_ProbeProcess() for _ in range(self.workers or os.cpu_count() or 1)]
+            return list(self._processes)
+
+    def shutdown(self):
+        with self._lock:
+            processes, self._processes = self._processes, []
+        for process in processes:
+            process.close()
+
+    # ---------- 提取 ----------
+
+    def _map(self, paths):
+        """各解析进程依次领取下一个文件，按输入顺序返回结果"""
+        processes = self._pool()
+        results = [None] * len(paths)
+        indexes = iter(range(len(paths)))
+        lock = threading.Lock()
+
+        def drive(process):
+            while True:
+                with lock:
+                    index = next(indexes, None)
+                if index is None:
+                    return
+                results[index] = process.probe(paths[index])
+
+        with ThreadPoolExecutor(max_workers=len(processes), thread_name_prefix='metadata') as threads:
+            for future in [threads.submit(drive, process) for process in processes]:
+                future.result()
+        return results
+
+    def extract_many(self, paths):
+        """按输入顺序返回每个文件的 (结果, 错误信息)"""
+        if not paths:
+            return []
+        started = time.perf_counter()
+        if self.workers == 0:
+            results = [probe_safe(path) for path in paths]
+        else:
+            try:
+                results = self._map(paths)
+            except OSError:
+                # 解析进程异常退出（如被系统终止），重新启动后重试一次
+                self.shutdown()
+                results = self._map(paths)
+        self._count(results, started)
+        return results
+
+    def extract(self, path):
+        """在当前进程中解析单个文件"""
+        started = time.perf_counter()
+        try:
+            metadata = probe(path)
+        except (MetadataError, OSError, ValueError) as e:
+            self._count([(None, str(e))], started)
+            raise MetadataError(str(e)) from None
+        self._count([(metadata, None)], started)
+        return metadata
+
+    def _count(self, results, started):
+        with self._lock:
+            self._counters['files'] += len(results)
+            self._counters['failed'] += sum(1 for _, error in results if error)
+            self._counters['seconds'] += time.perf_counter() - started
+
+    @staticmethod
+    def path_for(file_url):
+        """Music.file_url 对应的本地文件路径；远程地址或不在媒体目录内时返回 None"""
+        relative = audio_streamer.resolve(file_url)
+        return safe_join(audio_streamer.media_root, relative) if relative else None
+
+    @staticmethod
+    def apply(music, metadata, overwrite=()):
+        """写入提取结果：时长和比特率总是更新；标签只填充空字段和 overwrite 中列出的字段"""
+        if metadata.get('duration') is not None:
+            music.duration = int(round(metadata['duration']))
+        if metadata.get('bitrate') is not None:
+            music.bitrate = metadata['bitrate']
+        for field in ('title', 'artist', 'album', 'genre'):
+            value = metadata['tags'].get(field)
+            if value and (field in overwrite or not getattr(music, field)):
+                setattr(music, field, value[:Music.__table__.c[field].type.length])
+
+    def scan_backlog(self, after_id=0, limit=None, progress_callback=None):
+        """为尚未提取元数据（bitrate 为空）的本地音乐补全时长、比特率和空缺的标签
+
+        按 id 分批处理，每批提交一次；progress_callback(done, total, last_id)。
+        远程文件和缺失的文件跳过，解析失败的文件记录错误后继续。
+        """
+        query = Music.query.filter(Music.bitrate.is_(None), Music.file_url.isnot(None))
+        total = query.filter(Music.id > after_id).count()
+        if limit is not None:
+            total = min(total, limit)
+        summary = {'processed': 0, 'updated': 0, 'skipped': 0, 'failed': 0, 'last_id': after_id, 'errors': []}
+        started = time.perf_counter()
+
+        while summary['processed'] < total:
+            batch_size = min(self.batch_size, total - summary['processed'])
+            batch = query.filter(Music.id > summary['last_id']).order_by(Music.id).limit(batch_size).all()
+            if not batch:
+                break
+            summary['last_id'] = batch[-1].id
+            summary['processed'] += len(batch)
+
+            local = []
+            for music in batch:
+                path = self.path_for(music.file_url)
+                if path and os.path.isfile(path):
+                    local.append((music, path))
+            summary['skipped'] += len(batch) - len(local)
+
+            results = self.extract_many([path for _, path in local])
+            for (music, _), (metadata, error) in zip(local, results):
+                if error:
+                    summary['failed'] += 1
+                    if len(summary['errors']) < 20:
+                        summary['errors'].append({'music_id': music.id, 'error': error})
+                    continue
+                self.apply(music, metadata)
+                summary['updated'] += 1
+            db.session.commit()
+
+            if progress_callback:
+                progress_callback(summary['processed'], total, summary['last_id'])
+
+        seconds = time.perf_counter() - started
+        extracted = summary['updated'] + summary['failed']
+        summary['duration_ms'] = round(seconds * 1000, 2)
+        summary['files_per_second'] = round(extracted / seconds, 1) if seconds > 0 else None
+        return summary
+
+    def get_stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        seconds = counters.pop('seconds')
+        return dict(
+            counters,
+            workers=self.workers if self.workers is not None else os.cpu_count(),
+            files_per_second=round(counters['files'] / seconds, 1) if seconds else None
+        )
+
+
+# 全局元数据提取实例
+audio_metadata = MetadataExtractor()
@@ -0,0 +1,728 @@
+"""音频文件头解析 - 只依赖标准库，不导入应用和数据库模型
+
+以 python -m src.services.audio_probe 运行时作为批量解析的工作进程：
+每行读入一个 JSON 编码的文件路径，每行写出 JSON 编码的 [结果, 错误信息]。
+"""
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+
+
+class MetadataError(ValueError):
+    """不是可识别的音频文件，或文件头已损坏"""
+
+
+MIME_TYPES = {
+    'mp3': 'audio/mpeg',
+    'aac': 'audio/aac',
+    'flac': 'audio/flac',
+    'wav': 'audio/wav',
+    'ogg': 'audio/ogg',
+    'opus': 'audio/ogg',
+    'mp4': 'audio/mp4',
+}
+
+# ID3v1 流派编号：0-79 为标准定义，80 之后为 Winamp 扩展
+ID3V1_GENRES = (
+    'Blues', 'Classic Rock', 'Country', 'Dance', 'Disco', 'Funk', 'Grunge', 'Hip-Hop', 'Jazz', 'Metal',
+    'New Age', 'Oldies', 'Other', 'Pop', 'R&B', 'Rap', 'Reggae', 'Rock', 'Techno', 'Industrial',
+    'Alternative', 'Ska', 'Death Metal', 'Pranks', 'Soundtrack', 'Euro-Techno', 'Ambient', 'Trip-Hop', 'Vocal',
+    'Jazz+Funk', 'Fusion', 'Trance', 'Classical', 'Instrumental', 'Acid', 'House', 'Game', 'Sound Clip',
+    'Gospel', 'Noise', 'AlternRock', 'Bass', 'Soul', 'Punk', 'Space', 'Meditative', 'Instrumental Pop',
+    'Instrumental Rock', 'Ethnic', 'Gothic', 'Darkwave', 'Techno-Industrial', 'Electronic', 'Pop-Folk',
+    'Eurodance', 'Dream', 'Southern Rock', 'Comedy', 'Cult', 'Gangsta', 'Top 40', 'Christian Rap', 'Pop/Funk',
+    'Jungle', 'Native American', 'Cabaret', 'New Wave', 'Psychadelic', 'Rave', 'Showtunes', 'Trailer', 'Lo-Fi',
+    'Tribal', 'Acid Punk', 'Acid Jazz', 'Polka', 'Retro', 'Musical', 'Rock & Roll', 'Hard Rock',
+    'Folk', 'Folk-Rock', 'National Folk', 'Swing', 'Fast Fusion', 'Bebob', 'Latin', 'Revival', 'Celtic',
+    'Bluegrass', 'Avantgarde', 'Gothic Rock', 'Progressive Rock', 'Psychedelic Rock', 'Symphonic Rock',
+    'Slow Rock', 'Big Band', 'Chorus', 'Easy Listening', 'Acoustic', 'Humour', 'Speech', 'Chanson', 'Opera',
+    'Chamber Music', 'Sonata', 'Symphony', 'Booty Bass', 'Primus', 'Porn Groove', 'Satire', 'Slow Jam', 'Club',
+    'Tango', 'Samba', 'Folklore', 'Ballad', 'Power Ballad', 'Rhythmic Soul', 'Freestyle', 'Duet', 'Punk Rock',
+    'Drum Solo', 'A capella', 'Euro-House', 'Dance Hall',
+)
+
+
+# ---------- 标签 ----------
+
+ID3_FRAMES = {
+    'TIT2': 'title', 'TT2': 'title',
+    'TPE1': 'artist', 'TP1': 'artist',
+    'TALB': 'album', 'TAL': 'album',
+    'TCON': 'genre', 'TCO': 'genre',
+    'TYER': 'year', 'TYE': 'year', 'TDRC': 'year',
+    'TRCK': 'track', 'TRK': 'track',
+}
+
+VORBIS_FIELDS = {
+    'TITLE': 'title', 'ARTIST': 'artist', 'ALBUM': 'album', 'GENRE': 'genre', 'DATE': 'year',
+    'TRACKNUMBER': 'track',
+}
+
+RIFF_INFO_FIELDS = {
+    b'INAM': 'title', b'IART': 'artist', b'IPRD': 'album', b'IGNR': 'genre', b'ICRD': 'year',
+    b'ITRK': 'track', b'IPRT': 'track',
+}
+
+MP4_FIELDS = {
+    b'\xa9nam': 'title', b'\xa9ART': 'artist', b'\xa9alb': 'album', b'\xa9gen': 'genre', b'gnre': 'genre',
+    b'\xa9day': 'year', b'trkn': 'track',
+}
+
+_NUMBERED_GENRE = re.compile(r'^\((\d+)\)(.*)$')
+
+
+def _genre(value):
+    """ID3 流派可能是 "(17)"、"17"、"(17)Rock" 或直接的名称"""
+    match = _NUMBERED_GENRE.match(value)
+    if match:
+        if match.group(2).strip():
+            return match.group(2).strip()
+        index = int(match.group(1))
+    elif value.isdigit():
+        index = int(value)
+    else:
+        return value
+    return ID3V1_GENRES[index] if index < len(ID3V1_GENRES) else None
+
+
+def _normalize_tags(tags):
+    result = {}
+    for field, value in tags.items():
+        value = value.replace('\x00', '').strip() if value else None
+        if field == 'genre' and value:
+            value = _genre(value)
+        elif field == 'year' and value:
+            value = value[:4] if value[:4].isdigit() else None
+        if value:
+            result[field] = value
+    return result
+
+
+def _syncsafe(data):
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _id3_text(data):
+    """ID3v2 文本帧：首字节为编码；v2.4 多个值以空字符分隔时取第一个"""
+    if not data:
+        return None
+    encoding, raw = data[0], bytes(data[1:])
+    if encoding == 0:
+        text = raw.decode('latin-1')
+    elif encoding == 1:
+        text = raw.decode('utf-16', 'replace')
+    elif encoding == 2:
+        text = raw.decode('utf-16-be', 'replace')
+    elif encoding == 3:
+        text = raw.decode('utf-8', 'replace')
+    else:
+        return None
+    return text.split('\x00')[0].strip() or None
+
+
+def _read_id3v2(mm, offset=0):
+    """解析 offset 处的 ID3v2 标签，返回 (标签, 标签总长度)；没有标签时返回 ({}, 0)"""
+    header = mm[offset:offset + 10]
+    if len(header) < 10 or header[:3] != b'ID3' or header[3] not in (2, 3, 4):
+        return {}, 0
+    major, flags = header[3], header[5]
+    size = _syncsafe(header[6:10])
+    length = 10 + size + (10 if flags & 0x10 else 0)
+
+    data = mm[offset + 10:offset + 10 + size]
+    if flags & 0x80 and major < 4:
+        # v2.3 及以前对整个标签做反同步处理
+        data = data.replace(b'\xff\x00', b'\xff')
+    pos = 0
+    if flags & 0x40:
+        pos = 4 + int.from_bytes(data[:4], 'big') if major == 3 else _syncsafe(data[:4])
+
+    id_length, header_length = (3, 6) if major == 2 else (4, 10)
+    tags = {}
+    while pos + header_length <= len(data):
+        frame_id = data[pos:pos + id_length]
+        if frame_id[0] == 0:
+            # 进入填充区
+            break
+        if major == 2:
+            frame_size, frame_flags = int.from_bytes(data[pos + 3:pos + 6], 'big'), 0
+        elif major == 3:
+            frame_size, frame_flags = int.from_bytes(data[pos + 4:pos + 8], 'big'), int.from_bytes(data[pos + 8:pos + 10], 'big')
+        else:
+            frame_size, frame_flags = _syncsafe(data[pos + 4:pos + 8]), int.from_bytes(data[pos + 8:pos + 10], 'big')
+        pos += header_length
+        body = data[pos:pos + frame_size]
+        pos += frame_size
+
+        field = ID3_FRAMES.get(frame_id.decode('latin-1'))
+        if field is None or field in tags:
+            continue
+        if major == 3:
+            if frame_flags & 0x00C0:
+                # 压缩或加密的帧
+                continue
+            if frame_flags & 0x0020:
+                body = body[1:]
+        elif major == 4:
+            if frame_flags & 0x000C:
+                continue
+            if frame_flags & 0x0040:
+                body = body[1:]
+            if frame_flags & 0x0001:
+                body = body[4:]
+            if frame_flags & 0x0002:
+                body = body.replace(b'\xff\x00', b'\xff')
+        value = _id3_text(body)
+        if value:
+            tags[field] = value
+    return tags, length
+
+
+def _read_id3v1(mm, end):
+    """文件末尾 128 字节的 ID3v1 标签，返回 (标签, 长度)"""
+    if end < 128 or mm[end - 128:end - 125] != b'TAG':
+        return {}, 0
+    block = mm[end - 128:end]
+
+    def text(raw):
+        return raw.split(b'\x00')[0].decode('latin-1').strip() or None
+
+    tags = {
+        'title': text(block[3:33]),
+        'artist': text(block[33:63]),
+        'album': text(block[63:93]),
+        'year': text(block[93:97]),
+    }
+    if block[125] == 0 and block[126]:
+        tags['track'] = str(block[126])
+    if block[127] < len(ID3V1_GENRES):
+        tags['genre'] = ID3V1_GENRES[block[127]]
+    return {field: value for field, value in tags.items() if value}, 128
+
+
+def _ape_length(mm, end):
+    """文件末尾 APEv2 标签的长度（含可选的标签头）"""
+    if end < 32 or mm[end - 32:end - 24] != b'APETAGEX':
+        return 0
+    size, _, flags = struct.unpack_from('<III', mm, end - 20)
+    return size + (32 if flags & 0x80000000 else 0)
+
+
+def _vorbis_comment(data, pos=0):
+    vendor_length = struct.unpack_from('<I', data, pos)[0]
+    pos += 4 + vendor_length
+    count = struct.unpack_from('<I', data, pos)[0]
+    pos += 4
+    tags = {}
+    for _ in range(count):
+        length = struct.unpack_from('<I', data, pos)[0]
+        pos += 4
+        key, separator, value = bytes(data[pos:pos + length]).decode('utf-8', 'replace').partition('=')
+        pos += length
+        field = VORBIS_FIELDS.get(key.upper())
+        if field and separator and value.strip() and field not in tags:
+            tags[field] = value.strip()
+    return tags
+
+
+# ---------- MPEG 音频 ----------
+
+MPEG_VERSIONS = {0: 2.5, 2: 2, 3: 1}
+MPEG_LAYERS = {1: 3, 2: 2, 3: 1}
+MPEG_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MPEG_SAMPLE_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 2.5: (11025, 12000, 8000)}
+# 帧同步最多向后搜索的字节数
+SYNC_SEARCH_LIMIT = 128 * 1024
+
+
+def _mpeg_frame(mm, pos):
+    """解析 pos 处的 MPEG 音频帧头，返回 (帧长度, 每帧采样数, 采样率, 比特率kbps, 版本, 声道数)，无效时返回 None"""
+    if pos + 4 > len(mm) or mm[pos] != 0xFF:
+        return None
+    b1, b2, b3 = mm[pos + 1], mm[pos + 2], mm[pos + 3]
+    if b1 & 0xE0 != 0xE0:
+        return None
+    version = MPEG_VERSIONS.get((b1 >> 3) & 3)
+    layer = MPEG_LAYERS.get((b1 >> 1) & 3)
+    bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 3
+    # 不支持自由比特率（索引 0）
+    if version is None or layer is None or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = MPEG_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index]
+    sample_rate = MPEG_SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate * 1000 // sample_rate + padding) * 4
+    else:
+        samples = 1152 if layer == 2 or version == 1 else 576
+        length = samples // 8 * bitrate * 1000 // sample_rate + padding
+    channels = 1 if b3 >> 6 == 3 else 2
+    return length, samples, sample_rate, bitrate, version, channels
+
+
+def _find_frame(mm, start, end, sample_rate=None):
+    """从 start 开始寻找帧同步，要求紧接着的下一帧也有效，避免把数据中的 0xFF 误认为帧头"""
+    pos, stop = start, min(end, start + SYNC_SEARCH_LIMIT)
+    while pos < stop:
+        pos = mm.find(b'\xff', pos, stop)
+        if pos < 0:
+            return None
+        frame = _mpeg_frame(mm, pos)
+        if frame is not None and (sample_rate is None or frame[2] == sample_rate):
+            following = pos + frame[0]
+            if following >= end:
+                return pos, frame
+            next_frame = _mpeg_frame(mm, following)
+            if next_frame is not None and next_frame[2] == frame[2]:
+                return pos, frame
+        pos += 1
+    return None
+
+
+def _vbr_header(mm, pos, frame):
+    """第一帧中的 Xing/Info（含 LAME 扩展）或 VBRI 头，返回总帧数、编码延迟和末尾填充"""
+    _, _, _, _, version, channels = frame
+    side_info = (17 if channels == 1 else 32) if version == 1 else (9 if channels == 1 else 17)
+    offset = pos + 4 + side_info
+    tag = mm[offset:offset + 4]
+    if tag in (b'Xing', b'Info'):
+        flags = struct.unpack_from('>I', mm, offset + 4)[0]
+        cursor = offset + 8
+        frames = None
+        if flags & 0x1:
+            frames = struct.unpack_from('>I', mm, cursor)[0]
+            cursor += 4
+        if flags & 0x2:
+            cursor += 4
+        if flags & 0x4:
+            cursor += 100
+        if flags & 0x8:
+            cursor += 4
+        delay = padding = 0
+        if mm[cursor:cursor + 4] in (b'LAME', b'Lavf', b'Lavc'):
+            raw = mm[cursor + 21:cursor + 24]
+            delay = (raw[0] << 4) | (raw[1] >> 4)
+            padding = ((raw[1] & 0x0F) << 8) | raw[2]
+        return {'frames': frames, 'delay': delay, 'padding': padding, 'vbr': tag == b'Xing', 'source': tag.decode().lower()}
+
+    if mm[pos + 36:pos + 40] == b'VBRI':
+        frames = struct.unpack_from('>I', mm, pos + 50)[0]
+        return {'frames': frames, 'delay': 0, 'padding': 0, 'vbr': True, 'source': 'vbri'}
+    return None
+
+
+def _walk_frames(mm, pos, end, sample_rate):
+    """逐帧累加采样数（只读帧头，不解码），返回 (帧数, 采样数, 不同比特率的个数)"""
+    frames = samples = 0
+    cache = {}
+    while pos + 4 <= end:
+        header = mm[pos:pos + 4]
+        frame = cache.get(header)
+        if frame is None:
+            frame = _mpeg_frame(mm, pos)
+            if frame is None or frame[2] != sample_rate:
+                # 损坏的数据：重新寻找帧同步
+                found = _find_frame(mm, pos + 1, end, sample_rate)
+                if found is None:
+                    break
+                pos, frame = found
+                header = mm[pos:pos + 4]
+            cache[header] = frame
+        if pos + frame[0] > end:
+            # 截断的最后一帧
+            break
+        frames += 1
+        samples += frame[1]
+        pos += frame[0]
+    return frames, samples, len({frame[3] for frame in cache.values()})
+
+
+def _probe_mpeg(mm, start, end):
+    found = _find_frame(mm, start, end)
+    if found is None:
+        raise MetadataError('未找到 MPEG 音频帧')
+    pos, frame = found
+    length, samples_per_frame, sample_rate, bitrate, _, channels = frame
+
+    header = _vbr_header(mm, pos, frame)
+    if header and header['frames']:
+        samples = header['frames'] * samples_per_frame
+        if header['delay'] + header['padding'] < samples:
+            samples -= header['delay'] + header['padding']
+        # Xing/VBRI 所在的帧不含音频
+        audio_start, source, vbr = pos + length, header['source'], header['vbr']
+    else:
+        if header:
+            pos += length
+        _, samples, bitrates = _walk_frames(mm, pos, end, sample_rate)
+        audio_start, source, vbr = pos, 'frames', bitrates > 1
+
+    return {
+        'format': 'mp3',
+        'duration': samples / sample_rate,
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'audio_bytes': end - audio_start,
+        'vbr': vbr,
+        'duration_source': source,
+    }
+
+
+ADTS_SAMPLE_RATES = (96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350)
+
+
+def _is_adts(mm, pos):
+    return pos + 7 <= len(mm) and mm[pos] == 0xFF and mm[pos + 1] & 0xF6 == 0xF0
+
+
+def _probe_adts(mm, start, end):
+    """AAC ADTS 流：逐帧累加原始数据块数，每块 1024 个采样"""
+    pos, blocks = start, 0
+    sample_rate = channels = None
+    while pos + 7 <= end and _is_adts(mm, pos):
+        rate_index = (mm[pos + 2] >> 2) & 0x0F
+        length = ((mm[pos + 3] & 0x03) << 11) | (mm[pos + 4] << 3) | (mm[pos + 5] >> 5)
+        if length < 7 or rate_index >= len(ADTS_SAMPLE_RATES) or pos + length > end:
+            break
+        if sample_rate is None:
+            sample_rate = ADTS_SAMPLE_RATES[rate_index]
+            channels = ((mm[pos + 2] & 0x01) << 2) | (mm[pos + 3] >> 6)
+        blocks += (mm[pos + 6] & 0x03) + 1
+        pos += length
+    if not blocks:
+        raise MetadataError('ADTS 帧头损坏')
+    return {
+        'format': 'aac',
+        'duration': blocks * 1024 / sample_rate,
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'audio_bytes': pos - start,
+        'duration_source': 'frames',
+    }
+
+
+# ---------- 容器格式 ----------
+
+def _probe_wav(mm):
+    pos, size = 12, len(mm)
+    fmt = data_size = None
+    tags = {}
+    while pos + 8 <= size:
+        chunk_id = mm[pos:pos + 4]
+        chunk_size = struct.unpack_from('<I', mm, pos + 4)[0]
+        body = pos + 8
+        if chunk_id == b'fmt ':
+            fmt = struct.unpack_from('<HHIIHH', mm, body)
+        elif chunk_id == b'data':
+            # 流式写入的文件长度可能是 0xFFFFFFFF 或文件被截断
+            data_size = min(chunk_size, size - body)
+        elif chunk_id == b'LIST' and mm[body:body + 4] == b'INFO':
+            cursor, stop = body + 4, min(body + chunk_size, size)
+            while cursor + 8 <= stop:
+                sub_id = mm[cursor:cursor + 4]
+                sub_size = struct.unpack_from('<I', mm, cursor + 4)[0]
+                field = RIFF_INFO_FIELDS.get(sub_id)
+                if field and field not in tags:
+                    raw = mm[cursor + 8:cursor + 8 + sub_size].split(b'\x00')[0]
+                    try:
+                        tags[field] = raw.decode('utf-8')
+                    except UnicodeDecodeError:
+                        tags[field] = raw.decode('latin-1')
+                cursor += 8 + sub_size + (sub_size & 1)
+        elif chunk_id in (b'id3 ', b'ID3 '):
+            id3_tags, _ = _read_id3v2(mm, body)
+            tags = dict(id3_tags, **tags)
+        pos = body + chunk_size + (chunk_size & 1)
+
+    if fmt is None or data_size is None:
+        raise MetadataError('WAV 缺少 fmt 或 data 块')
+    audio_format, channels, sample_rate, byte_rate, block_align, _ = fmt
+    if not byte_rate or not sample_rate:
+        raise MetadataError('WAV 格式头损坏')
+    if audio_format in (1, 3, 0xFFFE) and block_align:
+        # PCM：按完整采样帧计算
+        duration = data_size // block_align / sample_rate
+    else:
+        duration = data_size / byte_rate
+    return {
+        'format': 'wav',
+        'duration': duration,
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'audio_bytes': data_size,
+        'duration_source': 'header',
+        'tags': tags,
+    }
+
+
+def _probe_flac(mm, start):
+    pos = start + 4
+    streaminfo = None
+    tags = {}
+    while pos + 4 <= len(mm):
+        block_header = mm[pos]
+        length = int.from_bytes(mm[pos + 1:pos + 4], 'big')
+        body = pos + 4
+        block_type = block_header & 0x7F
+        if block_type == 0:
+            # 采样率 20 位、声道数-1 3 位、位深-1 5 位、总采样数 36 位
+            packed = int.from_bytes(mm[body + 10:body + 18], 'big')
+            streaminfo = (packed >> 44, ((packed >> 41) & 0x07) + 1, packed & 0xFFFFFFFFF)
+        elif block_type == 4:
+            tags = _vorbis_comment(mm, body)
+        pos = body + length
+        if block_header & 0x80:
+            break
+    if streaminfo is None or not streaminfo[0]:
+        raise MetadataError('FLAC 缺少 STREAMINFO')
+    sample_rate, channels, total_samples = streaminfo
+    return {
+        'format': 'flac',
+        'duration': total_samples / sample_rate if total_samples else None,
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'audio_bytes': len(mm) - pos,
+        'duration_source': 'streaminfo',
+        'tags': tags,
+    }
+
+
+def _ogg_packets(mm, count):
+    """重组第一个逻辑流的前 count 个数据包，返回 (数据包, 流序列号)"""
+    packets, current = [], []
+    pos, serial = 0, None
+    while len(packets) < count and pos + 27 <= len(mm):
+        if mm[pos:pos + 4] != b'OggS':
+            raise MetadataError('Ogg 页头损坏')
+        page_serial = struct.unpack_from('<I', mm, pos + 14)[0]
+        segments = mm[pos + 26]
+        table = mm[pos + 27:pos + 27 + segments]
+        body = pos + 27 + segments
+        if serial is None:
+            serial = page_serial
+        if page_serial == serial:
+            for lacing in table:
+                current.append(mm[body:body + lacing])
+                body += lacing
+                if lacing < 255:
+                    packets.append(b''.join(current))
+                    current = []
+                    if len(packets) == count:
+                        break
+        pos += 27 + segments + sum(table)
+    return packets, serial
+
+
+def _ogg_last_granule(mm, serial):
+    """从文件末尾向前找该逻辑流最后一个有效的 granule position"""
+    pos = len(mm)
+    while pos > 0:
+        pos = mm.rfind(b'OggS', 0, pos)
+        if pos < 0:
+            return None
+        if pos + 27 <= len(mm) and struct.unpack_from('<I', mm, pos + 14)[0] == serial:
+            granule = struct.unpack_from('<q', mm, pos + 6)[0]
+            if granule >= 0:
+                return granule
+    return None
+
+
+def _probe_ogg(mm):
+    packets, serial = _ogg_packets(mm, 2)
+    if len(packets) < 2:
+        raise MetadataError('Ogg 缺少头部数据包')
+    ident, comment = packets
+    if ident[:7] == b'\x01vorbis':
+        channels, sample_rate = ident[11], struct.unpack_from('<I', ident, 12)[0]
+        audio_format, pre_skip, rate = 'ogg', 0, sample_rate
+        tags = _vorbis_comment(comment, 7) if comment[:7] == b'\x03vorbis' else {}
+    elif ident[:8] == b'OpusHead':
+        channels, pre_skip, sample_rate = ident[9], struct.unpack_from('<H', ident, 10)[0], struct.unpack_from('<I', ident, 12)[0]
+        # Opus 的 granule position 固定以 48kHz 计
+        audio_format, rate = 'opus', 48000
+        tags = _vorbis_comment(comment, 8) if comment[:8] == b'OpusTags' else {}
+    else:
+        raise MetadataError('不支持的 Ogg 编码')
+    if not rate:
+        raise MetadataError('Ogg 头部损坏')
+
+    granule = _ogg_last_granule(mm, serial)
+    return {
+        'format': audio_format,
+        'duration': max(granule - pre_skip, 0) / rate if granule is not None else None,
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'audio_bytes': len(mm),
+        'duration_source': 'granule',
+        'tags': tags,
+    }
+
+
+def _mp4_atoms(mm, pos, end):
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from('>I4s', mm, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', mm, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            raise MetadataError('MP4 atom 长度错误')
+        yield kind, pos + header, min(pos + size, end)
+        pos += size
+
+
+def _mp4_ilst(mm, pos, end):
+    tags = {}
+    for kind, body, stop in _mp4_atoms(mm, pos, end):
+        field = MP4_FIELDS.get(kind)
+        if field is None or field in tags:
+            continue
+        for data_kind, data_body, data_stop in _mp4_atoms(mm, body, stop):
+            if data_kind != b'data':
+                continue
+            # data atom: 类型(4) + 语言(4) + 值
+            value = mm[data_body + 8:data_stop]
+            if kind == b'trkn':
+                if len(value) >= 4:
+                    tags[field] = str(struct.unpack_from('>H', value, 2)[0])
+            elif kind == b'gnre':
+                if len(value) >= 2:
+                    index = struct.unpack_from('>H', value)[0] - 1
+                    if 0 <= index < len(ID3V1_GENRES):
+                        tags[field] = ID3V1_GENRES[index]
+            else:
+                tags[field] = value.decode('utf-8', 'replace')
+            break
+    return tags
+
+
+def _probe_mp4(mm):
+    tags, tracks = {}, []
+    state = {'mdat': 0}
+
+    def walk(pos, end, track):
+        for kind, body, stop in _mp4_atoms(mm, pos, end):
+            if kind == b'trak':
+                current = {}
+                walk(body, stop, current)
+                tracks.append(current)
+            elif kind in (b'moov', b'mdia', b'minf', b'stbl', b'udta'):
+                walk(body, stop, track)
+            elif kind == b'meta':
+                # full box：跳过版本和标志
+                walk(body + 4, stop, track)
+            elif kind == b'ilst':
+                tags.update(_mp4_ilst(mm, body, stop))
+            elif kind == b'mdat':
+                state['mdat'] += stop - body
+            elif track is not None and kind == b'hdlr':
+                track['handler'] = mm[body + 8:body + 12]
+            elif track is not None and kind == b'mdhd':
+                if mm[body] == 1:
+                    track['timescale'], track['duration'] = struct.unpack_from('>IQ', mm, body + 20)
+                else:
+                    track['timescale'], track['duration'] = struct.unpack_from('>II', mm, body + 12)
+            elif track is not None and kind == b'stsd':
+                # 第一个 AudioSampleEntry：声道数和 16.16 定点采样率
+                entry = body + 8
+                track['channels'] = struct.unpack_from('>H', mm, entry + 24)[0]
+                track['sample_rate'] = struct.unpack_from('>I', mm, entry + 32)[0] >> 16
+
+    walk(0, len(mm), None)
+    audio = next((track for track in tracks if track.get('handler') == b'soun' and track.get('timescale')), None)
+    if audio is None:
+        raise MetadataError('MP4 中没有音频轨道')
+    return {
+        'format': 'mp4',
+        'duration': audio['duration'] / audio['timescale'] if audio.get('duration') else None,
+        'sample_rate': audio.get('sample_rate') or audio['timescale'],
+        'channels': audio.get('channels'),
+        'audio_bytes': state['mdat'] or len(mm),
+        'duration_source': 'mdhd',
+        'tags': tags,
+    }
+
+
+# ---------- 入口 ----------
+
+def _probe(mm):
+    head = mm[:12]
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        return _probe_wav(mm)
+    if head[4:8] == b'ftyp':
+        return _probe_mp4(mm)
+    if head[:4] == b'OggS':
+        return _probe_ogg(mm)
+
+    id3_tags, start = _read_id3v2(mm)
+    if mm[start:start + 4] == b'fLaC':
+        info = _probe_flac(mm, start)
+        info['tags'] = dict(id3_tags, **info['tags'])
+        return info
+
+    end = len(mm)
+    id3v1_tags, length = _read_id3v1(mm, end)
+    end -= length
+    end -= _ape_length(mm, end)
+    # 跳过 ID3v2 之后可能存在的填充
+    pos = start
+    while pos < end and mm[pos] == 0:
+        pos += 1
+    info = _probe_adts(mm, pos, end) if _is_adts(mm, pos) else _probe_mpeg(mm, start, end)
+    info['tags'] = dict(id3v1_tags, **id3_tags)
+    return info
+
+
+def probe(path):
+    """解析音频文件头和标签，不解码音频
+
+    返回格式、MIME 类型、精确时长（秒）、平均比特率（kbps）、采样率、声道数和标签
+    （title / artist / album / genre / year / track）。文件无法识别时抛出 MetadataError。
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise MetadataError('空文件')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            try:
+                info = _probe(mm)
+            except (struct.error, IndexError, RecursionError) as e:
+                raise MetadataError(f'文件头损坏: {e}') from None
+
+    duration = info['duration']
+    info['mime_type'] = MIME_TYPES[info['format']]
+    info['tags'] = _normalize_tags(info.get('tags') or {})
+    info['bitrate'] = round(info.pop('audio_bytes') * 8 / duration / 1000) if duration else None
+    info['duration'] = round(duration, 3) if duration is not None else None
+    return info
+
+
+def probe_safe(path):
+    """返回 (结果, 错误信息)，单个文件失败不影响同批其他文件"""
+    try:
+        return probe(path), None
+    except (MetadataError, OSError, ValueError) as e:
+        return None, str(e)
+
+
+def _serve():
+    for line in sys.stdin:
+        metadata, error = probe_safe(json.loads(line))
+        sys.stdout.write(json.dumps([metadata, error], ensure_ascii=False) + '\n')
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    _serve()
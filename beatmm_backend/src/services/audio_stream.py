@@ -0,0 +1,218 @@
+import mimetypes
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+
+from flask import Response, redirect
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+from werkzeug.wsgi import wrap_file
+
+
+OFFLOAD_MODES = (None, 'x-sendfile', 'x-accel-redirect')
+READ_BLOCK = 64 * 1024
+
+
+class _MappedReader:
+    """共享 mmap 上的独立读取位置，供多个请求并发读取同一缓存文件"""
+
+    def __init__(self, mapped):
+        self._mapped = mapped
+        self._position = 0
+
+    def read(self, size=-1):
+        end = len(self._mapped) if size is None or size < 0 else min(len(self._mapped), self._position + size)
+        data = self._mapped[self._position:end]
+        self._position = end
+        return data
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += len(self._mapped)
+        self._position = max(0, min(offset, len(self._mapped)))
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        # mmap 由缓存持有，淘汰后最后一个读取者释放引用时自动解除映射
+        self._mapped = b''
+
+
+class AudioStreamer:
+    """音频流式播放 - 支持 Range/206、强 ETag 和 If-Range
+
+    本地文件默认交给 wsgi.file_wrapper（服务器支持时走 sendfile 零拷贝）；
+    配置 offload 后只返回 X-Sendfile / X-Accel-Redirect 头，由前端服务器发送文件。
+    不超过 mmap_max_file 的热门文件映射到内存，按 LRU 淘汰，总大小不超过 mmap_cache_bytes。
+    file_url 为 http(s) 地址时重定向到该地址。
+    """
+
+    def __init__(self, media_root=None, url_prefix='/media/', offload=None, accel_prefix='/protected-media/',
+                 mmap_max_file=8 * 1024 * 1024, mmap_cache_bytes=256 * 1024 * 1024, max_age=86400):
+        self.media_root = media_root
+        self.url_prefix = url_prefix
+        self.offload = offload
+        self.accel_prefix = accel_prefix
+        self.mmap_max_file = mmap_max_file
+        self.mmap_cache_bytes = mmap_cache_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'file_responses': 0, 'offloaded': 0}
+
+    def init_app(self, app):
+        self.media_root = app.config.get('MEDIA_ROOT', self.media_root)
+        self.url_prefix = app.config.get('MEDIA_URL_PREFIX', self.url_prefix)
+        self.offload = app.config.get('STREAM_OFFLOAD', self.offload)
+        if self.offload not in OFFLOAD_MODES:
+            raise ValueError(f'STREAM_OFFLOAD 只能是 {OFFLOAD_MODES}')
+        self.accel_prefix = app.config.get('STREAM_ACCEL_PREFIX', self.accel_prefix)
+        self.mmap_max_file = app.config.get('STREAM_MMAP_MAX_FILE', self.mmap_max_file)
+        self.mmap_cache_bytes = app.config.get('STREAM_MMAP_CACHE_BYTES', self.mmap_cache_bytes)
+        self.max_age = app.config.get('STREAM_MAX_AGE', self.max_age)
+        app.extensions['audio_stream'] = self
+
+    # ---------- 文件定位 ----------
+
+    def resolve(self, file_url):
+        """file_url -> 媒体目录下的相对路径；不在媒体目录内时返回 None"""
+        if not file_url or not self.media_root:
+            return None
+        relative = file_url
+        if self.url_prefix and relative.startswith(self.url_prefix):
+            relative = relative[len(self.url_prefix):]
+        relative = relative.lstrip('/')
+        if not relative or safe_join(self.media_root, relative) is None:
+            return None
+        return relative
+
+    @staticmethod
+    def etag_for(stat):
+        """由文件大小和纳秒修改时间构成的强 ETag，文件被替换后随之改变"""
+        return f'{stat.st_size:x}-{stat.st_mtime_ns:x}'
+
+    # ---------- 响应 ----------
+
+    def stream(self, environ, file_url, etag=None):
+        """返回 file_url 对应音频的响应；文件不存在时返回 None
+
+        etag 由调用方提供（如内容哈希）时优先使用，否则按文件状态生成。
+        """
+        if file_url and file_url.startswith(('http://', 'https://')):
+            return redirect(file_url, code=302)
+
+        relative = self.resolve(file_url)
+        if relative is None:
+            return None
+        path = safe_join(self.media_root, relative)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        etag = etag or self.etag_for(stat)
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+        if self.offload == 'x-accel-redirect':
+            # nginx 自行处理 Range 和条件请求
+            with self._lock:
+                self._counters['offloaded'] += 1
+            response = Response(mimetype=mimetype)
+            response.headers['X-Accel-Redirect'] = self.accel_prefix + quote(relative)
+            response.set_etag(etag)
+            response.last_modified = stat.st_mtime
+            return self._cacheable(response)
+
+        if self.offload == 'x-sendfile':
+            with self._lock:
+                self._counters['offloaded'] += 1
+            return self._cacheable(send_file(
+                path, environ, mimetype=mimetype, conditional=True, etag=etag,
+                max_age=self.max_age, use_x_sendfile=True
+            ))
+
+        if stat.st_size <= self.mmap_max_file:
+            mapped = self._mapped(path, stat)
+            if mapped is not None:
+                response = Response(
+                    wrap_file(environ, _MappedReader(mapped), READ_BLOCK),
+                    mimetype=mimetype,
+                    direct_passthrough=True
+                )
+                response.content_length = stat.st_size
+                response.set_etag(etag)
+                response.last_modified = stat.st_mtime
+                self._cacheable(response)
+                return response.make_conditional(environ, accept_ranges=True, complete_length=stat.st_size)
+
+        with self._lock:
+            self._counters['file_responses'] += 1
+        return self._cacheable(send_file(
+            path, environ, mimetype=mimetype, conditional=True, etag=etag, max_age=self.max_age
+        ))
+
+    def _cacheable(self, response):
+        response.headers['Accept-Ranges'] = 'bytes'
+        if self.max_age:
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = self.max_age
+        return response
+
+    # ---------- 内存映射缓存 ----------
+
+    def _mapped(self, path, stat):
+        """返回文件的 mmap，按 (路径, 大小, 修改时间) 缓存；空文件无法映射时返回 None"""
+        if stat.st_size == 0:
+            return None
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            mapped = self._cache.get(key)
+            if mapped is not None:
+                self._cache.move_to_end(key)
+                self._counters['hits'] += 1
+                return mapped
+            self._counters['misses'] += 1
+
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        with self._lock:
+            # 同一路径的旧版本（文件已被替换）直接丢弃
+            for stale in [cached for cached in self._cache if cached[0] == path and cached != key]:
+                self._cached_bytes -= stale[1]
+                del self._cache[stale]
+            if key not in self._cache:
+                self._cache[key] = mapped
+                self._cached_bytes += stat.st_size
+            while self._cached_bytes > self.mmap_cache_bytes and len(self._cache) > 1:
+                evicted, _ = self._cache.popitem(last=False)
+                self._cached_bytes -= evicted[1]
+                self._counters['evictions'] += 1
+            return self._cache.get(key, mapped)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(
+                self._counters,
+                cached_files=len(self._cache),
+                cached_bytes=self._cached_bytes,
+                cache_limit_bytes=self.mmap_cache_bytes,
+                offload=self.offload
+            )
+
+
+# 全局音频流实例
+audio_streamer = AudioStreamer()
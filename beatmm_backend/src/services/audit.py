@@ -0,0 +1,272 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from src.models.user import db, SystemLog
+
+
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'spill')
+
+
+class AuditLogWriter:
+    """审计日志异步写入器 - 有界队列 + 后台线程批量插入 SystemLog
+
+    队列满时按 overflow_policy 处理：
+    - block: 阻塞请求线程直到有空位（超过 block_timeout 后落入 spill 文件）
+    - drop_oldest: 丢弃队列中最旧的一条
+    - spill: 直接追加写入本地 spill 文件，队列空闲时再重放
+    """
+
+    def __init__(self, max_queue_size=10000, batch_size=200, flush_interval=0.5,
+                 overflow_policy='block', block_timeout=1.0, spill_path=None):
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.spill_path = spill_path
+        self.app = None
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stats_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        self._counters = {
+            'enqueued': 0,
+            'written': 0,
+            'dropped': 0,
+            'spilled': 0,
+            'replayed': 0,
+            'write_errors': 0,
+            'flush_count': 0,
+            'max_queue_depth': 0,
+            'last_flush_ms': None,
+            'max_flush_ms': None,
+            'total_flush_ms': 0.0
+        }
+
+    def init_app(self, app):
+        """读取配置并启动后台写入线程"""
+        self.app = app
+        self.max_queue_size = app.config.get('AUDIT_LOG_QUEUE_SIZE', self.max_queue_size)
+        self.batch_size = app.config.get('AUDIT_LOG_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('AUDIT_LOG_FLUSH_INTERVAL', self.flush_interval)
+        self.overflow_policy = app.config.get('AUDIT_LOG_OVERFLOW_POLICY', self.overflow_policy)
+        self.block_timeout = app.config.get('AUDIT_LOG_BLOCK_TIMEOUT', self.block_timeout)
+        self.spill_path = app.config.get('AUDIT_LOG_SPILL_PATH', self.spill_path)
+
+        if self.overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f'无效的审计日志溢出策略: {self.overflow_policy}')
+
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        app.extensions['audit_log'] = self
+
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def log(self, user_id, action, details=None, ip_address=None, resource=None, resource_id=None):
+        """记录一条审计日志（不阻塞数据库提交）"""
+        record = {
+            'user_id': user_id,
+            'action': action,
+            'resource': resource,
+            'resource_id': resource_id,
+            'details': details,
+            'ip_address': ip_address,
+            'created_at': datetime.utcnow()
+        }
+
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._handle_overflow(record)
+            return
+
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            self._counters['enqueued'] += 1
+            if depth > self._counters['max_queue_depth']:
+                self._counters['max_queue_depth'] = depth
+
+    def flush(self):
+        """写出队列中所有日志，返回写入条数"""
+        written = 0
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                break
+            written += self._write_batch(batch)
+        return written
+
+    def shutdown(self):
+        """停止后台线程并写出剩余日志"""
+        self._stopped.set()
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        if self.app is not None:
+            self.flush()
+
+    def get_stats(self):
+        """队列深度与写入延迟计数器"""
+        with self._stats_lock:
+            stats = dict(self._counters)
+        total_flush_ms = stats.pop('total_flush_ms')
+        stats['avg_flush_ms'] = round(total_flush_ms / stats['flush_count'], 2) if stats['flush_count'] else None
+        stats['queue_depth'] = self._queue.qsize()
+        stats['queue_capacity'] = self.max_queue_size
+        stats['overflow_policy'] = self.overflow_policy
+        return stats
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._replay_spill()
+                continue
+
+            batch = [first] + self._drain(self.batch_size - 1)
+            try:
+                self._write_batch(batch)
+            except Exception:
+                # 写入线程不能退出，失败批次已写入 spill 文件
+                pass
+
+    def _drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch):
+        started = time.perf_counter()
+        try:
+            with self._flush_lock:
+                with self.app.app_context():
+                    with db.engine.begin() as conn:
+                        # 列表参数会以 executemany 方式执行
+                        conn.execute(SystemLog.__table__.insert(), batch)
+        except Exception:
+            with self._stats_lock:
+                self._counters['write_errors'] += 1
+            self._spill(batch)
+            return 0
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self._counters['written'] += len(batch)
+            self._counters['flush_count'] += 1
+            self._counters['last_flush_ms'] = round(elapsed_ms, 2)
+            self._counters['total_flush_ms'] += elapsed_ms
+            if self._counters['max_flush_ms'] is None or elapsed_ms > self._counters['max_flush_ms']:
+                self._counters['max_flush_ms'] = round(elapsed_ms, 2)
+        return len(batch)
+
+    def _handle_overflow(self, record):
+        if self.overflow_policy == 'drop_oldest':
+            try:
+                self._queue.get_nowait()
+                with self._stats_lock:
+                    self._counters['dropped'] += 1
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(record)
+                with self._stats_lock:
+                    self._counters['enqueued'] += 1
+            except queue.Full:
+                with self._stats_lock:
+                    self._counters['dropped'] += 1
+            return
+
+        if self.overflow_policy == 'block':
+            try:
+                self._queue.put(record, timeout=self.block_timeout)
+                with self._stats_lock:
+                    self._counters['enqueued'] += 1
+                return
+            except queue.Full:
+                pass
+
+        if self.spill_path:
+            self._spill([record])
+        else:
+            with self._stats_lock:
+                self._counters['dropped'] += 1
+
+    def _spill(self, records):
+        """追加写入本地 spill 文件（只追加，fsync 保证持久）"""
+        if not self.spill_path:
+            with self._stats_lock:
+                self._counters['dropped'] += len(records)
+            return
+
+        with self._spill_lock:
+            os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(dict(record, created_at=record['created_at'].isoformat()), ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        with self._stats_lock:
+            self._counters['spilled'] += len(records)
+
+    def _replay_spill(self):
+        """队列空闲时把 spill 文件中的日志重新写入数据库"""
+        if not self.spill_path:
+            return
+        if not os.path.exists(self.spill_path) and not os.path.exists(self.spill_path + '.replay'):
+            return
+
+        replay_path = self.spill_path + '.replay'
+        with self._spill_lock:
+            # 上次重放中断时留下的 .replay 文件优先处理
+            if not os.path.exists(replay_path):
+                try:
+                    os.replace(self.spill_path, replay_path)
+                except OSError:
+                    return
+
+        batch = []
+        replayed = 0
+        with open(replay_path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    record['created_at'] = datetime.fromisoformat(record['created_at'])
+                except (ValueError, KeyError):
+                    continue
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    replayed += self._write_batch(batch)
+                    batch = []
+        if batch:
+            replayed += self._write_batch(batch)
+
+        with self._stats_lock:
+            self._counters['replayed'] += replayed
+        os.remove(replay_path)
+
+
+# 全局审计日志写入器
+audit_log = AuditLogWriter()
+
+
+def log_action(user_id, action, details=None, ip_address=None):
+    """记录系统日志"""
+    audit_log.log(user_id, action, details, ip_address)
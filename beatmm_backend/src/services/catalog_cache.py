@@ -0,0 +1,340 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import inspect
+
+from src.models.user import db, Music
+from src.services.orm_events import TransactionChanges, listen_once
+
+
+# 高频变化的计数器不放在序列化结果里，读取时从计数器叠加，变化时不淘汰缓存
+COUNTERS = ('play_count', 'like_count')
+
+# 影响列表筛选和排序的字段（play_count 的变化只在列表 TTL 到期后体现，避免每次播放都淘汰列表页）
+LIST_FIELDS = ('genre', 'is_featured', 'created_at')
+
+# to_dict() 中不包含、修改后不需要刷新缓存的字段
+_IGNORED_FIELDS = ('upload_user_id', 'updated_at')
+
+_MISS = object()
+
+
+class _Track:
+    """缓存的单曲：序列化结果 + 计数器"""
+
+    __slots__ = ('data', 'play_count', 'like_count', 'expires')
+
+    def __init__(self, data, expires):
+        self.data = data
+        self.play_count = data.pop('play_count')
+        self.like_count = data.pop('like_count')
+        self.expires = expires
+
+    def to_dict(self):
+        return dict(self.data, play_count=self.play_count, like_count=self.like_count)
+
+
+class _Page:
+    """缓存的列表页：只保存歌曲ID和分页信息，歌曲内容从单曲缓存组装"""
+
+    __slots__ = ('ids', 'pagination', 'genre', 'generation', 'expires')
+
+    def __init__(self, ids, pagination, genre, generation, expires):
+        self.ids = ids
+        self.pagination = pagination
+        self.genre = genre
+        self.generation = generation
+        self.expires = expires
+
+
+class _Flight:
+    """同一个键正在进行的加载，等待者共用其结果"""
+
+    __slots__ = ('done', 'value')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = _MISS
+
+
+class CatalogCache:
+    """音乐详情和列表页的读穿缓存
+
+    单曲和列表页分别按 LRU 限制条数并带 TTL；同一个键同时未命中时只有一个请求查询数据库，
+    其余请求等待其结果。列表页只保存歌曲ID，修改标题等字段只需淘汰对应单曲；新增、删除或修改
+    流派/推荐/创建时间时，按流派递增列表版本号，旧版本的列表页在读取时丢弃。
+    play_count、like_count 保存在单曲条目的计数器中，播放落库和收藏变化直接更新计数器。
+
+    缓存在进程内，其他进程的修改在 TTL 到期后可见。
+    """
+
+    def __init__(self, max_tracks=50000, max_pages=5000, track_ttl=300, page_ttl=60, wait_timeout=5.0):
+        self.max_tracks = max_tracks
+        self.max_pages = max_pages
+        self.track_ttl = track_ttl
+        self.page_ttl = page_ttl
+        self.wait_timeout = wait_timeout
+
+        self._lock = threading.Lock()
+        self._tracks = OrderedDict()
+        self._pages = OrderedDict()
+        self._inflight = {}
+        # 正在查询数据库的加载数；加载期间失效的单曲记在 _track_generations 中，加载结果不写入缓存
+        self._loading = 0
+        self._track_generations = {}
+        self._list_generations = {}
+        self._changes = TransactionChanges('catalog_cache_changes', list, self._apply_changes)
+
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'evictions': 0,
+            'invalidations': 0,
+            'counter_updates': 0
+        }
+
+    def init_app(self, app):
+        self.max_tracks = app.config.get('CATALOG_CACHE_MAX_TRACKS', self.max_tracks)
+        self.max_pages = app.config.get('CATALOG_CACHE_MAX_PAGES', self.max_pages)
+        self.track_ttl = app.config.get('CATALOG_CACHE_TRACK_TTL', self.track_ttl)
+        self.page_ttl = app.config.get('CATALOG_CACHE_PAGE_TTL', self.page_ttl)
+        app.extensions['catalog_cache'] = self
+
+        listen_once(Music, (('after_insert', self._after_insert), ('after_update', self._after_update),
+                            ('after_delete', self._after_delete)))
+        self._changes.register()
+
+    # ---------- 读取 ----------
+
+    def track(self, music_id):
+        """单曲详情，不存在时返回 None"""
+        def lookup():
+            track = self._get_track(music_id, time.monotonic())
+            return track.to_dict() if track is not None else _MISS
+
+        def load():
+            tracks = self._load_tracks([music_id])
+            return tracks[music_id].to_dict() if music_id in tracks else None
+
+        return self._single_flight(('track', music_id), lookup, load)
+
+    def tracks(self, music_ids):
+        """按顺序返回多首歌曲，未缓存的一次查询加载，已删除的跳过"""
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for music_id in music_ids:
+                track = self._get_track(music_id, now)
+                if track is not None:
+                    found[music_id] = track.to_dict()
+        missing = [music_id for music_id in music_ids if music_id not in found]
+        if missing:
+            for music_id, track in self._load_tracks(missing).items():
+                found[music_id] = track.to_dict()
+        return [found[music_id] for music_id in music_ids if music_id in found]
+
+    def page(self, key, genre, loader):
+        """列表页: loader() 返回 (Music 列表, 分页信息)，结果按 key 缓存；genre 为列表的流派筛选条件"""
+        def lookup():
+            page = self._get_page(key, time.monotonic())
+            return page if page is not None else _MISS
+
+        def load():
+            with self._lock:
+                generation = self._list_generations.get(genre, 0)
+            items, pagination = loader()
+            tracks = self._store_tracks(items)
+            with self._lock:
+                page = _Page([music.id for music in items], pagination, genre, generation,
+                             time.monotonic() + self.page_ttl)
+                if self.max_pages > 0 and self._list_generations.get(genre, 0) == generation:
+                    self._pages[key] = page
+                    self._pages.move_to_end(key)
+                    while len(self._pages) > self.max_pages:
+                        self._pages.popitem(last=False)
+                        self.stats['evictions'] += 1
+            return [tracks[music.id].to_dict() for music in items], pagination
+
+        result = self._single_flight(('page', key), lookup, load)
+        if isinstance(result, _Page):
+            return self.tracks(result.ids), result.pagination
+        return result
+
+    def _single_flight(self, key, lookup, load):
+        with self._lock:
+            value = lookup()
+            if value is not _MISS:
+                self.stats['hits'] += 1
+                return value
+            flight = self._inflight.get(key)
+            if flight is None:
+                flight = self._inflight[key] = _Flight()
+                leader = True
+            else:
+                self.stats['coalesced'] += 1
+                leader = False
+
+        if not leader:
+            # 等待正在加载的请求并共用其结果；它失败或超时时自行查询
+            if flight.done.wait(self.wait_timeout) and flight.value is not _MISS:
+                return flight.value
+            with self._lock:
+                self.stats['misses'] += 1
+            return load()
+
+        with self._lock:
+            self.stats['misses'] += 1
+        try:
+            flight.value = load()
+            return flight.value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def _get_track(self, music_id, now):
+        track = self._tracks.get(music_id)
+        if track is None:
+            return None
+        if track.expires <= now:
+            del self._tracks[music_id]
+            return None
+        self._tracks.move_to_end(music_id)
+        return track
+
+    def _get_page(self, key, now):
+        page = self._pages.get(key)
+        if page is None:
+            return None
+        if page.expires <= now or page.generation != self._list_generations.get(page.genre, 0):
+            del self._pages[key]
+            return None
+        self._pages.move_to_end(key)
+        return page
+
+    def _load_tracks(self, music_ids):
+        items = db.session.query(Music).filter(Music.id.in_(music_ids)).all()
+        return self._store_tracks(items)
+
+    def _store_tracks(self, items):
+        """序列化并写入单曲缓存，返回 {music_id: _Track}；加载期间已失效的不写入"""
+        with self._lock:
+            self._loading += 1
+            generations = {music.id: self._track_generations.get(music.id, 0) for music in items}
+
+        now = time.monotonic()
+        tracks = {music.id: _Track(music.to_dict(), now + self.track_ttl) for music in items}
+
+        with self._lock:
+            for music_id, track in tracks.items():
+                if self.max_tracks <= 0 or self._track_generations.get(music_id, 0) != generations[music_id]:
+                    continue
+                # 已有未过期的条目时保留其计数器（可能已包含查询之后落库的播放）
+                cached = self._tracks.get(music_id)
+                if cached is not None and cached.expires > now:
+                    track.play_count, track.like_count = cached.play_count, cached.like_count
+                self._tracks[music_id] = track
+                self._tracks.move_to_end(music_id)
+            while len(self._tracks) > self.max_tracks:
+                self._tracks.popitem(last=False)
+                self.stats['evictions'] += 1
+            self._loading -= 1
+            if not self._loading:
+                self._track_generations.clear()
+        return tracks
+
+    # ---------- 失效与计数器 ----------
+
+    def add_plays(self, deltas):
+        """播放写缓冲落库后累加播放次数: {music_id: 增量}"""
+        with self._lock:
+            for music_id, delta in deltas.items():
+                track = self._tracks.get(music_id)
+                if track is not None:
+                    track.play_count += delta
+                    self.stats['counter_updates'] += 1
+                elif self._loading:
+                    self._bump_track(music_id)
+
+    def invalidate(self, music_id, genres=None):
+        """淘汰单曲；genres 不为 None 时同时淘汰这些流派和全部流派的列表页"""
+        with self._lock:
+            self._invalidate(music_id, genres)
+
+    def clear(self):
+        with self._lock:
+            self._tracks.clear()
+            self._pages.clear()
+
+    def _invalidate(self, music_id, genres):
+        if self._tracks.pop(music_id, None) is not None:
+            self.stats['invalidations'] += 1
+        if self._loading:
+            self._bump_track(music_id)
+        if genres is not None:
+            for genre in set(genres) | {None}:
+                self._list_generations[genre] = self._list_generations.get(genre, 0) + 1
+            self.stats['invalidations'] += 1
+
+    def _bump_track(self, music_id):
+        self._track_generations[music_id] = self._track_generations.get(music_id, 0) + 1
+
+    def _after_insert(self, mapper, connection, target):
+        pending = self._changes.pending(target)
+        if pending is not None:
+            pending.append((target.id, True, (target.genre,), None))
+
+    def _after_update(self, mapper, connection, target):
+        state = inspect(target)
+        changed = {attr.key for attr in state.mapper.column_attrs
+                   if state.attrs[attr.key].history.has_changes()}
+        changed.difference_update(_IGNORED_FIELDS)
+        if not changed:
+            return
+        pending = self._changes.pending(target)
+        if pending is None:
+            return
+
+        genres = None
+        if changed.intersection(LIST_FIELDS):
+            history = state.attrs.genre.history
+            genres = (target.genre,) + tuple(history.deleted or ())
+        # 只记录本次修改的计数器，play_count 的会话内值可能落后于已落库的播放
+        counters = {field: getattr(target, field) for field in COUNTERS if field in changed}
+        pending.append((target.id, bool(changed.difference(COUNTERS)), genres, counters))
+
+    def _after_delete(self, mapper, connection, target):
+        pending = self._changes.pending(target)
+        if pending is not None:
+            pending.append((target.id, True, (target.genre,), None))
+
+    def _apply_changes(self, changes):
+        """事务提交后应用本事务中的歌曲变更"""
+        with self._lock:
+            for music_id, refresh, genres, counters in changes:
+                if refresh:
+                    self._invalidate(music_id, genres)
+                    continue
+                track = self._tracks.get(music_id)
+                if track is not None:
+                    for field, value in counters.items():
+                        setattr(track, field, value or 0)
+                    self.stats['counter_updates'] += 1
+                elif self._loading:
+                    self._bump_track(music_id)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['tracks'] = len(self._tracks)
+            stats['pages'] = len(self._pages)
+            stats['inflight'] = len(self._inflight)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else None
+        return stats
+
+
+# 全局音乐目录缓存实例
+catalog_cache = CatalogCache()
@@ -0,0 +1,124 @@
+import time
+from datetime import timedelta
+
+from src.models.user import db, Notification, SystemLog, WalletTransaction, TransactionStatus
+
+
+# 各表数据保留天数
+DEFAULT_RETENTION_DAYS = {
+    'system_logs': 30,
+    'failed_transactions': 7
+}
+
+
+def _statement_batch(build_statement):
+    """把 build_statement(limit) 生成的 UPDATE/DELETE 包装为分批执行函数"""
+    def execute(conn, limit):
+        return conn.execute(build_statement(limit)).rowcount
+    return execute
+
+
+class BatchCleaner:
+    """分批清理过期数据 - 每批一个短事务，批次之间让出数据库
+
+    每批通过 `WHERE id IN (SELECT id ... LIMIT n)` 只处理 batch_size 行，
+    SQLite 的写锁只在单个批次内持有，其他请求可以在批次间隙写入。
+    """
+
+    def __init__(self, batch_size=1000, batch_pause=0.05, retention_days=None, max_reported_batches=50):
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.retention_days = dict(DEFAULT_RETENTION_DAYS, **(retention_days or {}))
+        self.max_reported_batches = max_reported_batches
+
+    def init_app(self, app):
+        self.batch_size = app.config.get('CLEANUP_BATCH_SIZE', self.batch_size)
+        self.batch_pause = app.config.get('CLEANUP_BATCH_PAUSE', self.batch_pause)
+        self.retention_days = dict(DEFAULT_RETENTION_DAYS, **app.config.get('CLEANUP_RETENTION_DAYS', {}))
+        app.extensions['cleanup'] = self
+
+    def run_batches(self, operation, execute_batch, on_batch=None, progress_callback=None, batch_size=None):
+        """在独立的短事务中反复执行 execute_batch(conn, batch_size) 直到处理行数为0，返回该操作的统计"""
+        batch_size = batch_size or self.batch_size
+        batches = []
+        total = 0
+        started = time.perf_counter()
+
+        while True:
+            batch_started = time.perf_counter()
+            with db.engine.begin() as conn:
+                count = execute_batch(conn, batch_size)
+            elapsed = time.perf_counter() - batch_started
+            if count <= 0:
+                break
+
+            total += count
+            batches.append((count, elapsed))
+            if on_batch:
+                on_batch(count)
+            if progress_callback:
+                progress_callback(operation, total)
+            if count < batch_size:
+                break
+            time.sleep(self.batch_pause)
+
+        duration = time.perf_counter() - started
+        batch_ms = [elapsed * 1000 for _, elapsed in batches]
+        return {
+            'operation': operation,
+            'count': total,
+            'status': 'success',
+            'batches': len(batches),
+            'batch_size': batch_size,
+            'duration_ms': round(duration * 1000, 2),
+            'rows_per_second': round(total / duration, 1) if duration > 0 else None,
+            'batch_ms': {
+                'min': round(min(batch_ms), 2) if batch_ms else None,
+                'avg': round(sum(batch_ms) / len(batch_ms), 2) if batch_ms else None,
+                'max': round(max(batch_ms), 2) if batch_ms else None
+            },
+            'batch_throughput': [
+                {'rows': count, 'ms': round(elapsed * 1000, 2), 'rows_per_second': round(count / elapsed, 1)}
+                for count, elapsed in batches[:self.max_reported_batches]
+                if elapsed > 0
+            ]
+        }
+
+    def expire_notifications(self, now):
+        table = Notification.__table__
+
+        def build(limit):
+            ids = db.select(table.c.id).where(
+                table.c.is_active == True,
+                table.c.expires_at < now
+            ).limit(limit)
+            return db.update(table).where(table.c.id.in_(ids.scalar_subquery())).values(is_active=False)
+        return _statement_batch(build)
+
+    def log_cutoff(self, now):
+        return now - timedelta(days=self.retention_days['system_logs'])
+
+    def delete_old_logs(self, now):
+        table = SystemLog.__table__
+        cutoff = self.log_cutoff(now)
+
+        def build(limit):
+            ids = db.select(table.c.id).where(table.c.created_at < cutoff).order_by(table.c.created_at).limit(limit)
+            return db.delete(table).where(table.c.id.in_(ids.scalar_subquery()))
+        return _statement_batch(build)
+
+    def delete_failed_transactions(self, now):
+        table = WalletTransaction.__table__
+        cutoff = now - timedelta(days=self.retention_days['failed_transactions'])
+
+        def build(limit):
+            ids = db.select(table.c.id).where(
+                table.c.status == TransactionStatus.FAILED.name,
+                table.c.created_at < cutoff
+            ).limit(limit)
+            return db.delete(table).where(table.c.id.in_(ids.scalar_subquery()))
+        return _statement_batch(build)
+
+
+# 全局清理实例
+batch_cleaner = BatchCleaner()
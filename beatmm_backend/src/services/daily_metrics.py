@@ -0,0 +1,87 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, time
+from decimal import Decimal
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from src.models.user import db, DailyMetric, TransactionStatus
+
+
+METRIC_COLUMNS = ('new_users', 'plays', 'transaction_count', 'revenue_amount', 'expense_amount')
+
+
+def day_range(day):
+    """某一天的半开时间区间 [00:00, 次日00:00)，可以直接使用时间列上的索引"""
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+
+def _upsert(table):
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+def bump_daily_metrics(bind, day, **deltas):
+    """在调用方的事务中累加某天的汇总计数（bind 可以是 session 或 connection）"""
+    deltas = {column: value for column, value in deltas.items() if value}
+    if not deltas:
+        return
+
+    table = DailyMetric.__table__
+    values = {column: 0 for column in METRIC_COLUMNS}
+    values.update(deltas)
+    stmt = _upsert(table).values(day=day, **values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['day'],
+        set_={column: table.c[column] + stmt.excluded[column] for column in deltas}
+    )
+    bind.execute(stmt)
+
+
+def transaction_deltas(amount, status):
+    """一笔交易对日汇总的影响"""
+    if status != TransactionStatus.COMPLETED:
+        return {}
+    amount = Decimal(str(amount))
+    if amount > 0:
+        return {'transaction_count': 1, 'revenue_amount': amount}
+    return {'transaction_count': 1, 'expense_amount': -amount}
+
+
+def record_plays(bind, played_at_list):
+    """按播放日期累加播放次数"""
+    per_day = defaultdict(int)
+    for played_at in played_at_list:
+        per_day[played_at.date()] += 1
+    for day, count in per_day.items():
+        bump_daily_metrics(bind, day, plays=count)
+
+
+def get_daily_metrics(start_day, end_day):
+    """返回 [start_day, end_day] 每天的汇总，缺失的日期补零"""
+    rows = DailyMetric.query.filter(
+        DailyMetric.day >= start_day,
+        DailyMetric.day <= end_day
+    ).all()
+    by_day = {row.day: row.to_dict() for row in rows}
+
+    result = []
+    day = start_day
+    while day <= end_day:
+        result.append(by_day.get(day) or {
+            'day': day.isoformat(),
+            'new_users': 0,
+            'plays': 0,
+            'transaction_count': 0,
+            'revenue_amount': 0.0,
+            'expense_amount': 0.0
+        })
+        day += timedelta(days=1)
+    return result
+
+
+def get_day_metric(day, column):
+    """读取某一天的单个汇总值"""
+    value = db.session.query(getattr(DailyMetric, column)).filter(DailyMetric.day == day).scalar()
+    return value or 0
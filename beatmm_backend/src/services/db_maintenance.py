@@ -0,0 +1,335 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from src.models.user import db
+
+
+# auto_vacuum 取值
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+
+def parse_window(window):
+    """'02:00-05:00' -> (time(2, 0), time(5, 0))；结束早于开始表示跨越午夜"""
+    start, _, end = window.partition('-')
+    return (datetime.strptime(start.strip(), '%H:%M').time(),
+            datetime.strptime(end.strip(), '%H:%M').time())
+
+
+def _in_window(window, moment):
+    start, end = window
+    current = moment.time()
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end
+
+
+class MaintenanceEngine:
+    """SQLite 非阻塞维护 - 用增量回收、PRAGMA optimize 和 WAL 检查点代替整库 VACUUM
+
+    数据库使用 WAL 日志，读请求不会被维护操作阻塞；写锁只在单个步骤内持有。
+    每步 incremental_vacuum 回收的页数根据上一步耗时自动调整，使单步耗时
+    不超过 max_block_ms，步骤之间暂停 step_pause 秒让其他请求写入。
+    增量回收要求 auto_vacuum=INCREMENTAL：新建的数据库在连接时自动设置，
+    已有数据库需要执行一次整库 VACUUM 才能切换，会长时间持有写锁，只在显式要求（convert=True）时进行。
+    """
+
+    def __init__(self, max_block_ms=200, initial_step_pages=256, max_step_pages=16384, step_pause=0.05,
+                 max_duration=60.0, checkpoint_pages=1000, busy_timeout_ms=5000, analysis_limit=400,
+                 window='02:00-05:00', truncate_max_bytes=128 * 1024 * 1024, synchronous=None):
+        self.max_block_ms = max_block_ms
+        self.initial_step_pages = initial_step_pages
+        self.max_step_pages = max_step_pages
+        self.step_pause = step_pause
+        self.max_duration = max_duration
+        self.checkpoint_pages = checkpoint_pages
+        self.busy_timeout_ms = busy_timeout_ms
+        self.analysis_limit = analysis_limit
+        self.window = parse_window(window)
+        self.truncate_max_bytes = truncate_max_bytes
+        self.synchronous = synchronous
+        self.last_report = None
+
+    def init_app(self, app):
+        """读取配置，并为数据库连接设置 WAL、忙等待和自动检查点（需在 db.init_app 之后、应用上下文中调用）"""
+        self.max_block_ms = app.config.get('MAINTENANCE_MAX_BLOCK_MS', self.max_block_ms)
+        self.step_pause = app.config.get('MAINTENANCE_STEP_PAUSE', self.step_pause)
+        self.max_duration = app.config.get('MAINTENANCE_MAX_DURATION', self.max_duration)
+        self.checkpoint_pages = app.config.get('MAINTENANCE_CHECKPOINT_PAGES', self.checkpoint_pages)
+        self.busy_timeout_ms = app.config.get('DB_BUSY_TIMEOUT_MS', self.busy_timeout_ms)
+        self.synchronous = app.config.get('DB_SYNCHRONOUS', self.synchronous)
+        if app.config.get('MAINTENANCE_WINDOW'):
+            self.window = parse_window(app.config['MAINTENANCE_WINDOW'])
+        app.extensions['db_maintenance'] = self
+
+        engine = db.engine
+        if engine.dialect.name == 'sqlite' and not event.contains(engine, 'connect', self._configure_connection):
+            event.listen(engine, 'connect', self._configure_connection)
+            # 丢弃监听器注册前建立的连接
+            engine.dispose()
+
+    def _configure_connection(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+            # 只对尚未建表的新数据库生效，已有数据库保持原设置
+            if cursor.execute('PRAGMA page_count').fetchone()[0] == 0:
+                cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            cursor.execute('PRAGMA journal_mode=WAL')
+            # 默认保持 SQLite 的 synchronous 设置，配置为 NORMAL 时以掉电可能丢失最近提交为代价减少 fsync
+            if self.synchronous:
+                cursor.execute(f'PRAGMA synchronous={self.synchronous}')
+            cursor.execute(f'PRAGMA wal_autocheckpoint={int(self.checkpoint_pages)}')
+            # 检查点之后把 WAL 文件截断到约 checkpoint_pages 页
+            page_size = cursor.execute('PRAGMA page_size').fetchone()[0]
+            cursor.execute(f'PRAGMA journal_size_limit={int(self.checkpoint_pages * page_size)}')
+        finally:
+            cursor.close()
+
+    def in_window(self, now=None):
+        return _in_window(self.window, now or datetime.utcnow())
+
+    @property
+    def window_start(self):
+        return self.window[0]
+
+    def _window_remaining(self, now):
+        """当前维护窗口剩余秒数"""
+        end = datetime.combine(now.date(), self.window[1])
+        if end <= now:
+            end += timedelta(days=1)
+        return (end - now).total_seconds()
+
+    # ---------- 状态 ----------
+
+    @staticmethod
+    def _pragma(conn, name):
+        return conn.exec_driver_sql(f'PRAGMA {name}').scalar()
+
+    def _file_sizes(self):
+        path = db.engine.url.database
+        if not path or path == ':memory:':
+            return {'database_bytes': None, 'wal_bytes': None, 'total_bytes': None}
+
+        def size(file_path):
+            try:
+                return os.path.getsize(file_path)
+            except OSError:
+                return 0
+        database_bytes, wal_bytes = size(path), size(path + '-wal')
+        return {'database_bytes': database_bytes, 'wal_bytes': wal_bytes, 'total_bytes': database_bytes + wal_bytes}
+
+    def snapshot(self):
+        """当前文件大小、页数和空闲页数"""
+        with db.engine.connect() as conn:
+            page_size = self._pragma(conn, 'page_size')
+            page_count = self._pragma(conn, 'page_count')
+            freelist = self._pragma(conn, 'freelist_count')
+            state = {
+                'page_size': page_size,
+                'page_count': page_count,
+                'freelist_pages': freelist,
+                'freelist_bytes': freelist * page_size,
+                'auto_vacuum': AUTO_VACUUM_MODES.get(self._pragma(conn, 'auto_vacuum'), 'unknown'),
+                'journal_mode': self._pragma(conn, 'journal_mode')
+            }
+        state.update(self._file_sizes())
+        return state
+
+    # ---------- 维护步骤 ----------
+
+    def _timed(self, conn, sql):
+        started = time.perf_counter()
+        result = conn.exec_driver_sql(sql)
+        rows = result.fetchall() if result.returns_rows else []
+        return rows, (time.perf_counter() - started) * 1000
+
+    def incremental_vacuum(self, deadline):
+        """分步回收空闲页，每步耗时控制在 max_block_ms 以内"""
+        pages = self.initial_step_pages
+        steps = []
+        reclaimed = 0
+        freelist = 0
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            while time.monotonic() < deadline:
+                freelist = self._pragma(conn, 'freelist_count')
+                if freelist <= 0:
+                    break
+                step = min(pages, freelist)
+                # pysqlite 对不返回列的语句只执行一步（只回收一页），executescript 会执行到结束
+                started = time.perf_counter()
+                conn.connection.driver_connection.executescript(f'PRAGMA incremental_vacuum({step})')
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                remaining = self._pragma(conn, 'freelist_count')
+                done = freelist - remaining
+                freelist = remaining
+                reclaimed += done
+                steps.append(elapsed_ms)
+                if done <= 0:
+                    break
+
+                # 按本步每页耗时估算下一步页数，留一半余量
+                per_page = elapsed_ms / step
+                target = int(self.max_block_ms * 0.5 / per_page) if per_page > 0 else self.max_step_pages
+                pages = max(1, min(self.max_step_pages, target, pages * 2))
+                time.sleep(self.step_pause)
+
+        return {
+            'operation': 'incremental_vacuum',
+            'status': 'success',
+            'reclaimed_pages': reclaimed,
+            'steps': len(steps),
+            'step_ms': {
+                'avg': round(sum(steps) / len(steps), 2) if steps else None,
+                'max': round(max(steps), 2) if steps else None
+            },
+            'remaining_pages': freelist
+        }
+
+    def analyze(self, deadline):
+        """对缺少统计信息的表逐个执行抽样 ANALYZE，其余交给 PRAGMA optimize 判断"""
+        analyzed = []
+        steps = []
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.exec_driver_sql(f'PRAGMA analysis_limit={int(self.analysis_limit)}')
+            tables = [row[0] for row in conn.exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+            )]
+            has_stats = conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+            ).scalar()
+            analyzed_tables = set()
+            if has_stats:
+                analyzed_tables = {row[0] for row in conn.exec_driver_sql('SELECT DISTINCT tbl FROM sqlite_stat1')}
+
+            for table in tables:
+                if table in analyzed_tables or time.monotonic() >= deadline:
+                    continue
+                _, elapsed_ms = self._timed(conn, f'ANALYZE "{table}"')
+                analyzed.append(table)
+                steps.append(elapsed_ms)
+                time.sleep(self.step_pause)
+
+            # 0x10000: 检查所有表而不仅是本连接用过的表（旧版本 SQLite 忽略该位）
+            _, optimize_ms = self._timed(conn, 'PRAGMA optimize=0x10002')
+
+        return {
+            'operation': 'optimize',
+            'status': 'success',
+            'analyzed_tables': analyzed,
+            'analyze_max_ms': round(max(steps), 2) if steps else None,
+            'optimize_ms': round(optimize_ms, 2)
+        }
+
+    def checkpoint(self):
+        """PASSIVE 检查点不等待读写请求；全部写回后尝试把 WAL 截断"""
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            (busy, log_frames, checkpointed), = conn.exec_driver_sql('PRAGMA wal_checkpoint(PASSIVE)').fetchall()
+            page_size = self._pragma(conn, 'page_size')
+            truncated = False
+            # WAL 文件超过预算且内容已全部写回时截断；截断耗时与文件大小成正比，
+            # 过大的文件（只会由整库 VACUUM 产生）交给 convert_auto_vacuum 处理
+            wal_bytes = self._file_sizes()['wal_bytes'] or 0
+            oversized = self.checkpoint_pages * page_size < wal_bytes <= self.truncate_max_bytes
+            if not busy and log_frames >= 0 and checkpointed == log_frames and oversized:
+                # TRUNCATE 需要短暂独占，忙等待时间限制为 max_block_ms，拿不到就放弃
+                conn.exec_driver_sql(f'PRAGMA busy_timeout={int(self.max_block_ms)}')
+                try:
+                    (busy, _, _), = conn.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+                    truncated = not busy
+                finally:
+                    conn.exec_driver_sql(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        return {
+            'operation': 'wal_checkpoint',
+            'status': 'success',
+            'wal_frames': log_frames,
+            'checkpointed_frames': checkpointed,
+            'truncated': truncated
+        }
+
+    def convert_auto_vacuum(self):
+        """切换到 auto_vacuum=INCREMENTAL，需要整库 VACUUM 一次，期间阻塞所有写入"""
+        started = time.perf_counter()
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.exec_driver_sql('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.exec_driver_sql('VACUUM')
+            # VACUUM 把整个数据库写入了 WAL，立即写回并截断
+            conn.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+        return {
+            'operation': 'convert_auto_vacuum',
+            'status': 'success',
+            'duration_ms': round((time.perf_counter() - started) * 1000, 2)
+        }
+
+    # ---------- 入口 ----------
+
+    def run(self, scheduled=False, convert=False, now=None):
+        """执行一轮维护并返回前后对比
+
+        scheduled 为 True 时只在维护窗口内执行，并在窗口结束前停止；
+        convert 为 True 时允许为切换 auto_vacuum 执行一次整库 VACUUM。
+        """
+        now = now or datetime.utcnow()
+        report = {
+            'timestamp': now.isoformat(),
+            'window': f'{self.window[0]:%H:%M}-{self.window[1]:%H:%M}',
+            'max_block_ms': self.max_block_ms,
+            'operations': []
+        }
+        if db.engine.dialect.name != 'sqlite':
+            report['status'] = 'skipped'
+            report['message'] = '仅支持 SQLite 数据库'
+            return report
+        if scheduled and not self.in_window(now):
+            report['status'] = 'skipped'
+            report['message'] = '不在维护时间窗口内'
+            return report
+
+        duration = self.max_duration
+        if scheduled:
+            duration = min(duration, self._window_remaining(now))
+        deadline = time.monotonic() + duration
+        started = time.perf_counter()
+        before = self.snapshot()
+        report['before'] = before
+
+        steps = []
+        if before['auto_vacuum'] != 'incremental':
+            if convert:
+                steps.append(('convert_auto_vacuum', self.convert_auto_vacuum))
+            else:
+                report['operations'].append({
+                    'operation': 'incremental_vacuum',
+                    'status': 'skipped',
+                    'message': '数据库未启用 auto_vacuum=INCREMENTAL，需要执行一次转换（convert_auto_vacuum）'
+                })
+        if before['auto_vacuum'] == 'incremental':
+            steps.append(('incremental_vacuum', lambda: self.incremental_vacuum(deadline)))
+        steps.append(('optimize', lambda: self.analyze(deadline)))
+        steps.append(('wal_checkpoint', self.checkpoint))
+
+        for operation, step in steps:
+            try:
+                report['operations'].append(step())
+            except Exception as e:
+                report['operations'].append({
+                    'operation': operation,
+                    'error': str(e),
+                    'status': 'failed'
+                })
+
+        after = self.snapshot()
+        report['after'] = after
+        report['reclaimed_bytes'] = (
+            before['total_bytes'] - after['total_bytes'] if before['total_bytes'] is not None else None
+        )
+        report['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        report['status'] = 'failed' if any(op['status'] == 'failed' for op in report['operations']) else 'success'
+        self.last_report = report
+        return report
+
+
+# 全局数据库维护实例
+db_maintenance = MaintenanceEngine()
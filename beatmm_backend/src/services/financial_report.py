@@ -0,0 +1,173 @@
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import datetime, date, timedelta
+
+from src.models.user import db, WalletTransaction, TransactionStatus
+from src.services.money import sql_cents, from_cents
+
+
+GRANULARITIES = ('daily', 'weekly', 'monthly')
+
+
+def bucket_key(day, granularity):
+    """某一天所属的分桶: (标签, 桶起始日)"""
+    if granularity == 'weekly':
+        start = day - timedelta(days=day.weekday())
+        year, week, _ = start.isocalendar()
+        return f'{year}-W{week:02d}', start
+    if granularity == 'monthly':
+        return day.strftime('%Y-%m'), day.replace(day=1)
+    return day.isoformat(), day
+
+
+def _empty_totals():
+    return {'revenue_by_type': defaultdict(int), 'expense_by_type': defaultdict(int), 'transaction_count': 0}
+
+
+def _totals_to_dict(totals):
+    """分为单位的累计值转换为响应格式"""
+    revenue = sum(totals['revenue_by_type'].values())
+    expense = sum(totals['expense_by_type'].values())
+    net_profit = revenue - expense
+    return {
+        'total_revenue': float(from_cents(revenue)),
+        'total_expense': float(from_cents(expense)),
+        'net_profit': float(from_cents(net_profit)),
+        'profit_margin': round(net_profit / revenue * 100, 2) if revenue > 0 else 0,
+        'revenue_breakdown': {t: float(from_cents(v)) for t, v in totals['revenue_by_type'].items()},
+        'expense_breakdown': {t: float(from_cents(v)) for t, v in totals['expense_by_type'].items()},
+        'transaction_count': totals['transaction_count']
+    }
+
+
+class FinancialReportService:
+    """财务报表聚合 - 按天 GROUP BY 交易类型和金额正负，在数据库中完成汇总
+
+    已结束的日期（今天之前）的交易汇总不会再变化，按天缓存在 LRU 中；
+    任意日期范围的报表只需查询未缓存的日期，再在内存中合并为日/周/月分桶。
+    """
+
+    def __init__(self, max_cached_days=3660):
+        self.max_cached_days = max_cached_days
+        self._lock = threading.Lock()
+        self._days = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self.max_cached_days = app.config.get('FINANCIAL_REPORT_CACHE_DAYS', self.max_cached_days)
+        app.extensions['financial_reports'] = self
+
+    def daily_breakdown(self, start_date, end_date):
+        """返回 {日期: {(交易类型, 'revenue'|'expense'): [笔数, 金额分]}}，包含 [start_date, end_date] 每一天"""
+        today = datetime.utcnow().date()
+        result = {}
+        missing = []
+
+        with self._lock:
+            day = start_date
+            while day <= end_date:
+                cached = self._days.get(day)
+                if cached is None:
+                    missing.append(day)
+                else:
+                    self._days.move_to_end(day)
+                    result[day] = cached
+                day += timedelta(days=1)
+            self.hits += len(result)
+            self.misses += len(missing)
+
+        if missing:
+            fetched = self._query_days(missing[0], missing[-1])
+            with self._lock:
+                for day in missing:
+                    breakdown = fetched.get(day, {})
+                    result[day] = breakdown
+                    if day < today:
+                        self._days[day] = breakdown
+                        self._days.move_to_end(day)
+                while len(self._days) > self.max_cached_days:
+                    self._days.popitem(last=False)
+
+        return result
+
+    def _query_days(self, first_day, last_day):
+        """一条 GROUP BY 查询取回日期范围内每天按类型、正负分组的汇总"""
+        amount = WalletTransaction.amount
+        tx_day = db.func.date(WalletTransaction.created_at)
+        direction = db.case((amount > 0, 'revenue'), else_='expense')
+        query = db.session.query(
+            tx_day,
+            WalletTransaction.transaction_type,
+            direction,
+            db.func.count(),
+            db.func.sum(db.func.abs(sql_cents(amount)))
+        ).filter(
+            WalletTransaction.status == TransactionStatus.COMPLETED,
+            WalletTransaction.created_at >= datetime.combine(first_day, datetime.min.time()),
+            WalletTransaction.created_at < datetime.combine(last_day + timedelta(days=1), datetime.min.time())
+        ).group_by(tx_day, WalletTransaction.transaction_type, direction)
+
+        fetched = defaultdict(dict)
+        for day, transaction_type, kind, count, cents in query:
+            if isinstance(day, str):
+                day = date.fromisoformat(day)
+            fetched[day][(transaction_type.value, kind)] = [count, cents or 0]
+        return fetched
+
+    def report(self, start_date, end_date, granularity=None):
+        """汇总日期范围内的收支，granularity 为 daily/weekly/monthly 时附带分桶明细"""
+        if granularity is not None and granularity not in GRANULARITIES:
+            raise ValueError(f'不支持的分桶粒度: {granularity}')
+
+        totals = _empty_totals()
+        buckets = OrderedDict()
+        for day, breakdown in sorted(self.daily_breakdown(start_date, end_date).items()):
+            targets = [totals]
+            if granularity:
+                label, bucket_start = bucket_key(day, granularity)
+                if label not in buckets:
+                    buckets[label] = (max(bucket_start, start_date), _empty_totals())
+                targets.append(buckets[label][1])
+
+            for (transaction_type, kind), (count, cents) in breakdown.items():
+                for target in targets:
+                    target[f'{kind}_by_type'][transaction_type] += cents
+                    target['transaction_count'] += count
+
+        result = {'summary': _totals_to_dict(totals)}
+        if granularity:
+            result['granularity'] = granularity
+            result['buckets'] = []
+            labels = list(buckets)
+            for index, label in enumerate(labels):
+                bucket_start, bucket_totals = buckets[label]
+                bucket_end = buckets[labels[index + 1]][0] - timedelta(days=1) if index + 1 < len(labels) else end_date
+                result['buckets'].append(dict(
+                    _totals_to_dict(bucket_totals),
+                    period=label,
+                    start_date=bucket_start.isoformat(),
+                    end_date=bucket_end.isoformat()
+                ))
+        return result
+
+    def invalidate(self, day=None):
+        """交易状态被事后修改时清除对应日期（不指定则全部）的缓存"""
+        with self._lock:
+            if day is None:
+                self._days.clear()
+            else:
+                self._days.pop(day, None)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'cached_days': len(self._days),
+                'max_cached_days': self.max_cached_days,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+# 全局财务报表服务实例
+financial_reports = FinancialReportService()
@@ -0,0 +1,361 @@
+import atexit
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from src.models.user import db, BotJob
+
+
+
+def pack(value):
+    """JSON 序列化后 zlib 压缩"""
+    if value is None:
+        return None
+    raw = json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+    return zlib.compress(raw, 6)
+
+
+def unpack(blob):
+    if blob is None:
+        return None
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+class JobContext:
+    """传给任务处理函数，用于上报进度和阶段性结果"""
+
+    def __init__(self, manager, job_id, params, created_by):
+        self.manager = manager
+        self.job_id = job_id
+        self.params = params
+        self.created_by = created_by
+        self._last_report = 0.0
+
+    def progress(self, current, total=None, partial=None, force=False):
+        """上报进度；为避免频繁写库，默认最多每 progress_interval 秒写一次"""
+        now = time.monotonic()
+        if not force and now - self._last_report < self.manager.progress_interval:
+            return
+        self._last_report = now
+        values = {'progress_current': current, 'heartbeat_at': datetime.utcnow()}
+        if total is not None:
+            values['progress_total'] = total
+        if partial is not None:
+            values['partial_result'] = pack(partial)
+        try:
+            self.manager._update(self.job_id, **values)
+        except Exception:
+            # 进度写入失败（如数据库繁忙）不影响任务本身
+            pass
+
+
+class JobManager:
+    """异步任务管理 - 请求立即返回任务ID，任务在后台线程池执行
+
+    任务状态、进度和压缩后的结果持久化在 bot_jobs 表中，结果保留 result_ttl 秒。
+    运行中的任务定期刷新心跳；进程重启或崩溃后，心跳超时的任务
+    若类型可恢复则重新排队执行，否则标记为 interrupted。
+    """
+
+    def __init__(self, max_workers=2, result_ttl=86400, lease_seconds=120, maintenance_interval=15.0,
+                 progress_interval=1.0, max_attempts=3):
+        self.max_workers = max_workers
+        self.result_ttl = result_ttl
+        self.lease_seconds = lease_seconds
+        self.maintenance_interval = maintenance_interval
+        self.progress_interval = progress_interval
+        self.max_attempts = max_attempts
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.app = None
+
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._running = set()
+        # 已交给线程池但尚未开始执行的任务，维护线程不会重复提交
+        self._submitted = set()
+        self._executor = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def job(self, job_type, resumable=False):
+        """注册任务处理函数: handler(context, **params) -> 可序列化的结果
+
+        resumable 表示中断后可以安全地重新执行（处理函数幂等或自带断点）。
+        """
+        def decorator(handler):
+            self._handlers[job_type] = (handler, resumable)
+            return handler
+        return decorator
+
+    def init_app(self, app):
+        """读取配置，启动线程池和维护线程，并接管中断的任务"""
+        self.app = app
+        self.max_workers = app.config.get('BOT_JOB_MAX_WORKERS', self.max_workers)
+        self.result_ttl = app.config.get('BOT_JOB_RESULT_TTL', self.result_ttl)
+        self.lease_seconds = app.config.get('BOT_JOB_LEASE_SECONDS', self.lease_seconds)
+        app.extensions['bot_jobs'] = self
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='bot-job')
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run_maintenance, name='bot-job-maintenance', daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def shutdown(self):
+        self._stopped.set()
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def submit(self, job_type, created_by, **params):
+        """创建任务并交给线程池执行，返回任务ID"""
+        if job_type not in self._handlers:
+            raise KeyError(job_type)
+        job = BotJob(
+            id=uuid.uuid4().hex,
+            job_type=job_type,
+            status='queued',
+            params=json.dumps(params, ensure_ascii=False),
+            created_by=created_by
+        )
+        db.session.add(job)
+        db.session.commit()
+        self._dispatch(job.id)
+        return job.id
+
+    def get(self, job_id, include_result=True):
+        """任务状态字典，不存在或已过期时返回 None"""
+        job = db.session.get(BotJob, job_id)
+        if job is None or (job.expires_at and job.expires_at < datetime.utcnow()):
+            return None
+        data = {
+            'job_id': job.id,
+            'job_type': job.job_type,
+            'status': job.status,
+            'params': json.loads(job.params) if job.params else {},
+            'progress': {
+                'current': job.progress_current or 0,
+                'total': job.progress_total,
+                'percent': round(job.progress_current * 100 / job.progress_total, 1) if job.progress_total else None
+            },
+            'attempts': job.attempts,
+            'error': job.error_message,
+            'created_at': job.created_at.isoformat() if job.created_at else None,
+            'started_at': job.started_at.isoformat() if job.started_at else None,
+            'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+            'expires_at': job.expires_at.isoformat() if job.expires_at else None
+        }
+        if include_result:
+            data['partial_result'] = unpack(job.partial_result) if job.status != 'succeeded' else None
+            data['result'] = unpack(job.result)
+        return data
+
+    def get_stats(self):
+        with self._lock:
+            running = len(self._running)
+        counts = dict(db.session.query(BotJob.status, db.func.count()).group_by(BotJob.status).all())
+        return {
+            'worker_id': self.worker_id,
+            'running_here': running,
+            'max_workers': self.max_workers,
+            'jobs_by_status': counts
+        }
+
+    def _update(self, job_id, **values):
+        with self.app.app_context():
+            db.session.execute(
+                db.update(BotJob).where(BotJob.id == job_id).values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+
+    def _claim(self, job_id):
+        """条件更新认领排队中的任务，防止多个进程重复执行"""
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            db.update(BotJob).where(
+                BotJob.id == job_id,
+                BotJob.status == 'queued'
+            ).values(
+                status='running',
+                worker_id=self.worker_id,
+                heartbeat_at=now,
+                started_at=now,
+                attempts=BotJob.attempts + 1
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        return claimed == 1
+
+    def _dispatch(self, job_id):
+        """交给线程池执行；本进程已提交或正在执行的任务跳过"""
+        with self._lock:
+            if job_id in self._submitted or job_id in self._running:
+                return
+            self._submitted.add(job_id)
+        try:
+            self._executor.submit(self._execute, job_id)
+        except Exception:
+            with self._lock:
+                self._submitted.discard(job_id)
+            raise
+
+    def _execute(self, job_id):
+        # 认领之前先加入执行列表：认领提交后维护线程看到的运行中任务必定已在列表中，
+        # 不会因为 worker_id 是本进程而被当作重启前留下的任务重新排队
+        with self._lock:
+            self._submitted.discard(job_id)
+            if job_id in self._running:
+                return
+            self._running.add(job_id)
+        with self.app.app_context():
+            try:
+                if not self._claim(job_id):
+                    return
+                job = db.session.get(BotJob, job_id)
+                handler, _ = self._handlers[job.job_type]
+                params = json.loads(job.params) if job.params else {}
+                context = JobContext(self, job_id, params, job.created_by)
+                db.session.commit()
+
+                try:
+                    result = handler(context, **params)
+                except Exception as e:
+                    db.session.rollback()
+                    self._finish(job_id, 'failed', error=str(e))
+                else:
+                    self._finish(job_id, 'succeeded', result=result)
+            finally:
+                with self._lock:
+                    self._running.discard(job_id)
+
+    def _finish(self, job_id, status, result=None, error=None):
+        now = datetime.utcnow()
+        values = {
+            'status': status,
+            'finished_at': now,
+            'heartbeat_at': now,
+            'expires_at': now + timedelta(seconds=self.result_ttl),
+            'error_message': error
+        }
+        if result is not None:
+            values['result'] = pack(result)
+            values['partial_result'] = None
+        if status == 'succeeded':
+            values['progress_current'] = db.func.coalesce(BotJob.progress_total, BotJob.progress_current)
+        db.session.execute(
+            db.update(BotJob).where(
+                BotJob.id == job_id,
+                BotJob.worker_id == self.worker_id
+            ).values(**values).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    def _run_maintenance(self):
+        while not self._stopped.is_set():
+            try:
+                with self.app.app_context():
+                    self._heartbeat()
+                    self._recover()
+                    self._evict()
+            except Exception:
+                # 数据库暂时不可用时下一轮重试
+                pass
+            self._stopped.wait(self.maintenance_interval)
+
+    def _heartbeat(self):
+        with self._lock:
+            running = list(self._running)
+        if running:
+            db.session.execute(
+                db.update(BotJob).where(
+                    BotJob.id.in_(running),
+                    BotJob.worker_id == self.worker_id
+                ).values(heartbeat_at=datetime.utcnow()).execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+
+    def _recover(self):
+        """接管心跳超时的运行中任务，以及无人执行的排队任务"""
+        deadline = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+        with self._lock:
+            own = list(self._running)
+
+        running = BotJob.query.filter(
+            BotJob.status == 'running',
+            ~BotJob.id.in_(own)
+        ).all()
+        stale = [
+            job for job in running
+            if job.heartbeat_at is None or job.heartbeat_at < deadline or not self._worker_alive(job.worker_id)
+        ]
+        requeued = []
+        for job in stale:
+            _, resumable = self._handlers.get(job.job_type, (None, False))
+            requeue = resumable and job.attempts < self.max_attempts
+            if requeue:
+                values = {'status': 'queued', 'worker_id': None}
+            else:
+                now = datetime.utcnow()
+                values = {
+                    'status': 'interrupted',
+                    'error_message': '执行进程中断',
+                    'finished_at': now,
+                    'expires_at': now + timedelta(seconds=self.result_ttl)
+                }
+            updated = db.session.execute(
+                db.update(BotJob).where(
+                    BotJob.id == job.id,
+                    BotJob.status == 'running',
+                    BotJob.heartbeat_at == job.heartbeat_at
+                ).values(**values).execution_options(synchronize_session=False)
+            ).rowcount
+            if updated and requeue:
+                requeued.append(job.id)
+        db.session.commit()
+        for job_id in requeued:
+            self._dispatch(job_id)
+
+        # 排队超过租约时间仍未开始的任务（提交它的进程已退出）
+        orphaned = db.session.query(BotJob.id).filter(
+            BotJob.status == 'queued',
+            db.or_(BotJob.heartbeat_at.is_(None), BotJob.heartbeat_at < deadline),
+            BotJob.created_at < deadline
+        ).all()
+        for (job_id,) in orphaned:
+            self._dispatch(job_id)
+
+    def _worker_alive(self, worker_id):
+        """同一主机上的执行进程是否还在；其他主机无法判断，只能等心跳超时"""
+        if worker_id == self.worker_id:
+            # 本进程ID相同但不在执行列表中，说明是重启前（如容器内PID复用）留下的
+            return False
+        host, _, pid = (worker_id or '').rpartition(':')
+        if host != socket.gethostname() or not pid.isdigit():
+            return True
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _evict(self):
+        """删除结果已过期的任务"""
+        db.session.execute(
+            db.delete(BotJob).where(BotJob.expires_at < datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+
+# 全局异步任务管理实例
+job_manager = JobManager()
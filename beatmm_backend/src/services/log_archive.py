@@ -0,0 +1,267 @@
+import gzip
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+
+from src.models.user import db, SystemLog
+
+
+ARCHIVE_COLUMNS = ('id', 'user_id', 'action', 'resource', 'resource_id', 'details', 'ip_address', 'user_agent',
+                   'created_at')
+
+
+class ArchivedLog:
+    """归档中的一条日志，属性与 SystemLog 相同"""
+
+    archived = True
+
+    def __init__(self, row):
+        for column in ARCHIVE_COLUMNS:
+            setattr(self, column, row.get(column))
+        if isinstance(self.created_at, str):
+            self.created_at = datetime.fromisoformat(self.created_at)
+
+
+def _sort_key(log):
+    return log.created_at or datetime.min, log.id
+
+
+class LogArchive:
+    """SystemLog 冷数据归档 - 过期日志写入按天分区的 gzip 段文件后从表中删除
+
+    每个段文件旁有一个 .idx.json 索引，记录时间范围、id 范围以及按 user_id、action
+    统计的行数。查询时先用索引排除不相关的段，只解压可能命中的段；
+    单一条件下的计数和翻页偏移可以直接由索引得出，不需要读取段文件。
+    段文件写入后不再修改。
+    """
+
+    def __init__(self, archive_dir=None, segment_rows=10000, refresh_interval=5.0, cached_segments=16):
+        self.archive_dir = archive_dir
+        self.segment_rows = segment_rows
+        self.refresh_interval = refresh_interval
+        self.cached_segments = cached_segments
+        self._lock = threading.Lock()
+        self._catalog = {}
+        self._catalog_loaded_at = 0.0
+        self._rows_cache = OrderedDict()
+
+    def init_app(self, app):
+        self.archive_dir = app.config.get('LOG_ARCHIVE_DIR', self.archive_dir)
+        self.segment_rows = app.config.get('LOG_ARCHIVE_SEGMENT_ROWS', self.segment_rows)
+        app.extensions['log_archive'] = self
+
+    @property
+    def enabled(self):
+        return bool(self.archive_dir)
+
+    # ---------- 写入 ----------
+
+    def archive_batch(self, cutoff):
+        """返回分批执行函数: 归档并删除至多 limit 条早于 cutoff 的日志（每天一个段），返回处理行数"""
+        table = SystemLog.__table__
+
+        def execute(conn, limit):
+            rows = conn.execute(
+                db.select(*[table.c[column] for column in ARCHIVE_COLUMNS])
+                .where(table.c.created_at < cutoff)
+                .order_by(table.c.created_at, table.c.id)
+                .limit(limit)
+            ).mappings().all()
+            if not rows:
+                return 0
+
+            by_day = defaultdict(list)
+            for row in rows:
+                by_day[row['created_at'].date()].append(dict(row))
+            for day, day_rows in by_day.items():
+                self._write_segment(day, day_rows)
+
+            # 段文件已落盘后再删除
+            conn.execute(db.delete(table).where(table.c.id.in_([row['id'] for row in rows])))
+            return len(rows)
+        return execute
+
+    def _write_segment(self, day, rows):
+        first_id = min(row['id'] for row in rows)
+        last_id = max(row['id'] for row in rows)
+        directory = os.path.join(self.archive_dir, f'{day:%Y}', f'{day:%m}')
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f'{day.isoformat()}-{first_id}-{last_id}')
+        data_path = base + '.jsonl.gz'
+        index_path = base + '.idx.json'
+
+        # 中断后重跑会得到同名段，直接覆盖即可
+        rows.sort(key=lambda row: (row['created_at'], row['id']))
+        user_counts = defaultdict(int)
+        action_counts = defaultdict(int)
+        with gzip.open(data_path + '.tmp', 'wt', encoding='utf-8', compresslevel=6) as f:
+            for row in rows:
+                user_counts[str(row['user_id'])] += 1
+                action_counts[row['action']] += 1
+                f.write(json.dumps(dict(row, created_at=row['created_at'].isoformat()), ensure_ascii=False))
+                f.write('\n')
+        self._fsync_replace(data_path + '.tmp', data_path)
+
+        index = {
+            'segment': os.path.basename(data_path),
+            'day': day.isoformat(),
+            'rows': len(rows),
+            'min_id': first_id,
+            'max_id': last_id,
+            'min_created_at': rows[0]['created_at'].isoformat(),
+            'max_created_at': rows[-1]['created_at'].isoformat(),
+            'user_ids': user_counts,
+            'actions': action_counts
+        }
+        with open(index_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        self._fsync_replace(index_path + '.tmp', index_path)
+
+        with self._lock:
+            self._catalog[data_path] = self._parse_index(index)
+
+    @staticmethod
+    def _fsync_replace(tmp_path, path):
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    # ---------- 索引 ----------
+
+    @staticmethod
+    def _parse_index(index):
+        return dict(
+            index,
+            min_created_at=datetime.fromisoformat(index['min_created_at']),
+            max_created_at=datetime.fromisoformat(index['max_created_at'])
+        )
+
+    def segments(self):
+        """全部段的索引，按最晚时间倒序；定期重新扫描目录以发现其他进程写入的段"""
+        if not self.enabled:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            stale = now - self._catalog_loaded_at >= self.refresh_interval
+        if stale:
+            catalog = {}
+            for root, _, files in os.walk(self.archive_dir):
+                for name in files:
+                    if not name.endswith('.idx.json'):
+                        continue
+                    data_path = os.path.join(root, name[:-len('.idx.json')] + '.jsonl.gz')
+                    with self._lock:
+                        known = self._catalog.get(data_path)
+                    if known is None:
+                        try:
+                            with open(os.path.join(root, name), encoding='utf-8') as f:
+                                known = self._parse_index(json.load(f))
+                        except (OSError, ValueError):
+                            continue
+                    catalog[data_path] = known
+            with self._lock:
+                self._catalog = catalog
+                self._catalog_loaded_at = now
+
+        with self._lock:
+            items = list(self._catalog.items())
+        items.sort(key=lambda item: item[1]['max_created_at'], reverse=True)
+        return items
+
+    @staticmethod
+    def _indexed_count(index, user_id=None, action=None):
+        """仅凭索引能得出的命中行数；两个条件同时存在时无法得出，返回 None"""
+        if user_id and action:
+            if str(user_id) not in index['user_ids']:
+                return 0
+            if not any(action in name for name in index['actions']):
+                return 0
+            return None
+        if user_id:
+            return index['user_ids'].get(str(user_id), 0)
+        if action:
+            return sum(count for name, count in index['actions'].items() if action in name)
+        return index['rows']
+
+    # ---------- 查询 ----------
+
+    def _read_segment(self, data_path):
+        with self._lock:
+            rows = self._rows_cache.get(data_path)
+            if rows is not None:
+                self._rows_cache.move_to_end(data_path)
+                return rows
+        with gzip.open(data_path, 'rt', encoding='utf-8') as f:
+            rows = [ArchivedLog(json.loads(line)) for line in f]
+        rows.sort(key=_sort_key, reverse=True)
+        with self._lock:
+            self._rows_cache[data_path] = rows
+            while len(self._rows_cache) > self.cached_segments:
+                self._rows_cache.popitem(last=False)
+        return rows
+
+    @staticmethod
+    def _matches(log, user_id, action, before):
+        if user_id and log.user_id != user_id:
+            return False
+        if action and action not in (log.action or ''):
+            return False
+        if before is not None and _sort_key(log) >= before:
+            return False
+        return True
+
+    def count(self, user_id=None, action=None):
+        total = 0
+        for data_path, index in self.segments():
+            indexed = self._indexed_count(index, user_id, action)
+            if indexed is None:
+                indexed = sum(1 for log in self._read_segment(data_path) if self._matches(log, user_id, action, None))
+            total += indexed
+        return total
+
+    def query(self, user_id=None, action=None, before=None, offset=0, limit=50):
+        """按 (created_at, id) 倒序返回归档日志
+
+        before 为 (created_at, id) 时只返回严格早于该位置的日志（游标分页）；
+        offset 用于页码分页，能由索引算出行数的段会被整体跳过。
+        """
+        results = []
+        segments = self.segments()
+        for position, (data_path, index) in enumerate(segments):
+            if before is not None and index['min_created_at'] > before[0]:
+                continue
+            indexed = self._indexed_count(index, user_id, action)
+            if indexed == 0:
+                continue
+            # 已收集够且剩余段都更早时停止
+            if len(results) >= offset + limit:
+                results.sort(key=_sort_key, reverse=True)
+                if index['max_created_at'] < results[offset + limit - 1].created_at:
+                    break
+            # 整段都落在偏移量之内时不解压直接跳过，前提是它与前后的段在时间上不交叠
+            if indexed is not None and before is None and offset >= indexed and not results:
+                following = segments[position + 1][1] if position + 1 < len(segments) else None
+                if following is None or following['max_created_at'] < index['min_created_at']:
+                    offset -= indexed
+                    continue
+            results.extend(log for log in self._read_segment(data_path) if self._matches(log, user_id, action, before))
+
+        results.sort(key=_sort_key, reverse=True)
+        return results[offset:offset + limit]
+
+    def get_stats(self):
+        segments = self.segments()
+        return {
+            'enabled': self.enabled,
+            'segments': len(segments),
+            'rows': sum(index['rows'] for _, index in segments),
+            'oldest': min((index['min_created_at'] for _, index in segments), default=None),
+            'newest': max((index['max_created_at'] for _, index in segments), default=None)
+        }
+
+
+# 全局日志归档实例
+log_archive = LogArchive()
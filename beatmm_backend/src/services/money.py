@@ -0,0 +1,16 @@
+from decimal import Decimal
+
+from src.models.user import db
+
+
+CENT = Decimal('0.01')
+
+
+def sql_cents(column):
+    """金额在数据库中转换为整数分，求和时不引入浮点误差"""
+    return db.cast(db.func.round(column * 100), db.Integer)
+
+
+def from_cents(value):
+    """整数分转换为精确到分的 Decimal"""
+    return (Decimal(value or 0) * CENT).quantize(CENT)
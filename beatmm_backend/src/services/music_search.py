@@ -0,0 +1,567 @@
+import heapq
+import math
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+from sqlalchemy import bindparam, inspect, text
+
+from src.models.user import db, Music
+from src.services.orm_events import listen_once
+
+
+# 参与全文索引的列，与 FTS 表的列顺序一致
+FIELDS = ('title', 'artist', 'album', 'genre')
+
+# 默认的 unicode61 只把 L*、N*、Co 类字符当作词内字符，缅文的元音符号和韵尾（Mn/Mc）会被当成分隔符，
+# 因此需要把 M* 也加入；缅文音节由 Python 端预先切分并以空格分隔后写入
+TOKENIZER = "unicode61 remove_diacritics 2 categories 'L* N* Co M*'"
+
+# 前缀索引覆盖的最长前缀（字符数），更长的前缀查询按词表展开
+PREFIX_INDEX_MAX = 3
+
+CREATE_STATEMENTS = (
+    f'''CREATE VIRTUAL TABLE IF NOT EXISTS music_fts USING fts5(
+        {', '.join(FIELDS)}, tokenize="{TOKENIZER}", prefix='{' '.join(map(str, range(2, PREFIX_INDEX_MAX + 1)))}'
+    )''',
+    'CREATE VIRTUAL TABLE IF NOT EXISTS music_fts_vocab USING fts5vocab(music_fts, row)',
+)
+
+# 缅文（含扩展区）字符
+_MYANMAR = r'\u1000-\u109f\ua9e0-\ua9ff\uaa60-\uaa7f'
+# 词内字符之外的都视为分隔符；缅文标点 ၊ ။ ၌ ၍ ၎ ၏ 同样是分隔符
+_SEPARATOR = re.compile(rf'(?:[^\w{_MYANMAR}]|[_\u104a-\u104f])+')
+_SCRIPT_RUN = re.compile(rf'[{_MYANMAR}]+|[^{_MYANMAR}]+')
+_IS_MYANMAR = re.compile(rf'[{_MYANMAR}]')
+# 缅文音节切分（sylbreak 规则）：辅音前断开，除非它前面是叠写符 ္ 或后面紧跟 ်/္（韵尾或叠写上半部分）；
+# 独立元音、缅文数字和 ဿ 自成音节
+_SYLLABLE_START = re.compile(r'(?:(?<!\u1039)[\u1000-\u1021](?![\u103a\u1039])|[\u1023-\u102a\u103f\u1040-\u1049])')
+# 零宽空格在缅文中用作断词提示，其余零宽字符直接去掉
+_ZERO_WIDTH = str.maketrans({'\u200b': ' ', '\u200c': None, '\u200d': None, '\ufeff': None})
+
+_LATIN_ALPHABET = 'abcdefghijklmnopqrstuvwxyz0123456789'
+_MAX_CHAR = chr(0x10FFFF)
+
+# FTS 行号 = (热度档位 << 32) | music_id。FTS5 按行号顺序遍历匹配结果，
+# ORDER BY rowid DESC LIMIT n 在取到 n 条后即停止，先拿到的就是最热门的匹配；
+# 热度档位按播放次数的对数划分，每翻一倍分 4 档，播放次数跨档时才需要移动索引行
+ID_BITS = 32
+ID_MASK = (1 << ID_BITS) - 1
+BUCKETS_PER_OCTAVE = 4
+MAX_BUCKET = 127
+
+
+class SearchError(ValueError):
+    """搜索词无效"""
+
+
+# total 为 None 表示匹配数超过候选上限、未精确计数
+SearchResult = namedtuple('SearchResult', 'items total has_next page per_page corrected_query')
+
+# 查询中的一个词：若干可选的分词序列（原词、前缀展开、纠错候选），prefix 表示最后一个分词按前缀匹配，
+# post_filter 表示不参与 FTS 匹配、只在候选中过滤
+_Clause = namedtuple('_Clause', 'alternatives prefix post_filter')
+
+
+def syllables(run):
+    """把一段缅文切分成音节列表"""
+    return _SYLLABLE_START.sub(lambda match: ' ' + match.group(), run).split()
+
+
+def _fold(word):
+    """与 FTS 分词器一致的大小写和变音符号折叠（只作用于非缅文部分）"""
+    if word.isascii():
+        return word.lower()
+    decomposed = unicodedata.normalize('NFKD', word)
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def tokenize(value):
+    """文本 -> 词列表，每个词是按顺序排列的若干分词（缅文词切分为音节，其他文字保持整词）"""
+    if not value:
+        return []
+    value = unicodedata.normalize('NFKC', value).translate(_ZERO_WIDTH).casefold()
+    words = []
+    for word in _SEPARATOR.split(value):
+        if not word:
+            continue
+        tokens = []
+        for run in _SCRIPT_RUN.findall(word):
+            if _IS_MYANMAR.match(run):
+                tokens.extend(syllables(run))
+            else:
+                tokens.append(_fold(run))
+        words.append(tokens)
+    return words
+
+
+def index_text(value):
+    """写入 FTS 表的文本：缅文音节之间插入空格"""
+    return ' '.join(token for word in tokenize(value) for token in word)
+
+
+def popularity_bucket(play_count):
+    return min(int(math.log2(1 + max(play_count or 0, 0)) * BUCKETS_PER_OCTAVE), MAX_BUCKET)
+
+
+def search_rowid(music_id, play_count):
+    return (popularity_bucket(play_count) << ID_BITS) | music_id
+
+
+def bucket_play_count(rowid):
+    """行号所在档位的最小播放次数"""
+    return 2 ** ((rowid >> ID_BITS) / BUCKETS_PER_OCTAVE) - 1
+
+
+_INSERT = text(f'INSERT INTO music_fts(rowid, {", ".join(FIELDS)}) VALUES (:rowid, {", ".join(":" + f for f in FIELDS)})')
+_FIND_ROWIDS = text('SELECT rowid FROM music_fts WHERE rowid IN :rowids').bindparams(bindparam('rowids', expanding=True))
+
+
+def _index_values(music_id, play_count, values):
+    return dict({field: index_text(value) for field, value in zip(FIELDS, values)},
+                rowid=search_rowid(music_id, play_count))
+
+
+def _current_rowids(conn, music_id):
+    """music_id 当前在索引中的行号（逐档查找，正常情况下至多一个）"""
+    candidates = [(bucket << ID_BITS) | music_id for bucket in range(MAX_BUCKET + 1)]
+    return conn.execute(_FIND_ROWIDS, {'rowids': candidates}).scalars().all()
+
+
+def create_index(conn):
+    """创建 FTS 表并按 music 表全量重建（迁移和重建任务使用）"""
+    if conn.dialect.name != 'sqlite':
+        return 0
+    for statement in CREATE_STATEMENTS:
+        conn.exec_driver_sql(statement)
+    conn.exec_driver_sql('DELETE FROM music_fts')
+
+    # FTS5 要求同一事务内行号递增才能把写入合并成大段，先按行号排好再分批读取文本写入
+    music = Music.__table__
+    rowids = array('q', sorted(
+        search_rowid(music_id, play_count)
+        for music_id, play_count in conn.execute(db.select(music.c.id, music.c.play_count))
+    ))
+    columns = [music.c.id, music.c.play_count] + [music.c[field] for field in FIELDS]
+    for start in range(0, len(rowids), 5000):
+        batch = [rowid & ID_MASK for rowid in rowids[start:start + 5000]]
+        rows = {row[0]: row for row in conn.execute(db.select(*columns).where(music.c.id.in_(batch)))}
+        conn.execute(_INSERT, [_index_values(row[0], row[1], row[2:]) for row in map(rows.get, batch) if row])
+    # 合并写入过程中产生的小段，之后查询只需读取少量 b-tree
+    conn.exec_driver_sql("INSERT INTO music_fts(music_fts) VALUES ('optimize')")
+    return len(rowids)
+
+
+class _Vocabulary:
+    """fts5vocab 的内存副本：按词序排列的词及其文档数，以及计算 BM25 所需的总行数和平均行长度"""
+
+    def __init__(self, terms, docs, rows, average_length):
+        self.terms = terms
+        self.docs = docs
+        self.rows = rows
+        self.average_length = average_length or 1.0
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def load(cls, session):
+        terms, docs = [], array('q')
+        occurrences = 0
+        for term, doc, count in session.execute(text('SELECT term, doc, cnt FROM music_fts_vocab')):
+            terms.append(term)
+            docs.append(doc)
+            occurrences += count
+        rows = session.execute(text('SELECT count(*) FROM music_fts')).scalar()
+        return cls(terms, docs, rows, occurrences / rows if rows else 1.0)
+
+    def _range(self, prefix):
+        return bisect_left(self.terms, prefix), bisect_left(self.terms, prefix + _MAX_CHAR)
+
+    def lookup(self, term, prefix=False):
+        """(文档数, 词表中的词)，不存在时为 (0, None)；prefix 时取第一个以 term 开头的词"""
+        position = bisect_left(self.terms, term)
+        if position < len(self.terms):
+            found = self.terms[position]
+            if found == term or (prefix and found.startswith(term)):
+                return self.docs[position], found
+        return 0, None
+
+    def expand(self, prefix, limit):
+        """以 prefix 开头的词，超过 limit 个时保留文档数最多的"""
+        start, end = self._range(prefix)
+        if end - start <= limit:
+            return self.terms[start:end]
+        return [self.terms[i] for i in sorted(heapq.nlargest(limit, range(start, end), key=self.docs.__getitem__))]
+
+    def phrase_docs(self, tokens, prefix=False, scan_limit=1000):
+        """包含短语的文档数的估计：取各分词文档数的最小值；前缀只累加前 scan_limit 个词"""
+        counts = [self.lookup(token)[0] for token in tokens[:-1]]
+        if prefix:
+            start, end = self._range(tokens[-1])
+            counts.append(sum(self.docs[start:min(end, start + scan_limit)]))
+        else:
+            counts.append(self.lookup(tokens[-1])[0])
+        return min(counts)
+
+    def add(self, token):
+        position = bisect_left(self.terms, token)
+        if position < len(self.terms) and self.terms[position] == token:
+            self.docs[position] += 1
+        else:
+            self.terms.insert(position, token)
+            self.docs.insert(position, 1)
+
+
+class MusicSearch:
+    """音乐目录全文搜索 - SQLite FTS5 + BM25，按播放次数加权
+
+    索引由 Music 的 ORM 写入事件在同一事务中同步更新；播放写缓冲批量增加 play_count 后
+    调用 refresh_popularity() 移动跨档的索引行。绕过这两条路径修改音乐信息后需要执行重建任务。
+
+    索引行按热度档位排列，每次查询只按热度从高到低取前 candidate_limit 条匹配，
+    在这些候选中按 BM25 × 播放次数加成排序，耗时与曲库大小和匹配总数无关；
+    匹配数超过候选上限时只能翻到候选范围内的页，且不返回总数。
+    IDF、平均行长度和前缀展开使用 fts5vocab 的内存副本（首次查询时加载，vocabulary_ttl 秒后刷新）。
+    最后一个词（至少两个字符）按前缀匹配；没有结果时对拉丁字母词做一次编辑距离为 1 的纠错。
+    """
+
+    def __init__(self, weights=(10.0, 6.0, 3.0, 1.0), popularity_boost=1.0, popularity_half=1000,
+                 candidate_limit=200, max_terms=8, max_expansions=32, typo_min_length=4, max_corrections=3,
+                 vocabulary_ttl=600):
+        self.weights = weights
+        self.popularity_boost = popularity_boost
+        self.popularity_half = popularity_half
+        self.candidate_limit = candidate_limit
+        self.max_terms = max_terms
+        self.max_expansions = max_expansions
+        self.typo_min_length = typo_min_length
+        self.max_corrections = max_corrections
+        self.vocabulary_ttl = vocabulary_ttl
+        self._lock = threading.Lock()
+        self._vocabulary = None
+        self._reloading = False
+        self._counters = {'queries': 0, 'truncated_queries': 0, 'corrected_queries': 0, 'index_writes': 0,
+                          'popularity_moves': 0}
+
+    def init_app(self, app):
+        self.weights = tuple(app.config.get('MUSIC_SEARCH_WEIGHTS', self.weights))
+        if len(self.weights) != len(FIELDS):
+            raise ValueError(f'MUSIC_SEARCH_WEIGHTS 需要 {len(FIELDS)} 个权重: {FIELDS}')
+        self.popularity_boost = app.config.get('MUSIC_SEARCH_POPULARITY_BOOST', self.popularity_boost)
+        self.popularity_half = app.config.get('MUSIC_SEARCH_POPULARITY_HALF', self.popularity_half)
+        self.candidate_limit = app.config.get('MUSIC_SEARCH_CANDIDATE_LIMIT', self.candidate_limit)
+        self.typo_min_length = app.config.get('MUSIC_SEARCH_TYPO_MIN_LENGTH', self.typo_min_length)
+        self.vocabulary_ttl = app.config.get('MUSIC_SEARCH_VOCABULARY_TTL', self.vocabulary_ttl)
+        app.extensions['music_search'] = self
+
+        listen_once(Music, (('after_insert', self._after_insert), ('after_update', self._after_update),
+                            ('after_delete', self._after_delete)))
+
+    # ---------- 写路径 ----------
+
+    def _write(self, connection, target):
+        for rowid in _current_rowids(connection, target.id):
+            connection.execute(text('DELETE FROM music_fts WHERE rowid = :rowid'), {'rowid': rowid})
+        values = _index_values(target.id, target.play_count, [getattr(target, field) for field in FIELDS])
+        connection.execute(_INSERT, values)
+        with self._lock:
+            self._counters['index_writes'] += 1
+            if self._vocabulary is not None:
+                for field in FIELDS:
+                    for token in values[field].split():
+                        self._vocabulary.add(token)
+
+    def _after_insert(self, mapper, connection, target):
+        if connection.dialect.name == 'sqlite':
+            self._write(connection, target)
+
+    def _after_update(self, mapper, connection, target):
+        if connection.dialect.name != 'sqlite':
+            return
+        state = inspect(target)
+        if any(state.attrs[field].history.has_changes() for field in FIELDS):
+            self._write(connection, target)
+        elif state.attrs.play_count.history.has_changes():
+            self.refresh_popularity(connection, [target.id])
+
+    def _after_delete(self, mapper, connection, target):
+        if connection.dialect.name == 'sqlite':
+            for rowid in _current_rowids(connection, target.id):
+                connection.execute(text('DELETE FROM music_fts WHERE rowid = :rowid'), {'rowid': rowid})
+
+    def refresh_popularity(self, connection, music_ids):
+        """play_count 变化后把跨档的索引行移到新行号；只有跨档的歌曲需要逐个查找，返回移动的行数"""
+        if connection.dialect.name != 'sqlite' or not music_ids:
+            return 0
+        music = Music.__table__
+        rows = connection.execute(
+            db.select(music.c.id, music.c.play_count).where(music.c.id.in_(list(music_ids)))
+        ).all()
+        expected = {search_rowid(music_id, play_count): music_id for music_id, play_count in rows}
+        if not expected:
+            return 0
+        present = set(connection.execute(_FIND_ROWIDS, {'rowids': list(expected)}).scalars())
+        moved = 0
+        for rowid, music_id in expected.items():
+            if rowid in present:
+                continue
+            for old in _current_rowids(connection, music_id):
+                connection.execute(text('UPDATE music_fts SET rowid = :new WHERE rowid = :old'),
+                                   {'new': rowid, 'old': old})
+                moved += 1
+        if moved:
+            with self._lock:
+                self._counters['popularity_moves'] += moved
+        return moved
+
+    def rebuild(self):
+        """按 music 表全量重建索引"""
+        started = time.perf_counter()
+        with db.engine.begin() as conn:
+            count = create_index(conn)
+        with self._lock:
+            self._vocabulary = None
+        return {'indexed': count, 'duration_ms': round((time.perf_counter() - started) * 1000, 2)}
+
+    # ---------- 查询 ----------
+
+    def parse(self, query):
+        """搜索词 -> 词列表（每个词是一个分词序列，缅文词为音节序列）"""
+        words = tokenize(query)
+        if not words:
+            raise SearchError('搜索词不能为空')
+        return words[:self.max_terms]
+
+    def _vocabulary_snapshot(self):
+        """当前词表；过期后由第一个发现的请求重新加载，其他请求继续使用旧词表"""
+        with self._lock:
+            vocabulary = self._vocabulary
+            if vocabulary is not None and (
+                    self._reloading or time.monotonic() - vocabulary.loaded_at < self.vocabulary_ttl):
+                return vocabulary
+            self._reloading = True
+        try:
+            vocabulary = _Vocabulary.load(db.session)
+        finally:
+            with self._lock:
+                self._reloading = False
+        with self._lock:
+            self._vocabulary = vocabulary
+        return vocabulary
+
+    def _plan(self, words, vocabulary, corrections=None):
+        """词列表 -> [_Clause]；最后一个词按前缀匹配，corrections 为 _corrections() 的结果"""
+        clauses = []
+        for position, tokens in enumerate(words):
+            last = position == len(words) - 1
+            syllable = None
+            if last and len(tokens) > 1 and len(tokens[-1]) == 1 and _IS_MYANMAR.match(tokens[-1]):
+                # 输入中的缅文词末尾单独的辅音多半是还没打完的韵尾（如 ကျက → ကျက်），并入前一个音节按前缀匹配；
+                # 它也可能本身就是一个音节（如 ဂီတ），原样整词匹配作为补充
+                syllable = tuple(tokens)
+                tokens = tokens[:-2] + [tokens[-2] + tokens[-1]]
+            alternatives = [tuple(tokens)] + [(candidate,) for candidate, _ in (corrections or {}).get(position, ())]
+            prefix = post_filter = False
+            if last and len(words) > 1 and tokens == [tokens[0][:1]]:
+                # 末尾单个字符的前缀会匹配大半个曲库，不交给 FTS，只在其他词的匹配结果中过滤
+                prefix = post_filter = True
+            elif last and len(''.join(tokens)) > 1:
+                # 只有一个字符的搜索词按整词匹配
+                if len(tokens[-1]) <= PREFIX_INDEX_MAX and syllable is None:
+                    prefix = True
+                else:
+                    # 超出前缀索引长度的前缀由 FTS5 合并所有匹配词的文档列表后才能返回第一条，
+                    # 改为按词表展开成若干整词的 OR，按行号流式合并；展开后都是整词，可以和原样的音节并列
+                    expanded = []
+                    for alternative in alternatives:
+                        expanded.append(alternative)
+                        expanded.extend(alternative[:-1] + (term,)
+                                        for term in vocabulary.expand(alternative[-1], self.max_expansions))
+                    alternatives = expanded + ([syllable] if syllable else [])
+            clauses.append(_Clause(list(dict.fromkeys(alternatives)), prefix, post_filter))
+        return clauses
+
+    @staticmethod
+    def _match_expression(clauses):
+        parts = []
+        for clause in clauses:
+            if clause.post_filter:
+                continue
+            star = '*' if clause.prefix else ''
+            phrases = ['"' + ' '.join(alternative).replace('"', '""') + '"' + star
+                       for alternative in clause.alternatives]
+            parts.append(phrases[0] if len(phrases) == 1 else '(' + ' OR '.join(phrases) + ')')
+        # 隐式 AND 只能连接短语，带括号的 OR 组需要显式 AND
+        return ' AND '.join(parts)
+
+    def search(self, query, genre=None, page=1, per_page=20):
+        """返回 SearchResult；items 为 Music 对象列表"""
+        words = self.parse(query)
+        page = max(page, 1)
+        vocabulary = self._vocabulary_snapshot()
+        clauses = self._plan(words, vocabulary)
+        candidates, truncated = self._candidates(clauses, genre)
+        corrected_query = None
+
+        if not candidates:
+            corrections = self._corrections(words, vocabulary)
+            if corrections:
+                clauses = self._plan(words, vocabulary, corrections)
+                candidates, truncated = self._candidates(clauses, genre)
+                if candidates:
+                    # 前缀纠错显示为词表中的完整词
+                    corrected_query = ' '.join(
+                        corrections[position][0][1] if position in corrections else ''.join(tokens)
+                        for position, tokens in enumerate(words)
+                    )
+
+        ranked = self._rank(clauses, candidates, vocabulary)
+        offset = (page - 1) * per_page
+        ids = [rowid & ID_MASK for rowid in ranked[offset:offset + per_page]]
+
+        with self._lock:
+            self._counters['queries'] += 1
+            self._counters['truncated_queries'] += truncated
+            self._counters['corrected_queries'] += corrected_query is not None
+        music = {m.id: m for m in Music.query.filter(Music.id.in_(ids)).all()} if ids else {}
+        return SearchResult(
+            [music[i] for i in ids if i in music],
+            None if truncated else len(candidates),
+            offset + per_page < len(candidates),
+            page, per_page, corrected_query
+        )
+
+    def _candidates(self, clauses, genre):
+        """按热度从高到低取至多 candidate_limit 条匹配，返回 ([(rowid, title, artist, album, genre)], 是否截断)
+
+        不使用 FTS5 自带的 bm25()：它为计算 IDF 会遍历每个短语的完整文档列表，
+        常用词的查询耗时随匹配数线性增长。
+        """
+        params = {'query': self._match_expression(clauses), 'limit': self.candidate_limit + 1}
+        columns = ', '.join(f'music_fts.{field}' for field in FIELDS)
+        if genre:
+            sql = f'''
+                SELECT music_fts.rowid, {columns} FROM music_fts
+                JOIN music m ON m.id = (music_fts.rowid & {ID_MASK})
+                WHERE music_fts MATCH :query AND m.genre = :genre
+                ORDER BY music_fts.rowid DESC LIMIT :limit
+            '''
+            params['genre'] = genre
+        else:
+            sql = f'''
+                SELECT rowid, {columns} FROM music_fts
+                WHERE music_fts MATCH :query ORDER BY rowid DESC LIMIT :limit
+            '''
+        rows = [tuple(row) for row in db.session.execute(text(sql), params)]
+        truncated = len(rows) > self.candidate_limit
+        rows = rows[:self.candidate_limit]
+        for clause in clauses:
+            if clause.post_filter:
+                count = self._counter(clause)
+                rows = [row for row in rows if any(count(value.split()) for value in row[1:] if value)]
+        return rows, truncated
+
+    @staticmethod
+    def _counter(clause):
+        """返回统计一列分词中匹配次数的函数；只有单个分词的可选项时走集合查找的快速路径"""
+        singles = tuple(alternative[0] for alternative in clause.alternatives if len(alternative) == 1)
+        phrases = [alternative for alternative in clause.alternatives if len(alternative) > 1]
+        if not phrases:
+            if clause.prefix:
+                return lambda tokens: sum(token.startswith(singles) for token in tokens)
+            lookup = frozenset(singles).__contains__
+            return lambda tokens: sum(map(lookup, tokens))
+
+        def count(tokens):
+            total = sum(token.startswith(singles) if clause.prefix else token in singles for token in tokens)
+            for phrase in phrases:
+                head, last, size = list(phrase[:-1]), phrase[-1], len(phrase)
+                for i in range(len(tokens) - size + 1):
+                    if tokens[i:i + size - 1] == head and (
+                            tokens[i + size - 1].startswith(last) if clause.prefix else tokens[i + size - 1] == last):
+                        total += 1
+            return total
+        return count
+
+    def _rank(self, clauses, candidates, vocabulary):
+        """BM25（IDF 取自词表，各列词频按权重累加）× 播放次数加成，返回排好序的行号"""
+        k1, b = 1.2, 0.75
+        rows = max(vocabulary.rows, 1)
+        matchers = []
+        for clause in clauses:
+            documents = sum(vocabulary.phrase_docs(alternative, clause.prefix) for alternative in clause.alternatives)
+            documents = min(max(documents, 1), rows)
+            idf = math.log(1 + (rows - documents + 0.5) / (documents + 0.5))
+            matchers.append((idf * (k1 + 1), self._counter(clause)))
+
+        weights = self.weights
+        length_factor = k1 * b / vocabulary.average_length
+        boost, half = self.popularity_boost, self.popularity_half
+        scored = []
+        for rowid, *values in candidates:
+            fields = [(weight, value.split()) for weight, value in zip(weights, values) if value]
+            norm = k1 * (1 - b) + length_factor * sum(len(tokens) for _, tokens in fields)
+            score = 0.0
+            for idf, count in matchers:
+                frequency = 0.0
+                for weight, tokens in fields:
+                    hits = count(tokens)
+                    if hits:
+                        frequency += weight * hits
+                score += idf * frequency / (frequency + norm)
+            play_count = bucket_play_count(rowid)
+            scored.append((score * (1.0 + boost * play_count / (play_count + half)), rowid))
+        scored.sort(reverse=True)
+        return [rowid for _, rowid in scored]
+
+    # ---------- 纠错 ----------
+
+    @staticmethod
+    def _edits(word):
+        """编辑距离为 1 的候选（删除、相邻交换、替换、插入）"""
+        splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+        candidates = set()
+        for left, right in splits:
+            if right:
+                candidates.add(left + right[1:])
+                for ch in _LATIN_ALPHABET:
+                    candidates.add(left + ch + right[1:])
+            if len(right) > 1:
+                candidates.add(left + right[1] + right[0] + right[2:])
+            for ch in _LATIN_ALPHABET:
+                candidates.add(left + ch + right)
+        candidates.discard(word)
+        return candidates
+
+    def _corrections(self, words, vocabulary):
+        """{词序号: [(候选词, 词表中对应的完整词)]}，只纠正单个拉丁字母分词且长度足够的词，
+        候选按文档数从多到少排列"""
+        corrections = {}
+        for position, tokens in enumerate(words):
+            if len(tokens) != 1 or not tokens[0].isascii() or len(tokens[0]) < self.typo_min_length:
+                continue
+            word = tokens[0]
+            prefix = position == len(words) - 1
+            if vocabulary.lookup(word, prefix)[0]:
+                continue
+            scored = [vocabulary.lookup(candidate, prefix) + (candidate,) for candidate in self._edits(word)]
+            found = sorted((item for item in scored if item[0]), key=lambda item: (-item[0], item[2]))
+            if found:
+                corrections[position] = [(candidate, term) for _, term, candidate in found[:self.max_corrections]]
+        return corrections
+
+    def get_stats(self):
+        with self._lock:
+            return dict(
+                self._counters,
+                vocabulary_terms=len(self._vocabulary.terms) if self._vocabulary is not None else None,
+                indexed_rows=self._vocabulary.rows if self._vocabulary is not None else None,
+                candidate_limit=self.candidate_limit
+            )
+
+
+# 全局音乐搜索实例
+music_search = MusicSearch()
@@ -0,0 +1,44 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+
+def listen_once(target, listeners):
+    """注册 [(事件名, 监听函数)]，重复调用 init_app 时不会重复注册"""
+    for name, listener in listeners:
+        if not event.contains(target, name, listener):
+            event.listen(target, name, listener)
+
+
+class TransactionChanges:
+    """收集一个会话事务内的变更，提交后统一处理，回滚时丢弃
+
+    mapper 事件（flush 时触发）通过 pending(target) 取得对象所在会话的变更容器并写入；
+    会话提交后以容器调用 apply(changes)，回滚时清空。容器由 factory 创建并保存在
+    session.info[key] 中，每个使用方需要各自的 key。
+    """
+
+    def __init__(self, key, factory, apply):
+        self.key = key
+        self.factory = factory
+        self.apply = apply
+
+    def register(self):
+        listen_once(Session, (('after_commit', self._after_commit), ('after_rollback', self._after_rollback)))
+
+    def pending(self, target):
+        """target 所在会话的变更容器，对象不属于任何会话时返回 None"""
+        session = object_session(target)
+        if session is None:
+            return None
+        changes = session.info.get(self.key)
+        if changes is None:
+            changes = session.info[self.key] = self.factory()
+        return changes
+
+    def _after_commit(self, session):
+        changes = session.info.pop(self.key, None)
+        if changes:
+            self.apply(changes)
+
+    def _after_rollback(self, session):
+        session.info.pop(self.key, None)
@@ -0,0 +1,131 @@
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from src.models.user import db
+
+
+MAX_CURSOR_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    """分页游标无法解析"""
+
+
+def encode_cursor(values):
+    """把排序键值编码为不透明游标"""
+    payload = []
+    for value in values:
+        if isinstance(value, datetime):
+            payload.append({'dt': value.isoformat()})
+        else:
+            payload.append(value)
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """解码游标，返回排序键值列表"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+
+    if not isinstance(payload, list) or len(payload) != size:
+        raise InvalidCursor(cursor)
+
+    values = []
+    for value in payload:
+        if isinstance(value, dict):
+            try:
+                value = datetime.fromisoformat(value['dt'])
+            except (KeyError, TypeError, ValueError):
+                raise InvalidCursor(cursor)
+        elif value is not None and (isinstance(value, bool) or not isinstance(value, (int, float, str))):
+            # 只允许 encode_cursor 能产生的标量值
+            raise InvalidCursor(cursor)
+        values.append(value)
+    return values
+
+
+def _matches_column(column, value):
+    """游标中的值与排序列的类型一致（数值列不接受字符串等）；键集条件无法与 NULL 比较"""
+    if value is None:
+        return False
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return True
+    if python_type in (int, float, Decimal):
+        return isinstance(value, (int, float))
+    if python_type in (str, datetime):
+        return isinstance(value, python_type)
+    return True
+
+
+def wants_total(args):
+    """请求参数 with_total=1/true 时返回精确总数"""
+    return args.get('with_total', '').lower() in ('1', 'true')
+
+
+class CursorPage:
+    """游标分页结果"""
+
+    def __init__(self, items, per_page, next_cursor, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.has_next = next_cursor is not None
+        self.total = total
+
+    def to_dict(self):
+        data = {
+            'per_page': self.per_page,
+            'next_cursor': self.next_cursor,
+            'has_next': self.has_next
+        }
+        if self.total is not None:
+            data['total'] = self.total
+        return data
+
+
+def _keyset_condition(order_by, values):
+    """(k1, k2, ...) 严格排在游标之后的条件，支持混合升降序"""
+    clauses = []
+    for i, (column, descending) in enumerate(order_by):
+        equal_prefix = [order_by[j][0] == values[j] for j in range(i)]
+        beyond = column < values[i] if descending else column > values[i]
+        clauses.append(db.and_(*equal_prefix, beyond))
+    return db.or_(*clauses)
+
+
+def cursor_paginate(query, order_by, key, cursor=None, per_page=20, with_total=False):
+    """基于 (排序键, id) 的键集分页，不使用 OFFSET，也不默认执行 COUNT(*)
+
+    order_by: [(列, 是否降序), ...]，最后一列必须唯一（通常是主键）
+    key: 从结果行取出对应排序键值的函数
+    cursor: 上一页返回的 next_cursor，空值表示第一页
+    with_total: 需要精确总数时才额外执行 COUNT
+    """
+    per_page = max(1, min(per_page, MAX_CURSOR_PAGE_SIZE))
+
+    total = query.order_by(None).count() if with_total else None
+
+    if cursor:
+        values = decode_cursor(cursor, len(order_by))
+        if not all(_matches_column(column, value) for (column, _), value in zip(order_by, values)):
+            raise InvalidCursor(cursor)
+        query = query.filter(_keyset_condition(order_by, values))
+
+    query = query.order_by(None).order_by(
+        *[column.desc() if descending else column.asc() for column, descending in order_by]
+    )
+
+    rows = query.limit(per_page + 1).all()
+    has_next = len(rows) > per_page
+    items = rows[:per_page]
+    next_cursor = encode_cursor(key(items[-1])) if has_next else None
+
+    return CursorPage(items, per_page, next_cursor, total)
@@ -0,0 +1,291 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import bindparam
+from sqlalchemy.exc import OperationalError
+
+from src.models.user import db, Music, PlayHistory
+from src.services.daily_metrics import record_plays
+from src.services.music_search import music_search
+from src.services.typeahead import typeahead
+from src.services.catalog_cache import catalog_cache
+from src.services.trending import trending
+from src.services.statistics import statistics
+
+
+# 单次播放时长上限（秒）
+MAX_PLAY_DURATION = 86400
+
+
+def _valid_event(record):
+    """字段类型正确的事件才放回缓冲"""
+    duration = record.get('play_duration')
+    return (record.get('user_id') is not None and type(record.get('music_id')) is int
+            and type(duration) is int and 0 <= duration <= MAX_PLAY_DURATION)
+
+
+class PlayIngestBuffer:
+    """播放事件写缓冲 - 请求线程只入队，后台线程批量落库
+
+    每次播放不再单独提交事务：play_count 增量按 music_id 合并，
+    PlayHistory 行按批次一次性多行插入（审计日志由 audit 写入器负责）。
+    达到批次大小或刷新间隔时触发刷新；数据库不可用时事件追加写入本地
+    spool 文件，下次启动或下次成功刷新时重放，保证不丢失。
+    整批因个别事件的数据错误而失败时逐条重试，写不进去的事件转存到
+    .rejected 文件，不会回到缓冲里拖累其他播放。
+    """
+
+    def __init__(self, max_batch_size=500, flush_interval=1.0, spool_path=None):
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.spool_path = spool_path
+        self.app = None
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        self._events = []
+        self._deltas = defaultdict(int)
+        self._inflight = {}
+
+        self.stats = {
+            'accepted': 0,
+            'flushed': 0,
+            'flush_count': 0,
+            'spooled': 0,
+            'replayed': 0,
+            'rejected': 0,
+            'last_flush_ms': None
+        }
+
+    def init_app(self, app):
+        """绑定应用并启动后台刷新线程"""
+        self.app = app
+        self.max_batch_size = app.config.get('PLAY_INGEST_BATCH_SIZE', self.max_batch_size)
+        self.flush_interval = app.config.get('PLAY_INGEST_FLUSH_INTERVAL', self.flush_interval)
+        self.spool_path = app.config.get('PLAY_INGEST_SPOOL_PATH', self.spool_path)
+        app.extensions['play_ingest'] = self
+
+        self._replay_spool()
+
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='play-ingest-flusher', daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def record(self, user_id, music_id, play_duration=0):
+        """接收一次播放事件，立即返回"""
+        event = {
+            'user_id': user_id,
+            'music_id': music_id,
+            'play_duration': play_duration,
+            'played_at': datetime.utcnow()
+        }
+        with self._lock:
+            self._events.append(event)
+            self._deltas[music_id] += 1
+            self.stats['accepted'] += 1
+            batch_full = len(self._events) >= self.max_batch_size
+
+        if batch_full:
+            self._wakeup.set()
+
+    def pending_delta(self, music_id):
+        """尚未落库的播放次数增量"""
+        with self._lock:
+            return self._deltas.get(music_id, 0) + self._inflight.get(music_id, 0)
+
+    def flush(self):
+        """将缓冲中的事件批量写入数据库，返回写入的事件数"""
+        with self._flush_lock:
+            with self._lock:
+                events, self._events = self._events, []
+                deltas, self._deltas = self._deltas, defaultdict(int)
+                self._inflight = dict(deltas)
+
+            if not events:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                with self.app.app_context():
+                    with db.engine.begin() as conn:
+                        self._write_batch(conn, events, deltas)
+            except OperationalError:
+                self._spool(events)
+                with self._lock:
+                    self._inflight = {}
+                return 0
+            except Exception:
+                events, failed, rejected = self._write_rows(events)
+                self._spool(failed)
+                self._reject(rejected)
+                deltas = defaultdict(int)
+                for e in events:
+                    deltas[e['music_id']] += 1
+                if not events:
+                    with self._lock:
+                        self._inflight = {}
+                    return 0
+
+            # 输入建议的权重、缓存中的播放次数和热度分数随落库的播放累加
+            typeahead.add_plays(deltas)
+            catalog_cache.add_plays(deltas)
+            trending.add_plays(deltas)
+            today = datetime.utcnow().date()
+            statistics.adjust(
+                total_plays=len(events),
+                today_plays=sum(1 for e in events if e['played_at'].date() == today)
+            )
+
+            with self._lock:
+                self._inflight = {}
+                self.stats['flushed'] += len(events)
+                self.stats['flush_count'] += 1
+                self.stats['last_flush_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+        self._replay_spool()
+        return len(events)
+
+    def shutdown(self):
+        """停止后台线程并刷新剩余事件"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        if self.app is not None:
+            self.flush()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['buffered'] = len(self._events)
+        return stats
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # 刷新线程不能退出，失败事件已写入 spool
+                pass
+
+    def _write_batch(self, conn, events, deltas):
+        conn.execute(
+            PlayHistory.__table__.insert(),
+            [
+                {
+                    'user_id': e['user_id'],
+                    'music_id': e['music_id'],
+                    'played_at': e['played_at'],
+                    'play_duration': e['play_duration']
+                }
+                for e in events
+            ]
+        )
+
+        music_table = Music.__table__
+        conn.execute(
+            music_table.update()
+            .where(music_table.c.id == bindparam('b_music_id'))
+            .values(play_count=music_table.c.play_count + bindparam('b_delta')),
+            [{'b_music_id': music_id, 'b_delta': delta} for music_id, delta in deltas.items()]
+        )
+        # 播放次数跨过热度档位的歌曲在搜索索引中换到新位置
+        music_search.refresh_popularity(conn, deltas.keys())
+
+        record_plays(conn, [e['played_at'] for e in events])
+
+    def _write_rows(self, events):
+        """整批写入失败后逐条写入，返回 (已写入, 数据库不可用未写入, 数据错误) 三组事件"""
+        written, rejected = [], []
+        with self.app.app_context():
+            for index, e in enumerate(events):
+                try:
+                    with db.engine.begin() as conn:
+                        self._write_batch(conn, [e], {e['music_id']: 1})
+                except OperationalError:
+                    return written, events[index:], rejected
+                except Exception:
+                    rejected.append(e)
+                else:
+                    written.append(e)
+        return written, [], rejected
+
+    def _spool(self, events):
+        """落库失败时追加写入本地文件（fsync 保证持久）"""
+        if not self.spool_path or not events:
+            return
+        self._append(self.spool_path, events)
+        with self._lock:
+            self.stats['spooled'] += len(events)
+
+    def _reject(self, events):
+        """无法写入的事件转存到 .rejected 文件，不再重放"""
+        if not events:
+            return
+        if self.spool_path:
+            self._append(self.spool_path + '.rejected', events)
+        with self._lock:
+            self.stats['rejected'] += len(events)
+
+    def _append(self, path, events):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            for e in events:
+                record = dict(e, played_at=e['played_at'].isoformat())
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _replay_spool(self):
+        """把 spool 文件中的事件重新放回缓冲"""
+        if not self.spool_path or not os.path.exists(self.spool_path):
+            return
+
+        replay_path = self.spool_path + '.replay'
+        try:
+            os.replace(self.spool_path, replay_path)
+        except OSError:
+            return
+
+        events, rejected = [], []
+        with open(replay_path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    record['played_at'] = datetime.fromisoformat(record['played_at'])
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if _valid_event(record):
+                    events.append(record)
+                else:
+                    rejected.append(record)
+        self._reject(rejected)
+
+        with self._lock:
+            self._events.extend(events)
+            for e in events:
+                self._deltas[e['music_id']] += 1
+            self.stats['replayed'] += len(events)
+
+        os.remove(replay_path)
+        if events:
+            self._wakeup.set()
+
+
+# 全局播放写缓冲实例
+play_ingest = PlayIngestBuffer()
@@ -0,0 +1,147 @@
+import calendar
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import g
+from flask_jwt_extended import get_jwt, get_jwt_identity
+
+from src.models.user import db, User, UserRole
+
+
+class Principal:
+    """已认证用户的轻量身份信息（仅权限判断所需字段）"""
+
+    __slots__ = ('id', 'role', 'is_active')
+
+    def __init__(self, id, role, is_active=True):
+        self.id = id
+        self.role = role
+        self.is_active = is_active
+
+    def is_super_admin(self):
+        return self.role == UserRole.SUPER_ADMIN
+
+    def is_admin(self):
+        return self.role in [UserRole.ADMIN, UserRole.SUPER_ADMIN]
+
+
+def principal_claims(user):
+    """签发访问令牌时嵌入的角色声明"""
+    return {'role': user.role.value, 'active': bool(user.is_active)}
+
+
+class PrincipalCache:
+    """按用户ID缓存 Principal，带短 TTL 和显式失效
+
+    令牌中带有角色声明时直接信任声明，无需查库；但若该用户的角色或状态在令牌
+    签发之后被修改过（本进程显式失效，或其他进程修改了 users.principal_changed_at），
+    则回退到数据库。登录等其他修改只更新 updated_at，不影响令牌。
+    跨进程的修改通过每个 TTL 周期一次的增量查询同步。
+    """
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._changed_at = {}
+        self._synced_until = None
+        self._next_sync = 0.0
+
+    def init_app(self, app):
+        self.ttl = app.config.get('PRINCIPAL_CACHE_TTL', self.ttl)
+        app.extensions['principal_cache'] = self
+
+    def get(self, user_id):
+        """从缓存获取 Principal，未命中或过期时查询数据库"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[1] > now:
+                return entry[0]
+
+        row = db.session.query(User.id, User.role, User.is_active).filter(User.id == user_id).first()
+        if not row:
+            return None
+
+        principal = Principal(row.id, row.role, row.is_active)
+        with self._lock:
+            self._entries[user_id] = (principal, now + self.ttl)
+        return principal
+
+    def from_claims(self, user_id, claims):
+        """根据令牌声明构造 Principal，声明可能已过期时返回 None"""
+        role = claims.get('role')
+        if role is None:
+            return None
+
+        self._sync_changes()
+        issued_at = claims.get('iat', 0)
+        with self._lock:
+            changed_at = self._changed_at.get(user_id)
+        if changed_at is not None and issued_at <= changed_at:
+            return None
+
+        try:
+            return Principal(user_id, UserRole(role), claims.get('active', True))
+        except ValueError:
+            return None
+
+    def invalidate(self, user_id):
+        """用户角色或状态变更后调用"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._changed_at[user_id] = int(time.time())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._changed_at.clear()
+
+    def _sync_changes(self):
+        """每个 TTL 周期同步一次其他进程对用户的修改"""
+        now = time.monotonic()
+        if now < self._next_sync:
+            return
+        self._next_sync = now + self.ttl
+
+        query = db.session.query(User.id, User.principal_changed_at)
+        if self._synced_until is not None:
+            query = query.filter(User.principal_changed_at >= self._synced_until)
+        else:
+            # 首次同步只需覆盖仍可能有效的令牌（访问令牌有效期24小时）
+            query = query.filter(User.principal_changed_at >= datetime.utcnow() - timedelta(hours=24))
+
+        latest = self._synced_until
+        changes = {}
+        for user_id, changed in query:
+            if changed is None:
+                continue
+            changes[user_id] = calendar.timegm(changed.utctimetuple())
+            if latest is None or changed > latest:
+                latest = changed
+
+        with self._lock:
+            for user_id, changed_at in changes.items():
+                if changed_at > self._changed_at.get(user_id, 0):
+                    self._changed_at[user_id] = changed_at
+                    self._entries.pop(user_id, None)
+            self._synced_until = latest
+
+
+# 全局身份缓存实例
+principal_cache = PrincipalCache()
+
+
+def load_current_principal():
+    """解析当前请求的 Principal 并保存在 flask.g 中供处理函数复用"""
+    if 'current_principal' in g:
+        return g.current_principal
+
+    user_id = get_jwt_identity()
+    principal = principal_cache.from_claims(user_id, get_jwt())
+    if principal is None:
+        principal = principal_cache.get(user_id)
+
+    g.current_principal = principal
+    return principal
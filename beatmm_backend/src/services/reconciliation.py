@@ -0,0 +1,263 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from src.models.user import db, User, WalletTransaction, TransactionStatus, BotTask, BotExecutionLog
+from src.services.money import sql_cents, from_cents
+
+
+RECONCILE_TASK_NAME = 'auto_reconcile_accounts'
+
+
+class ReconciliationInProgress(RuntimeError):
+    """同一对账任务已有正在执行的对账"""
+
+
+class ReconciliationEngine:
+    """钱包对账引擎 - 按用户ID分区，每个分区一条 SQL 聚合，线程池并行执行
+
+    金额全部以整数分计算并转换为 Decimal，不存在浮点误差。
+    进度写入 BotExecutionLog.result_summary，进程中断后可从已完成的分区继续；
+    增量模式只检查上次成功对账之后有交易或新注册的用户。
+    每完成一个分区更新一次进度时间，超过 stale_after 秒未更新的 running 记录视为已中断，
+    否则认为对账仍在执行，拒绝同时开始另一次对账。
+    """
+
+    def __init__(self, partition_size=5000, workers=4, initial_balance='1000.00', max_reported=1000,
+                 stale_after=600):
+        self.partition_size = partition_size
+        self.workers = workers
+        self.initial_balance = Decimal(initial_balance)
+        self.max_reported = max_reported
+        self.stale_after = stale_after
+        self.app = None
+
+    def init_app(self, app):
+        self.app = app
+        self.partition_size = app.config.get('RECONCILE_PARTITION_SIZE', self.partition_size)
+        self.workers = app.config.get('RECONCILE_WORKERS', self.workers)
+        self.initial_balance = Decimal(str(app.config.get('RECONCILE_INITIAL_BALANCE', self.initial_balance)))
+        self.max_reported = app.config.get('RECONCILE_MAX_REPORTED', self.max_reported)
+        self.stale_after = app.config.get('RECONCILE_STALE_AFTER', self.stale_after)
+        app.extensions['reconciliation'] = self
+
+    def run(self, created_by, incremental=False, resume=True, task=None, execution_log=None,
+            progress_callback=None, owner=None):
+        """执行对账，返回对账结果
+
+        由调度器执行时传入 task 和已创建的 execution_log，否则使用系统对账任务并新建执行记录。
+        owner 标识发起方（如异步任务ID），同一发起方中断后重新执行时可以直接接管自己的执行记录。
+        """
+        started = time.monotonic()
+        task = task or self._get_task(created_by)
+        mode = 'incremental' if incremental else 'full'
+
+        running = self._live_log(task, execution_log, owner)
+        if running is not None:
+            raise ReconciliationInProgress(f'对账正在执行（执行记录 {running.id}）')
+
+        previous = self._resumable_log(task, mode, execution_log) if resume else None
+        if previous is not None:
+            state = json.loads(previous.result_summary)
+            state['resumed'] = True
+            state['owner'] = owner
+            if execution_log is None:
+                execution_log = previous
+            else:
+                # 进度已转移到本次执行记录
+                previous.status = 'partial'
+        else:
+            since = self._last_success_time(task) if incremental else None
+            state = {
+                'mode': mode,
+                'since': since.isoformat() if since else None,
+                'started_at': datetime.utcnow().isoformat(),
+                'partitions': self._plan_partitions(since),
+                'completed': [],
+                'users_checked': 0,
+                'inconsistencies_found': 0,
+                'inconsistencies': [],
+                'resumed': False,
+                'owner': owner
+            }
+        if execution_log is None:
+            execution_log = BotExecutionLog(task_id=task.id, status='running')
+            db.session.add(execution_log)
+        execution_log.status = 'running'
+        execution_log.error_message = None
+        self._save(execution_log, state)
+
+        completed = set(state['completed'])
+        pending = [(index, partition) for index, partition in enumerate(state['partitions']) if index not in completed]
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='reconcile') as pool:
+                futures = {pool.submit(self._check_partition, partition): index for index, partition in pending}
+                for future in as_completed(futures):
+                    checked, inconsistencies = future.result()
+                    state['completed'].append(futures[future])
+                    state['users_checked'] += checked
+                    state['inconsistencies_found'] += len(inconsistencies)
+                    room = self.max_reported - len(state['inconsistencies'])
+                    if room > 0:
+                        state['inconsistencies'].extend(inconsistencies[:room])
+                    self._save(execution_log, state)
+                    if progress_callback:
+                        progress_callback(len(state['completed']), len(state['partitions']))
+        except Exception as e:
+            execution_log.status = 'failed'
+            execution_log.error_message = str(e)
+            execution_log.execution_duration = int(time.monotonic() - started)
+            self._save(execution_log, state)
+            raise
+
+        execution_log.status = 'success'
+        execution_log.execution_duration = int(time.monotonic() - started)
+        self._save(execution_log, state)
+
+        task.last_run = datetime.utcnow()
+        db.session.commit()
+
+        return {
+            'reconciliation_date': datetime.utcnow().isoformat(),
+            'mode': state['mode'],
+            'since': state['since'],
+            'resumed': state['resumed'],
+            'execution_log_id': execution_log.id,
+            'partitions': len(state['partitions']),
+            'total_users_checked': state['users_checked'],
+            'inconsistencies_found': state['inconsistencies_found'],
+            'inconsistencies': state['inconsistencies'],
+            'duration_ms': round((time.monotonic() - started) * 1000, 2)
+        }
+
+    def _get_task(self, created_by):
+        task = BotTask.query.filter_by(task_type='accounting', task_name=RECONCILE_TASK_NAME).first()
+        if task is None:
+            task = BotTask(
+                task_type='accounting',
+                task_name=RECONCILE_TASK_NAME,
+                description='钱包余额与交易记录对账',
+                schedule_type='once',
+                created_by=created_by
+            )
+            db.session.add(task)
+            db.session.commit()
+        return task
+
+    def _live_log(self, task, current=None, owner=None):
+        """进度在 stale_after 秒内更新过的 running 执行记录（不含本次执行记录和同一发起方的记录）"""
+        query = BotExecutionLog.query.filter_by(task_id=task.id, status='running')
+        if current is not None:
+            query = query.filter(BotExecutionLog.id != current.id)
+        deadline = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        for execution_log in query.order_by(BotExecutionLog.id.desc()):
+            try:
+                state = json.loads(execution_log.result_summary or '')
+            except ValueError:
+                state = {}
+            if owner is not None and state.get('owner') == owner:
+                continue
+            # 尚未写入进度（调度器刚创建的执行记录）时按开始时间计算
+            progress_at = state.get('progress_at')
+            progress_at = datetime.fromisoformat(progress_at) if progress_at else execution_log.execution_time
+            if progress_at is None or progress_at >= deadline:
+                return execution_log
+        return None
+
+    def _resumable_log(self, task, mode, current=None):
+        """最近一次未完成且模式相同的执行记录（不含本次执行记录）
+
+        调用前已确认没有仍在执行的对账，running 状态的记录都已中断。
+        """
+        query = BotExecutionLog.query.filter_by(task_id=task.id)
+        if current is not None:
+            query = query.filter(BotExecutionLog.id != current.id)
+        execution_log = query.order_by(BotExecutionLog.id.desc()).first()
+        if execution_log is None or execution_log.status not in ('running', 'failed'):
+            return None
+        try:
+            state = json.loads(execution_log.result_summary or '')
+        except ValueError:
+            return None
+        if state.get('mode') != mode or 'partitions' not in state:
+            return None
+        return execution_log
+
+    def _last_success_time(self, task):
+        execution_log = BotExecutionLog.query.filter_by(task_id=task.id, status='success').order_by(
+            BotExecutionLog.id.desc()
+        ).first()
+        return execution_log.execution_time if execution_log else None
+
+    def _plan_partitions(self, since):
+        """全量模式按ID区间分区，增量模式按变更用户ID列表分区"""
+        if since is None:
+            low, high = db.session.query(db.func.min(User.id), db.func.max(User.id)).one()
+            if low is None:
+                return []
+            return [
+                {'low': start, 'high': min(start + self.partition_size, high + 1)}
+                for start in range(low, high + 1, self.partition_size)
+            ]
+
+        changed = db.session.query(WalletTransaction.user_id).filter(
+            db.or_(WalletTransaction.created_at >= since, WalletTransaction.processed_at >= since)
+        ).union(
+            db.session.query(User.id).filter(User.created_at >= since)
+        )
+        user_ids = sorted(user_id for (user_id,) in changed)
+        return [
+            {'ids': user_ids[i:i + self.partition_size]}
+            for i in range(0, len(user_ids), self.partition_size)
+        ]
+
+    def _check_partition(self, partition):
+        """在工作线程中用一条聚合查询检查一个分区，返回 (检查用户数, 不一致列表)"""
+        transactions = WalletTransaction.__table__
+        users = User.__table__
+        stmt = db.select(
+            users.c.id,
+            users.c.phone,
+            sql_cents(db.func.coalesce(users.c.wallet_balance, 0)),
+            db.func.coalesce(db.func.sum(sql_cents(transactions.c.amount)), 0)
+        ).select_from(
+            users.outerjoin(transactions, db.and_(
+                transactions.c.user_id == users.c.id,
+                transactions.c.status == TransactionStatus.COMPLETED.name
+            ))
+        ).group_by(users.c.id, users.c.phone, users.c.wallet_balance)
+
+        if 'ids' in partition:
+            stmt = stmt.where(users.c.id.in_(partition['ids']))
+        else:
+            stmt = stmt.where(users.c.id >= partition['low'], users.c.id < partition['high'])
+
+        with self.app.app_context():
+            with db.engine.connect() as conn:
+                rows = conn.execute(stmt).all()
+
+        inconsistencies = []
+        for user_id, phone, balance_cents, transaction_cents in rows:
+            current_balance = from_cents(balance_cents)
+            calculated_balance = self.initial_balance + from_cents(transaction_cents)
+            if current_balance != calculated_balance:
+                inconsistencies.append({
+                    'user_id': user_id,
+                    'phone': phone,
+                    'current_balance': str(current_balance),
+                    'calculated_balance': str(calculated_balance),
+                    'difference': str(calculated_balance - current_balance)
+                })
+        return len(rows), inconsistencies
+
+    def _save(self, execution_log, state):
+        state['progress_at'] = datetime.utcnow().isoformat()
+        execution_log.result_summary = json.dumps(state, ensure_ascii=False)
+        db.session.commit()
+
+
+# 全局对账引擎实例
+reconciliation_engine = ReconciliationEngine()
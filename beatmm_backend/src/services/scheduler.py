@@ -0,0 +1,321 @@
+import atexit
+import calendar
+import json
+import os
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from src.models.user import db, BotTask, BotExecutionLog
+
+
+SCHEDULE_TYPES = ('once', 'daily', 'weekly', 'monthly')
+
+
+def _add_months(value, months=1):
+    month = value.month - 1 + months
+    year = value.year + month // 12
+    month = month % 12 + 1
+    day = min(value.day, calendar.monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
+
+
+def first_run(schedule_type, schedule_time=None, now=None):
+    """新任务的首次执行时间: 一次性任务立即执行，周期任务为下一个 schedule_time"""
+    now = now or datetime.utcnow()
+    if schedule_type == 'once' or schedule_time is None:
+        return now
+    candidate = datetime.combine(now.date(), schedule_time)
+    return candidate if candidate > now else candidate + timedelta(days=1)
+
+
+def compute_next_run(schedule_type, previous_run, schedule_time=None, now=None):
+    """周期任务的下一次执行时间，错过的周期直接跳过而不补跑；一次性任务返回 None"""
+    if schedule_type not in SCHEDULE_TYPES or schedule_type == 'once':
+        return None
+    now = now or datetime.utcnow()
+    next_run = previous_run or now
+    if schedule_time is not None:
+        next_run = datetime.combine(next_run.date(), schedule_time)
+
+    while next_run <= now:
+        if schedule_type == 'daily':
+            next_run += timedelta(days=1)
+        elif schedule_type == 'weekly':
+            next_run += timedelta(days=7)
+        else:
+            next_run = _add_months(next_run)
+    return next_run
+
+
+class BotScheduler:
+    """机器人任务调度器 - 轮询到期的 BotTask 并交给有界线程池执行
+
+    到期任务通过 (status, next_run) 索引查询；执行前用条件 UPDATE
+    把状态从 active 改为 running 来认领任务，多个进程同时轮询时只有一个能认领成功。
+    执行中的任务定期刷新 updated_at 作为心跳，心跳超过 lease_seconds 未更新
+    （进程崩溃）的任务会被其他进程放回 active。
+    """
+
+    def __init__(self, poll_interval=5.0, max_workers=4, type_limits=None, default_type_limit=1,
+                 lease_seconds=300):
+        self.poll_interval = poll_interval
+        self.max_workers = max_workers
+        self.type_limits = dict(type_limits or {})
+        self.default_type_limit = default_type_limit
+        self.lease_seconds = lease_seconds
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.app = None
+
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._running = {}
+        self._running_by_type = {}
+        self._stopped = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._executor = None
+        self._counters = {'claimed': 0, 'succeeded': 0, 'failed': 0, 'claim_conflicts': 0, 'recovered': 0}
+
+    def task(self, task_name, task_type):
+        """注册任务处理函数: handler(task, execution_log) -> 可序列化的结果"""
+        def decorator(handler):
+            self._handlers[task_name] = (task_type, handler)
+            return handler
+        return decorator
+
+    def task_type_of(self, task_name):
+        registered = self._handlers.get(task_name)
+        return registered[0] if registered else None
+
+    def registered_tasks(self):
+        return {name: task_type for name, (task_type, _) in self._handlers.items()}
+
+    def init_app(self, app):
+        """读取配置并启动轮询线程"""
+        self.app = app
+        self.poll_interval = app.config.get('BOT_SCHEDULER_POLL_INTERVAL', self.poll_interval)
+        self.max_workers = app.config.get('BOT_SCHEDULER_MAX_WORKERS', self.max_workers)
+        self.type_limits = dict(app.config.get('BOT_SCHEDULER_TYPE_LIMITS', self.type_limits))
+        self.lease_seconds = app.config.get('BOT_SCHEDULER_LEASE_SECONDS', self.lease_seconds)
+        app.extensions['bot_scheduler'] = self
+
+        if not app.config.get('BOT_SCHEDULER_ENABLED', True):
+            return
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='bot-task')
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='bot-scheduler', daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def wakeup(self):
+        """立即触发一次轮询（例如新建了需要马上执行的任务）"""
+        self._wakeup.set()
+
+    def shutdown(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(
+                self._counters,
+                worker_id=self.worker_id,
+                running=sorted(self._running),
+                running_by_type=dict(self._running_by_type),
+                max_workers=self.max_workers,
+                type_limits=dict(self.type_limits),
+                enabled=self._thread is not None and self._thread.is_alive()
+            )
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                with self.app.app_context():
+                    self._heartbeat()
+                    self._recover_stale()
+                    self.poll()
+            except Exception:
+                # 数据库暂时不可用等情况，下一轮重试
+                pass
+            # 加入随机抖动，避免多个进程同时轮询
+            self._wakeup.wait(self.poll_interval * random.uniform(0.8, 1.2))
+            self._wakeup.clear()
+
+    def _capacity(self, task_type):
+        limit = self.type_limits.get(task_type, self.default_type_limit)
+        return limit - self._running_by_type.get(task_type, 0)
+
+    def poll(self, now=None):
+        """认领并派发到期任务，返回本轮派发的任务ID"""
+        now = now or datetime.utcnow()
+        with self._lock:
+            free_slots = self.max_workers - len(self._running)
+        if free_slots <= 0:
+            return []
+
+        due = db.session.query(BotTask.id, BotTask.task_name, BotTask.next_run).filter(
+            BotTask.status == 'active',
+            BotTask.next_run <= now
+        ).order_by(BotTask.next_run).limit(free_slots * 4).all()
+
+        dispatched = []
+        for task_id, task_name, next_run in due:
+            if len(dispatched) >= free_slots:
+                break
+            task_type = self.task_type_of(task_name)
+            if task_type is None:
+                continue
+            with self._lock:
+                if self._capacity(task_type) <= 0:
+                    continue
+                # 先占用本进程的名额，认领失败再释放
+                self._running[task_id] = task_type
+                self._running_by_type[task_type] = self._running_by_type.get(task_type, 0) + 1
+
+            if self._claim(task_id, next_run):
+                dispatched.append(task_id)
+                self._executor.submit(self._execute, task_id)
+            else:
+                self._release(task_id)
+
+        return dispatched
+
+    def _claim(self, task_id, next_run):
+        """条件更新认领任务，只有一个进程能把 active 改为 running"""
+        result = db.session.execute(
+            db.update(BotTask).where(
+                BotTask.id == task_id,
+                BotTask.status == 'active',
+                BotTask.next_run == next_run
+            ).values(status='running', updated_at=datetime.utcnow()).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        with self._lock:
+            if result.rowcount == 1:
+                self._counters['claimed'] += 1
+                return True
+            self._counters['claim_conflicts'] += 1
+            return False
+
+    def _release(self, task_id):
+        with self._lock:
+            task_type = self._running.pop(task_id, None)
+            if task_type is not None:
+                self._running_by_type[task_type] -= 1
+
+    def _execute(self, task_id):
+        """在工作线程中执行一个已认领的任务"""
+        try:
+            with self.app.app_context():
+                task = db.session.get(BotTask, task_id)
+                execution_log = BotExecutionLog(task_id=task_id, status='running', execution_time=datetime.utcnow())
+                db.session.add(execution_log)
+                db.session.commit()
+
+                started = time.monotonic()
+                error = None
+                result = None
+                try:
+                    _, handler = self._handlers[task.task_name]
+                    result = handler(task, execution_log)
+                except Exception as e:
+                    db.session.rollback()
+                    error = e
+                duration = time.monotonic() - started
+
+                self._finish(task, execution_log, result, error, duration)
+        finally:
+            self._release(task_id)
+
+    def _finish(self, task, execution_log, result, error, duration):
+        """写入执行记录并计算下一次执行时间"""
+        execution_log = db.session.get(BotExecutionLog, execution_log.id)
+        execution_log.execution_duration = int(round(duration))
+        if error is not None:
+            execution_log.status = 'failed'
+            execution_log.error_message = str(error)
+        elif execution_log.status == 'running':
+            execution_log.status = 'success'
+        if execution_log.result_summary is None and result is not None:
+            execution_log.result_summary = json.dumps(
+                dict(result, duration_ms=round(duration * 1000, 2)) if isinstance(result, dict) else result,
+                ensure_ascii=False,
+                default=str
+            )
+
+        now = datetime.utcnow()
+        next_run = compute_next_run(task.schedule_type, task.next_run, task.schedule_time, now)
+        if next_run is not None:
+            status = 'active'
+        else:
+            status = 'failed' if error is not None else 'completed'
+
+        # 只更新仍由本进程持有的任务（暂停等操作会先改掉 running 状态）
+        db.session.execute(
+            db.update(BotTask).where(
+                BotTask.id == task.id,
+                BotTask.status == 'running'
+            ).values(
+                status=status,
+                last_run=now,
+                next_run=next_run,
+                updated_at=now
+            ).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+        with self._lock:
+            self._counters['failed' if error is not None else 'succeeded'] += 1
+
+    def _heartbeat(self):
+        """刷新本进程正在执行的任务的心跳"""
+        with self._lock:
+            running = list(self._running)
+        if not running:
+            return
+        db.session.execute(
+            db.update(BotTask).where(
+                BotTask.id.in_(running),
+                BotTask.status == 'running'
+            ).values(updated_at=datetime.utcnow()).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    def _recover_stale(self):
+        """把心跳超时的任务放回 active，并把其未完成的执行记录标记为失败"""
+        deadline = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+        with self._lock:
+            own = list(self._running)
+        stale = BotTask.query.filter(
+            BotTask.status == 'running',
+            BotTask.updated_at < deadline,
+            ~BotTask.id.in_(own)
+        ).all()
+        for task in stale:
+            recovered = db.session.execute(
+                db.update(BotTask).where(
+                    BotTask.id == task.id,
+                    BotTask.status == 'running',
+                    BotTask.updated_at == task.updated_at
+                ).values(status='active', updated_at=datetime.utcnow()).execution_options(synchronize_session=False)
+            ).rowcount
+            if recovered:
+                BotExecutionLog.query.filter_by(task_id=task.id, status='running').update(
+                    {'status': 'failed', 'error_message': '执行进程中断'}, synchronize_session=False
+                )
+                with self._lock:
+                    self._counters['recovered'] += 1
+        db.session.commit()
+
+
+# 全局任务调度器实例
+scheduler = BotScheduler()
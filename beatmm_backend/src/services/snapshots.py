@@ -0,0 +1,316 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing
+from datetime import datetime
+
+from src.models.user import db
+
+
+COPY_CHUNK = 1024 * 1024
+
+
+def _checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _table_counts(conn):
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+    )]
+    return {table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in tables}
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+class SnapshotManager:
+    """数据库在线快照 - 使用 sqlite3 备份 API 分步复制，压缩后轮转保存
+
+    每步复制 pages_per_step 页，步骤之间暂停 step_pause 秒。WAL 模式下源连接在整个复制期间
+    保持一个读事务，所有步骤读取同一时间点的数据，其他连接的写入既不被阻塞也不会让备份重来
+    （代价是复制期间检查点无法越过该时间点，WAL 文件会暂时增长）。
+    回滚日志模式下读锁只在单步内持有，源库被修改时备份会从头开始，
+    重启超过 max_restarts 次后改为一步复制完（一个读事务）。
+    快照文件为 gzip 压缩的数据库文件，旁边的 .json 清单记录校验和、页数和各表行数，
+    只保留最近 keep 份。
+    """
+
+    def __init__(self, snapshot_dir=None, keep=7, pages_per_step=1024, step_pause=0.01, max_restarts=3,
+                 compresslevel=6):
+        self.snapshot_dir = snapshot_dir
+        self.keep = keep
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+        self.max_restarts = max_restarts
+        self.compresslevel = compresslevel
+        self._running = threading.Lock()
+
+    def init_app(self, app):
+        self.snapshot_dir = app.config.get('SNAPSHOT_DIR', self.snapshot_dir)
+        self.keep = app.config.get('SNAPSHOT_KEEP', self.keep)
+        self.pages_per_step = app.config.get('SNAPSHOT_PAGES_PER_STEP', self.pages_per_step)
+        self.step_pause = app.config.get('SNAPSHOT_STEP_PAUSE', self.step_pause)
+        app.extensions['snapshots'] = self
+
+    @property
+    def enabled(self):
+        return bool(self.snapshot_dir)
+
+    def _source_path(self):
+        if db.engine.dialect.name != 'sqlite':
+            raise ValueError('仅支持 SQLite 数据库快照')
+        path = db.engine.url.database
+        if not path or path == ':memory:':
+            raise ValueError('内存数据库无法快照')
+        return path
+
+    @staticmethod
+    def _fsync_replace(tmp_path, path):
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    # ---------- 创建 ----------
+
+    def create(self, progress_callback=None):
+        """创建一份快照并返回清单；progress_callback(phase, done, total)"""
+        if not self.enabled:
+            raise ValueError('未配置快照目录')
+        if not self._running.acquire(blocking=False):
+            raise RuntimeError('已有快照正在进行')
+        try:
+            return self._create(progress_callback)
+        finally:
+            self._running.release()
+
+    def _create(self, progress_callback):
+        source_path = self._source_path()
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        created_at = datetime.utcnow()
+        name = f'snapshot-{created_at:%Y%m%dT%H%M%S}Z'
+        data_path = os.path.join(self.snapshot_dir, name + '.db.gz')
+        manifest_path = os.path.join(self.snapshot_dir, name + '.json')
+        copy_path = os.path.join(self.snapshot_dir, name + '.db.tmp')
+
+        try:
+            copy_stats = self._backup(source_path, copy_path, progress_callback)
+
+            with closing(sqlite3.connect(copy_path)) as conn:
+                # 快照文件不依赖 -wal 文件，恢复后可以直接打开
+                conn.execute('PRAGMA journal_mode=DELETE')
+                counts = _table_counts(conn)
+            raw_bytes = os.path.getsize(copy_path)
+
+            started = time.perf_counter()
+            with open(copy_path, 'rb') as src, gzip.open(data_path + '.tmp', 'wb', compresslevel=self.compresslevel) as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK)
+            self._fsync_replace(data_path + '.tmp', data_path)
+            compress_seconds = time.perf_counter() - started
+        finally:
+            for path in (copy_path, data_path + '.tmp'):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        compressed_bytes = os.path.getsize(data_path)
+        manifest = dict(
+            copy_stats,
+            name=name,
+            file=os.path.basename(data_path),
+            created_at=created_at.isoformat(),
+            raw_bytes=raw_bytes,
+            compressed_bytes=compressed_bytes,
+            compression_ratio=round(compressed_bytes / raw_bytes, 4) if raw_bytes else None,
+            compress_ms=round(compress_seconds * 1000, 2),
+            sha256=_checksum(data_path),
+            table_counts=counts,
+            verification=None
+        )
+        self._write_manifest(manifest_path, manifest)
+        manifest['rotated'] = self._rotate()
+        return manifest
+
+    def _backup(self, source_path, copy_path, progress_callback):
+        """分步在线备份，返回复制统计"""
+        steps = []
+        state = {'remaining': None, 'restarts': 0, 'last': time.perf_counter()}
+
+        def progress(status, remaining, total):
+            now = time.perf_counter()
+            steps.append((now - state['last']) * 1000)
+            # 剩余页数没有减少说明源库被修改，备份重新开始
+            if state['remaining'] is not None and remaining >= state['remaining']:
+                state['restarts'] += 1
+                if state['restarts'] > self.max_restarts:
+                    raise _TooManyRestarts()
+            state['remaining'] = remaining
+            if progress_callback:
+                progress_callback('copy', total - remaining, total)
+            if remaining:
+                time.sleep(self.step_pause)
+            state['last'] = time.perf_counter()
+
+        started = time.perf_counter()
+        try:
+            pinned = self._copy(source_path, copy_path, self.pages_per_step, progress)
+        except _TooManyRestarts:
+            # 写入频繁时分步复制无法完成，改为在一个读事务中一次复制完
+            fallback_started = time.perf_counter()
+            pinned = self._copy(source_path, copy_path, -1, None)
+            steps.append((time.perf_counter() - fallback_started) * 1000)
+
+        with closing(sqlite3.connect(copy_path)) as target:
+            page_size = target.execute('PRAGMA page_size').fetchone()[0]
+            page_count = target.execute('PRAGMA page_count').fetchone()[0]
+
+        duration = time.perf_counter() - started
+        copied_bytes = page_count * page_size
+        return {
+            'page_size': page_size,
+            'pages': page_count,
+            'copy_ms': round(duration * 1000, 2),
+            'copy_mb_per_second': round(copied_bytes / 1024 / 1024 / duration, 1) if duration > 0 else None,
+            'steps': len(steps),
+            'pages_per_step': self.pages_per_step,
+            'restarts': state['restarts'],
+            'pinned_read': pinned,
+            # 每步在源库上持有读锁的时间；回滚日志模式下即为写入被阻塞的最长时间，WAL 模式下写入不受影响
+            'writer_block_ms': 0 if pinned else (round(max(steps), 2) if steps else None),
+            'max_step_ms': round(max(steps), 2) if steps else None,
+            'avg_step_ms': round(sum(steps) / len(steps), 2) if steps else None
+        }
+
+    @staticmethod
+    def _copy(source_path, copy_path, pages, progress):
+        """执行一次备份，返回是否在 WAL 读事务中复制"""
+        source = sqlite3.connect(source_path, timeout=30, isolation_level=None)
+        target = sqlite3.connect(copy_path)
+        try:
+            pinned = source.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+            if pinned:
+                source.execute('BEGIN')
+                source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            source.backup(target, pages=pages, progress=progress)
+            if pinned:
+                source.execute('COMMIT')
+            return pinned
+        finally:
+            target.close()
+            source.close()
+
+    def _write_manifest(self, manifest_path, manifest):
+        with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        self._fsync_replace(manifest_path + '.tmp', manifest_path)
+
+    def _rotate(self):
+        """只保留最近 keep 份快照，返回删除的快照名"""
+        removed = []
+        for manifest in self.list()[self.keep:]:
+            for suffix in ('.db.gz', '.json'):
+                path = os.path.join(self.snapshot_dir, manifest['name'] + suffix)
+                if os.path.exists(path):
+                    os.remove(path)
+            removed.append(manifest['name'])
+        return removed
+
+    # ---------- 查询 ----------
+
+    def list(self):
+        """全部快照清单，最新的在前"""
+        if not self.enabled or not os.path.isdir(self.snapshot_dir):
+            return []
+        manifests = []
+        for name in os.listdir(self.snapshot_dir):
+            if not (name.startswith('snapshot-') and name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.snapshot_dir, name), encoding='utf-8') as f:
+                    manifests.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        manifests.sort(key=lambda manifest: manifest['created_at'], reverse=True)
+        return manifests
+
+    def get(self, name):
+        for manifest in self.list():
+            if manifest['name'] == name:
+                return manifest
+        return None
+
+    # ---------- 恢复校验 ----------
+
+    def verify(self, name=None, progress_callback=None):
+        """把快照恢复到临时文件并校验：压缩文件校验和、完整性检查、各表行数，返回各阶段耗时"""
+        manifest = self.get(name) if name else next(iter(self.list()), None)
+        if manifest is None:
+            raise ValueError('快照不存在')
+        data_path = os.path.join(self.snapshot_dir, manifest['file'])
+        result = {'name': manifest['name'], 'verified_at': datetime.utcnow().isoformat(), 'checks': {}}
+        started = time.perf_counter()
+
+        def phase(label, index, fn):
+            if progress_callback:
+                progress_callback(label, index, 3)
+            phase_started = time.perf_counter()
+            value = fn()
+            result[f'{label}_ms'] = round((time.perf_counter() - phase_started) * 1000, 2)
+            return value
+
+        checksum = phase('checksum', 0, lambda: _checksum(data_path))
+        result['checks']['sha256'] = checksum == manifest['sha256']
+
+        with tempfile.TemporaryDirectory(dir=self.snapshot_dir) as tmp:
+            restored_path = os.path.join(tmp, 'restore.db')
+
+            def restore():
+                with gzip.open(data_path, 'rb') as src, open(restored_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, COPY_CHUNK)
+            if result['checks']['sha256']:
+                phase('restore', 1, restore)
+
+                def check():
+                    with closing(sqlite3.connect(restored_path)) as conn:
+                        integrity = conn.execute('PRAGMA quick_check').fetchone()[0]
+                        return integrity, _table_counts(conn)
+                integrity, counts = phase('integrity', 2, check)
+                result['checks']['integrity'] = integrity == 'ok'
+                result['checks']['table_counts'] = counts == manifest['table_counts']
+                result['restored_bytes'] = os.path.getsize(restored_path)
+
+        result['ok'] = len(result['checks']) == 3 and all(result['checks'].values())
+        result['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+        manifest['verification'] = result
+        self._write_manifest(os.path.join(self.snapshot_dir, manifest['name'] + '.json'), manifest)
+        return result
+
+    def get_stats(self):
+        manifests = self.list()
+        latest = manifests[0] if manifests else None
+        return {
+            'enabled': self.enabled,
+            'snapshots': len(manifests),
+            'keep': self.keep,
+            'total_bytes': sum(manifest['compressed_bytes'] for manifest in manifests),
+            'latest': latest and {
+                'name': latest['name'],
+                'created_at': latest['created_at'],
+                'verified': (latest.get('verification') or {}).get('ok')
+            }
+        }
+
+
+# 全局快照实例
+snapshots = SnapshotManager()
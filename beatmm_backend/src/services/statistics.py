@@ -0,0 +1,102 @@
+import threading
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+from src.models.user import db, User, UserRole, Music, PlayHistory, Notification
+from src.services.daily_metrics import get_day_metric
+
+
+COUNTERS = (
+    'total_users', 'active_users', 'admin_users', 'today_new_users',
+    'total_balance', 'total_music', 'total_plays', 'today_plays', 'active_notifications'
+)
+
+
+class StatisticsService:
+    """管理后台统计计数器 - 启动后从数据库播种一次，之后由写路径增量更新
+
+    读取时不再查询数据库；每隔 reconcile_interval 秒与数据库重新对账一次，
+    以纠正其他进程的写入或遗漏的增量。
+    """
+
+    def __init__(self, reconcile_interval=300):
+        self.reconcile_interval = reconcile_interval
+        self._lock = threading.Lock()
+        self._counters = None
+        self._day = None
+        self._version = 0
+        self._generation = uuid.uuid4().hex[:8]
+        self._next_reconcile = 0.0
+
+    def init_app(self, app):
+        self.reconcile_interval = app.config.get('STATISTICS_RECONCILE_INTERVAL', self.reconcile_interval)
+        app.extensions['statistics'] = self
+
+    def snapshot(self):
+        """返回 (计数器字典, 版本标识)，必要时先与数据库对账"""
+        if self._counters is None or time.monotonic() >= self._next_reconcile:
+            self.reconcile()
+
+        with self._lock:
+            self._roll_day()
+            return dict(self._counters), f'{self._generation}-{self._version}'
+
+    def reconcile(self):
+        """从数据库重新计算全部计数器"""
+        today = datetime.utcnow().date()
+        counters = {
+            'total_users': User.query.count(),
+            'active_users': User.query.filter_by(is_active=True).count(),
+            'admin_users': User.query.filter(User.role.in_([UserRole.ADMIN, UserRole.SUPER_ADMIN])).count(),
+            'today_new_users': get_day_metric(today, 'new_users'),
+            'total_balance': Decimal(str(db.session.query(db.func.sum(User.wallet_balance)).scalar() or 0)),
+            'total_music': Music.query.count(),
+            'total_plays': PlayHistory.query.count(),
+            'today_plays': get_day_metric(today, 'plays'),
+            'active_notifications': Notification.query.filter_by(is_active=True).count()
+        }
+
+        with self._lock:
+            if counters != self._counters:
+                self._counters = counters
+                self._version += 1
+            self._day = today
+            self._next_reconcile = time.monotonic() + self.reconcile_interval
+
+    def adjust(self, **deltas):
+        """写路径提交成功后调用，累加对应计数器"""
+        with self._lock:
+            if self._counters is None:
+                # 尚未播种，首次读取时会从数据库获取
+                return
+            self._roll_day()
+            changed = False
+            for name, delta in deltas.items():
+                if name not in COUNTERS:
+                    raise KeyError(name)
+                if not delta:
+                    continue
+                if name == 'total_balance':
+                    delta = Decimal(str(delta))
+                self._counters[name] += delta
+                changed = True
+            if changed:
+                self._version += 1
+
+    def invalidate(self):
+        """强制下次读取时与数据库对账"""
+        self._next_reconcile = 0.0
+
+    def _roll_day(self):
+        today = datetime.utcnow().date()
+        if self._day != today:
+            self._day = today
+            self._counters['today_new_users'] = 0
+            self._counters['today_plays'] = 0
+            self._version += 1
+
+
+# 全局统计服务实例
+statistics = StatisticsService()
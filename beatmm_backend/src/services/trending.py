@@ -0,0 +1,469 @@
+import calendar
+import math
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+
+from sqlalchemy import inspect
+
+from src.models.user import db, Music, UserFavorite
+from src.services.orm_events import TransactionChanges, listen_once
+from src.services.pagination import MAX_CURSOR_PAGE_SIZE, InvalidCursor, decode_cursor, encode_cursor
+
+
+# 列表排序方式：trending / hot 按衰减热度排序，all_time 按累计播放次数排序（查询数据库）
+SORTS = ('trending', 'hot', 'all_time')
+KINDS = ('trending', 'hot')
+
+# 重建时读取的历史长度（半衰期的倍数），更早事件的权重不到 1/1000
+_WINDOW_HALF_LIVES = 10
+_CHUNK = 500
+
+
+def _timestamp(value):
+    return calendar.timegm(value.utctimetuple()) if value is not None else time.time()
+
+
+class _Track:
+    """一首歌曲的筛选字段和各排序方式的分数"""
+
+    __slots__ = ('genre', 'featured', 'base', 'scores')
+
+    def __init__(self, genre, featured, base):
+        self.genre = genre or None
+        self.featured = bool(featured)
+        # 分数相同（通常都为 0）时按建立索引时的累计播放次数排序
+        self.base = base or 0
+        self.scores = [0.0] * len(KINDS)
+
+    def scopes(self):
+        """所属的 (流派, 推荐) 筛选组合，None 表示不筛选"""
+        genres = (None, self.genre) if self.genre else (None,)
+        return [(genre, featured) for genre in genres for featured in (None, self.featured)]
+
+
+class _Ranking:
+    """一个筛选组合的前 N 名，按排序键升序保存（分数取负，最热的在最前）"""
+
+    __slots__ = ('limit', 'order', 'keys')
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.order = []
+        self.keys = {}
+
+    def update(self, music_id, key):
+        old = self.keys.get(music_id)
+        if old is not None:
+            if old == key:
+                return
+            del self.order[bisect_left(self.order, old)]
+        elif len(self.order) >= self.limit and key >= self.order[-1]:
+            return
+        insort(self.order, key)
+        self.keys[music_id] = key
+        if len(self.order) > self.limit:
+            del self.keys[-self.order.pop()[2]]
+
+    def remove(self, music_id):
+        key = self.keys.pop(music_id, None)
+        if key is not None:
+            del self.order[bisect_left(self.order, key)]
+
+
+class _State:
+    """某一时刻建立的全部分数和榜单
+
+    分数按 epoch 时刻的尺度保存：t 时刻权重为 w 的事件累加 w * e^(λ(t - epoch))。所有歌曲随时间按
+    同一比例衰减，相对顺序只在发生新事件时改变，因此榜单只需在事件到达时调整，不必定期重排。
+    """
+
+    def __init__(self, epoch, rates, limit):
+        self.epoch = epoch
+        self.rates = rates
+        self.limit = limit
+        self.tracks = {}
+        self.rankings = {}
+
+    def ranking(self, kind, genre, featured):
+        key = (kind, genre, featured)
+        ranking = self.rankings.get(key)
+        if ranking is None:
+            ranking = self.rankings[key] = _Ranking(self.limit)
+        return ranking
+
+    def key(self, kind, music_id, track):
+        return (-track.scores[kind], -track.base, -music_id)
+
+    def place(self, music_id, track):
+        for kind in range(len(KINDS)):
+            key = self.key(kind, music_id, track)
+            for genre, featured in track.scopes():
+                self.ranking(kind, genre, featured).update(music_id, key)
+
+    def unplace(self, music_id, track):
+        for kind in range(len(KINDS)):
+            for genre, featured in track.scopes():
+                ranking = self.rankings.get((kind, genre, featured))
+                if ranking is not None:
+                    ranking.remove(music_id)
+
+    def add(self, music_id, meta, weight, at):
+        track = self.tracks.get(music_id)
+        if track is None:
+            if meta is None:
+                return
+            track = self.tracks[music_id] = _Track(*meta)
+        for kind, rate in enumerate(self.rates):
+            # 取消收藏减去对应收藏的贡献，浮点误差不会让分数变成负数
+            track.scores[kind] = max(0.0, track.scores[kind] + weight * math.exp(rate * (at - self.epoch)))
+        self.place(music_id, track)
+
+    def set_meta(self, music_id, genre, featured):
+        track = self.tracks.get(music_id)
+        if track is None:
+            track = self.tracks[music_id] = _Track(genre, featured, 0)
+        else:
+            self.unplace(music_id, track)
+            track.genre, track.featured = genre or None, bool(featured)
+        self.place(music_id, track)
+
+    def remove(self, music_id):
+        track = self.tracks.pop(music_id, None)
+        if track is not None:
+            self.unplace(music_id, track)
+
+
+class TrendingEngine:
+    """按时间衰减的热度榜单
+
+    每首歌的分数是播放和收藏事件按指数衰减后的加权和，trending 和 hot 使用不同的半衰期。
+    每个流派（以及不筛选、推荐/非推荐）的前 N 名常驻内存，播放落库和收藏提交时增量调整，
+    读取一页只切片榜单，与曲库大小无关。有事件的歌曲不足 N 首时用累计播放次数最高的歌曲补足。
+
+    后台线程按 play_history 和 user_favorites 定期重建，同时校正其他进程产生的事件。
+    """
+
+    def __init__(self, half_lives=None, top_n=1000, play_weight=1.0, like_weight=3.0, rebuild_interval=3600,
+                 stream_batch_size=10000):
+        self.half_lives = half_lives or {'trending': 3 * 86400, 'hot': 6 * 3600}
+        self.top_n = top_n
+        self.play_weight = play_weight
+        self.like_weight = like_weight
+        self.rebuild_interval = rebuild_interval
+        self.stream_batch_size = stream_batch_size
+        self.app = None
+
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._state = None
+        # 重建期间发生的事件，新榜单替换前按顺序重放
+        self._replay = None
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._last_build = None
+        self._counters = {'builds': 0, 'play_events': 0, 'like_events': 0, 'reads': 0}
+        self._changes = TransactionChanges('trending_changes', list, self._apply_changes)
+
+    def init_app(self, app):
+        """绑定应用并启动后台构建线程（需在数据库初始化之后调用）"""
+        self.app = app
+        self.half_lives = app.config.get('TRENDING_HALF_LIVES', self.half_lives)
+        self.top_n = app.config.get('TRENDING_TOP_N', self.top_n)
+        self.play_weight = app.config.get('TRENDING_PLAY_WEIGHT', self.play_weight)
+        self.like_weight = app.config.get('TRENDING_LIKE_WEIGHT', self.like_weight)
+        self.rebuild_interval = app.config.get('TRENDING_REBUILD_INTERVAL', self.rebuild_interval)
+        app.extensions['trending'] = self
+
+        listen_once(Music, (('after_insert', self._after_music_insert),
+                            ('after_update', self._after_music_change),
+                            ('after_delete', self._after_music_delete)))
+        listen_once(UserFavorite, (('after_insert', self._after_favorite_insert),
+                                   ('after_delete', self._after_favorite_delete)))
+        self._changes.register()
+
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='trending-builder', daemon=True)
+            self._thread.start()
+
+    @property
+    def rates(self):
+        return tuple(math.log(2) / self.half_lives[kind] for kind in KINDS)
+
+    # ---------- 构建 ----------
+
+    def build(self):
+        """按历史事件重建分数和榜单并替换当前状态"""
+        with self._build_lock:
+            return self._build()
+
+    def _build(self):
+        started = time.perf_counter()
+        with self._lock:
+            self._replay = []
+        try:
+            with self.app.app_context():
+                state = self._build_state()
+                db.session.remove()
+            with self._lock:
+                for change in self._replay:
+                    self._apply(state, change)
+                self._state = state
+        finally:
+            with self._lock:
+                self._replay = None
+
+        with self._lock:
+            self._counters['builds'] += 1
+            self._last_build = {
+                'tracks': len(state.tracks),
+                'rankings': len(state.rankings),
+                'duration_ms': round((time.perf_counter() - started) * 1000, 2)
+            }
+            return dict(self._last_build)
+
+    def _build_state(self):
+        epoch = time.time()
+        rates = self.rates
+        state = _State(epoch, rates, self.top_n)
+        window_start = epoch - _WINDOW_HALF_LIVES * max(self.half_lives.values())
+        since = datetime.utcfromtimestamp(window_start)
+
+        scores = {}
+
+        def add(music_id, weight, factors):
+            values = scores.get(music_id)
+            if values is None:
+                values = scores[music_id] = [0.0] * len(KINDS)
+            for kind, factor in enumerate(factors):
+                values[kind] += weight * factor
+
+        def decay(at):
+            return [math.exp(rate * (at - epoch)) for rate in rates]
+
+        # 每次播放视为发生在所在小时的中间：各小时的衰减系数写入临时表，按播放时间的覆盖索引连接后
+        # 在 SQL 中按歌曲求和（GROUP BY +music_id 避免改用 music_id 索引逐行回表）
+        columns = [f'f{kind}' for kind in range(len(KINDS))]
+        factors = []
+        for hour in range(int(window_start // 3600), int(epoch // 3600) + 1):
+            bucket = datetime.utcfromtimestamp(hour * 3600).strftime('%Y-%m-%d %H')
+            factors.append(dict(zip(columns, decay(min(hour * 3600 + 1800, epoch))), hour=bucket))
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('DROP TABLE IF EXISTS temp.trending_factors')
+            conn.exec_driver_sql('CREATE TEMP TABLE trending_factors (hour TEXT PRIMARY KEY, '
+                                 + ', '.join(f'{column} REAL' for column in columns) + ')')
+            conn.execute(db.text('INSERT INTO trending_factors VALUES (:hour, '
+                                 + ', '.join(f':{column}' for column in columns) + ')'), factors)
+            rows = conn.execute(db.text(
+                'SELECT p.music_id, ' + ', '.join(f'SUM(f.{column})' for column in columns) +
+                ' FROM play_history p JOIN trending_factors f ON f.hour = substr(p.played_at, 1, 13)'
+                ' WHERE p.played_at >= :since GROUP BY +p.music_id'
+            ).bindparams(db.bindparam('since', type_=db.DateTime)), {'since': since})
+            for music_id, *sums in rows:
+                add(music_id, self.play_weight, sums)
+            conn.exec_driver_sql('DROP TABLE temp.trending_factors')
+
+        likes = db.session.query(UserFavorite.music_id, UserFavorite.created_at).filter(
+            UserFavorite.created_at >= since
+        )
+        for music_id, created_at in likes:
+            add(music_id, self.like_weight, decay(_timestamp(created_at)))
+
+        ids = sorted(scores)
+        for start in range(0, len(ids), _CHUNK):
+            for music_id, genre, featured, base in db.session.query(
+                    Music.id, Music.genre, Music.is_featured, Music.play_count
+            ).filter(Music.id.in_(ids[start:start + _CHUNK])):
+                track = state.tracks[music_id] = _Track(genre, featured, base)
+                track.scores = scores[music_id]
+        del scores
+
+        # 按分数从高到低依次放入所属的榜单，各榜单只需追加
+        for kind in range(len(KINDS)):
+            for key, music_id, track in sorted((state.key(kind, music_id, track), music_id, track)
+                                               for music_id, track in state.tracks.items()):
+                for genre, featured in track.scopes():
+                    ranking = state.ranking(kind, genre, featured)
+                    if len(ranking.order) < ranking.limit:
+                        ranking.order.append(key)
+                        ranking.keys[music_id] = key
+
+        # 不足 N 首的榜单用累计播放次数最高的歌曲补足（分数为 0，排在有事件的歌曲之后）
+        genres = [genre for genre, in db.session.query(Music.genre).distinct() if genre]
+        for genre in [None] + genres:
+            for featured in (None, True, False):
+                ranking = state.rankings.get((0, genre, featured))
+                if ranking is not None and len(ranking.order) >= self.top_n:
+                    continue
+                query = db.session.query(Music.id, Music.genre, Music.is_featured, Music.play_count)
+                if genre is not None:
+                    query = query.filter(Music.genre == genre)
+                if featured is not None:
+                    query = query.filter(Music.is_featured == featured)
+                for music_id, track_genre, track_featured, base in query.order_by(
+                        Music.play_count.desc(), Music.id.desc()).limit(self.top_n):
+                    if music_id not in state.tracks:
+                        state.tracks[music_id] = _Track(track_genre, track_featured, base)
+                        state.place(music_id, state.tracks[music_id])
+        return state
+
+    def _run(self):
+        while True:
+            try:
+                self.build()
+            except Exception:
+                # 构建失败时保留旧榜单，稍后重试
+                pass
+            self._wakeup.wait(self.rebuild_interval)
+            self._wakeup.clear()
+
+    # ---------- 增量更新 ----------
+
+    def _apply(self, state, change):
+        if change[0] == 'add':
+            state.add(*change[1:])
+        elif change[0] == 'meta':
+            state.set_meta(*change[1:])
+        else:
+            state.remove(change[1])
+
+    def _submit(self, changes):
+        """调用方持有锁"""
+        if self._replay is not None:
+            self._replay.extend(changes)
+        if self._state is not None:
+            for change in changes:
+                self._apply(self._state, change)
+
+    def _meta(self, connection, music_ids):
+        """事件涉及的歌曲的筛选字段，不在当前状态中的从数据库读取"""
+        with self._lock:
+            tracks = self._state.tracks if self._state is not None else {}
+            metas = {music_id: (tracks[music_id].genre, tracks[music_id].featured, tracks[music_id].base)
+                     for music_id in music_ids if music_id in tracks}
+        missing = [music_id for music_id in music_ids if music_id not in metas]
+        music = Music.__table__
+        for start in range(0, len(missing), _CHUNK):
+            statement = db.select(music.c.id, music.c.genre, music.c.is_featured, music.c.play_count).where(
+                music.c.id.in_(missing[start:start + _CHUNK])
+            )
+            for music_id, genre, featured, base in connection.execute(statement):
+                metas[music_id] = (genre, featured, base)
+        return metas
+
+    def add_plays(self, deltas):
+        """播放写缓冲落库后累加分数: {music_id: 增量}"""
+        if self.app is None or not deltas:
+            return
+        at = time.time()
+        with self.app.app_context():
+            with db.engine.connect() as conn:
+                metas = self._meta(conn, list(deltas))
+        with self._lock:
+            self._submit([('add', music_id, metas.get(music_id), delta * self.play_weight, at)
+                          for music_id, delta in deltas.items()])
+            self._counters['play_events'] += sum(deltas.values())
+
+    def _after_music_insert(self, mapper, connection, target):
+        pending = self._changes.pending(target)
+        if pending is not None:
+            pending.append(('meta', target.id, target.genre, target.is_featured))
+
+    def _after_music_change(self, mapper, connection, target):
+        state = inspect(target)
+        if state.attrs.genre.history.has_changes() or state.attrs.is_featured.history.has_changes():
+            pending = self._changes.pending(target)
+            if pending is not None:
+                pending.append(('meta', target.id, target.genre, target.is_featured))
+
+    def _after_music_delete(self, mapper, connection, target):
+        pending = self._changes.pending(target)
+        if pending is not None:
+            pending.append(('remove', target.id))
+
+    def _favorite(self, connection, target, weight):
+        pending = self._changes.pending(target)
+        if pending is not None:
+            meta = self._meta(connection, [target.music_id]).get(target.music_id)
+            pending.append(('add', target.music_id, meta, weight, _timestamp(target.created_at)))
+
+    def _after_favorite_insert(self, mapper, connection, target):
+        self._favorite(connection, target, self.like_weight)
+
+    def _after_favorite_delete(self, mapper, connection, target):
+        # 减去这次收藏按收藏时间计算的贡献
+        self._favorite(connection, target, -self.like_weight)
+
+    def _apply_changes(self, changes):
+        """事务提交后把本事务中的歌曲和收藏变更写入榜单"""
+        with self._lock:
+            self._submit(changes)
+            self._counters['like_events'] += sum(1 for change in changes if change[0] == 'add')
+
+    # ---------- 查询 ----------
+
+    def _ranking(self, sort, genre, featured):
+        """调用方持有锁；榜单尚未建立时返回 None"""
+        if self._state is None:
+            return None
+        self._counters['reads'] += 1
+        ranking = self._state.rankings.get((KINDS.index(sort), genre or None, featured))
+        return ranking if ranking is not None else _Ranking(0)
+
+    def page(self, sort, genre=None, featured=None, page=1, per_page=20):
+        """按页码读取榜单，返回 (歌曲ID列表, 榜单长度)；榜单尚未建立时返回 None"""
+        per_page = max(1, min(per_page, MAX_CURSOR_PAGE_SIZE))
+        offset = (max(page, 1) - 1) * per_page
+        with self._lock:
+            ranking = self._ranking(sort, genre, featured)
+            if ranking is None:
+                return None
+            return [-key[2] for key in ranking.order[offset:offset + per_page]], len(ranking.order)
+
+    def after(self, sort, genre=None, featured=None, cursor=None, per_page=20):
+        """按游标读取榜单，返回 (歌曲ID列表, 下一页游标, 榜单长度)；榜单尚未建立时返回 None
+
+        游标保存上一页最后一首的排序键和建立分数的 epoch，重建之后按新的 epoch 换算
+        """
+        per_page = max(1, min(per_page, MAX_CURSOR_PAGE_SIZE))
+        values = decode_cursor(cursor, 4) if cursor else None
+        if values is not None and not all(isinstance(value, (int, float)) and not isinstance(value, bool)
+                                          for value in values):
+            raise InvalidCursor(cursor)
+        with self._lock:
+            ranking = self._ranking(sort, genre, featured)
+            if ranking is None:
+                return None
+            state = self._state
+            start = 0
+            if values is not None:
+                epoch, score, base, music_id = values
+                try:
+                    score *= math.exp(state.rates[KINDS.index(sort)] * (epoch - state.epoch))
+                except OverflowError:
+                    raise InvalidCursor(cursor)
+                start = bisect_right(ranking.order, (-score, -base, -music_id))
+            keys = ranking.order[start:start + per_page + 1]
+            total = len(ranking.order)
+
+        next_cursor = None
+        if len(keys) > per_page:
+            keys = keys[:per_page]
+            score, base, music_id = keys[-1]
+            next_cursor = encode_cursor([state.epoch, -score, -base, -music_id])
+        return [-key[2] for key in keys], next_cursor, total
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['ready'] = self._state is not None
+            stats['tracks'] = len(self._state.tracks) if self._state is not None else 0
+            stats['last_build'] = dict(self._last_build) if self._last_build else None
+        stats['half_lives'] = dict(self.half_lives)
+        stats['top_n'] = self.top_n
+        return stats
+
+
+# 全局热度榜单实例
+trending = TrendingEngine()
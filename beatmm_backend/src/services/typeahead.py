@@ -0,0 +1,491 @@
+import heapq
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+
+from sqlalchemy import inspect
+
+from src.models.user import db, Music
+from src.services.music_search import tokenize
+from src.services.orm_events import TransactionChanges, listen_once
+
+
+# 建议来源，顺序即 kind 编号
+KINDS = ('title', 'artist', 'album')
+
+# 规范化文本之间的分隔符，比任何字符都小，"love" 排在 "love story" 之前
+_SEP = '\x00'
+
+# 参与排序和匹配的最长前缀（字符数），更长的输入截断到这个长度
+KEY_LENGTH = 48
+
+# 每条建议最多登记的词首数（长标题后面的词不再单独作为入口）
+MAX_STARTS = 8
+
+
+def normalize(value):
+    """文本 -> (规范化文本, 词首位置列表)
+
+    与全文搜索的分词一致：大小写和变音符号折叠，标点视为空格；缅文词的每个音节开头也算词首，
+    这样输入词中间的音节也能匹配
+    """
+    words = tokenize(value)
+    parts, starts = [], []
+    position = 0
+    for tokens in words:
+        for token in tokens:
+            starts.append(position)
+            position += len(token)
+        parts.append(''.join(tokens))
+        position += 1
+    return ' '.join(parts), starts
+
+
+class _Index:
+    """前缀索引
+
+    主体部分在构建后不再改变：所有建议的规范化文本依次拼成一个字符串 blob，每个词首是 blob 中的一个偏移量，
+    偏移量按其后的文本排序存放在 array 中，查询时用 bisect 找到以输入开头的区间。区间超过 scan_limit 的前缀
+    在构建时预先算好按权重排在前面的候选（pools），查询时只需要对这些候选按当前权重重新排序。
+    构建之后新增的建议放在小的有序列表 delta 中，查询时合并。
+
+    权重是建议对应的各首歌的 play_count 之和；歌曲的增删改和播放都直接更新 weights/counts，
+    counts 为 0 的建议（对应的歌曲都已删除或改名）不再返回。
+    """
+
+    def __init__(self, scan_limit, pool_size):
+        self.scan_limit = scan_limit
+        self.pool_size = pool_size
+        self.blob = _SEP
+        self.text_starts = array('I')       # 主体建议在 blob 中的起始位置
+        self.displays = ''                  # 主体建议的原始文本，按 display_starts 切分
+        self.display_starts = array('I', [0])
+        self.offsets = array('I')           # 排好序的词首偏移量
+        self.key_sids = array('I')          # 每个词首所属的建议
+        self.pools = {}                     # 前缀 -> 预先选出的候选建议
+        self.size = 0                       # 主体建议数，之后的编号属于 delta
+        self.kinds = array('B')
+        self.weights = array('q')
+        self.counts = array('I')
+        self.delta = []                     # [(规范化文本的词首后缀, 建议编号)]，有序
+        self.delta_texts = {}               # (kind, 规范化文本) -> 建议编号
+        self.delta_displays = []
+        self.track_sids = array('i')        # music_id * 3 + kind -> 建议编号，-1 表示没有
+        self.track_plays = array('q')       # music_id -> 计入权重的 play_count
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def build(cls, rows, scan_limit, pool_size):
+        """rows: 流式读取的 (id, title, artist, album, play_count)
+
+        构建过程中的临时对象同样按百万级曲库控制：词首在生成时就记为 blob 中的绝对偏移量，
+        排序时按首字符分桶，同一时刻只有一个桶的排序键在内存中
+        """
+        index = cls(scan_limit, pool_size)
+        sids = ({}, {}, {})                 # 每种来源: 规范化文本 -> 建议编号
+        artist_sids = {}                    # 艺术家名大量重复，先按原始文本查找，省去重复的规范化
+        norms, displays = [], []
+        keys = array('I')
+        position = 0
+        for music_id, *values, play_count in rows:
+            index._ensure_track(music_id)
+            play_count = play_count or 0
+            index.track_plays[music_id] = play_count
+            for kind, value in enumerate(values):
+                if not value:
+                    continue
+                sid = artist_sids.get(value) if kind == 1 else None
+                if sid is None:
+                    norm, word_starts = normalize(value)
+                    if not norm:
+                        continue
+                    sid = sids[kind].get(norm)
+                    if sid is None:
+                        sid = sids[kind][norm] = len(norms)
+                        norms.append(norm)
+                        displays.append(value.strip())
+                        index.text_starts.append(position)
+                        index.display_starts.append(index.display_starts[-1] + len(displays[-1]))
+                        keys.extend(position + start for start in word_starts[:MAX_STARTS])
+                        position += len(norm) + 1
+                        index.kinds.append(kind)
+                        index.weights.append(0)
+                        index.counts.append(0)
+                    if kind == 1:
+                        artist_sids[value] = sid
+                index.weights[sid] += play_count
+                index.counts[sid] += 1
+                index.track_sids[music_id * 3 + kind] = sid
+        del sids, artist_sids
+
+        index.size = len(norms)
+        index.blob = blob = _SEP.join(norms) + _SEP
+        del norms
+        index.displays = ''.join(displays)
+        del displays
+
+        buckets = {}
+        for offset in keys:
+            bucket = buckets.get(blob[offset])
+            if bucket is None:
+                bucket = buckets[blob[offset]] = array('I')
+            bucket.append(offset)
+        del keys
+        sort_key = lambda offset: blob[offset:offset + KEY_LENGTH]
+        for first in sorted(buckets):
+            index.offsets.extend(sorted(buckets.pop(first), key=sort_key))
+        text_starts = index.text_starts
+        index.key_sids = array('I', (bisect_right(text_starts, offset) - 1 for offset in index.offsets))
+        index._build_pools('', 0, len(index.offsets))
+        return index
+
+    def _build_pools(self, prefix, lo, hi):
+        """返回区间内权重最高的 pool_size 个建议；区间超过 scan_limit 时把结果记在 pools 中
+
+        自底向上合并：小区间直接扫描，大区间由各个下一字符的子区间的结果合并而来，每个词首只扫描一次
+        """
+        if hi - lo <= self.scan_limit:
+            return heapq.nlargest(self.pool_size, set(self.key_sids[lo:hi]), key=self.weights.__getitem__)
+
+        blob, offsets = self.blob, self.offsets
+        length = len(prefix) + 1
+        child_key = lambda offset: blob[offset:offset + length]
+        candidates = set()
+        start = lo
+        if length > KEY_LENGTH:
+            candidates.update(self.key_sids[lo:hi])
+            start = hi
+        while start < hi:
+            child = child_key(offsets[start])
+            end = bisect_right(offsets, child, start, hi, key=child_key)
+            if child.endswith(_SEP):
+                # 恰好到此结束的文本
+                candidates.update(self.key_sids[start:end])
+            else:
+                candidates.update(self._build_pools(child, start, end))
+            start = end
+        pool = heapq.nlargest(self.pool_size, candidates, key=self.weights.__getitem__)
+        self.pools[prefix] = array('I', pool)
+        return pool
+
+    # ---------- 增量更新 ----------
+
+    def _ensure_track(self, music_id):
+        missing = music_id + 1 - len(self.track_plays)
+        if missing > 0:
+            # 按比例预留，逐行读取时不必每次都扩容
+            missing = max(missing, len(self.track_plays) // 4)
+            self.track_plays.extend(array('q', bytes(8 * missing)))
+            self.track_sids.extend(array('i', [-1]) * (3 * missing))
+
+    def _lookup(self, kind, norm):
+        """已有建议的编号，不存在时为 None"""
+        sid = self.delta_texts.get((kind, norm))
+        if sid is not None:
+            return sid
+        target = norm + _SEP
+        length = len(target)
+        if length > KEY_LENGTH:
+            # 超长文本的排序键被截断，只能在同一截断键的区间内逐个比较
+            key = lambda offset: self.blob[offset:offset + KEY_LENGTH]
+            lo = bisect_left(self.offsets, target[:KEY_LENGTH], key=key)
+            hi = bisect_right(self.offsets, target[:KEY_LENGTH], key=key)
+        else:
+            key = lambda offset: self.blob[offset:offset + length]
+            lo = bisect_left(self.offsets, target, key=key)
+            hi = bisect_right(self.offsets, target, key=key)
+        for i in range(lo, hi):
+            sid = self.key_sids[i]
+            start = self.text_starts[sid]
+            if (self.offsets[i] == start and self.kinds[sid] == kind
+                    and self.blob[start:start + length] == target):
+                return sid
+        return None
+
+    def _add(self, kind, value):
+        norm, word_starts = normalize(value)
+        if not norm:
+            return -1
+        sid = self._lookup(kind, norm)
+        if sid is None:
+            sid = len(self.weights)
+            self.kinds.append(kind)
+            self.weights.append(0)
+            self.counts.append(0)
+            self.delta_texts[(kind, norm)] = sid
+            self.delta_displays.append(value.strip())
+            for start in word_starts[:MAX_STARTS]:
+                insort(self.delta, (norm[start:start + KEY_LENGTH], sid))
+        return sid
+
+    def remove_track(self, music_id):
+        if music_id >= len(self.track_plays):
+            return
+        play_count = self.track_plays[music_id]
+        for kind in range(3):
+            sid = self.track_sids[music_id * 3 + kind]
+            if sid >= 0:
+                self.weights[sid] -= play_count
+                self.counts[sid] -= 1
+                self.track_sids[music_id * 3 + kind] = -1
+        self.track_plays[music_id] = 0
+
+    def set_track(self, music_id, values, play_count):
+        """以歌曲当前的标题、艺术家、专辑和播放次数为准更新（幂等）"""
+        self.remove_track(music_id)
+        self._ensure_track(music_id)
+        play_count = play_count or 0
+        self.track_plays[music_id] = play_count
+        for kind, value in enumerate(values):
+            sid = self._add(kind, value) if value else -1
+            if sid >= 0:
+                self.weights[sid] += play_count
+                self.counts[sid] += 1
+            self.track_sids[music_id * 3 + kind] = sid
+
+    def add_plays(self, music_id, delta):
+        if music_id >= len(self.track_plays):
+            return
+        self.track_plays[music_id] += delta
+        for kind in range(3):
+            sid = self.track_sids[music_id * 3 + kind]
+            if sid >= 0:
+                self.weights[sid] += delta
+
+    # ---------- 查询 ----------
+
+    def candidates(self, prefix):
+        key = lambda offset: self.blob[offset:offset + len(prefix)]
+        lo = bisect_left(self.offsets, prefix, key=key)
+        hi = bisect_right(self.offsets, prefix, key=key)
+        if hi - lo > self.scan_limit:
+            found = set(self.pools.get(prefix, ()))
+        else:
+            found = set(self.key_sids[lo:hi])
+        for i in range(bisect_left(self.delta, (prefix,)), len(self.delta)):
+            text, sid = self.delta[i]
+            if not text.startswith(prefix):
+                break
+            found.add(sid)
+        return found
+
+    def display(self, sid):
+        if sid < self.size:
+            return self.displays[self.display_starts[sid]:self.display_starts[sid + 1]]
+        return self.delta_displays[sid - self.size]
+
+    def memory(self):
+        """各部分占用的字节数"""
+        def size(value):
+            return value.itemsize * len(value) if isinstance(value, array) else sys.getsizeof(value)
+
+        pools = sys.getsizeof(self.pools) + sum(sys.getsizeof(prefix) + size(pool)
+                                                for prefix, pool in self.pools.items())
+        delta = (sys.getsizeof(self.delta) + sys.getsizeof(self.delta_texts)
+                 + sum(sys.getsizeof(entry) + sys.getsizeof(entry[0]) for entry in self.delta)
+                 + sum(sys.getsizeof(display) for display in self.delta_displays))
+        report = {
+            'texts': size(self.blob) + size(self.text_starts),
+            'displays': size(self.displays) + size(self.display_starts),
+            'prefix_array': size(self.offsets) + size(self.key_sids),
+            'pools': pools,
+            'weights': size(self.kinds) + size(self.weights) + size(self.counts),
+            'tracks': size(self.track_sids) + size(self.track_plays),
+            'delta': delta
+        }
+        report['total'] = sum(report.values())
+        return report
+
+
+class Typeahead:
+    """输入即搜的前缀建议：标题、艺术家、专辑，按 play_count 加权取前 k 个
+
+    进程启动时由后台线程用一次流式查询构建索引，构建完成前返回空列表。歌曲的增删改在事务提交后
+    写入索引，播放次数由播放写缓冲在落库后累加。新增的建议超过 delta_limit 条或距上次构建超过
+    rebuild_interval 秒时重新构建，预先算好的热门前缀候选也随之按最新的播放次数更新。
+    """
+
+    def __init__(self, max_limit=20, scan_limit=512, rebuild_interval=3600, delta_limit=20000,
+                 stream_batch_size=10000):
+        self.max_limit = max_limit
+        self.scan_limit = scan_limit
+        self.rebuild_interval = rebuild_interval
+        self.delta_limit = delta_limit
+        self.stream_batch_size = stream_batch_size
+        self.app = None
+        self._index = None
+        self._lock = threading.Lock()
+        self._building = False
+        self._touched = None                # 构建期间变化的歌曲，构建完成后按数据库重放
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._counters = {'queries': 0, 'builds': 0, 'track_updates': 0}
+        self._last_build = {}
+        self._changes = TransactionChanges('typeahead_changes', dict, self._apply_changes)
+
+    def init_app(self, app):
+        """绑定应用并启动后台构建线程（需在数据库初始化之后调用）"""
+        self.app = app
+        self.max_limit = app.config.get('TYPEAHEAD_MAX_LIMIT', self.max_limit)
+        self.scan_limit = app.config.get('TYPEAHEAD_SCAN_LIMIT', self.scan_limit)
+        self.rebuild_interval = app.config.get('TYPEAHEAD_REBUILD_INTERVAL', self.rebuild_interval)
+        self.delta_limit = app.config.get('TYPEAHEAD_DELTA_LIMIT', self.delta_limit)
+        app.extensions['typeahead'] = self
+
+        listen_once(Music, (('after_insert', self._after_change), ('after_update', self._after_change),
+                            ('after_delete', self._after_delete)))
+        self._changes.register()
+
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='typeahead-builder', daemon=True)
+            self._thread.start()
+
+    # ---------- 构建 ----------
+
+    def build(self):
+        """全量构建并替换当前索引，返回耗时和规模"""
+        started = time.perf_counter()
+        with self._lock:
+            self._building = True
+            self._touched = set()
+        try:
+            with self.app.app_context():
+                music = Music.__table__
+                statement = db.select(music.c.id, music.c.title, music.c.artist, music.c.album, music.c.play_count)
+                with db.engine.connect() as conn:
+                    rows = conn.execution_options(yield_per=self.stream_batch_size).execute(statement)
+                    index = _Index.build(rows, self.scan_limit, self.max_limit * 2)
+
+                # 构建期间提交的修改可能没有被流式查询读到，按数据库的当前值重放（set_track 是幂等的），
+                # 直到没有新的修改时在同一次加锁中替换索引
+                while True:
+                    with self._lock:
+                        touched, self._touched = self._touched, set()
+                        if not touched:
+                            self._index = index
+                            break
+                    ids = sorted(touched)
+                    for start in range(0, len(ids), 500):
+                        batch = ids[start:start + 500]
+                        rows = {row[0]: row for row in db.session.execute(statement.where(music.c.id.in_(batch)))}
+                        with self._lock:
+                            for music_id in batch:
+                                row = rows.get(music_id)
+                                if row is None:
+                                    index.remove_track(music_id)
+                                else:
+                                    index.set_track(music_id, row[1:4], row[4])
+                    db.session.remove()
+        finally:
+            with self._lock:
+                self._building = False
+                self._touched = None
+
+        with self._lock:
+            self._counters['builds'] += 1
+            self._last_build = {
+                'suggestions': index.size,
+                'prefixes': len(index.offsets),
+                'pools': len(index.pools),
+                'duration_ms': round((time.perf_counter() - started) * 1000, 2)
+            }
+            return dict(self._last_build)
+
+    def _run(self):
+        while True:
+            try:
+                self.build()
+            except Exception:
+                # 构建失败时保留旧索引，稍后重试
+                pass
+            self._wakeup.wait(self.rebuild_interval)
+            self._wakeup.clear()
+
+    # ---------- 增量更新 ----------
+
+    def _after_change(self, mapper, connection, target):
+        state = inspect(target)
+        if not state.attrs.play_count.history.has_changes() and not any(
+                state.attrs[kind].history.has_changes() for kind in KINDS):
+            return
+        pending = self._changes.pending(target)
+        if pending is not None:
+            pending[target.id] = (tuple(getattr(target, kind) for kind in KINDS), target.play_count)
+
+    def _after_delete(self, mapper, connection, target):
+        pending = self._changes.pending(target)
+        if pending is not None:
+            pending[target.id] = None
+
+    def _apply_changes(self, changes):
+        """事务提交后把本事务中的歌曲变更写入索引"""
+        with self._lock:
+            if self._touched is not None:
+                self._touched.update(changes)
+            index = self._index
+            if index is None:
+                return
+            for music_id, change in changes.items():
+                if change is None:
+                    index.remove_track(music_id)
+                else:
+                    index.set_track(music_id, *change)
+            self._counters['track_updates'] += len(changes)
+            if len(index.delta) > self.delta_limit:
+                self._wakeup.set()
+
+    def add_plays(self, deltas):
+        """播放写缓冲落库后累加播放次数: {music_id: 增量}"""
+        with self._lock:
+            if self._touched is not None:
+                self._touched.update(deltas)
+            if self._index is None:
+                return
+            for music_id, delta in deltas.items():
+                self._index.add_plays(music_id, delta)
+
+    # ---------- 查询 ----------
+
+    def suggest(self, query, limit=10):
+        """返回 [{'text', 'type', 'weight', 'tracks'}]，索引尚未构建完成时返回空列表"""
+        prefix, _ = normalize(query)
+        if prefix and query[-1:].isspace():
+            # 输入以空格结尾时只匹配完整的词
+            prefix += ' '
+        prefix = prefix[:KEY_LENGTH]
+        limit = max(1, min(limit, self.max_limit))
+
+        with self._lock:
+            self._counters['queries'] += 1
+            index = self._index
+            if index is None or not prefix:
+                return []
+            live = (sid for sid in index.candidates(prefix) if index.counts[sid] > 0)
+            top = heapq.nlargest(limit, live, key=index.weights.__getitem__)
+            return [{
+                'text': index.display(sid),
+                'type': KINDS[index.kinds[sid]],
+                'weight': index.weights[sid],
+                'tracks': index.counts[sid]
+            } for sid in top]
+
+    def memory_report(self):
+        with self._lock:
+            return self._index.memory() if self._index is not None else None
+
+    def get_stats(self):
+        with self._lock:
+            index = self._index
+            return dict(
+                self._counters,
+                ready=index is not None,
+                building=self._building,
+                last_build=dict(self._last_build),
+                delta=len(index.delta) if index is not None else 0
+            )
+
+
+# 全局输入建议实例
+typeahead = Typeahead()
@@ -0,0 +1,346 @@
+import hashlib
+import json
+import mimetypes
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from src.models.user import db, Music, MediaBlob, UploadSession, UploadChunk
+
+
+READ_BLOCK = 64 * 1024
+AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.aac', '.wav', '.flac', '.ogg', '.opus')
+
+
+# 文件头特征 -> (格式, MIME 类型)
+SIGNATURES = (
+    (0, b'ID3', ('mp3', 'audio/mpeg')),
+    (0, b'fLaC', ('flac', 'audio/flac')),
+    (0, b'OggS', ('ogg', 'audio/ogg')),
+    (8, b'WAVE', ('wav', 'audio/wav')),
+    (4, b'ftyp', ('mp4', 'audio/mp4')),
+)
+
+
+def sniff_format(path):
+    """根据文件头判断音频格式，无法识别时返回 (None, None)"""
+    with open(path, 'rb') as f:
+        head = f.read(16)
+    for offset, magic, result in SIGNATURES:
+        if head[offset:offset + len(magic)] == magic:
+            return result
+    # 没有 ID3 标签的 MP3 以帧同步字开头
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        return 'mp3', 'audio/mpeg'
+    return None, None
+
+
+class UploadError(ValueError):
+    """上传参数或数据不合法"""
+
+
+def _ranges(indexes):
+    """[0, 1, 2, 5, 6] -> [[0, 2], [5, 6]]"""
+    ranges = []
+    for index in indexes:
+        if ranges and ranges[-1][1] == index - 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+    return ranges
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class UploadManager:
+    """可断点续传的分块上传
+
+    每个会话对应 upload_dir 下一个预分配大小的临时文件，分块按 64KB 读取请求体
+    并直接写入文件中对应的偏移，同时计算分块的 SHA-256，每个上传占用的内存与文件大小无关。
+    已接收的分块记录在 upload_chunks 表中，客户端中断后查询会话即可只补传缺失的分块。
+    全部分块到齐后计算整个文件的 SHA-256：内容相同的文件只保存一份（media_blobs），
+    然后创建 Music 记录。
+    """
+
+    def __init__(self, upload_dir=None, media_root=None, url_prefix='/media/', chunk_size=4 * 1024 * 1024,
+                 min_chunk_size=256 * 1024, max_chunk_size=16 * 1024 * 1024, max_file_size=200 * 1024 * 1024,
+                 session_ttl=86400):
+        self.upload_dir = upload_dir
+        self.media_root = media_root
+        self.url_prefix = url_prefix
+        self.chunk_size = chunk_size
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.max_file_size = max_file_size
+        self.session_ttl = session_ttl
+
+    def init_app(self, app):
+        self.media_root = app.config.get('MEDIA_ROOT', self.media_root)
+        self.url_prefix = app.config.get('MEDIA_URL_PREFIX', self.url_prefix)
+        self.upload_dir = app.config.get('UPLOAD_DIR', self.upload_dir)
+        self.chunk_size = app.config.get('UPLOAD_CHUNK_SIZE', self.chunk_size)
+        self.max_file_size = app.config.get('UPLOAD_MAX_FILE_SIZE', self.max_file_size)
+        self.session_ttl = app.config.get('UPLOAD_SESSION_TTL', self.session_ttl)
+        app.extensions['uploads'] = self
+
+    def _part_path(self, session_id):
+        return os.path.join(self.upload_dir, session_id + '.part')
+
+    # ---------- 会话 ----------
+
+    def create_session(self, user_id, filename, total_size, mime_type=None, sha256=None, details=None,
+                       chunk_size=None):
+        filename = os.path.basename(filename or '').strip()
+        if not filename:
+            raise UploadError('缺少文件名')
+        extension = os.path.splitext(filename)[1].lower()
+        mime_type = mime_type or mimetypes.guess_type(filename)[0]
+        if extension not in AUDIO_EXTENSIONS and not (mime_type or '').startswith('audio/'):
+            raise UploadError('只支持上传音频文件')
+        if not isinstance(total_size, int) or total_size <= 0:
+            raise UploadError('文件大小无效')
+        if total_size > self.max_file_size:
+            raise UploadError(f'文件不能超过 {self.max_file_size // (1024 * 1024)}MB')
+        if sha256 is not None and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256.lower())):
+            raise UploadError('sha256 格式无效')
+        chunk_size = chunk_size or self.chunk_size
+        if not isinstance(chunk_size, int) or not self.min_chunk_size <= chunk_size <= self.max_chunk_size:
+            raise UploadError(f'分块大小须在 {self.min_chunk_size} 到 {self.max_chunk_size} 字节之间')
+
+        session = UploadSession(
+            id=uuid.uuid4().hex,
+            user_id=user_id,
+            filename=filename,
+            mime_type=mime_type,
+            total_size=total_size,
+            chunk_size=chunk_size,
+            expected_sha256=sha256.lower() if sha256 else None,
+            details=json.dumps(details or {}, ensure_ascii=False),
+            status='uploading',
+            expires_at=datetime.utcnow() + timedelta(seconds=self.session_ttl)
+        )
+        os.makedirs(self.upload_dir, exist_ok=True)
+        # 预分配（稀疏）文件，分块按偏移写入，到达顺序无关
+        with open(self._part_path(session.id), 'wb') as f:
+            f.truncate(total_size)
+        db.session.add(session)
+        db.session.commit()
+        return session
+
+    def describe(self, session):
+        received = [index for (index,) in db.session.query(UploadChunk.chunk_index).filter_by(
+            session_id=session.id
+        ).order_by(UploadChunk.chunk_index)]
+        received_bytes = sum(session.chunk_length(index) for index in received)
+        missing = sorted(set(range(session.chunk_count)) - set(received))
+        return {
+            'upload_id': session.id,
+            'status': session.status,
+            'filename': session.filename,
+            'total_size': session.total_size,
+            'chunk_size': session.chunk_size,
+            'chunk_count': session.chunk_count,
+            'received_chunks': _ranges(received),
+            'received_bytes': received_bytes,
+            'next_chunk': missing[0] if missing else None,
+            'missing_count': len(missing),
+            'music_id': session.music_id,
+            'job_id': session.job_id,
+            'error': session.error_message,
+            'expires_at': session.expires_at.isoformat() if session.expires_at else None
+        }
+
+    # ---------- 分块 ----------
+
+    def write_chunk(self, session, index, stream, content_length, expected_sha256=None):
+        """把请求体流式写入分块对应的偏移，校验长度和 SHA-256 后记录该分块"""
+        if session.status != 'uploading':
+            raise UploadError('上传会话不可写入')
+        if not 0 <= index < session.chunk_count:
+            raise UploadError('分块序号超出范围')
+        length = session.chunk_length(index)
+        if content_length is not None and content_length != length:
+            raise UploadError(f'分块 {index} 应为 {length} 字节')
+
+        digest = hashlib.sha256()
+        offset = index * session.chunk_size
+        written = 0
+        fd = os.open(self._part_path(session.id), os.O_WRONLY)
+        try:
+            while written < length:
+                block = stream.read(min(READ_BLOCK, length - written))
+                if not block:
+                    break
+                digest.update(block)
+                os.pwrite(fd, block, offset + written)
+                written += len(block)
+        finally:
+            os.close(fd)
+
+        checksum = digest.hexdigest()
+        error = None
+        if written != length or stream.read(1):
+            error = f'分块 {index} 应为 {length} 字节'
+        elif expected_sha256 and expected_sha256.lower() != checksum:
+            error = f'分块 {index} 校验失败'
+        if error:
+            # 该偏移处的数据已被覆盖，之前接收的同一分块也不再有效
+            UploadChunk.query.filter_by(session_id=session.id, chunk_index=index).delete(synchronize_session=False)
+            db.session.commit()
+            raise UploadError(error)
+
+        db.session.merge(UploadChunk(session_id=session.id, chunk_index=index, size=length, sha256=checksum))
+        # 活跃的会话顺延过期时间
+        session.expires_at = datetime.utcnow() + timedelta(seconds=self.session_ttl)
+        db.session.commit()
+        return checksum
+
+    # ---------- 完成 ----------
+
+    def complete(self, session):
+        """校验完整文件并去重存储，创建 Music 记录；返回 (music, blob)"""
+        claimed = db.session.execute(
+            db.update(UploadSession).where(
+                UploadSession.id == session.id,
+                UploadSession.status == 'uploading'
+            ).values(status='completing', updated_at=datetime.utcnow()).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            raise UploadError('上传会话已完成或正在处理')
+        db.session.refresh(session)
+        try:
+            return self._complete(session)
+        except Exception:
+            db.session.rollback()
+            session = db.session.get(UploadSession, session.id)
+            if session.status == 'completing':
+                # 意外失败时放回上传状态，客户端可以重试
+                session.status = 'uploading'
+                db.session.commit()
+            raise
+
+    def _complete(self, session):
+        received = UploadChunk.query.filter_by(session_id=session.id).count()
+        if received != session.chunk_count:
+            raise UploadError(f'还有 {session.chunk_count - received} 个分块未上传')
+
+        part_path = self._part_path(session.id)
+        checksum = file_sha256(part_path)
+        if session.expected_sha256 and checksum != session.expected_sha256:
+            session.status = 'failed'
+            session.error_message = '文件校验失败'
+            db.session.commit()
+            self._discard(session.id)
+            raise UploadError('文件校验失败，请重新上传')
+
+        details = json.loads(session.details or '{}')
+        try:
+            music, blob = self._create_music(part_path, checksum, session, details)
+        except IntegrityError:
+            # 并发完成了相同内容的上传，对方已登记，改为增加引用
+            music, blob = self._create_music(part_path, checksum, session, details)
+        # 提交之后才删除临时文件，失败时客户端重试仍能找到已上传的数据
+        self._discard(session.id)
+        return music, blob
+
+    def _create_music(self, part_path, checksum, session, details):
+        """在同一个事务中登记文件引用、创建 Music 记录并完成会话
+
+        相同内容已存在时增加引用，否则以硬链接把临时文件放入媒体目录；事务失败时回滚，
+        删除没有被登记的链接，临时文件保留。
+        """
+        increment = db.update(MediaBlob).where(MediaBlob.sha256 == checksum).values(
+            ref_count=MediaBlob.ref_count + 1
+        ).execution_options(synchronize_session=False)
+        linked = None
+        if db.session.execute(increment).rowcount:
+            blob = MediaBlob.query.filter_by(sha256=checksum).one()
+        else:
+            extension = os.path.splitext(session.filename)[1].lower()
+            storage_path = f'blobs/{checksum[:2]}/{checksum[2:4]}/{checksum}{extension}'
+            final_path = os.path.join(self.media_root, storage_path)
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            try:
+                os.link(part_path, final_path)
+                linked = storage_path
+            except FileExistsError:
+                # 文件名即校验和，已存在的文件内容相同
+                pass
+            blob = MediaBlob(sha256=checksum, size=session.total_size, storage_path=storage_path,
+                             mime_type=session.mime_type, ref_count=1)
+            db.session.add(blob)
+
+        music = Music(
+            title=details.get('title') or os.path.splitext(session.filename)[0],
+            artist=details.get('artist') or '未知艺术家',
+            album=details.get('album'),
+            genre=details.get('genre'),
+            file_url=self.url_prefix + blob.storage_path,
+            upload_user_id=session.user_id
+        )
+        db.session.add(music)
+        try:
+            db.session.flush()
+            session.music_id = music.id
+            session.blob_id = blob.id
+            session.status = 'completed'
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            if linked and not MediaBlob.query.filter_by(storage_path=linked).first():
+                os.remove(os.path.join(self.media_root, linked))
+            raise
+        return music, blob
+
+    def blob_path(self, blob):
+        return os.path.join(self.media_root, blob.storage_path)
+
+    def abort(self, session):
+        if session.status in ('completing', 'completed'):
+            raise UploadError('上传已完成，无法取消')
+        self._discard(session.id)
+        UploadChunk.query.filter_by(session_id=session.id).delete(synchronize_session=False)
+        db.session.delete(session)
+        db.session.commit()
+
+    def _discard(self, session_id):
+        try:
+            os.remove(self._part_path(session_id))
+        except FileNotFoundError:
+            pass
+
+    # ---------- 清理 ----------
+
+    def expire_sessions(self, now):
+        """返回分批执行函数: 删除过期会话及其临时文件和分块记录"""
+        sessions = UploadSession.__table__
+        chunks = UploadChunk.__table__
+
+        def execute(conn, limit):
+            ids = [row[0] for row in conn.execute(
+                db.select(sessions.c.id).where(
+                    sessions.c.expires_at < now,
+                    sessions.c.status != 'completing'
+                ).limit(limit)
+            )]
+            if not ids:
+                return 0
+            conn.execute(db.delete(chunks).where(chunks.c.session_id.in_(ids)))
+            conn.execute(db.delete(sessions).where(sessions.c.id.in_(ids)))
+            for session_id in ids:
+                self._discard(session_id)
+            return len(ids)
+        return execute
+
+
+# 全局上传实例
+uploads = UploadManager()
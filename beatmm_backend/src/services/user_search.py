@@ -0,0 +1,206 @@
+import re
+import threading
+import time
+import unicodedata
+
+from sqlalchemy import inspect, text
+
+from src.models.user import db, User
+from src.services.orm_events import listen_once
+
+
+# 参与搜索的列；trigram 分词器把每个连续的三个字符作为一个词，任意长度不小于 3 的子串都能走索引
+FIELDS = ('phone', 'first_name', 'last_name', 'email')
+
+# starts 列保存每个词的前两个字符（前面加两个标记字符），一两个字符的搜索词补上标记后也是三字符词，
+# 按词首前缀走索引，而不是退回到扫描整张表；三个字符以上的词直接按子串匹配
+_MARK = '\x1f\x1f'
+_STARTS_LENGTH = 2
+
+CREATE_STATEMENTS = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5(phone, name, email, starts, tokenize='trigram')",
+)
+
+_INSERT = text('INSERT INTO user_search(rowid, phone, name, email, starts) VALUES (:rowid, :phone, :name, :email, :starts)')
+_DELETE = text('DELETE FROM user_search WHERE rowid = :rowid')
+
+# 搜索词中的手机号：可带 + 国际前缀，数字之间允许空格、短横线、点和括号；与字母相连的数字属于普通词
+_PHONE = re.compile(r'(?<!\w)\+?\(?\d(?:[\d\s\-.()]*\d)?(?!\w)')
+_WORD_SEPARATOR = re.compile(r'[\W_]+')
+_CONTROL = re.compile(r'[\x00-\x1f]')
+
+# 缅甸手机号本地格式 09xxxxxxxx，国际格式 +959xxxxxxxx；索引和查询都只使用去掉前缀后的用户号码，
+# 否则每个用户都含有 09、959 等三字符词，这些词的文档列表和用户表一样长
+_LOCAL_PREFIX = '09'
+_INTERNATIONAL_PREFIX = '959'
+
+
+def _normalize(value):
+    return _CONTROL.sub(' ', unicodedata.normalize('NFKC', value or '')).casefold().strip()
+
+
+def _digits(value):
+    """只保留数字，缅文等其他数字写法统一成 0-9"""
+    return ''.join(str(unicodedata.digit(ch)) for ch in value if ch.isdigit())
+
+
+def subscriber_number(phone, international=False):
+    """去掉国际拨号前缀、国家码或本地前缀 0 后的号码：+959 4123 / 0095 94123 / 094123 -> 4123
+
+    international 表示输入带有 + 或 00，此时 959 的任意前缀（如 +95）都只是国家码的一部分
+    """
+    digits = _digits(phone or '')
+    if digits.startswith('00'):
+        digits, international = digits[2:], True
+    if digits.startswith(_INTERNATIONAL_PREFIX):
+        return digits[len(_INTERNATIONAL_PREFIX):]
+    if international and _INTERNATIONAL_PREFIX.startswith(digits):
+        return ''
+    if digits.startswith(_LOCAL_PREFIX):
+        return digits[len(_LOCAL_PREFIX):]
+    return digits
+
+
+def index_values(user_id, phone, first_name, last_name, email):
+    """写入 user_search 表的一行"""
+    number = subscriber_number(phone)
+    name = ' '.join(part for part in (_normalize(first_name), _normalize(last_name)) if part)
+    email = _normalize(email)
+    words = dict.fromkeys(word[:_STARTS_LENGTH] for word in
+                          [number] + _WORD_SEPARATOR.split(name) + _WORD_SEPARATOR.split(email) if word)
+    return {
+        'rowid': user_id,
+        'phone': number,
+        'name': name,
+        'email': email,
+        'starts': ' '.join(_MARK + word for word in words)
+    }
+
+
+def create_index(conn):
+    """创建搜索表并按 users 表全量重建（迁移和重建任务使用）"""
+    if conn.dialect.name != 'sqlite':
+        return 0
+    for statement in CREATE_STATEMENTS:
+        conn.exec_driver_sql(statement)
+    conn.exec_driver_sql('DELETE FROM user_search')
+
+    users = User.__table__
+    columns = [users.c.id] + [users.c[field] for field in FIELDS]
+    count = 0
+    batch = []
+    for row in conn.execute(db.select(*columns).order_by(users.c.id)):
+        batch.append(index_values(*row))
+        if len(batch) == 5000:
+            conn.execute(_INSERT, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        conn.execute(_INSERT, batch)
+        count += len(batch)
+    conn.exec_driver_sql("INSERT INTO user_search(user_search) VALUES ('optimize')")
+    return count
+
+
+def _phrase(value):
+    return '"' + value.replace('"', '""') + '"'
+
+
+class UserSearch:
+    """管理后台用户搜索：手机号、姓名、邮箱的 trigram 全文索引
+
+    原来的四个 LIKE '%词%' 每次都要扫描整张 users 表；这里的每个搜索词都在 FTS5 索引中查找，
+    耗时只与匹配的用户数有关。三个字符以上的词按子串匹配，一两个字符的词按词首前缀匹配；
+    手机号片段去掉空格、短横线和国际前缀后匹配本地或国际写法。非 SQLite 数据库退回 LIKE。
+    """
+
+    def __init__(self, max_terms=8):
+        self.max_terms = max_terms
+        self._lock = threading.Lock()
+        self._counters = {'queries': 0, 'index_writes': 0, 'fallback_queries': 0}
+
+    def init_app(self, app):
+        self.max_terms = app.config.get('USER_SEARCH_MAX_TERMS', self.max_terms)
+        app.extensions['user_search'] = self
+
+        listen_once(User, (('after_insert', self._after_insert), ('after_update', self._after_update),
+                           ('after_delete', self._after_delete)))
+
+    # ---------- 写路径 ----------
+
+    def _write(self, connection, target):
+        connection.execute(_DELETE, {'rowid': target.id})
+        connection.execute(_INSERT, index_values(target.id, *(getattr(target, field) for field in FIELDS)))
+        with self._lock:
+            self._counters['index_writes'] += 1
+
+    def _after_insert(self, mapper, connection, target):
+        if connection.dialect.name == 'sqlite':
+            self._write(connection, target)
+
+    def _after_update(self, mapper, connection, target):
+        # 登录只更新 last_login/login_count，不需要改索引
+        if connection.dialect.name != 'sqlite':
+            return
+        state = inspect(target)
+        if any(state.attrs[field].history.has_changes() for field in FIELDS):
+            self._write(connection, target)
+
+    def _after_delete(self, mapper, connection, target):
+        if connection.dialect.name == 'sqlite':
+            connection.execute(_DELETE, {'rowid': target.id})
+
+    def rebuild(self):
+        """按 users 表全量重建索引"""
+        started = time.perf_counter()
+        with db.engine.begin() as conn:
+            count = create_index(conn)
+        return {'indexed': count, 'duration_ms': round((time.perf_counter() - started) * 1000, 2)}
+
+    # ---------- 查询 ----------
+
+    def match_expression(self, search):
+        """搜索词 -> FTS5 MATCH 表达式，各词之间为 AND；只有 09、+95 这类号码前缀时返回 None（不过滤）"""
+        value = unicodedata.normalize('NFKC', search or '')
+        parts = []
+        for match in _PHONE.finditer(value):
+            digits = subscriber_number(match.group(), international=match.group().startswith('+'))
+            if len(digits) >= 3:
+                parts.append('{phone email} : ' + _phrase(digits))
+            elif digits:
+                parts.append('starts : ' + _phrase(_MARK + digits))
+        value = _PHONE.sub(' ', value)
+
+        for word in _normalize(value).split():
+            if len(word) >= 3:
+                parts.append('{name email} : ' + _phrase(word))
+            else:
+                parts.append('starts : ' + _phrase(_MARK + word))
+        if not parts:
+            return None
+        return ' AND '.join(parts[:self.max_terms])
+
+    def condition(self, search):
+        """给 User 查询使用的过滤条件"""
+        with self._lock:
+            self._counters['queries'] += 1
+        if db.session.get_bind().dialect.name != 'sqlite':
+            with self._lock:
+                self._counters['fallback_queries'] += 1
+            return db.or_(*(getattr(User, field).contains(search) for field in FIELDS))
+
+        expression = self.match_expression(search)
+        if expression is None:
+            return db.true()
+        matches = db.select(db.literal_column('rowid')).select_from(db.table('user_search')).where(
+            db.text('user_search MATCH :user_search_query').bindparams(user_search_query=expression)
+        )
+        return User.id.in_(matches)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+
+# 全局用户搜索实例
+user_search = UserSearch()
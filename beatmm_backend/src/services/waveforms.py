@@ -0,0 +1,535 @@
+import array
+import hashlib
+import os
+import struct
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:  # 只有计算波形需要 numpy，读取已保存的波形不需要
+    np = None
+
+from src.models.user import db, Music, MusicWaveform
+from src.services.audio_metadata import audio_metadata, probe, MetadataError
+
+
+class WaveformError(ValueError):
+    """无法解码或分析音频"""
+
+
+# 解码结果：blocks(block_frames) 逐块产生 [帧数, 声道数] 的 float32 数组，取值 [-1, 1]；frames 未知时为 None
+DecodedAudio = namedtuple('DecodedAudio', 'sample_rate channels frames blocks')
+
+# 二进制格式（小端）：头部之后是 points 对 int8 (最小值, 最大值) 峰值，
+# 然后是 profile_length 个 int16 短期响度（LUFS x 10，PROFILE_SILENCE 表示低于 -70 LUFS）
+HEADER = struct.Struct('<4sBBHIIII')
+MAGIC = b'BMWF'
+FORMAT_VERSION = 1
+PROFILE_SILENCE = -32768
+
+# BS.1770：400ms 门限块以 100ms 步进，短期响度窗口 3s
+STEP_SECONDS = 0.1
+ABSOLUTE_GATE = -70.0
+
+
+# ---------- 解码 ----------
+
+def _wav_layout(path):
+    """WAV 的 (编码, 声道数, 采样率, 位深, 数据偏移, 数据长度)"""
+    with open(path, 'rb') as f:
+        header = f.read(12)
+        if header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            raise WaveformError('不是 WAV 文件')
+        size = os.fstat(f.fileno()).st_size
+        fmt = None
+        pos = 12
+        while pos + 8 <= size:
+            f.seek(pos)
+            chunk_id, chunk_size = struct.unpack('<4sI', f.read(8))
+            if chunk_id == b'fmt ':
+                raw = f.read(min(chunk_size, 40))
+                audio_format, channels, sample_rate, _, _, bits = struct.unpack_from('<HHIIHH', raw)
+                if audio_format == 0xFFFE and len(raw) >= 26:
+                    # WAVE_FORMAT_EXTENSIBLE：实际编码在子格式 GUID 的前两个字节
+                    audio_format = struct.unpack_from('<H', raw, 24)[0]
+                fmt = (audio_format, channels, sample_rate, bits)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    break
+                return fmt + (pos + 8, min(chunk_size, size - pos - 8))
+            pos += 8 + chunk_size + (chunk_size & 1)
+    raise WaveformError('WAV 缺少 fmt 或 data 块')
+
+
+def decode_wav(path):
+    """WAV 解码：数据块映射到内存，按块转换为浮点数，不会一次读入整个文件"""
+    audio_format, channels, sample_rate, bits, offset, size = _wav_layout(path)
+    dtypes = {(1, 8): 'u1', (1, 16): '<i2', (1, 24): 'u1', (1, 32): '<i4', (3, 32): '<f4', (3, 64): '<f8'}
+    if (audio_format, bits) not in dtypes or not channels or not sample_rate:
+        raise WaveformError(f'不支持的 WAV 编码: format={audio_format}, bits={bits}')
+    frame_bytes = channels * bits // 8
+    frames = size // frame_bytes
+
+    def blocks(block_frames):
+        if not frames:
+            return
+        width = channels * 3 if bits == 24 else channels
+        data = np.memmap(path, dtype=dtypes[(audio_format, bits)], mode='r', offset=offset, shape=(frames, width))
+        try:
+            for start in range(0, frames, block_frames):
+                block = data[start:start + block_frames]
+                if bits == 8:
+                    yield (block.astype(np.float32) - 128) / 128
+                elif bits == 16:
+                    yield block.astype(np.float32) / 32768
+                elif bits == 24:
+                    raw = block.reshape(len(block), channels, 3).astype(np.int32)
+                    value = raw[..., 0] | (raw[..., 1] << 8) | (raw[..., 2] << 16)
+                    yield ((value << 8) >> 8).astype(np.float32) / 8388608
+                elif audio_format == 1:
+                    yield block.astype(np.float32) / 2147483648
+                else:
+                    yield block.astype(np.float32)
+        finally:
+            del data
+
+    return DecodedAudio(sample_rate, channels, frames, blocks)
+
+
+def command_decoder(command, sample_rate=44100, channels=2):
+    """外部解码命令（如 ffmpeg），需把 32 位浮点小端 PCM 写到标准输出；参数中的 {path} 替换为文件路径"""
+    frame_bytes = 4 * channels
+
+    def decode(path):
+        def blocks(block_frames):
+            args = [part.replace('{path}', path) for part in command]
+            with subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+                try:
+                    while True:
+                        raw = process.stdout.read(block_frames * frame_bytes)
+                        if not raw:
+                            break
+                        usable = len(raw) - len(raw) % frame_bytes
+                        yield np.frombuffer(raw[:usable], dtype='<f4').reshape(-1, channels)
+                finally:
+                    process.stdout.close()
+                    returncode = process.wait()
+            if returncode != 0:
+                raise WaveformError(f'解码命令退出码 {returncode}')
+
+        return DecodedAudio(sample_rate, channels, None, blocks)
+
+    return decode
+
+
+# ---------- 分析 ----------
+
+def _k_weighting_fir(sample_rate, taps):
+    """BS.1770 K 计权（高架滤波 + RLB 高通）的冲激响应
+
+    两个二阶节按 RBJ 公式由模拟原型换算到当前采样率，在密集频率网格上求频响后逆变换，
+    截取前 taps 个点（高通的冲激响应在 0.1 秒内衰减到 1e-6 以下）。
+    """
+    def biquad(b, a, z):
+        return (b[0] + b[1] / z + b[2] / z ** 2) / (a[0] + a[1] / z + a[2] / z ** 2)
+
+    # 高架滤波: +4dB, 1500Hz, Q=1/sqrt(2)
+    gain = 10 ** (4.0 / 40)
+    w0 = 2 * np.pi * 1500.0 / sample_rate
+    alpha = np.sin(w0) / (2 * (1 / np.sqrt(2)))
+    cos_w0, sqrt_gain = np.cos(w0), np.sqrt(gain)
+    shelf_b = (gain * ((gain + 1) + (gain - 1) * cos_w0 + 2 * sqrt_gain * alpha),
+               -2 * gain * ((gain - 1) + (gain + 1) * cos_w0),
+               gain * ((gain + 1) + (gain - 1) * cos_w0 - 2 * sqrt_gain * alpha))
+    shelf_a = ((gain + 1) - (gain - 1) * cos_w0 + 2 * sqrt_gain * alpha,
+               2 * ((gain - 1) - (gain + 1) * cos_w0),
+               (gain + 1) - (gain - 1) * cos_w0 - 2 * sqrt_gain * alpha)
+    # 高通: 38Hz, Q=0.5
+    w0 = 2 * np.pi * 38.0 / sample_rate
+    alpha = np.sin(w0) / (2 * 0.5)
+    cos_w0 = np.cos(w0)
+    pass_b = ((1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2)
+    pass_a = (1 + alpha, -2 * cos_w0, 1 - alpha)
+
+    size = 1 << max(16, (taps * 4 - 1).bit_length())
+    z = np.exp(1j * np.pi * np.arange(size // 2 + 1) / (size // 2))
+    response = biquad(shelf_b, shelf_a, z) * biquad(pass_b, pass_a, z)
+    return np.fft.irfft(response, size)[:taps]
+
+
+class _KWeighting:
+    """分块 FFT 卷积（重叠相加），块之间保留卷积尾部
+
+    每块 block_frames 帧加上滤波器长度正好是一个 2 的幂的 FFT 长度，声道在前、单精度计算。
+    """
+
+    def __init__(self, sample_rate, fft_size=65536):
+        fir = _k_weighting_fir(sample_rate, max(64, int(sample_rate * 0.1)))
+        self.fft_size = max(fft_size, 1 << (2 * len(fir) - 1).bit_length())
+        self.block_frames = self.fft_size - len(fir) + 1
+        self.spectrum = np.fft.rfft(fir, self.fft_size).astype(np.complex64)
+        self.tail = None
+
+    def __call__(self, channels_first):
+        length = channels_first.shape[1]
+        filtered = np.fft.irfft(np.fft.rfft(channels_first, self.fft_size, axis=1) * self.spectrum, self.fft_size,
+                                axis=1)
+        if self.tail is not None:
+            filtered[:, :self.tail.shape[1]] += self.tail
+        self.tail = filtered[:, length:length + self.fft_size - self.block_frames]
+        return filtered[:, :length]
+
+
+class _Groups:
+    """沿最后一维把连续样本按固定长度分组归约，不足一组的部分留到下一块"""
+
+    def __init__(self, size, reduce):
+        self.size = size
+        self.reduce = reduce
+        self.carry = None
+        self.results = []
+
+    def feed(self, values):
+        if self.carry is not None:
+            values = np.concatenate([self.carry, values], axis=-1)
+        whole = values.shape[-1] // self.size * self.size
+        if whole:
+            grouped = values[..., :whole].reshape(values.shape[:-1] + (whole // self.size, self.size))
+            self.results.append(self.reduce(grouped))
+        self.carry = values[..., whole:]
+
+    def finish(self, keep_partial):
+        if keep_partial and self.carry is not None and self.carry.shape[-1]:
+            self.results.append(self.reduce(self.carry[..., None, :]))
+        if not self.results:
+            return None
+        return np.concatenate(self.results, axis=-1)
+
+
+def _channel_weights(channels):
+    """BS.1770 声道权重：5.1（L R C LFE Ls Rs）的环绕声道 1.41、LFE 不计，其他均为 1"""
+    if channels == 6:
+        return np.array([1.0, 1.0, 1.0, 0.0, 1.41, 1.41])
+    return np.ones(channels)
+
+
+def _loudness(power):
+    with np.errstate(divide='ignore'):
+        return -0.691 + 10 * np.log10(power)
+
+
+def analyze_pcm(decoded, points=1000, fft_size=65536, profile_interval=1.0):
+    """计算峰值包络、积分响度（BS.1770-4 / EBU R128）、响度范围和短期响度曲线"""
+    if np is None:
+        raise WaveformError('计算波形需要安装 numpy')
+    sample_rate, channels = decoded.sample_rate, decoded.channels
+    if decoded.frames:
+        samples_per_point = max(1, -(-decoded.frames // points))
+    else:
+        samples_per_point = max(1, sample_rate // 10)
+    step = int(round(sample_rate * STEP_SECONDS))
+
+    k_weighting = _KWeighting(sample_rate, fft_size)
+    # 波形点合并所有声道：交错排列的样本按 samples_per_point 帧连续分组
+    minimums = _Groups(samples_per_point * channels, lambda grouped: grouped.min(axis=-1))
+    maximums = _Groups(samples_per_point * channels, lambda grouped: grouped.max(axis=-1))
+    energy = _Groups(step, lambda grouped: grouped.sum(axis=-1, dtype=np.float64))
+    frames = 0
+    for decoded_block in decoded.blocks(k_weighting.block_frames):
+        # 自定义解码器返回的块可能大于请求的长度
+        for start in range(0, len(decoded_block), k_weighting.block_frames):
+            block = decoded_block[start:start + k_weighting.block_frames]
+            frames += len(block)
+            interleaved = block.reshape(-1)
+            minimums.feed(interleaved)
+            maximums.feed(interleaved)
+            filtered = k_weighting(np.ascontiguousarray(block.T, dtype=np.float32))
+            energy.feed(filtered * filtered)
+    if not frames:
+        raise WaveformError('没有音频数据')
+
+    low, high = minimums.finish(True), maximums.finish(True)
+    peaks = np.empty((len(low), 2), dtype=np.int8)
+    peaks[:, 0] = np.clip(np.round(low * 127), -127, 127)
+    peaks[:, 1] = np.clip(np.round(high * 127), -127, 127)
+    sample_peak = float(max(-low.min(), high.max()))
+
+    # 每 100ms 步的加权声道能量；最后不足一步的样本不参与门限计算
+    steps = energy.finish(False)
+    weighted = _channel_weights(channels) @ steps if steps is not None else np.zeros(0)
+    cumulative = np.concatenate([[0.0], np.cumsum(weighted)])
+
+    def windows(length):
+        """长度为 length 步、每步滑动一次的窗口平均功率"""
+        if len(weighted) < length:
+            return np.zeros(0)
+        return (cumulative[length:] - cumulative[:-length]) / (length * step)
+
+    blocks = windows(4)
+    levels = _loudness(blocks)
+    integrated = None
+    above = blocks[levels > ABSOLUTE_GATE]
+    if len(above):
+        relative_gate = _loudness(above.mean()) - 10
+        gated = blocks[(levels > ABSOLUTE_GATE) & (levels > relative_gate)]
+        integrated = float(_loudness(gated.mean()))
+
+    # 响度范围（EBU Tech 3342）：短期响度经 -70 LUFS 和 -20 LU 门限后第 10 到第 95 百分位之差
+    short_term = windows(int(round(3 / STEP_SECONDS)))
+    short_levels = _loudness(short_term)
+    loudness_range = None
+    above = short_term[short_levels > ABSOLUTE_GATE]
+    if len(above):
+        gated = short_levels[(short_levels > ABSOLUTE_GATE) & (short_levels > _loudness(above.mean()) - 20)]
+        if len(gated):
+            loudness_range = float(np.percentile(gated, 95) - np.percentile(gated, 10))
+
+    interval = max(1, int(round(profile_interval / STEP_SECONDS)))
+    sampled = short_levels[::interval]
+    profile = np.where(sampled > ABSOLUTE_GATE, np.round(np.maximum(sampled, -3276) * 10), PROFILE_SILENCE)
+
+    return {
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'frames': frames,
+        'samples_per_point': samples_per_point,
+        'peaks': peaks,
+        'profile': profile.astype('<i2'),
+        'profile_interval_ms': interval * int(STEP_SECONDS * 1000),
+        'integrated_lufs': round(integrated, 2) if integrated is not None else None,
+        'loudness_range': round(loudness_range, 2) if loudness_range is not None else None,
+        'sample_peak_db': round(20 * np.log10(sample_peak), 2) if sample_peak > 0 else None,
+    }
+
+
+# ---------- 存储格式 ----------
+
+def pack(analysis):
+    peaks, profile = analysis['peaks'], analysis['profile']
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, analysis['channels'], analysis['profile_interval_ms'],
+                         analysis['sample_rate'], analysis['samples_per_point'], len(peaks), len(profile))
+    return header + peaks.astype(np.int8).tobytes() + profile.astype('<i2').tobytes()
+
+
+def unpack(data):
+    """二进制波形 -> 字典（不依赖 numpy）"""
+    magic, version, channels, profile_interval_ms, sample_rate, samples_per_point, points, profile_length = \
+        HEADER.unpack_from(data)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise WaveformError('波形数据格式不兼容')
+    offset = HEADER.size
+    peaks = array.array('b', data[offset:offset + points * 2])
+    offset += points * 2
+    profile = array.array('h', data[offset:offset + profile_length * 2])
+    if sys.byteorder == 'big':
+        profile.byteswap()
+    return {
+        'channels': channels,
+        'sample_rate': sample_rate,
+        'samples_per_point': samples_per_point,
+        'points': points,
+        # 交替排列的 (最小值, 最大值)，范围 -127..127
+        'peaks': peaks.tolist(),
+        'profile_interval_ms': profile_interval_ms,
+        'short_term_lufs': [None if value == PROFILE_SILENCE else value / 10 for value in profile],
+    }
+
+
+class WaveformAnalyzer:
+    """波形与响度预计算 - 解码为 PCM 后用 NumPy 按块计算，结果以紧凑二进制保存在 music_waveforms
+
+    峰值为每个点所有声道的 (最小值, 最大值)，量化为 int8；响度按 BS.1770-4 K 计权和双重门限计算积分响度，
+    另保存每 profile_interval 秒一个的短期（3 秒）响度，供播放器做音量均衡。
+    内置 WAV 解码（内存映射）；其他格式通过 register_decoder 注册解码函数，
+    或配置 WAVEFORM_DECODER_COMMAND 使用外部解码命令。
+    """
+
+    def __init__(self, points=1000, fft_size=65536, profile_interval=1.0, target_lufs=-14.0,
+                 max_age=30 * 86400):
+        self.points = points
+        self.fft_size = fft_size
+        self.profile_interval = profile_interval
+        self.target_lufs = target_lufs
+        self.max_age = max_age
+        self._decoders = {'wav': decode_wav}
+        self._fallback = None
+        self._lock = threading.Lock()
+        self._counters = {'analyzed': 0, 'failed': 0, 'audio_seconds': 0.0, 'seconds': 0.0}
+
+    def init_app(self, app):
+        self.points = app.config.get('WAVEFORM_POINTS', self.points)
+        self.profile_interval = app.config.get('WAVEFORM_PROFILE_INTERVAL', self.profile_interval)
+        self.target_lufs = app.config.get('WAVEFORM_TARGET_LUFS', self.target_lufs)
+        self.max_age = app.config.get('WAVEFORM_MAX_AGE', self.max_age)
+        command = app.config.get('WAVEFORM_DECODER_COMMAND')
+        if command:
+            self._fallback = command_decoder(
+                command,
+                sample_rate=app.config.get('WAVEFORM_DECODER_SAMPLE_RATE', 44100),
+                channels=app.config.get('WAVEFORM_DECODER_CHANNELS', 2)
+            )
+        app.extensions['waveforms'] = self
+
+    @property
+    def available(self):
+        return np is not None
+
+    def register_decoder(self, audio_format, decoder):
+        """decoder(path) -> DecodedAudio；audio_format 为 audio_metadata 识别出的格式（mp3、flac 等）"""
+        self._decoders[audio_format] = decoder
+
+    def can_decode(self, audio_format):
+        return audio_format in self._decoders or self._fallback is not None
+
+    # ---------- 计算 ----------
+
+    def analyze_file(self, path):
+        """解码并分析文件，返回分析结果（含打包前的数组）"""
+        if not self.available:
+            raise WaveformError('计算波形需要安装 numpy')
+        try:
+            metadata = probe(path)
+        except MetadataError as e:
+            raise WaveformError(str(e)) from None
+        decoder = self._decoders.get(metadata['format'], self._fallback)
+        if decoder is None:
+            raise WaveformError(f'没有可用的 {metadata["format"]} 解码器')
+
+        decoded = decoder(path)
+        if decoded.frames is None and metadata.get('duration'):
+            # 外部解码器不知道总帧数，按头部解析出的精确时长确定每个点的采样数
+            decoded = decoded._replace(frames=int(round(metadata['duration'] * decoded.sample_rate)))
+        started = time.perf_counter()
+        try:
+            analysis = analyze_pcm(decoded, self.points, self.fft_size, self.profile_interval)
+        except WaveformError:
+            with self._lock:
+                self._counters['failed'] += 1
+            raise
+        with self._lock:
+            self._counters['analyzed'] += 1
+            self._counters['audio_seconds'] += analysis['frames'] / analysis['sample_rate']
+            self._counters['seconds'] += time.perf_counter() - started
+        return analysis
+
+    @staticmethod
+    def _source(path):
+        stat = os.stat(path)
+        return f'{stat.st_size:x}-{stat.st_mtime_ns:x}'
+
+    def analyze(self, music, path=None):
+        """计算并保存一首音乐的波形，返回 MusicWaveform（由调用方提交）"""
+        path = path or audio_metadata.path_for(music.file_url)
+        if not path or not os.path.isfile(path):
+            raise WaveformError('音频文件不存在')
+        analysis = self.analyze_file(path)
+        data = pack(analysis)
+
+        waveform = db.session.get(MusicWaveform, music.id) or MusicWaveform(music_id=music.id)
+        waveform.etag = hashlib.sha256(data).hexdigest()[:32]
+        waveform.source = self._source(path)
+        waveform.sample_rate = analysis['sample_rate']
+        waveform.channels = analysis['channels']
+        waveform.duration_ms = int(round(analysis['frames'] * 1000 / analysis['sample_rate']))
+        waveform.points = len(analysis['peaks'])
+        waveform.integrated_lufs = analysis['integrated_lufs']
+        waveform.loudness_range = analysis['loudness_range']
+        waveform.sample_peak_db = analysis['sample_peak_db']
+        waveform.data = data
+        waveform.analyzed_at = datetime.utcnow()
+        db.session.add(waveform)
+        return waveform
+
+    def analyze_backlog(self, limit=None, batch_size=50, progress_callback=None):
+        """为还没有波形的本地音乐计算波形；progress_callback(done, total)"""
+        query = Music.query.outerjoin(MusicWaveform, MusicWaveform.music_id == Music.id).filter(
+            MusicWaveform.music_id.is_(None),
+            Music.file_url.isnot(None)
+        )
+        total = query.count()
+        if limit is not None:
+            total = min(total, limit)
+        summary = {'processed': 0, 'analyzed': 0, 'skipped': 0, 'failed': 0, 'errors': []}
+        last_id = 0
+        started = time.perf_counter()
+
+        while summary['processed'] < total:
+            batch = query.filter(Music.id > last_id).order_by(Music.id).limit(
+                min(batch_size, total - summary['processed'])
+            ).all()
+            if not batch:
+                break
+            last_id = batch[-1].id
+            for music in batch:
+                summary['processed'] += 1
+                path = audio_metadata.path_for(music.file_url)
+                if not path or not os.path.isfile(path):
+                    summary['skipped'] += 1
+                    continue
+                try:
+                    self.analyze(music, path)
+                    db.session.commit()
+                    summary['analyzed'] += 1
+                except WaveformError as e:
+                    db.session.rollback()
+                    summary['failed'] += 1
+                    if len(summary['errors']) < 20:
+                        summary['errors'].append({'music_id': music.id, 'error': str(e)})
+                if progress_callback:
+                    progress_callback(summary['processed'], total)
+
+        summary['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        return summary
+
+    # ---------- 读取 ----------
+
+    @staticmethod
+    def etag(music_id):
+        """只查询 ETag，条件请求命中时不必读取波形数据"""
+        return db.session.query(MusicWaveform.etag).filter(MusicWaveform.music_id == music_id).scalar()
+
+    def render(self, music_id):
+        """波形的 JSON 表示；不存在时返回 None"""
+        waveform = db.session.query(MusicWaveform).options(db.undefer(MusicWaveform.data)).filter(
+            MusicWaveform.music_id == music_id
+        ).first()
+        if waveform is None:
+            return None
+        result = waveform.to_dict()
+        result.update(unpack(waveform.data))
+        result['normalization_gain_db'] = self.normalization_gain(waveform)
+        return result
+
+    def raw(self, music_id):
+        waveform = db.session.query(MusicWaveform).options(db.undefer(MusicWaveform.data)).filter(
+            MusicWaveform.music_id == music_id
+        ).first()
+        return waveform.data if waveform else None
+
+    def normalization_gain(self, waveform):
+        """把积分响度调整到 target_lufs 所需的增益，限制在不让采样峰值超过 -1 dBFS 的范围内"""
+        if waveform.integrated_lufs is None:
+            return None
+        gain = self.target_lufs - waveform.integrated_lufs
+        if waveform.sample_peak_db is not None:
+            gain = min(gain, -1.0 - waveform.sample_peak_db)
+        return round(gain, 2)
+
+    def get_stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        seconds = counters.pop('seconds')
+        counters['audio_seconds'] = round(counters['audio_seconds'], 1)
+        counters['realtime_factor'] = round(counters['audio_seconds'] / seconds, 1) if seconds else None
+        counters['numpy'] = self.available
+        counters['decoders'] = sorted(self._decoders) + (['command'] if self._fallback else [])
+        return counters
+
+
+# 全局波形分析实例
+waveforms = WaveformAnalyzer()